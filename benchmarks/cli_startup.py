@@ -0,0 +1,76 @@
+# coding=utf-8
+"""Startup time benchmark of the sbcli entry point.
+
+Runs CLI commands in fresh interpreters with `-X importtime` and reports the
+wall time, the time spent importing and the heaviest top level imports per
+command. With --max-ms the run fails when a command's import time exceeds
+the limit, for use as a regression check.
+
+    python -m benchmarks.cli_startup [--runs N] [--top N] [--max-ms MS] [command ...]
+"""
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+COMMANDS = [
+    '--help',
+    'cluster list',
+    'storage-node list',
+    'pool list',
+    'volume list',
+    'snapshot list',
+]
+
+_import_line = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def run(command):
+    """Runs `command` once, returns the wall time in ms and the top level imports as {module: cumulative us}"""
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'simplyblock_cli.cli', *command.split()],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall = (time.perf_counter() - start) * 1000
+
+    imports: dict = {}
+    for line in process.stderr.splitlines():
+        match = _import_line.match(line)
+        # one space of indentation marks the imports done by the entry point itself
+        if match and len(match.group(3)) == 1:
+            imports[match.group(4)] = imports.get(match.group(4), 0) + int(match.group(2))
+    return wall, imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('commands', nargs='*', default=COMMANDS)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=3, help='heaviest imports listed per command')
+    parser.add_argument('--max-ms', type=float, help='fail if the import time of a command exceeds this')
+    args = parser.parse_args()
+
+    print(f"{'command':<20}{'wall ms':>10}{'import ms':>11}  heaviest imports")
+    failed = []
+    for command in args.commands:
+        walls, totals, heaviest = [], [], {}
+        for _ in range(args.runs):
+            wall, imports = run(command)
+            walls.append(wall)
+            totals.append(sum(imports.values()) / 1000)
+            heaviest = imports
+        import_ms = statistics.median(totals)
+        top = sorted(heaviest.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        print(f"{command:<20}{statistics.median(walls):>10.0f}{import_ms:>11.0f}  "
+              + ', '.join(f'{name} {us / 1000:.0f}' for name, us in top))
+        if args.max_ms is not None and import_ms > args.max_ms:
+            failed.append(command)
+
+    if failed:
+        print(f"Import time over {args.max_ms:g}ms: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
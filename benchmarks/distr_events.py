@@ -0,0 +1,105 @@
+# coding=utf-8
+"""Event storm benchmark of the distr event collector.
+
+Feeds a synthetic storm of distr events, as sent by the nodes of a cluster
+after a device failure, through the per event handling of the former
+collector and through the coalescing one, and reports the events handled per
+second and the FDB commits, writes and bytes. The former collector scans all
+devices of all nodes per device event and writes each event twice, the
+coalescing one resolves devices with an index, counts repeated events on the
+first one and commits the events of a page at once. The device actions
+themselves are not part of the benchmark.
+
+    python -m benchmarks.distr_events [--events N] [--nodes N] [--devices N]
+"""
+import argparse
+import logging
+import random
+import time
+
+from benchmarks.stats_storage import CountingStore
+from simplyblock_core import constants
+from simplyblock_core.controllers import events_controller
+from simplyblock_core.models.base_model import BaseModel, UnitOfWork, transact
+from simplyblock_core.models.nvme_device import NVMeDevice
+from simplyblock_core.models.storage_node import StorageNode
+
+
+def storm(count, failed_devices, seed=0):
+    rng = random.Random(seed)
+    statuses = ['error_read', 'error_write', 'error_open', 'SPDK_BDEV_EVENT_REMOVE']
+    for _ in range(count):
+        if rng.random() < 0.9:
+            yield {'event_type': 'device_status', 'status': rng.choice(statuses),
+                   'storage_ID': rng.choice(failed_devices)}
+        else:
+            yield {'event_type': 'device_status', 'status': rng.choice(statuses[:2]), 'vuid': rng.randint(1, 200)}
+
+
+def pages(events):
+    events = list(events)
+    page, start = constants.DISTR_EVENT_COLLECTOR_NUM_OF_EVENTS, 0
+    while start < len(events):
+        yield events[start:start + page]
+        start += page
+        page = min(page * 10, constants.DISTR_EVENT_COLLECTOR_MAX_EVENTS)
+
+
+def before(store, nodes, events):
+    for page in pages(events):
+        for event_dict in page:
+            event = events_controller.new_distr_event('cluster_1', 'node_0', event_dict)
+            transact(store, BaseModel._write_op(event))
+            if event.storage_id >= 0:
+                for node in nodes:
+                    if any(dev.cluster_device_order == event.storage_id for dev in node.nvme_devices):
+                        break
+            event.status = 'processed'
+            transact(store, BaseModel._write_op(event))
+
+
+def after(store, nodes, events):
+    coalescer = events_controller.DistrEventCoalescer('cluster_1', 'node_0', constants.DISTR_EVENT_COALESCE_WINDOW_SEC)
+    index = {dev.cluster_device_order: node for node in nodes for dev in node.nvme_devices}
+    for page in pages(events):
+        updated = {}
+        for event_dict in page:
+            event, new = coalescer.add(event_dict)
+            if new:
+                if event.storage_id >= 0:
+                    index.get(event.storage_id)
+                event.status = 'processed'
+            updated[event.get_id()] = event
+        tx = UnitOfWork(store)
+        for event in updated.values():
+            event.write_to_db(tx)
+        tx.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--nodes', type=int, default=20)
+    parser.add_argument('--devices', type=int, default=12, help='devices per node')
+    parser.add_argument('--failed', type=int, default=4, help='devices the storm is about')
+    args = parser.parse_args()
+    events_controller.logger.setLevel(logging.CRITICAL)
+
+    nodes = [StorageNode({'uuid': f'node_{n}', 'nvme_devices': [
+        NVMeDevice({'uuid': f'dev_{n}_{d}', 'cluster_device_order': n * args.devices + d}).to_dict()
+        for d in range(args.devices)]}) for n in range(args.nodes)]
+    events = list(storm(args.events, list(range(args.nodes * args.devices - args.failed, args.nodes * args.devices))))
+
+    print(f"{args.events:,} events about {args.failed} devices, {args.nodes} nodes with {args.devices} devices")
+    print(f"{'':<8}{'events/s':>12}{'commits':>10}{'writes':>10}{'written':>14}")
+    for variant, collect in [('before', before), ('after', after)]:
+        store = CountingStore()
+        start = time.perf_counter()
+        collect(store, nodes, events)
+        elapsed = time.perf_counter() - start
+        print(f"{variant:<8}{args.events / elapsed:>12,.0f}{store.commits:>10,}{store.writes:>10,}"
+              f"{store.bytes_written:>14,}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# coding=utf-8
+"""Detection latency benchmark of the node health probes.
+
+Simulates a cluster in which one node does not answer, its probes take as
+long as their timeouts, and probes it the way the node monitor did, one
+check after the other, and with the concurrent NodeProber. Reports the pass
+duration, the time until the result of the last healthy node and of the
+unreachable node are known, and the probes per second. Delays are scaled
+by --scale to keep the run short, the reported times are scaled back.
+
+    python -m benchmarks.health_probes [--nodes N] [--scale S]
+"""
+import argparse
+import logging
+import time
+
+from simplyblock_core import constants, utils
+from simplyblock_core.controllers import health_controller
+from simplyblock_core.models.iface import IFace
+from simplyblock_core.models.storage_node import StorageNode
+
+DOWN = '10.0.0.1'
+DOWN_IPS = {DOWN, '10.1.0.1'}  # mgmt and data NIC
+# seconds a check takes on a reachable node, and on the unreachable one: the timeouts with retries
+CHECK_SEC = 0.02
+PING_SEC = constants.HEALTH_PROBE_PING_TIMEOUT_SEC
+API_TIMEOUT_SEC = 5 * 2
+
+
+def install(scale):
+    def check(ip, *args):
+        time.sleep((API_TIMEOUT_SEC if ip == DOWN else CHECK_SEC) * scale)
+        return ip != DOWN
+
+    def ping_host(ip):
+        time.sleep((PING_SEC if ip in DOWN_IPS else CHECK_SEC) * scale)
+        return ip not in DOWN_IPS
+
+    def ping_hosts(ips, *args):
+        time.sleep((PING_SEC if DOWN_IPS & set(ips) else CHECK_SEC) * scale)
+        return {ip: ip not in DOWN_IPS for ip in ips}
+
+    utils.ping_host = ping_host
+    utils.ping_hosts = ping_hosts
+    health_controller._check_node_api = check
+    health_controller._check_spdk_process_up = check
+    health_controller._check_node_rpc = check
+    health_controller._check_port_on_node = lambda node, port: check(node.mgmt_ip)
+
+
+def serial(nodes, ports, scale):
+    """The checks of the former node monitor loop, returns the seconds until each node's result"""
+    start = time.monotonic()
+    done = {}
+    for node in nodes:
+        if not health_controller._check_node_ping(node.mgmt_ip):
+            time.sleep(1 * scale)
+            health_controller._check_node_ping(node.mgmt_ip)
+        api = health_controller._check_node_api(node.mgmt_ip)
+        spdk_process = api and health_controller._check_spdk_process_up(node.mgmt_ip, node.rpc_port)
+        rpc = health_controller._check_node_rpc(node.mgmt_ip, node.rpc_port, node.rpc_username, node.rpc_password)
+        if spdk_process and rpc:
+            for port in ports[node.get_id()]:
+                health_controller._check_port_on_node(node, port)
+            for nic in node.data_nics:
+                health_controller._check_node_ping(nic.ip4_address)
+        done[node.get_id()] = time.monotonic() - start
+    return done
+
+
+def concurrent(nodes, ports, scale):
+    prober = health_controller.NodeProber(None, deadline=constants.HEALTH_PROBE_DEADLINE_SEC * scale)
+    probes = prober.probe(nodes, ports)
+    return {node_id: probe.duration_ms / 1000 for node_id, probe in probes.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--nodes', type=int, default=20)
+    parser.add_argument('--ports', type=int, default=3, help='firewall ports checked per node')
+    parser.add_argument('--scale', type=float, default=0.05)
+    args = parser.parse_args()
+    health_controller.logger.setLevel(logging.CRITICAL)
+    install(args.scale)
+
+    nodes = [StorageNode({
+        'uuid': f'node_{n}', 'cluster_id': 'cluster_1', 'mgmt_ip': f'10.0.0.{n + 1}', 'rpc_port': 8080,
+        'data_nics': [IFace({'ip4_address': f'10.1.0.{n + 1}'}).to_dict()]}) for n in range(args.nodes)]
+    ports = {node.get_id(): [4420 + p for p in range(args.ports)] for node in nodes}
+    probes = args.nodes * (4 + args.ports + 1)
+
+    print(f"{args.nodes} nodes, one unreachable, {probes} probes per pass")
+    print(f"{'':<12}{'pass s':>10}{'healthy s':>12}{'down s':>10}{'probes/s':>12}")
+    for variant, run in [('serial', lambda: serial(nodes, ports, args.scale)),
+                         ('concurrent', lambda: concurrent(nodes, ports, args.scale))]:
+        start = time.monotonic()
+        done = run()
+        elapsed = (time.monotonic() - start) / args.scale
+        healthy = max(t for node_id, t in done.items() if node_id != 'node_0') / args.scale
+        print(f"{variant:<12}{elapsed:>10.1f}{healthy:>12.1f}{done['node_0'] / args.scale:>10.1f}"
+              f"{probes / elapsed:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
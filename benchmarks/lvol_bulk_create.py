@@ -0,0 +1,185 @@
+# coding=utf-8
+"""Provisioning throughput benchmark of the bulk lvol creation.
+
+Creates a batch of lvols one by one with add_lvol_ha, the way CSI and
+automation do, and with one LVolBulkCreate. The RPC servers of the nodes
+are simulated: every HTTP request takes a round trip, and the calls are
+executed one at a time per node, like on the SPDK app thread. The objects
+are kept in an in-memory store. Reports the time to create the batch, the
+HTTP requests sent and the lvols created per second.
+
+    python -m benchmarks.lvol_bulk_create [--lvols N [N ...]] [--nodes N] [--rtt MS] [--call MS]
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from simplyblock_core import utils
+from simplyblock_core.controllers import lvol_controller
+from simplyblock_core.db_controller import DBController, Singleton
+from simplyblock_core.lvol_bulk import LVolBulkCreate
+from simplyblock_core.models.cluster import Cluster
+from simplyblock_core.models.iface import IFace
+from simplyblock_core.models.lvol_model import LVol
+from simplyblock_core.models.nvme_device import NVMeDevice
+from simplyblock_core.models.pool import Pool
+from simplyblock_core.models.storage_node import StorageNode
+from simplyblock_core.rpc_client import RPCClient
+
+
+class _Value:
+    def __init__(self, value):
+        self._value = value
+
+    def present(self):
+        return self._value is not None
+
+    def __bytes__(self):
+        return self._value
+
+
+class _Done:
+    def wait(self):
+        pass
+
+
+class MemoryStore:
+    """In-memory key value store applying writes immediately"""
+
+    def __init__(self):
+        self.data: dict = {}
+        self.lock = threading.Lock()
+
+    def create_transaction(self):
+        return self
+
+    def __getitem__(self, key):
+        return _Value(self.data.get(key))
+
+    def get_range_startswith(self, prefix, limit=0, reverse=False):
+        with self.lock:
+            items = sorted((k, v) for k, v in self.data.items() if k.startswith(prefix))
+        if reverse:
+            items.reverse()
+        return items[:limit] if limit else items
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+
+    def clear(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def add(self, key, param):
+        pass
+
+    def commit(self):
+        return _Done()
+
+
+class _Response:
+    status_code = 200
+
+    def __init__(self, data):
+        self.content = json.dumps(data).encode()
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class SimulatedServers:
+    """Answers the RPC requests after a round trip, executing the calls of a node one at a time"""
+
+    def __init__(self, rtt, call):
+        self.rtt = rtt
+        self.call = call
+        self.requests = 0
+        self._locks: dict = defaultdict(threading.Lock)
+
+    def _result(self, call):
+        method = call['method']
+        params = call.get('params') or {}
+        result: object
+        if method == 'bdev_lvol_create':
+            result = f"uuid-{params['lvol_name']}"
+        elif method == 'bdev_get_bdevs':
+            result = [{'uuid': f"uuid-{params.get('name')}", 'driver_specific': {'lvol': {'blobid': 1}}}]
+        elif method == 'nvmf_subsystem_add_ns':
+            result = 1
+        else:
+            result = True
+        return {'jsonrpc': '2.0', 'id': call['id'], 'result': result}
+
+    def post(self, client, payload):
+        calls = payload if isinstance(payload, list) else [payload]
+        time.sleep(self.rtt)
+        with self._locks[client.ip_address]:
+            self.requests += 1
+            time.sleep(self.call * len(calls))
+        results = [self._result(call) for call in calls]
+        return _Response(results if isinstance(payload, list) else results[0])
+
+
+def setup(nodes):
+    db = DBController()
+    db.kv_store = MemoryStore()  # type: ignore[assignment]
+    Singleton._instances[DBController] = db
+    Cluster({'uuid': 'cluster_1', 'status': Cluster.STATUS_ACTIVE, 'nqn': 'nqn:cluster_1',
+             'ha_type': 'single'}).write_to_db(db.kv_store)
+    Pool({'uuid': 'pool_1', 'pool_name': 'pool', 'cluster_id': 'cluster_1',
+          'status': Pool.STATUS_ACTIVE}).write_to_db(db.kv_store)
+    for n in range(nodes):
+        StorageNode({'uuid': f'node_{n}', 'cluster_id': 'cluster_1', 'status': StorageNode.STATUS_ONLINE,
+                     'max_lvol': 10000, 'lvstore': f'lvs_{n}', 'mgmt_ip': f'10.0.0.{n}', 'rpc_port': 8080,
+                     'data_nics': [IFace({'ip4_address': f'10.1.{i}.{n}'}).to_dict() for i in range(2)],
+                     'nvme_devices': [NVMeDevice({'status': NVMeDevice.STATUS_ONLINE, 'size': 2 ** 44}).to_dict()
+                                      for _ in range(8)],
+                     }).write_to_db(db.kv_store)
+    return db
+
+
+def one_by_one(db, volumes):
+    # _get_next_3_nodes prints its node selection
+    with contextlib.redirect_stdout(io.StringIO()):
+        for volume in volumes:
+            lvol_controller.add_lvol_ha(
+                volume['name'], volume['size'], None, 'default', 'pool', False, False, 0, 0, 0, 0, 0)
+
+
+def bulk(db, volumes):
+    LVolBulkCreate(db, 'pool', volumes).create()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lvols', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--nodes', type=int, default=4)
+    parser.add_argument('--rtt', type=float, default=1.0, help='round trip of an HTTP request in ms')
+    parser.add_argument('--call', type=float, default=0.05, help='execution time of a call in ms')
+    args = parser.parse_args()
+    utils.get_logger().setLevel(logging.CRITICAL)
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    print(f"{'lvols':>6}  {'':<12}{'created s':>10}{'requests':>10}{'lvols/s':>10}")
+    for count in args.lvols:
+        volumes = [{'name': f'lvol_{i}', 'size': 2 ** 30} for i in range(count)]
+        for variant, run in [('one by one', one_by_one), ('bulk', bulk)]:
+            db = setup(args.nodes)
+            servers = SimulatedServers(args.rtt / 1000, args.call / 1000)
+            RPCClient._post = lambda client, payload: servers.post(client, payload)  # type: ignore[method-assign]
+            start = time.monotonic()
+            run(db, volumes)
+            elapsed = time.monotonic() - start
+            lvols = db.get_lvols('cluster_1')
+            assert len(lvols) == count and all(lvol.status == LVol.STATUS_ONLINE for lvol in lvols)
+            print(f"{count:>6}  {variant:<12}{elapsed:>10.2f}{servers.requests:>10}{count / elapsed:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+# coding=utf-8
+"""Simulation of the lvol placement with LVolPlacement against the previous lvol count weighting.
+
+Places new lvols on a cluster whose existing lvols are spread evenly by count
+but whose hot lvols sit on a few nodes, with _get_next_3_nodes and with the
+weighting by lvol count it used before. The load of an lvol follows a heavy
+tailed distribution and becomes visible in the node stats the next time the
+simulated collector writes them. The objects are kept in an in-memory store.
+Reports the balance of the node IOPS, the CPU busy of the hottest node and
+the time per placement decision.
+
+    python -m benchmarks.lvol_placement [--nodes N] [--lvols N] [--refresh N] [--seed N]
+"""
+import argparse
+import logging
+import random
+import statistics
+import threading
+import time
+
+from simplyblock_core import lvol_placement, utils
+from simplyblock_core.controllers import lvol_controller
+from simplyblock_core.db_controller import DBController, Singleton
+from simplyblock_core.models.lvol_model import LVol
+from simplyblock_core.models.stats import NodeStatObject
+from simplyblock_core.models.storage_node import StorageNode
+
+NODE_IOPS = 400000  # IOPS saturating the reactors of a node
+NODE_SIZE = 100 * 2 ** 40
+
+
+class _Value:
+    def __init__(self, value):
+        self._value = value
+
+    def present(self):
+        return self._value is not None
+
+    def __bytes__(self):
+        return self._value
+
+
+class _Done:
+    def wait(self):
+        pass
+
+
+class MemoryStore:
+    """In-memory key value store applying writes immediately"""
+
+    def __init__(self):
+        self.data: dict = {}
+        self.lock = threading.Lock()
+
+    def create_transaction(self):
+        return self
+
+    def __getitem__(self, key):
+        return _Value(self.data.get(key))
+
+    def get_range_startswith(self, prefix, limit=0, reverse=False):
+        with self.lock:
+            items = sorted((k, v) for k, v in self.data.items() if k.startswith(prefix))
+        if reverse:
+            items.reverse()
+        return items[:limit] if limit else items
+
+    def get_range(self, begin, end, limit=0, reverse=False):
+        with self.lock:
+            items = sorted((k, v) for k, v in self.data.items() if begin <= k < end)
+        if reverse:
+            items.reverse()
+        return items[:limit] if limit else items
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+
+    def clear(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def add(self, key, param):
+        pass
+
+    def commit(self):
+        return _Done()
+
+    def on_error(self, error):
+        raise error
+
+
+def legacy_get_next_3_nodes(cluster_id):
+    """_get_next_3_nodes before LVolPlacement, without its debug output"""
+    db_controller = DBController()
+    online_nodes = []
+    node_stats = {}
+    for node in db_controller.get_storage_nodes_by_cluster_id(cluster_id):
+        if node.is_secondary_node or node.status != node.STATUS_ONLINE:
+            continue
+        lvol_count = len(db_controller.get_lvols_by_node_id(node.get_id()))
+        if lvol_count >= node.max_lvol:
+            continue
+        online_nodes.append(node)
+        node_stats[node.get_id()] = {"lvol": lvol_count + 1}
+    if len(online_nodes) <= 1:
+        return online_nodes
+    cluster_stats = utils.dict_agg([node_stats[k] for k in node_stats])
+
+    # utils.get_weights with a weight of 100 for the lvol count
+    nodes_weight = {}
+    for node_id in node_stats:
+        nodes_weight[node_id] = int((cluster_stats['lvol'] / node_stats[node_id]['lvol']) * 10)
+    heavy_node_id = max(nodes_weight, key=lambda node_id: nodes_weight[node_id])
+    nodes_weight[heavy_node_id] *= 5
+
+    selected_node_ids: list = []
+    while len(selected_node_ids) < min(len(node_stats), 3):
+        remaining = [node_id for node_id in nodes_weight if node_id not in selected_node_ids]
+        r_index = random.randint(0, sum(nodes_weight[node_id] for node_id in remaining))
+        n_start = 0
+        for node_id in remaining:
+            if n_start <= r_index <= n_start + nodes_weight[node_id]:
+                selected_node_ids.append(node_id)
+                break
+            n_start += nodes_weight[node_id]
+    return [db_controller.get_storage_node_by_id(node_id) for node_id in selected_node_ids]
+
+
+class Cluster:
+    """The simulated load of the lvols of each node"""
+
+    def __init__(self, nodes, rng):
+        self.rng = rng
+        self.iops = {f'node_{n}': 0 for n in range(nodes)}
+        self.bytes = {node_id: 0 for node_id in self.iops}
+        self.size = {node_id: 0 for node_id in self.iops}
+        self.count = 0
+        self.db = DBController()
+        self.db.kv_store = MemoryStore()  # type: ignore[assignment]
+        Singleton._instances[DBController] = self.db
+        for node_id in self.iops:
+            StorageNode({'uuid': node_id, 'cluster_id': 'cluster_1', 'status': StorageNode.STATUS_ONLINE,
+                         'max_lvol': 100000}).write_to_db(self.db.kv_store)
+        self.date = 1700000000
+
+    def lvol_load(self):
+        # most lvols are idle, a few carry most of the I/O
+        iops = int(min(self.rng.paretovariate(1.2) * 500, NODE_IOPS / 4))
+        return iops, iops * self.rng.choice([4096, 16384, 131072])
+
+    def add(self, node_id, iops, io_bytes, size=100 * 2 ** 30):
+        LVol({'uuid': f'lvol_{self.count}', 'node_id': node_id, 'size': size}).write_to_db(self.db.kv_store)
+        self.count += 1
+        self.iops[node_id] += iops
+        self.bytes[node_id] += io_bytes
+        self.size[node_id] += size
+
+    def collect(self):
+        """Writes a stats record per node, as the collector does every few seconds"""
+        self.date += 5
+        for node_id in self.iops:
+            NodeStatObject({
+                'cluster_id': 'cluster_1', 'uuid': node_id, 'date': self.date,
+                'read_io_ps': self.iops[node_id] * 7 // 10, 'write_io_ps': self.iops[node_id] * 3 // 10,
+                'read_bytes_ps': self.bytes[node_id] * 7 // 10, 'write_bytes_ps': self.bytes[node_id] * 3 // 10,
+                'size_util': self.size[node_id] * 100 // NODE_SIZE,
+                'cpu_busy': min(self.iops[node_id] * 100 // NODE_IOPS, 100),
+            }).write_to_db(self.db.kv_store)
+        # the records are read again once the stats TTL expired
+        lvol_placement._snapshot.clear()
+
+
+def simulate(select, args):
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    cluster = Cluster(args.nodes, rng)
+    hot_nodes = list(cluster.iops)[:2]
+    for i in range(args.nodes * args.existing):
+        node_id = list(cluster.iops)[i % args.nodes]
+        iops, io_bytes = cluster.lvol_load()
+        if node_id in hot_nodes:
+            iops, io_bytes = iops * 10, io_bytes * 10
+        cluster.add(node_id, iops, io_bytes)
+    cluster.collect()
+
+    latencies = []
+    for i in range(args.lvols):
+        start = time.perf_counter()
+        node = select('cluster_1')[0]
+        latencies.append(time.perf_counter() - start)
+        cluster.add(node.get_id(), *cluster.lvol_load())
+        if (i + 1) % args.refresh == 0:
+            cluster.collect()
+    return cluster, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--nodes', type=int, default=8)
+    parser.add_argument('--existing', type=int, default=20, help='lvols per node before the simulation')
+    parser.add_argument('--lvols', type=int, default=400, help='lvols placed')
+    parser.add_argument('--refresh', type=int, default=10, help='lvols placed between two stats records')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    utils.get_logger().setLevel(logging.CRITICAL)
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    print(f"{'':<10}{'max/mean IOPS':>15}{'IOPS CV':>10}{'max busy %':>12}{'lvols max/min':>15}"
+          f"{'ms/decision':>13}{'p99 ms':>9}")
+    for variant, select in [('legacy', legacy_get_next_3_nodes), ('placement', lvol_controller._get_next_3_nodes)]:
+        cluster, latencies = simulate(select, args)
+        iops = list(cluster.iops.values())
+        counts = [cluster.db.get_lvol_count_by_node_id(node_id) for node_id in cluster.iops]
+        latencies.sort()
+        print(f"{variant:<10}{max(iops) / statistics.mean(iops):>15.2f}"
+              f"{statistics.pstdev(iops) / statistics.mean(iops):>10.2f}"
+              f"{min(max(iops) * 100 // NODE_IOPS, 100):>12}"
+              f"{max(counts) / min(counts):>15.2f}"
+              f"{statistics.mean(latencies) * 1000:>13.2f}"
+              f"{latencies[int(len(latencies) * 0.99)] * 1000:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
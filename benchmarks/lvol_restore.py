@@ -0,0 +1,199 @@
+# coding=utf-8
+"""Recovery time benchmark of the lvol restoration after a node restart.
+
+Restores the subsystems, namespaces, listeners and QoS limits of the lvols of
+a node the way recreate_lvstore did, creating the subsystems one by one and
+adding each lvol in a thread of its own, and with LVolRestore. The RPC
+server is simulated: every HTTP request takes a round trip, and the calls
+are executed one at a time, like on the SPDK app thread. The objects are
+kept in an in-memory store. Reports the time until all lvols are restored,
+the HTTP requests sent and the lvols restored per second.
+
+    python -m benchmarks.lvol_restore [--lvols N [N ...]] [--rtt MS] [--call MS]
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from simplyblock_core import constants, utils
+from simplyblock_core.controllers import lvol_controller
+from simplyblock_core.db_controller import DBController
+from simplyblock_core.lvol_restore import LVolRestore
+from simplyblock_core.models.iface import IFace
+from simplyblock_core.models.lvol_model import LVol
+from simplyblock_core.models.pool import Pool
+from simplyblock_core.models.storage_node import StorageNode
+from simplyblock_core.rpc_client import RPCClient
+
+
+class _Value:
+    def __init__(self, value):
+        self._value = value
+
+    def present(self):
+        return self._value is not None
+
+    def __bytes__(self):
+        return self._value
+
+
+class _Done:
+    def wait(self):
+        pass
+
+
+class MemoryStore:
+    """In-memory key value store applying writes immediately"""
+
+    def __init__(self):
+        self.data: dict = {}
+        self.lock = threading.Lock()
+
+    def create_transaction(self):
+        return self
+
+    def __getitem__(self, key):
+        return _Value(self.data.get(key))
+
+    def get_range_startswith(self, prefix, limit=0, reverse=False):
+        if prefix in self.data:
+            return [(prefix, self.data[prefix])]
+        items = sorted((k, v) for k, v in self.data.items() if k.startswith(prefix))
+        return items[:limit] if limit else items
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+
+    def clear(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def add(self, key, param):
+        pass
+
+    def commit(self):
+        return _Done()
+
+
+class _Response:
+    status_code = 200
+
+    def __init__(self, data):
+        self.content = json.dumps(data).encode()
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class SimulatedServer:
+    """Answers the RPC requests after a round trip, executing their calls one at a time"""
+
+    def __init__(self, rtt, call):
+        self.rtt = rtt
+        self.call = call
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _result(self, call):
+        return {'jsonrpc': '2.0', 'id': call['id'], 'result': 1 if call['method'] == 'nvmf_subsystem_add_ns' else True}
+
+    def post(self, payload):
+        calls = payload if isinstance(payload, list) else [payload]
+        time.sleep(self.rtt)
+        with self._lock:
+            self.requests += 1
+            time.sleep(self.call * len(calls))
+        results = [self._result(call) for call in calls]
+        return _Response(results if isinstance(payload, list) else results[0])
+
+
+def legacy_add_lvol_thread(db, lvol, snode, lvol_ana_state="optimized"):
+    """storage_node_ops.add_lvol_thread before LVolRestore, passing the DB explicitly"""
+    rpc_client = RPCClient(
+        snode.mgmt_ip, snode.rpc_port,
+        snode.rpc_username, snode.rpc_password, timeout=10, retry=2)
+
+    ret = rpc_client.nvmf_subsystem_add_ns(lvol.nqn, lvol.top_bdev, lvol.uuid, lvol.guid, nsid=lvol.ns_id)
+    for iface in snode.data_nics:
+        if iface.ip4_address:
+            ret = rpc_client.listeners_create(
+                lvol.nqn, iface.get_transport_type(), iface.ip4_address, lvol.subsys_port, ana_state=lvol_ana_state)
+
+    lvol_obj = db.get_lvol_by_id(lvol.get_id())
+    lvol_obj.status = LVol.STATUS_ONLINE
+    lvol_obj.io_error = False
+    lvol_obj.health_check = True
+    lvol_obj.write_to_db(db.kv_store)
+    if lvol.rw_ios_per_sec or lvol.rw_mbytes_per_sec or lvol.r_mbytes_per_sec or lvol.w_mbytes_per_sec:
+        lvol_controller.set_lvol(lvol.uuid, lvol.rw_ios_per_sec, lvol.rw_mbytes_per_sec,
+                                 lvol.r_mbytes_per_sec, lvol.w_mbytes_per_sec)
+    return ret
+
+
+def legacy(db, snode, lvols):
+    rpc_client = RPCClient(snode.mgmt_ip, snode.rpc_port, snode.rpc_username, snode.rpc_password)
+    for lvol in lvols:
+        rpc_client.subsystem_create(lvol.nqn, lvol.ha_type, lvol.uuid, 1,
+                                    max_namespaces=constants.LVO_MAX_NAMESPACES_PER_SUBSYS)
+    # the executor was not waited for, the lvols were restored once its threads were done
+    executor = ThreadPoolExecutor(max_workers=50)
+    for lvol in lvols:
+        executor.submit(legacy_add_lvol_thread, db, lvol, snode)
+    executor.shutdown(wait=True)
+
+
+def pipelined(db, snode, lvols):
+    restore = LVolRestore(db, snode, lvols)
+    restore.create_subsystems()
+    restore.start()
+    errors = restore.wait()
+    assert not errors, errors
+
+
+def setup(count):
+    db = DBController()
+    db.kv_store = MemoryStore()  # type: ignore[assignment]
+    Pool({'uuid': 'pool_1', 'status': Pool.STATUS_ACTIVE}).write_to_db(db.kv_store)
+    snode = StorageNode({'uuid': 'node_1', 'mgmt_ip': '10.0.0.1', 'rpc_port': 8080,
+                         'data_nics': [IFace({'ip4_address': f'10.1.{i}.1'}).to_dict() for i in range(2)]})
+    snode.write_to_db(db.kv_store)
+    lvols = []
+    for i in range(count):
+        lvol = LVol({'uuid': f'lvol_{i}', 'node_id': 'node_1', 'pool_uuid': 'pool_1', 'nqn': f'nqn:lvol_{i}',
+                     'top_bdev': f'lvs/lvol_{i}', 'status': LVol.STATUS_OFFLINE,
+                     # a quarter of the lvols has QoS limits
+                     'rw_ios_per_sec': 10000 if i % 4 == 0 else 0})
+        lvol.write_to_db(db.kv_store)
+        lvols.append(lvol)
+    lvol_controller.DBController = lambda: db  # type: ignore[assignment,misc]
+    return db, snode, lvols
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lvols', type=int, nargs='+', default=[1000, 5000])
+    parser.add_argument('--rtt', type=float, default=1.0, help='round trip of an HTTP request in ms')
+    parser.add_argument('--call', type=float, default=0.05, help='execution time of a call in ms')
+    args = parser.parse_args()
+    utils.get_logger().setLevel(logging.CRITICAL)
+    logging.getLogger('simplyblock_core.lvol_restore').setLevel(logging.CRITICAL)
+
+    print(f"{'lvols':>6}  {'':<10}{'restored s':>12}{'requests':>10}{'lvols/s':>10}")
+    for count in args.lvols:
+        for variant, run in [('legacy', legacy), ('pipelined', pipelined)]:
+            db, snode, lvols = setup(count)
+            server = SimulatedServer(args.rtt / 1000, args.call / 1000)
+            RPCClient._post = server.post  # type: ignore[method-assign,assignment]
+            start = time.monotonic()
+            run(db, snode, lvols)
+            elapsed = time.monotonic() - start
+            assert all(db.get_lvol_by_id(lvol.get_id()).status == LVol.STATUS_ONLINE for lvol in lvols)
+            print(f"{count:>6}  {variant:<10}{elapsed:>12.2f}{server.requests:>10}{count / elapsed:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# coding=utf-8
+"""Benchmark of BaseModel (de)serialization against the previous implementation.
+
+Decodes and encodes a StorageNode with nested devices and lvstore stack, as
+read by the monitor services, and reports objects per second.
+
+    python -m benchmarks.model_serialization [--count N]
+"""
+import argparse
+import json
+import time
+from inspect import ismethod
+from typing import Mapping
+
+from simplyblock_core.models import base_model
+from simplyblock_core.models.iface import IFace
+from simplyblock_core.models.nvme_device import JMDevice, NVMeDevice
+from simplyblock_core.models.storage_node import StorageNode
+
+
+def legacy_attrs_map(obj):
+    return {
+        s: {"type": t, "default": getattr(obj, s)}
+        for s, t in obj.all_annotations().items()
+        if not s.startswith("_") and not ismethod(getattr(obj, s))
+    }
+
+
+def legacy_from_dict(obj, data):
+    """BaseModel.from_dict before the field schema was compiled per class"""
+    for attr, value_dict in legacy_attrs_map(obj).items():
+        value = value_dict['default']
+        if data is not None and attr in data:
+            dtype = value_dict['type']
+            value = data[attr]
+            if dtype in [int, float, str, bool]:
+                try:
+                    value = dtype(value)
+                except Exception:
+                    if type(value) is list and dtype is int:
+                        value = len(value)
+            elif hasattr(dtype, '__origin__'):
+                if dtype.__origin__ is list:
+                    if hasattr(dtype, "__args__") and hasattr(dtype.__args__[0], "from_dict"):
+                        value = [legacy_from_dict(dtype.__args__[0](), item) for item in data[attr]]
+                elif dtype.__origin__ == Mapping:
+                    value = dtype(data[attr])
+            elif hasattr(dtype, "from_dict"):
+                value = legacy_from_dict(dtype(), data[attr]) if data[attr] is not None else dtype()
+            else:
+                value = dtype(data[attr])
+        setattr(obj, attr, value)
+    obj.id = obj.uuid
+    return obj
+
+
+def legacy_to_dict(obj):
+    """BaseModel.to_dict before the field schema was compiled per class"""
+    result: dict = {}
+    for attr in legacy_attrs_map(obj):
+        value = getattr(obj, attr)
+        if isinstance(value, list):
+            result[attr] = [legacy_to_dict(x) if hasattr(x, "to_dict") else x for x in value]
+        elif hasattr(value, "to_dict"):
+            result[attr] = legacy_to_dict(value)
+        elif isinstance(value, dict):
+            result[attr] = {k: legacy_to_dict(v) if hasattr(v, "to_dict") else v for k, v in value.items()}
+        else:
+            result[attr] = value
+    return result
+
+
+def sample_node(devices=10, remote_devices=30, lvstore_stack=8):
+    def device(i, cls=NVMeDevice):
+        return cls({
+            'uuid': f'device-{i}', 'node_id': 'node-0', 'cluster_id': 'cluster-0', 'size': 2 ** 40,
+            'status': NVMeDevice.STATUS_ONLINE, 'alceml_bdev': f'alceml_{i}', 'bdev_stack': [{'type': 'alceml'}] * 3,
+        })
+
+    node = StorageNode({
+        'uuid': 'node-0', 'cluster_id': 'cluster-0', 'hostname': 'storage-0', 'mgmt_ip': '10.0.0.1',
+        'status': StorageNode.STATUS_ONLINE, 'poller_cpu_cores': list(range(8)),
+        'lvstore_stack': [{'type': 'bdev_distr', 'name': f'distrib_{i}', 'params': {'jm_vuid': i}}
+                          for i in range(lvstore_stack)],
+    })
+    node.nvme_devices = [device(i) for i in range(devices)]
+    node.remote_devices = [device(i) for i in range(devices, devices + remote_devices)]
+    node.jm_device = device('jm', JMDevice)  # type: ignore[assignment]
+    node.data_nics = [IFace({'if_name': 'eth1', 'ip4_address': '10.0.1.1'})]
+    return node
+
+
+def rate(func, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=2000)
+    args = parser.parse_args()
+
+    node = sample_node()
+    raw = json.dumps(node.to_dict()).encode()
+    assert legacy_to_dict(legacy_from_dict(StorageNode(), json.loads(raw))) == StorageNode(json.loads(raw)).to_dict()
+
+    results = [
+        ('decode', 'before', rate(lambda: legacy_from_dict(StorageNode(), json.loads(raw)), args.count)),
+        ('decode', 'after', rate(lambda: StorageNode().from_dict(base_model.json_loads(raw)), args.count)),
+        ('encode', 'before', rate(lambda: json.dumps(legacy_to_dict(node)).encode(), args.count)),
+        ('encode', 'after', rate(lambda: base_model.json_dumps(node.to_dict()), args.count)),
+    ]
+    print(f"StorageNode record: {len(raw)} bytes, orjson: {base_model.orjson is not None}")
+    for operation, variant, objects_per_sec in results:
+        print(f"{operation:<8}{variant:<8}{objects_per_sec:>12,.0f} objects/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+# coding=utf-8
+"""Load benchmark of the SPDK HTTP proxy modes.
+
+Starts a fake SPDK RPC socket and the proxy in its single threaded, threaded
+and asyncio modes, then sends requests from concurrent RPCClients and reports
+requests per second, latency percentiles and the CPU time the proxy spends
+per request, for small and large responses. Clients, proxy and fake SPDK
+share the machine, on few cores the CPU time is the most telling column.
+
+    python -m benchmarks.spdk_proxy [--clients N] [--duration SECONDS] [--bdevs N]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import psutil
+
+from simplyblock_core.rpc_client import RPCClient
+
+PROXY = os.path.join(os.path.dirname(__file__), '..', 'simplyblock_core', 'services', 'spdk_http_proxy_server.py')
+
+
+def fake_spdk(path, latency, bdevs):
+    """Answers JSON-RPC requests on the UNIX socket at `path` after `latency` seconds"""
+    # encoded once, like SPDK the response starts with the id
+    bdev_list = json.dumps([{'name': f'bdev_{i}', 'aliases': [f'lvs/bdev_{i}'], 'block_size': 4096,
+                             'num_blocks': 2 ** 28, 'uuid': f'{i:032x}',
+                             'driver_specific': {'lvol': {'thin_provision': True}}} for i in range(bdevs)])
+    version = json.dumps({'version': 'fake'})
+
+    async def respond(writer, request):
+        await asyncio.sleep(latency)
+        result = bdev_list if request['method'] == 'bdev_get_bdevs' else version
+        writer.write(f'{{"jsonrpc":"2.0","id":{json.dumps(request["id"])},"result":{result}}}'.encode())
+
+    async def handle(reader, writer):
+        decoder = json.JSONDecoder()
+        buffer = ''
+        while data := await reader.read(65536):
+            buffer += data.decode()
+            while buffer:
+                try:
+                    request, end = decoder.raw_decode(buffer)
+                except ValueError:
+                    break
+                buffer = buffer[end:].lstrip()
+                if 'id' in request:
+                    asyncio.ensure_future(respond(writer, request))
+        writer.close()
+
+    async def serve():
+        server = await asyncio.start_unix_server(handle, path)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_proxy(mode, sock_path, port):
+    env = dict(os.environ, SERVER_IP='127.0.0.1', RPC_PORT=str(port), RPC_USERNAME='user', RPC_PASSWORD='secret',
+               RPC_SOCK=sock_path)
+    if mode == 'threaded':
+        env['MULTI_THREADING_ENABLED'] = 'True'
+    elif mode == 'async':
+        env['ASYNC_ENABLED'] = 'True'
+    proxy = subprocess.Popen([sys.executable, PROXY], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return proxy
+        except OSError:
+            time.sleep(0.05)
+    proxy.kill()
+    raise RuntimeError(f'{mode} proxy did not start')
+
+
+def load(proxy, port, method, clients, duration):
+    latencies: list = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client():
+        rpc_client = RPCClient('127.0.0.1', port, 'user', 'secret', timeout=30, retry=0)
+        own = []
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            result, _ = rpc_client._request2(method)
+            own.append(time.perf_counter() - start)
+            if not result:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    cpu_before = sum(psutil.Process(proxy.pid).cpu_times()[:2])
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    cpu = sum(psutil.Process(proxy.pid).cpu_times()[:2]) - cpu_before
+
+    latencies.sort()
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50': latencies[len(latencies) // 2] * 1000,
+        'p99': latencies[int(len(latencies) * 0.99)] * 1000,
+        'cpu': cpu * 1000 / len(latencies),
+        'errors': errors[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--bdevs', type=int, default=2000, help='bdevs in the bdev_get_bdevs response')
+    parser.add_argument('--latency', type=float, default=1, help='SPDK response latency in ms')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    sock_path = os.path.join(workdir, 'spdk.sock')
+    spdk = multiprocessing.Process(target=fake_spdk, args=(sock_path, args.latency / 1000, args.bdevs), daemon=True)
+    spdk.start()
+    while not os.path.exists(sock_path):
+        time.sleep(0.01)
+
+    print(f"{args.clients} clients, {args.duration:g}s per run, SPDK latency {args.latency:g}ms")
+    print(f"{'mode':<10}{'method':<18}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'cpu ms/req':>12}{'errors':>8}")
+    try:
+        for mode in ['single', 'threaded', 'async']:
+            port = free_port()
+            proxy = start_proxy(mode, sock_path, port)
+            try:
+                for method in ['spdk_get_version', 'bdev_get_bdevs']:
+                    result = load(proxy, port, method, args.clients, args.duration)
+                    print(f"{mode:<10}{method:<18}{result['rps']:>10,.0f}{result['p50']:>10.1f}"
+                          f"{result['p99']:>10.1f}{result['cpu']:>12.2f}{result['errors']:>8}")
+            finally:
+                proxy.terminate()
+                proxy.wait()
+    finally:
+        spdk.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# coding=utf-8
+"""Benchmark of the StatsFrame stats aggregation against the previous implementation.
+
+Sums the device records of a node the way the capacity collector does, and
+downsamples an hour of records of a series into 20 buckets the way the
+history APIs do, from models and from dicts. Reports aggregations per second
+and checks that both implementations return the same values.
+
+    python -m benchmarks.stats_aggregation [--records N] [--count N]
+"""
+import argparse
+import random
+import time
+
+from simplyblock_core import utils
+from simplyblock_core.models.stats import DeviceStatObject
+from simplyblock_core.stats_frame import StatsFrame
+
+IO_KEYS = ['date', 'read_bytes', 'read_bytes_ps', 'read_io', 'read_io_ps', 'read_latency_ps',
+           'write_bytes', 'write_bytes_ps', 'write_io', 'write_io_ps', 'write_latency_ps']
+
+
+def legacy_sum_records(records):
+    """utils.sum_records before StatsFrame, folding StatsObject.__add__"""
+    total = records[0]
+    for rec in records[1:]:
+        total += rec
+    return total
+
+
+def legacy_dict_agg(data, mean=False, keys=None):
+    out: dict = {}
+    if not keys and data:
+        keys = data[0].keys()
+    for d in data:
+        for key in keys:
+            if isinstance(d[key], int) or isinstance(d[key], float):
+                if key in out:
+                    out[key] += d[key]
+                else:
+                    out[key] = d[key]
+    if out and mean:
+        count = len(data)
+        if count > 1:
+            for key in out:
+                out[key] = int(out[key] / count)
+    return out
+
+
+def legacy_process_records(records, records_count, keys=None):
+    records_count = min(records_count, len(records))
+    data_per_record = int(len(records) / records_count)
+    new_records = []
+    for i in range(records_count):
+        sl = records[i * data_per_record:min((i + 1) * data_per_record, len(records))]
+        new_records.append(legacy_dict_agg(sl, mean=True, keys=keys))
+    return new_records
+
+
+def sample_records(count):
+    rng = random.Random(0)
+    return [DeviceStatObject({
+        'uuid': 'dev-1', 'cluster_id': 'cluster_1', 'date': 1700000000 + i * 5,
+        'size_total': 2 ** 40, 'size_used': rng.randint(0, 2 ** 40),
+        **{key: rng.randint(0, 10 ** 9) for key in IO_KEYS[1:]}}) for i in range(count)]
+
+
+def rate(func, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=720, help='records of a series, an hour by default')
+    parser.add_argument('--devices', type=int, default=16, help='device records summed per node')
+    parser.add_argument('--count', type=int, default=50)
+    args = parser.parse_args()
+
+    records = sample_records(args.records)
+    dicts = [record.to_dict() for record in records]
+    devices = records[:args.devices]
+
+    summed = [dict(total.get_clean_dict(), uuid=None, id=None) for total in
+              (legacy_sum_records(devices), utils.sum_records(devices))]
+    assert summed[0] == summed[1]
+    assert legacy_process_records(records, 20, IO_KEYS) == utils.process_records(records, 20, IO_KEYS)
+    assert legacy_process_records(dicts, 20) == utils.process_records(dicts, 20)
+
+    results = [
+        ('sum devices', 'before', rate(lambda: legacy_sum_records(devices), args.count * 10)),
+        ('sum devices', 'after', rate(lambda: utils.sum_records(devices), args.count * 10)),
+        ('history', 'before', rate(lambda: legacy_process_records(records, 20, IO_KEYS), args.count)),
+        ('history', 'after', rate(lambda: utils.process_records(records, 20, IO_KEYS), args.count)),
+        ('history dicts', 'before', rate(lambda: legacy_process_records(dicts, 20), args.count)),
+        ('history dicts', 'after', rate(lambda: utils.process_records(dicts, 20), args.count)),
+    ]
+    frame = StatsFrame.from_records(records, IO_KEYS)
+    results.append(('p99', 'after', rate(lambda: frame.percentile(99), args.count)))
+    print(f"{args.records} records per series, {args.devices} devices per node")
+    for operation, variant, per_sec in results:
+        print(f"{operation:<16}{variant:<8}{per_sec:>12,.0f} aggregations/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+# coding=utf-8
+"""Benchmark of the StatsObject block layout against one JSON object per sample.
+
+Simulates the collectors writing a sample per series every 5 seconds for an
+hour and reports the FDB commits, write operations and bytes of both layouts.
+Legacy samples are committed one by one, blocks once per collector cycle. The
+block layout includes maintaining the 1m/1h/1d rollups.
+
+    python -m benchmarks.stats_storage [--series N] [--interval SECONDS]
+"""
+import argparse
+import random
+
+from simplyblock_core.models.base_model import BaseModel, UnitOfWork, transact
+from simplyblock_core.models.stats import DeviceStatObject
+
+
+class _Value:
+    def __init__(self, value):
+        self._value = value
+
+    def present(self):
+        return self._value is not None
+
+    def __bytes__(self):
+        return self._value
+
+
+class _Done:
+    def wait(self):
+        pass
+
+
+class CountingStore:
+    """In-memory key value store counting commits, writes and written bytes"""
+
+    def __init__(self):
+        self.data: dict = {}
+        self.commits = 0
+        self.writes = 0
+        self.bytes_written = 0
+
+    def create_transaction(self):
+        return self
+
+    def __getitem__(self, key):
+        return _Value(self.data.get(key))
+
+    def get_range(self, begin, end, limit=0, reverse=False):
+        items = sorted((k, v) for k, v in self.data.items() if begin <= k < end)
+        if reverse:
+            items.reverse()
+        return items[:limit] if limit else items
+
+    def set(self, key, value):
+        self.writes += 1
+        self.bytes_written += len(key) + len(value)
+        self.data[key] = value
+
+    def commit(self):
+        self.commits += 1
+        return _Done()
+
+    def bytes_stored(self):
+        return sum(len(k) + len(v) for k, v in self.data.items())
+
+
+def samples(series, interval, duration=3600):
+    rng = random.Random(0)
+    state = [{'read_bytes': 0, 'read_io': 0, 'write_bytes': 0, 'write_io': 0} for _ in range(series)]
+    start = 1700000000
+    for date in range(start, start + duration, interval):
+        cycle = []
+        for i, counters in enumerate(state):
+            read_io, write_io = rng.randint(0, 5000) * interval, rng.randint(0, 5000) * interval
+            counters['read_io'] += read_io
+            counters['write_io'] += write_io
+            counters['read_bytes'] += read_io * 4096
+            counters['write_bytes'] += write_io * 4096
+            cycle.append(DeviceStatObject({
+                'cluster_id': 'cluster-0', 'uuid': f'device-{i}', 'date': date,
+                'size_total': 2 ** 41, 'size_used': 2 ** 40 + date - start, 'size_free': 2 ** 40 - date + start,
+                'size_util': 50, 'read_latency_ticks': counters['read_io'] * 120,
+                'write_latency_ticks': counters['write_io'] * 150,
+                'read_io_ps': read_io // interval, 'write_io_ps': write_io // interval,
+                'read_bytes_ps': read_io * 4096 // interval, 'write_bytes_ps': write_io * 4096 // interval,
+                'capacity_dict': {'res': 1, 'npages_nmax': 2 ** 29, 'npages_used': 2 ** 28, 'pba_page_size': 4096},
+                **counters,
+            }))
+        yield cycle
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--series', type=int, default=100)
+    parser.add_argument('--interval', type=int, default=5)
+    args = parser.parse_args()
+
+    legacy, blocks = CountingStore(), CountingStore()
+    for cycle in samples(args.series, args.interval):
+        for record in cycle:
+            transact(legacy, BaseModel._write_op(record))
+        tx = UnitOfWork(blocks)
+        for record in cycle:
+            record.write_to_db(tx)
+        tx.commit()
+
+    print(f"{args.series} series, one sample every {args.interval}s, per hour:")
+    print(f"{'':<8}{'commits':>10}{'writes':>10}{'written':>14}{'keys':>10}{'stored':>14}")
+    for variant, store in [('before', legacy), ('after', blocks)]:
+        print(f"{variant:<8}{store.commits:>10,}{store.writes:>10,}{store.bytes_written:>14,}"
+              f"{len(store.data):>10,}{store.bytes_stored():>14,}")
+
+
+if __name__ == '__main__':
+    main()
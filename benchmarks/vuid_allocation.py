@@ -0,0 +1,139 @@
+# coding=utf-8
+"""Benchmark of the VUID allocation with VUIDAllocator against the previous scan.
+
+Allocates VUIDs for new lvols in a cluster with a given number of lvols, the
+way get_random_vuid did, loading all storage nodes and lvols from the DB and
+drawing random ids until a free one is found, and with the VUIDAllocator
+bitmaps. The objects are kept in an in-memory store. Reports the
+allocations per second and the keys read per allocation.
+
+    python -m benchmarks.vuid_allocation [--lvols N [N ...]] [--count N]
+"""
+import argparse
+import random
+import time
+
+from simplyblock_core import constants
+from simplyblock_core.db_controller import DBController
+from simplyblock_core.models.lvol_model import LVol
+from simplyblock_core.models.storage_node import StorageNode
+from simplyblock_core.vuid_allocator import VUIDAllocator
+
+
+class _Value:
+    def __init__(self, value):
+        self._value = value
+
+    def present(self):
+        return self._value is not None
+
+    def __bytes__(self):
+        return self._value
+
+
+class _Done:
+    def wait(self):
+        pass
+
+
+class CountingStore:
+    """In-memory key value store applying writes immediately, counting the keys read"""
+
+    def __init__(self):
+        self.data: dict = {}
+        self.reads = 0
+
+    def create_transaction(self):
+        return self
+
+    def __getitem__(self, key):
+        self.reads += 1
+        return _Value(self.data.get(key))
+
+    def get_range_startswith(self, prefix, limit=0, reverse=False):
+        items = sorted((k, v) for k, v in self.data.items() if k.startswith(prefix))
+        items = items[:limit] if limit else items
+        self.reads += len(items)
+        return items
+
+    def set(self, key, value):
+        self.data[key] = value
+
+    def clear(self, key):
+        self.data.pop(key, None)
+
+    def add(self, key, param):
+        pass
+
+    def commit(self):
+        return _Done()
+
+
+def legacy_get_random_vuid(db_controller):
+    """utils.get_random_vuid before VUIDAllocator, passing the DB explicitly"""
+    used_vuids = []
+    nodes = db_controller.get_storage_nodes()
+    for node in nodes:
+        for bdev in node.lvstore_stack:
+            type = bdev['type']
+            if type == "bdev_distr":
+                vuid = bdev['params']['vuid']
+            elif type == "bdev_raid" and "jm_vuid" in bdev:
+                vuid = bdev['jm_vuid']
+            else:
+                continue
+            used_vuids.append(vuid)
+
+    for lvol in db_controller.get_lvols():
+        used_vuids.append(lvol.vuid)
+
+    r = 1 + int(random.random() * 10000)
+    while r in used_vuids:
+        r = 1 + int(random.random() * 10000)
+    return r
+
+
+def setup(count):
+    db = DBController()
+    db.kv_store = CountingStore()  # type: ignore[assignment]
+    for n in range(3):
+        StorageNode({'uuid': f'node_{n}', 'lvstore_stack': [
+            {'type': 'bdev_distr', 'params': {'vuid': 9000 + n * 10 + i}} for i in range(4)]}).write_to_db(db.kv_store)
+    vuids = random.Random(0).sample(range(1, constants.VUID_SPACES['lvol'] - 100), count)
+    for i, vuid in enumerate(vuids):
+        LVol({'uuid': f'lvol_{i}', 'node_id': f'node_{i % 3}', 'vuid': vuid}).write_to_db(db.kv_store)
+    return db
+
+
+def rate(func, count):
+    start = time.perf_counter()
+    for i in range(count):
+        func(i)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lvols', type=int, nargs='+', default=[1000, 5000])
+    parser.add_argument('--count', type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'lvols':>6}  {'':<10}{'allocations/s':>15}{'keys/alloc':>13}")
+    for count in args.lvols:
+        db = setup(count)
+        allocator = VUIDAllocator('lvol', lambda: [(lvol.vuid, lvol.get_id()) for lvol in db.get_lvols()])
+        # the first allocation seeds the bitmaps from the lvols
+        allocator.allocate(db.kv_store, 'seed')
+        variants = [
+            ('legacy', lambda i: legacy_get_random_vuid(db)),
+            ('allocator', lambda i: allocator.allocate(db.kv_store, f'new_{i}')),
+        ]
+        for variant, func in variants:
+            reads = db.kv_store.reads
+            per_sec = rate(func, args.count)
+            per_alloc = (db.kv_store.reads - reads) / args.count
+            print(f"{count:>6}  {variant:<10}{per_sec:>15,.0f}{per_alloc:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
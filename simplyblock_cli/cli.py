@@ -325,6 +325,7 @@ class CLIWrapper(CLIWrapperBase):
         self.init_cluster__list_tasks(subparser)
         self.init_cluster__cancel_task(subparser)
         self.init_cluster__get_subtasks(subparser)
+        self.init_cluster__rebalance(subparser)
         self.init_cluster__delete(subparser)
         if self.developer_mode:
             self.init_cluster__set(subparser)
@@ -489,6 +490,11 @@ class CLIWrapper(CLIWrapperBase):
         subcommand = self.add_sub_command(subparser, 'get-subtasks', 'Get rebalancing subtasks list')
         subcommand.add_argument('task_id', help='Task id', type=str)
 
+    def init_cluster__rebalance(self, subparser):
+        subcommand = self.add_sub_command(subparser, 'rebalance', 'Moves volumes off the storage nodes which stay hot in I/O, throughput or capacity')
+        subcommand.add_argument('cluster_id', help='Cluster id', type=str).completer = self._completer_get_cluster_list
+        argument = subcommand.add_argument('--dry-run', help='Only print the planned moves', dest='dry_run', action='store_true')
+
     def init_cluster__delete(self, subparser):
         subcommand = self.add_sub_command(subparser, 'delete', 'Deletes a cluster')
         subcommand.add_argument('cluster_id', help='Cluster id', type=str).completer = self._completer_get_cluster_list
@@ -508,6 +514,7 @@ class CLIWrapper(CLIWrapperBase):
     def init_volume(self):
         subparser = self.add_command('volume', 'Logical volume commands', aliases=['lvol',])
         self.init_volume__add(subparser)
+        self.init_volume__add_bulk(subparser)
         self.init_volume__qos_set(subparser)
         self.init_volume__list(subparser)
         if self.developer_mode:
@@ -518,8 +525,7 @@ class CLIWrapper(CLIWrapperBase):
         self.init_volume__resize(subparser)
         self.init_volume__create_snapshot(subparser)
         self.init_volume__clone(subparser)
-        if self.developer_mode:
-            self.init_volume__move(subparser)
+        self.init_volume__move(subparser)
         self.init_volume__get_capacity(subparser)
         self.init_volume__get_io_stats(subparser)
         self.init_volume__check(subparser)
@@ -551,6 +557,24 @@ class CLIWrapper(CLIWrapperBase):
             argument = subcommand.add_argument('--uid', help='Set logical volume id', type=str, dest='uid')
         argument = subcommand.add_argument('--pvc-name', '--pvc_name', help='Set logical volume PVC name for k8s clients', type=str, dest='pvc_name')
 
+    def init_volume__add_bulk(self, subparser):
+        subcommand = self.add_sub_command(subparser, 'add-bulk', 'Adds many new logical volumes at once')
+        subcommand.add_argument('name', help='Name prefix of the new logical volumes', type=str)
+        subcommand.add_argument('count', help='Number of logical volumes', type=int)
+        subcommand.add_argument('size', help='Logical volume size: 10M, 10G, 10(bytes)', type=size_type())
+        subcommand.add_argument('pool', help='Pool id or name', type=str)
+        argument = subcommand.add_argument('--max-size', help='Logical volume max size', type=size_type(), default='1000T', dest='max_size')
+        argument = subcommand.add_argument('--host-id', help='Primary storage node id or Hostname', type=str, dest='host_id')
+        argument = subcommand.add_argument('--encrypt', help='Use inline data encryption and decryption on the logical volumes', dest='encrypt', action='store_true')
+        argument = subcommand.add_argument('--crypto-key1', help='Hex value of key1 to be used for logical volume encryption', type=str, dest='crypto_key1')
+        argument = subcommand.add_argument('--crypto-key2', help='Hex value of key2 to be used for logical volume encryption', type=str, dest='crypto_key2')
+        argument = subcommand.add_argument('--max-rw-iops', help='Maximum Read Write IO Per Second', type=int, dest='max_rw_iops')
+        argument = subcommand.add_argument('--max-rw-mbytes', help='Maximum Read Write Megabytes Per Second', type=int, dest='max_rw_mbytes')
+        argument = subcommand.add_argument('--max-r-mbytes', help='Maximum Read Megabytes Per Second', type=int, dest='max_r_mbytes')
+        argument = subcommand.add_argument('--max-w-mbytes', help='Maximum Write Megabytes Per Second', type=int, dest='max_w_mbytes')
+        argument = subcommand.add_argument('--ha-type', help='Logical volume HA type (single, ha), default is cluster HA type', type=str, default='default', dest='ha_type', choices=['single','default','ha',])
+        argument = subcommand.add_argument('--lvol-priority-class', help='Logical volume priority class', type=int, default=0, dest='lvol_priority_class')
+
     def init_volume__qos_set(self, subparser):
         subcommand = self.add_sub_command(subparser, 'qos-set', 'Changes QoS settings for an active logical volume')
         subcommand.add_argument('volume_id', help='Logical volume id', type=str)
@@ -603,10 +627,10 @@ class CLIWrapper(CLIWrapperBase):
         argument = subcommand.add_argument('--resize', help='New logical volume size: 10M, 10G, 10(bytes). Can only increase.', type=size_type(), default='0', dest='resize')
 
     def init_volume__move(self, subparser):
-        subcommand = self.add_sub_command(subparser, 'move', 'Moves a full copy of the logical volume between nodes')
+        subcommand = self.add_sub_command(subparser, 'move', 'Moves the logical volume to another node while it stays online')
         subcommand.add_argument('volume_id', help='Logical volume id', type=str)
         subcommand.add_argument('node_id', help='Destination node id', type=str)
-        argument = subcommand.add_argument('--force', help='Force logical volume delete from source node', dest='force', action='store_true')
+        argument = subcommand.add_argument('--force', help='Delete the logical volume from the source node without waiting for the hosts to connect to the destination', dest='force', action='store_true')
 
     def init_volume__get_capacity(self, subparser):
         subcommand = self.add_sub_command(subparser, 'get-capacity', 'Gets a logical volume\'s capacity')
@@ -962,6 +986,8 @@ class CLIWrapper(CLIWrapperBase):
                     ret = self.cluster__cancel_task(sub_command, args)
                 elif sub_command in ['get-subtasks']:
                     ret = self.cluster__get_subtasks(sub_command, args)
+                elif sub_command in ['rebalance']:
+                    ret = self.cluster__rebalance(sub_command, args)
                 elif sub_command in ['delete']:
                     ret = self.cluster__delete(sub_command, args)
                 elif sub_command in ['set']:
@@ -982,6 +1008,8 @@ class CLIWrapper(CLIWrapperBase):
                         args.distr_vuid = None
                         args.uid = None
                     ret = self.volume__add(sub_command, args)
+                elif sub_command in ['add-bulk']:
+                    ret = self.volume__add_bulk(sub_command, args)
                 elif sub_command in ['qos-set']:
                     ret = self.volume__qos_set(sub_command, args)
                 elif sub_command in ['list']:
@@ -1005,11 +1033,7 @@ class CLIWrapper(CLIWrapperBase):
                 elif sub_command in ['clone']:
                     ret = self.volume__clone(sub_command, args)
                 elif sub_command in ['move']:
-                    if not self.developer_mode:
-                        print("This command is private.")
-                        ret = False
-                    else:
-                        ret = self.volume__move(sub_command, args)
+                    ret = self.volume__move(sub_command, args)
                 elif sub_command in ['get-capacity']:
                     ret = self.volume__get_capacity(sub_command, args)
                 elif sub_command in ['get-io-stats']:
@@ -6,17 +6,34 @@ import json
 import re
 import sys
 import time
+from typing import TYPE_CHECKING
+
 import argcomplete
 
-from simplyblock_core import cluster_ops, utils, db_controller
-from simplyblock_core import storage_node_ops as storage_ops
-from simplyblock_core import mgmt_node_ops as mgmt_ops
-from simplyblock_core.controllers import pool_controller, lvol_controller, snapshot_controller, device_controller, \
-    tasks_controller
-from simplyblock_core.controllers import health_controller
+from simplyblock_core import utils
 from simplyblock_core.models.pool import Pool
 from simplyblock_core.models.cluster import Cluster
 
+if TYPE_CHECKING:
+    from simplyblock_core import cluster_ops, db_controller
+    from simplyblock_core import storage_node_ops as storage_ops
+    from simplyblock_core import mgmt_node_ops as mgmt_ops
+    from simplyblock_core.controllers import pool_controller, lvol_controller, snapshot_controller, device_controller, \
+        tasks_controller
+    from simplyblock_core.controllers import health_controller
+else:
+    # imported on first use, a command only loads the operations it runs
+    cluster_ops = utils.lazy_import('simplyblock_core.cluster_ops')
+    db_controller = utils.lazy_import('simplyblock_core.db_controller')
+    storage_ops = utils.lazy_import('simplyblock_core.storage_node_ops')
+    mgmt_ops = utils.lazy_import('simplyblock_core.mgmt_node_ops')
+    pool_controller = utils.lazy_import('simplyblock_core.controllers.pool_controller')
+    lvol_controller = utils.lazy_import('simplyblock_core.controllers.lvol_controller')
+    snapshot_controller = utils.lazy_import('simplyblock_core.controllers.snapshot_controller')
+    device_controller = utils.lazy_import('simplyblock_core.controllers.device_controller')
+    tasks_controller = utils.lazy_import('simplyblock_core.controllers.tasks_controller')
+    health_controller = utils.lazy_import('simplyblock_core.controllers.health_controller')
+
 
 def range_type(min, max):
     def f(arg):
@@ -415,6 +432,12 @@ class CLIWrapperBase:
     def cluster__get_subtasks(self, sub_command, args):
         return tasks_controller.get_subtasks(args.task_id)
 
+    def cluster__rebalance(self, sub_command, args):
+        moves = cluster_ops.rebalance_lvols(args.cluster_id, args.dry_run)
+        if not moves:
+            return "No volumes to move"
+        return utils.print_table(moves)
+
     def cluster__delete(self, sub_command, args):
         cluster_ops.delete_cluster(args.cluster_id)
         return True
@@ -474,6 +497,27 @@ class CLIWrapperBase:
         else:
             return error
 
+    def volume__add_bulk(self, sub_command, args):
+        volumes = [{
+            'name': f"{args.name}-{i}",
+            'size': args.size,
+            'max_size': args.max_size,
+            'host_id_or_name': args.host_id,
+            'ha_type': args.ha_type,
+            'use_crypto': args.encrypt,
+            'crypto_key1': args.crypto_key1,
+            'crypto_key2': args.crypto_key2,
+            'max_rw_iops': args.max_rw_iops,
+            'max_rw_mbytes': args.max_rw_mbytes,
+            'max_r_mbytes': args.max_r_mbytes,
+            'max_w_mbytes': args.max_w_mbytes,
+            'lvol_priority_class': args.lvol_priority_class,
+        } for i in range(1, args.count + 1)]
+        results = lvol_controller.add_lvols_bulk(args.pool, volumes)
+        return utils.print_table([
+            {"Name": volume['name'], "ID": lvol_id or "", "Error": error or ""}
+            for volume, (lvol_id, error) in zip(volumes, results)])
+
     def volume__qos_set(self, sub_command, args):
         return lvol_controller.set_lvol(
             args.volume_id, args.max_rw_iops, args.max_rw_mbytes,
@@ -17,6 +17,7 @@ from docker.errors import DockerException
 from simplyblock_core import utils, scripts, constants, mgmt_node_ops, storage_node_ops
 from simplyblock_core.controllers import cluster_events, device_controller
 from simplyblock_core.db_controller import DBController
+from simplyblock_core.lvol_rebalance import RebalancePlanner
 from simplyblock_core.models.cluster import Cluster
 from simplyblock_core.models.job_schedule import JobSchedule
 from simplyblock_core.models.lvol_model import LVol
@@ -972,7 +973,7 @@ def get_capacity(cluster_id, history, records_count=20) -> t.List[dict]:
     else:
         records_number = 20
 
-    records = db_controller.get_cluster_capacity(cluster, records_number)
+    records = db_controller.get_cluster_capacity(cluster, records_number, records_count)
 
     cap_stats_keys = [
         "date",
@@ -997,7 +998,7 @@ def get_iostats_history(cluster_id, history_string, records_count=20, with_sizes
     else:
         records_number = 20
 
-    records = db_controller.get_cluster_stats(cluster, records_number)
+    records = db_controller.get_cluster_stats(cluster, records_number, records_count)
 
     io_stats_keys = [
         "date",
@@ -1110,6 +1111,29 @@ def get_logs(cluster_id, limit=50, **kwargs) -> t.List[dict]:
     return out
 
 
+def rebalance_lvols(cluster_id, dry_run=False) -> t.List[dict]:
+    """Plans the lvol migrations moving load off the hot nodes and adds their tasks unless `dry_run`"""
+    db_controller = DBController()
+    db_controller.get_cluster_by_id(cluster_id)  # ensure exists
+
+    planner = RebalancePlanner(db_controller, cluster_id)
+    moves = planner.plan()
+    if not dry_run:
+        planner.apply(moves)
+    return [
+        {
+            "LVol": move['lvol_id'],
+            "Name": move['lvol_name'],
+            "From": move['source'],
+            "To": move['target'],
+            "Metric": move['metric'],
+            "Load": utils.humanbytes(move['load']) if move['metric'] in ['throughput', 'capacity'] else move['load'],
+            "Reason": move['reason'],
+        }
+        for move in moves
+    ]
+
+
 def get_cluster(cl_id) -> dict:
     return DBController().get_cluster_by_id(cl_id).get_clean_dict()
 
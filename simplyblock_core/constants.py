@@ -24,6 +24,9 @@ KVD_DB_FILE_PATH = '/etc/foundationdb/fdb.cluster'
 KVD_DB_TIMEOUT_MS = 10000
 SPK_DIR = '/home/ec2-user/spdk'
 RPC_HTTP_PROXY_PORT = 8080
+RPC_POOL_MAXSIZE = 16
+RPC_POOL_EVICT_AFTER_ERRORS = 3
+RPC_BATCH_MAX_CALLS = 64
 LOG_LEVEL = logging.INFO
 LOG_WEB_LEVEL = logging.DEBUG
 LOG_WEB_DEBUG = True if LOG_WEB_LEVEL == logging.DEBUG else False
@@ -37,14 +40,25 @@ LVOL_STAT_COLLECTOR_INTERVAL_SEC = 5
 LVOL_MONITOR_INTERVAL_SEC = 30
 DEV_MONITOR_INTERVAL_SEC = 10
 DEV_STAT_COLLECTOR_INTERVAL_SEC = 5
+DEV_STAT_COLLECTOR_WORKERS = 32
+DEV_STAT_COLLECTOR_DEADLINE_SEC = 4  # per node, from the start of a sampling interval
+STATS_COMMIT_CHUNK = 200  # stats samples written per transaction by the collectors
+STATS_COMMIT_MAX_RETRIES = 5
 PROT_STAT_COLLECTOR_INTERVAL_SEC = 2
 SPDK_STAT_COLLECTOR_INTERVAL_SEC = 30
 DISTR_EVENT_COLLECTOR_INTERVAL_SEC = 2
 DISTR_EVENT_COLLECTOR_NUM_OF_EVENTS = 10
+DISTR_EVENT_COLLECTOR_MAX_EVENTS = 10000  # page size limit, pages grow tenfold from DISTR_EVENT_COLLECTOR_NUM_OF_EVENTS
+DISTR_EVENT_COLLECTOR_MAX_PAGES = 10  # per poll, a node with more events is polled again right away
+DISTR_EVENT_COLLECTOR_WORKERS = 16
+DISTR_EVENT_COALESCE_WINDOW_SEC = 60
 CAP_MONITOR_INTERVAL_SEC = 10
 SSD_VENDOR_WHITE_LIST = ["1d0f:cd01", "1d0f:cd00"]
 CACHED_LVOL_STAT_COLLECTOR_INTERVAL_SEC = 5
 DEV_DISCOVERY_INTERVAL_SEC = 60
+METRICS_REFRESH_INTERVAL_SEC = 10
+METRICS_REACTOR_CACHE_TTL_SEC = 60
+METRICS_FIRST_REFRESH_WAIT_SEC = 30  # only the first scrape of a process waits for the metrics
 
 PMEM_DIR = '/tmp/pmem'
 
@@ -56,24 +70,94 @@ DEVICE_OVERLOAD_CAPACITY_THRESHOLD = 50
 
 CLUSTER_NQN = "nqn.2023-02.io.simplyblock"
 
-weights = {
-    "lvol": 100,
-    # "cpu": 10,
-    # "r_io": 10,
-    # "w_io": 10,
-    # "r_b": 10,
-    # "w_b": 10
+# relative weight of each node metric in the lvol placement score, 0 to ignore it
+LVOL_PLACEMENT_WEIGHTS = {
+    "lvol": 20,
+    "read_io_ps": 15,
+    "write_io_ps": 15,
+    "read_bytes_ps": 10,
+    "write_bytes_ps": 10,
+    "size_util": 15,
+    "cpu_busy": 15,
 }
+LVOL_PLACEMENT_STATS_SAMPLES = 6  # node stats samples averaged, 30s at the collector interval
+LVOL_PLACEMENT_STATS_TTL_SEC = 10  # node stats read once per TTL by the placement
 
 
 HEALTH_CHECK_INTERVAL_SEC = 30
+HEALTH_PROBE_WORKERS = 64
+HEALTH_PROBE_DEADLINE_SEC = 15  # per pass, checks not finished by then count as failed
+HEALTH_PROBE_PING_TIMEOUT_SEC = 3
+HEALTH_PROBE_PING_COUNT = 3
+HEALTH_PROBE_PING_RETRY_SEC = 1  # hosts not replying are pinged once more after this delay
+HEALTH_PROBE_RPC_TIMEOUT_SEC = 5
+HEALTH_PROBE_RPC_RETRY = 2
+HEALTH_PROBE_MAX_AGE_SEC = 30  # probes of the node monitor reused by the health check service
+NODE_STATE_TTL_SEC = 10  # node state views fetched by one monitor and reused by the others
+NODE_STATE_CHUNK_BYTES = 90 * 1024  # FDB values are limited to 100kB
+NODE_STATE_BDEV_LIST_INTERVAL_SEC = 10 * 60  # complete bdev listings, in between bdevs are requested by name
+LVOL_RESTORE_CHUNK_LVOLS = 16  # lvols per RPC batch when restoring the subsystems of a restarted node
+LVOL_RESTORE_WORKERS = 8  # batches in flight per node
+LVOL_RESTORE_RPC_TIMEOUT_SEC = 30
+# ids per VUID space, lvols, clones and the distribs and JMs of the nodes share the lvol space
+VUID_SPACES = {'lvol': 10000, 'snapshot': 1000000}
+LVOL_BULK_CHUNK_LVOLS = 16  # lvols per RPC batch when creating lvols in bulk
+LVOL_BULK_WORKERS = 8  # batches in flight
+LVOL_BULK_MAX_LVOLS = 1000  # lvols per bulk create request
+LVOL_BULK_RPC_TIMEOUT_SEC = 30
+LVOL_MIGRATION_MAX_PASSES = 5  # catch-up copies before the cutover, however much the last one copied
+LVOL_MIGRATION_CUTOVER_CLUSTERS = 64  # a copy this small is followed by the cutover
+LVOL_MIGRATION_CUTOVER_TIMEOUT_SEC = 10  # I/O is paused while the last copy runs, resumed on the source past this
+LVOL_MIGRATION_DRAIN_TIMEOUT_SEC = 60 * 60  # the source is removed once all hosts connected to the target or after this
+LVOL_MIGRATION_CNTLID_OFFSET = 2000  # controller ids of the target subsystems, distinct from those of the source
+LVOL_REBALANCE_INTERVAL_SEC = 5 * 60
+LVOL_REBALANCE_WINDOW = 60  # stats samples a node must be hot for, 5 min at the collector interval
+LVOL_REBALANCE_TRIGGER = 0.3  # a node is hot above the cluster mean by this fraction
+LVOL_REBALANCE_SETTLE = 0.1  # moves stop once the node is within this fraction above the mean
+# loads nodes are not hot below, however far above the mean
+LVOL_REBALANCE_MIN_LOAD = {
+    "iops": 10000,
+    "throughput": 100 * 1024 * 1024,
+    "capacity": 0,
+}
+LVOL_REBALANCE_MAX_MOVES = 2  # lvol migrations running in a cluster at once
+LVOL_REBALANCE_COOLDOWN_SEC = 60 * 60  # a migrated lvol is not moved again before this
+LVOL_REBALANCE_DRY_RUN = get_config_var("LVOL_REBALANCE_DRY_RUN", "true").lower() == "true"
 
 GRAYLOG_CHECK_INTERVAL_SEC = 60
 
 FDB_CHECK_INTERVAL_SEC = 60
 
+# Retention of the stats rollup tiers, raw samples are kept for LOG_DELETION_INTERVAL
+STATS_ROLLUP_RETENTION_SEC = {
+    '1m': 14 * 24 * 60 * 60,
+    '1h': 180 * 24 * 60 * 60,
+    '1d': 5 * 365 * 24 * 60 * 60,
+}
+# Per stats type overrides of the retention of the raw samples ('raw') and the rollup tiers
+STATS_RETENTION_SEC = {
+    'CachedLVolStatObject': {'raw': 24 * 60 * 60, '1m': 24 * 60 * 60},
+}
+EVENT_RETENTION_SEC = 90 * 24 * 60 * 60
+RETENTION_BATCH_KEYS = 1000
+RETENTION_BATCH_BYTES = 1024 * 1024
+RETENTION_ORPHAN_GRACE_SEC = 60 * 60  # stats of deleted objects are reaped once no sample arrived for this long
+
 TASK_EXEC_INTERVAL_SEC = 10
 TASK_EXEC_RETRY_COUNT = 8
+TASK_ARCHIVE_AFTER_SEC = 60*60*24*7  # done tasks older than this are moved to the archive keyspace
+TASK_RETENTION_SEC = 60*60*24*180  # archived tasks older than this are deleted
+TASK_SCHEDULER_MAX_BACKOFF_SEC = 60*5
+TASK_SCHEDULER_RELOAD_INTERVAL_SEC = 60  # in addition to the wakeups on task writes
+TASK_SCHEDULER_TASKS_PER_NODE = 1  # per executor pool
+TASK_SCHEDULER_CLUSTER_POOLS = ('restart',)  # pools running one task per cluster at a time
+TASK_SCHEDULER_WORKERS = {
+    'restart': 4,
+    'migration': 16,
+    'node_add': 1,
+    'port_allow': 4,
+    'lvol_migration': 4,
+}
 
 SIMPLY_BLOCK_SPDK_CORE_IMAGE = "simplyblock/spdk-core:v24.05-tag-latest"
 SIMPLY_BLOCK_DOCKER_IMAGE = get_config_var(
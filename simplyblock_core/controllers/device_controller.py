@@ -440,7 +440,7 @@ def get_device_capacity(device_id, history, records_count=20, parse_sizes=True):
     else:
         records_number = 20
 
-    records = db_controller.get_device_capacity(device, records_number)
+    records = db_controller.get_device_capacity(device, records_number, records_count)
     cap_stats_keys = [
         "date",
         "size_total",
@@ -482,7 +482,7 @@ def get_device_iostats(device_id, history, records_count=20, parse_sizes=True):
     else:
         records_number = 20
 
-    records_list = db_controller.get_device_stats(device, records_number)
+    records_list = db_controller.get_device_stats(device, records_number, records_count)
     io_stats_keys = [
         "date",
         "read_bytes",
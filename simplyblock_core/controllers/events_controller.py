@@ -25,8 +25,8 @@ CAUSED_BY_API = "api"
 CAUSED_BY_MONITOR = "monitor"
 
 
-def log_distr_event(cluster_id, node_id, event_dict):
-
+def new_distr_event(cluster_id, node_id, event_dict):
+    """Returns the EventObj of a distr event, unlike log_distr_event it is not written to the DB"""
     ds = EventObj()
     ds.uuid = str(uuid.uuid4())
     ds.cluster_uuid = cluster_id
@@ -50,12 +50,67 @@ def log_distr_event(cluster_id, node_id, event_dict):
 
     log_event_based_on_level(cluster_id, event_dict['event_type'], DOMAIN_DISTR,
                          event_dict['status'], CAUSED_BY_MONITOR, EventObj.LEVEL_ERROR)
+    return ds
 
+
+def log_distr_event(cluster_id, node_id, event_dict):
+    ds = new_distr_event(cluster_id, node_id, event_dict)
     db_controller = DBController()
     ds.write_to_db(db_controller.kv_store)
     return ds
 
 
+class DistrEventCoalescer:
+    """Coalesces the repeated distr events of a storage node.
+
+    An event with the same (storage_ID or vuid, event_type, status) as one
+    seen within the last `window` seconds is counted on the EventObj of the
+    first one instead of creating a new event.
+    """
+
+    def __init__(self, cluster_id, node_id, window):
+        self.cluster_id = cluster_id
+        self.node_id = node_id
+        self.window = window
+        self._events: dict = {}
+
+    @staticmethod
+    def _key(event_dict):
+        if "storage_ID" in event_dict:
+            sid = ('storage_ID', event_dict['storage_ID'])
+        elif "vuid" in event_dict:
+            sid = ('vuid', event_dict['vuid'])
+        else:
+            return None
+        return (*sid, event_dict['event_type'], event_dict['status'])
+
+    def add(self, event_dict, now=None):
+        """Returns the EventObj of `event_dict` and whether it is new, or (None, False) for unknown events"""
+        key = self._key(event_dict)
+        if key is None:
+            return None, False
+
+        now = time.time() if now is None else now
+        if key in self._events:
+            first_seen, event = self._events[key]
+            if now - first_seen < self.window:
+                event.count += 1
+                return event, False
+
+        event = new_distr_event(self.cluster_id, self.node_id, event_dict)
+        self._events[key] = (now, event)
+        return event, True
+
+    def forget(self, event_dict):
+        """Forgets the event of `event_dict`, so that its next occurrence is new again"""
+        self._events.pop(self._key(event_dict), None)
+
+    def expire(self, now=None):
+        """Forgets the events first seen more than `window` seconds ago"""
+        now = time.time() if now is None else now
+        self._events = {k: v for k, v in self._events.items() if now - v[0] < self.window}
+
+
 def log_event_cluster(cluster_id, domain, event, db_object, caused_by, message,
                       node_id=None, event_level=EventObj.LEVEL_INFO, status=None, storage_id=None):
     """
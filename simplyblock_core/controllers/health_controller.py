@@ -1,17 +1,20 @@
 # coding=utf-8
 import time
+from concurrent.futures import ThreadPoolExecutor, wait
 
 from typing import Any
 from logging import DEBUG, ERROR, INFO
 
 import jc
 
-from simplyblock_core import utils, distr_controller, storage_node_ops
+from simplyblock_core import constants, utils, distr_controller, storage_node_ops
 from simplyblock_core.db_controller import DBController
 from simplyblock_core.fw_api_client import FirewallClient
 from simplyblock_core.models.cluster import Cluster
+from simplyblock_core.models.node_probe import NodeProbe
 from simplyblock_core.models.nvme_device import NVMeDevice, JMDevice
 from simplyblock_core.models.storage_node import StorageNode
+from simplyblock_core.node_state import NodeStateSnapshot
 from simplyblock_core.rpc_client import RPCClient
 from simplyblock_core.snode_client import SNodeClient
 from simplyblock_core.controllers import device_controller
@@ -169,7 +172,136 @@ def _check_node_ping(ip):
     else:
         return False
 
-def _check_node_hublvol(node: StorageNode, node_bdev_names=None, node_lvols_nqns=None):
+
+def _timed(check, *args):
+    try:
+        result = check(*args)
+    except Exception as e:
+        logger.debug(e)
+        result = False
+    return result, time.monotonic()
+
+
+def _ping_hosts(ips):
+    """Pings `ips`, those not replying once more after HEALTH_PROBE_PING_RETRY_SEC"""
+    pings = utils.ping_hosts(ips, constants.HEALTH_PROBE_PING_TIMEOUT_SEC, constants.HEALTH_PROBE_PING_COUNT)
+    failed = [ip for ip in ips if not pings.get(ip)]
+    if failed:
+        time.sleep(constants.HEALTH_PROBE_PING_RETRY_SEC)
+        pings.update(utils.ping_hosts(
+            failed, constants.HEALTH_PROBE_PING_TIMEOUT_SEC, constants.HEALTH_PROBE_PING_COUNT))
+    return pings
+
+
+class NodeProber:
+    """Probes the reachability of storage nodes concurrently.
+
+    The mgmt and data NIC ips of all nodes are pinged at once, see
+    utils.ping_hosts, those not replying once more, while the node API, SPDK process, RPC and firewall port
+    checks of all nodes run in a shared thread pool. Checks not finished
+    `deadline` seconds after the start of a pass count as failed, so an
+    unreachable node delays no other node by more than that.
+
+    Results are stored as NodeProbe objects, `get` reuses those younger than
+    its `max_age`, which shares them between the node monitor and the health
+    check service.
+    """
+
+    def __init__(self, db, workers=constants.HEALTH_PROBE_WORKERS, deadline=constants.HEALTH_PROBE_DEADLINE_SEC):
+        self.db = db
+        self.deadline = deadline
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="probe")
+
+    def get(self, cluster_id, nodes, ports=None, max_age=0):
+        """Returns the probes of `nodes` by node id.
+
+        `ports` maps node ids to the ports to check on the node. Nodes
+        without a stored probe younger than `max_age` seconds which covers
+        their ports are probed, and the new results stored.
+        """
+        ports = ports or {}
+        probes = {}
+        if max_age > 0:
+            now = time.time()
+            for node_id, probe in self.db.get_node_probes(cluster_id).items():
+                if now - probe.date <= max_age and all(str(port) in probe.ports for port in ports.get(node_id, [])):
+                    probes[node_id] = probe
+        stale = [node for node in nodes if node.get_id() not in probes]
+        if stale:
+            fresh = self.probe(stale, ports)
+            try:
+                self.db.write_many(fresh.values())
+            except Exception as e:
+                logger.error(f"Failed to store node probes: {e}")
+            probes.update(fresh)
+        return {node.get_id(): probes[node.get_id()] for node in nodes}
+
+    def probe(self, nodes, ports=None):
+        """Probes `nodes` and returns their NodeProbe by node id"""
+        ports = ports or {}
+        start = time.monotonic()
+        ips = {node.mgmt_ip for node in nodes}
+        ips.update(nic.ip4_address for node in nodes for nic in node.data_nics if nic.ip4_address)
+        ping = self._executor.submit(_timed, _ping_hosts, ips)
+        checks = {}
+        for node in nodes:
+            node_checks = {
+                'api': self._executor.submit(_timed, _check_node_api, node.mgmt_ip),
+                'spdk_process': self._executor.submit(_timed, _check_spdk_process_up, node.mgmt_ip, node.rpc_port),
+                'rpc': self._executor.submit(
+                    _timed, _check_node_rpc, node.mgmt_ip, node.rpc_port, node.rpc_username, node.rpc_password,
+                    constants.HEALTH_PROBE_RPC_TIMEOUT_SEC, constants.HEALTH_PROBE_RPC_RETRY),
+            }
+            for port in ports.get(node.get_id(), []):
+                node_checks[str(port)] = self._executor.submit(_timed, _check_port_on_node, node, port)
+            checks[node.get_id()] = node_checks
+        wait([ping] + [future for node_checks in checks.values() for future in node_checks.values()],
+             timeout=self.deadline)
+
+        def result(future, default):
+            return future.result() if future.done() else (default, start + self.deadline)
+
+        pings, ping_end = result(ping, {})
+        pings = pings or {}
+        now = time.time()
+        probes = {}
+        for node in nodes:
+            results = {name: result(future, False) for name, future in checks[node.get_id()].items()}
+            ends = [ping_end] + [end for _, end in results.values()]
+            probes[node.get_id()] = NodeProbe({
+                'cluster_id': node.cluster_id,
+                'node_id': node.get_id(),
+                'date': now,
+                'duration_ms': int((max(ends) - start) * 1000),
+                'timed_out': not ping.done() or not all(future.done() for future in checks[node.get_id()].values()),
+                'ping': pings.get(node.mgmt_ip, False),
+                'data_nics': {nic.ip4_address: pings.get(nic.ip4_address, False)
+                              for nic in node.data_nics if nic.ip4_address},
+                'api': bool(results.pop('api')[0]),
+                'spdk_process': bool(results.pop('spdk_process')[0]),
+                'rpc': bool(results.pop('rpc')[0]),
+                'ports': {port: bool(ret) for port, (ret, _) in results.items()},
+            })
+
+        elapsed = time.monotonic() - start
+        count = len(ips) + sum(len(node_checks) for node_checks in checks.values())
+        slowest = max(probes.values(), key=lambda probe: probe.duration_ms, default=None)
+        logger.info(f"Probed {len(nodes)} nodes in {elapsed:.2f}s, {count} probes ({count / elapsed:.0f}/s)"
+                    + (f", slowest node {slowest.node_id}: {slowest.duration_ms} ms" if slowest else ""))
+        for probe in probes.values():
+            if probe.timed_out:
+                logger.warning(f"Probes of node {probe.node_id} did not finish within {self.deadline}s")
+        return probes
+
+def _lvstore_info(rpc_client, name, state=None):
+    """Returns the info of lvstore `name` on the node, taken from its NodeState if given"""
+    if state is not None:
+        return state.lvstores.get(name)
+    ret = rpc_client.bdev_lvol_get_lvstores(name)
+    return ret[0] if ret else None
+
+
+def _check_node_hublvol(node: StorageNode, node_bdev_names=None, node_lvols_nqns=None, snapshot=None):
     if not node.hublvol:
         logger.error(f"Node {node.get_id()} does not have a hublvol")
         return False
@@ -182,7 +314,11 @@ def _check_node_hublvol(node: StorageNode, node_bdev_names=None, node_lvols_nqns
         rpc_client = RPCClient(
             node.mgmt_ip, node.rpc_port, node.rpc_username, node.rpc_password, timeout=5, retry=1)
 
-        if not node_bdev_names:
+        state = snapshot.get(node) if snapshot is not None else None
+        if state is not None:
+            node_bdev_names, node_lvols_nqns = state.bdevs, state.subsystems
+
+        if state is None and not node_bdev_names:
             node_bdev_names = {}
             ret = rpc_client.get_bdevs()
             if ret:
@@ -191,7 +327,7 @@ def _check_node_hublvol(node: StorageNode, node_bdev_names=None, node_lvols_nqns
                     for al in b['aliases']:
                         node_bdev_names[al] = b
 
-        if not node_lvols_nqns:
+        if state is None and not node_lvols_nqns:
             node_lvols_nqns = {}
             ret = rpc_client.subsystem_list()
             for sub in ret:
@@ -206,10 +342,9 @@ def _check_node_hublvol(node: StorageNode, node_bdev_names=None, node_lvols_nqns
             logger.error(f"Cluster with id {node.cluster_id} not found")
             return False
 
-        ret = rpc_client.bdev_lvol_get_lvstores(node.lvstore)
-        if ret:
+        lvs_info = _lvstore_info(rpc_client, node.lvstore, state)
+        if lvs_info:
             logger.info(f"Checking lvstore: {node.lvstore} ... ok")
-            lvs_info = ret[0]
             logger.info("lVol store Info:")
             lvs_info_dict = []
             expected: dict[str, Any] = {}
@@ -237,7 +372,7 @@ def _check_node_hublvol(node: StorageNode, node_bdev_names=None, node_lvols_nqns
     return passed
 
 
-def _check_sec_node_hublvol(node: StorageNode, node_bdev=None, node_lvols_nqns=None, auto_fix=False):
+def _check_sec_node_hublvol(node: StorageNode, node_bdev=None, node_lvols_nqns=None, auto_fix=False, snapshot=None):
     db_controller = DBController()
     try:
         primary_node = db_controller.get_storage_node_by_id(node.lvstore_stack_secondary_1)
@@ -256,7 +391,11 @@ def _check_sec_node_hublvol(node: StorageNode, node_bdev=None, node_lvols_nqns=N
         rpc_client = RPCClient(
             node.mgmt_ip, node.rpc_port, node.rpc_username, node.rpc_password, timeout=5, retry=1)
 
-        if not node_bdev:
+        state = snapshot.get(node) if snapshot is not None else None
+        if state is not None:
+            node_bdev, node_lvols_nqns = state.bdevs, state.subsystems
+
+        if state is None and not node_bdev:
             node_bdev = {}
             ret = rpc_client.get_bdevs()
             if ret:
@@ -267,7 +406,7 @@ def _check_sec_node_hublvol(node: StorageNode, node_bdev=None, node_lvols_nqns=N
             else:
                 node_bdev = []
 
-        if not node_lvols_nqns:
+        if state is None and not node_lvols_nqns:
             node_lvols_nqns = {}
             ret = rpc_client.subsystem_list()
             for sub in ret:
@@ -294,10 +433,9 @@ def _check_sec_node_hublvol(node: StorageNode, node_bdev=None, node_lvols_nqns=N
         except KeyError:
             logger.error(f"Cluster with id {node.cluster_id} not found")
             return False
-        ret = rpc_client.bdev_lvol_get_lvstores(primary_node.lvstore)
-        if ret:
+        lvs_info = _lvstore_info(rpc_client, primary_node.lvstore, state)
+        if lvs_info:
             logger.info(f"Checking lvstore: {primary_node.lvstore} ... ok")
-            lvs_info = ret[0]
             logger.info("lVol store Info:")
             lvs_info_dict = []
             expected: dict [str, Any] = {}
@@ -330,7 +468,7 @@ def _check_sec_node_hublvol(node: StorageNode, node_bdev=None, node_lvols_nqns=N
 
 
 def _check_node_lvstore(
-        lvstore_stack, node, auto_fix=False, node_bdev_names=None, stack_src_node=None):
+        lvstore_stack, node, auto_fix=False, node_bdev_names=None, stack_src_node=None, snapshot=None):
     db_controller = DBController()
     lvstore_check = True
     logger.info(f"Checking distr stack on node : {node.get_id()}")
@@ -357,7 +495,10 @@ def _check_node_lvstore(
         if type == "bdev_raid":
             node_distribs_list = bdev["distribs_list"]
 
-    if not node_bdev_names:
+    state = snapshot.get(node) if snapshot is not None else None
+    if state is not None:
+        node_bdev_names = state.bdevs
+    elif not node_bdev_names:
         ret = rpc_client.get_bdevs()
         if ret:
             node_bdev_names = [b['name'] for b in ret]
@@ -426,8 +567,7 @@ def _check_node_lvstore(
             logger.info(f"Checking raid bdev: {raid} ... not found")
             lvstore_check = False
     if bdev_lvstore:
-        ret = rpc_client.bdev_lvol_get_lvstores(bdev_lvstore)
-        if ret:
+        if _lvstore_info(rpc_client, bdev_lvstore, state):
             logger.info(f"Checking lvstore: {bdev_lvstore} ... ok")
         else:
             logger.info(f"Checking lvstore: {bdev_lvstore} ... not found")
@@ -554,17 +694,19 @@ def check_node(node_id, with_devices=True):
         print("*" * 100)
         if snode.lvstore_stack:
             lvstore_stack = snode.lvstore_stack
-            lvstore_check &= _check_node_lvstore(lvstore_stack, snode)
+            snapshot = NodeStateSnapshot(timeout=5, retry=1)
+            lvstore_check &= _check_node_lvstore(lvstore_stack, snode, snapshot=snapshot)
             print("*" * 100)
             if snode.secondary_node_id:
                 second_node_1 = db_controller.get_storage_node_by_id(snode.secondary_node_id)
                 if second_node_1.status == StorageNode.STATUS_ONLINE:
-                    lvstore_check &= _check_node_lvstore(lvstore_stack, second_node_1, stack_src_node=snode)
+                    lvstore_check &= _check_node_lvstore(
+                        lvstore_stack, second_node_1, stack_src_node=snode, snapshot=snapshot)
                     print("*" * 100)
-                lvstore_check &= _check_node_hublvol(snode)
+                lvstore_check &= _check_node_hublvol(snode, snapshot=snapshot)
                 if second_node_1.status == StorageNode.STATUS_ONLINE:
                     print("*" * 100)
-                    lvstore_check &= _check_sec_node_hublvol(second_node_1)
+                    lvstore_check &= _check_sec_node_hublvol(second_node_1, snapshot=snapshot)
 
     return is_node_online and node_devices_check and node_remote_devices_check and lvstore_check
 
@@ -683,7 +825,13 @@ def check_remote_device(device_id, target_node=None):
     return result
 
 
-def check_lvol_on_node(lvol_id, node_id, node_bdev_names=None, node_lvols_nqns=None):
+def lvol_bdev_names(lvol):
+    """Returns the names of the bdevs of `lvol` looked for by the lvol checks"""
+    return [lvol.lvol_uuid if bdev['type'] in ["bdev_lvol", "bdev_lvol_clone"] else bdev['name']
+            for bdev in lvol.bdev_stack]
+
+
+def check_lvol_on_node(lvol_id, node_id, node_bdev_names=None, node_lvols_nqns=None, snapshot=None):
     logger.info(f"Checking lvol on node: {node_id}")
 
     db_controller = DBController()
@@ -698,31 +846,20 @@ def check_lvol_on_node(lvol_id, node_id, node_bdev_names=None, node_lvols_nqns=N
     except KeyError:
         return False
 
-    rpc_client = RPCClient(
-        snode.mgmt_ip, snode.rpc_port,
-        snode.rpc_username, snode.rpc_password, timeout=5, retry=1)
-
-    if not node_bdev_names:
-        node_bdev_names = {}
-        ret = rpc_client.get_bdevs()
-        if ret:
-            for bdev in ret:
-                node_bdev_names[bdev['name']] = bdev
-
-    if not node_lvols_nqns:
-        node_lvols_nqns = {}
-        ret = rpc_client.subsystem_list()
-        if ret:
-            for sub in ret:
-                node_lvols_nqns[sub['nqn']] = sub
+    if snapshot is None:
+        # whatever the caller did not pass is fetched with one request
+        snapshot = NodeStateSnapshot(timeout=5, retry=1)
+        state = snapshot.get(snode, [view for view, given in [
+            ('bdevs', node_bdev_names), ('subsystems', node_lvols_nqns)] if not given])
+        node_bdev_names = node_bdev_names or state.bdevs
+        node_lvols_nqns = node_lvols_nqns or state.subsystems
+    else:
+        state = snapshot.get(snode, bdev_names=lvol_bdev_names(lvol))
+        node_bdev_names, node_lvols_nqns = state.bdevs, state.subsystems
 
     passed = True
     try:
-        for bdev_info in lvol.bdev_stack:
-            bdev_name = bdev_info['name']
-            if bdev_info['type'] in ["bdev_lvol", "bdev_lvol_clone"]:
-                bdev_name = lvol.lvol_uuid
-
+        for bdev_name in lvol_bdev_names(lvol):
             passed &= check_bdev(bdev_name, bdev_names=node_bdev_names)
 
         passed &= check_subsystem(lvol.nqn, nqns=node_lvols_nqns, ns_uuid=lvol.uuid)
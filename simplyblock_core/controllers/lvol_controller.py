@@ -1,16 +1,16 @@
 # coding=utf-8
 import logging as lg
 import json
-import random
 import sys
 import time
 import uuid
 from datetime import datetime
-from typing import List, Tuple
+from typing import Tuple
 
 from simplyblock_core import utils, constants
 from simplyblock_core.controllers import snapshot_controller, pool_controller, lvol_events
 from simplyblock_core.db_controller import DBController
+from simplyblock_core.lvol_placement import LVolPlacement
 from simplyblock_core.models.pool import Pool
 from simplyblock_core.models.lvol_model import LVol
 from simplyblock_core.models.storage_node import StorageNode
@@ -131,105 +131,27 @@ def validate_add_lvol_func(name, size, host_id_or_name, pool_id_or_name,
 
 
 def _get_next_3_nodes(cluster_id, lvol_size=0):
+    """Returns up to 3 online primary nodes to place an lvol on, by their load, see LVolPlacement"""
     db_controller = DBController()
     snodes = db_controller.get_storage_nodes_by_cluster_id(cluster_id)
     online_nodes = []
-    node_stats = {}
+    lvol_counts = {}
     for node in snodes:
         if node.is_secondary_node:  # pass
             continue
 
         if node.status == node.STATUS_ONLINE:
 
-            lvol_count = len(db_controller.get_lvols_by_node_id(node.get_id()))
+            lvol_count = db_controller.get_lvol_count_by_node_id(node.get_id())
             if lvol_count >= node.max_lvol:
                 continue
 
-            # Validate Eligible nodes for adding lvol
-            # snode_api = SNodeClient(node.api_endpoint)
-            # result, _ = snode_api.info()
-            # memory_free = result["memory_details"]["free"]
-            # huge_free = result["memory_details"]["huge_free"]
-            # total_node_capacity = db_controller.get_snode_size(node.get_id())
-            # error = utils.validate_add_lvol_or_snap_on_node(memory_free, huge_free, node.max_lvol, lvol_size,  total_node_capacity, len(node.lvols))
-            # if error:
-            #     logger.warning(error)
-            #     continue
-            #
             online_nodes.append(node)
-            # node_stat_list = db_controller.get_node_stats(node, limit=1000)
-            # combined_record = utils.sum_records(node_stat_list)
-            node_st = {
-                "lvol": lvol_count+1,
-                # "cpu": 1 + (node.cpu * node.cpu_hz),
-                # "r_io": combined_record.read_io_ps,
-                # "w_io": combined_record.write_io_ps,
-                # "r_b": combined_record.read_bytes_ps,
-                # "w_b": combined_record.write_bytes_ps
-            }
-
-            node_stats[node.get_id()] = node_st
+            lvol_counts[node.get_id()] = lvol_count
 
     if len(online_nodes) <= 1:
         return online_nodes
-    cluster_stats = utils.dict_agg([node_stats[k] for k in node_stats])
-
-    nodes_weight = utils.get_weights(node_stats, cluster_stats)
-
-    node_start_end = {}
-    n_start = 0
-    for node_id in nodes_weight:
-        node_start_end[node_id] = {
-            "weight": nodes_weight[node_id]['total'],
-            "start": n_start,
-            "end": n_start + nodes_weight[node_id]['total'],
-        }
-        n_start = node_start_end[node_id]['end']
-
-    for node_id in node_start_end:
-        node_start_end[node_id]['%'] = int(node_start_end[node_id]['weight'] * 100 / n_start)
-
-    ############# log
-    print("Node stats")
-    utils.print_table_dict({**node_stats, "Cluster": cluster_stats})
-    print("Node weights")
-    utils.print_table_dict({**nodes_weight, "weights": {"lvol": n_start, "total": n_start}})
-    print("Node selection range")
-    utils.print_table_dict(node_start_end)
-    #############
-
-    selected_node_ids: List[str] = []
-    while len(selected_node_ids) < min(len(node_stats), 3):
-        r_index = random.randint(0, n_start)
-        print(f"Random is {r_index}/{n_start}")
-        for node_id in node_start_end:
-            if node_start_end[node_id]['start'] <= r_index <= node_start_end[node_id]['end']:
-                if node_id not in selected_node_ids:
-                    selected_node_ids.append(node_id)
-
-                    node_start_end = {}
-                    n_start = 0
-                    for node in nodes_weight:
-                        if node in selected_node_ids:
-                            continue
-                        node_start_end[node] = {
-                            "weight": nodes_weight[node]['total'],
-                            "start": n_start,
-                            "end": n_start + nodes_weight[node]['total'],
-                        }
-                        n_start = node_start_end[node]['end']
-
-                    break
-
-    ret = []
-    if selected_node_ids:
-        for node_id in selected_node_ids:
-            node = db_controller.get_storage_node_by_id(node_id)
-            print(f"Selected node: {node_id}, {node.hostname}")
-            ret.append(node)
-        return ret
-    else:
-        return online_nodes
+    return LVolPlacement(db_controller).select(online_nodes, lvol_counts, 3)
 
 def is_hex(s: str) -> bool:
     """
@@ -262,6 +184,51 @@ def validate_aes_xts_keys(key1: str, key2: str) -> Tuple[bool, str]:
     return True, ""
 
 
+def _get_ha_nodes(host_node, lvs_name):
+    """Returns the (primary, secondary, error) to create an HA lvol of `host_node` on.
+
+    The primary is the leader of the lvstore, the secondary is None if it
+    is not online.
+    """
+    db_controller = DBController()
+    primary_node = None
+    secondary_node = None
+    sec_node = db_controller.get_storage_node_by_id(host_node.secondary_node_id)
+    if host_node.status == StorageNode.STATUS_ONLINE:
+
+        if is_node_leader(host_node, lvs_name):
+            primary_node = host_node
+            if sec_node.status == StorageNode.STATUS_DOWN:
+                return None, None, "Secondary node is in down status, can not create lvol"
+            elif sec_node.status == StorageNode.STATUS_ONLINE:
+                secondary_node = sec_node
+
+        elif sec_node.status == StorageNode.STATUS_ONLINE:
+            if is_node_leader(sec_node, lvs_name):
+                primary_node = sec_node
+                secondary_node = host_node
+            else:
+                # both nodes are non leaders and online, set primary as leader
+                primary_node = host_node
+                secondary_node = sec_node
+
+        else:
+            # sec node is not online, set primary as leader
+            primary_node = host_node
+            secondary_node = None
+
+    elif sec_node.status == StorageNode.STATUS_ONLINE:
+        # primary is not online but secondary is, create on secondary and set leader if needed,
+        secondary_node = None
+        primary_node = sec_node
+
+    else:
+        # both primary and secondary are not online
+        return None, None, "Host nodes are not online"
+
+    return primary_node, secondary_node, None
+
+
 def add_lvol_ha(name, size, host_id_or_name, ha_type, pool_id_or_name, use_comp, use_crypto,
                 distr_vuid, max_rw_iops, max_rw_mbytes, max_r_mbytes, max_w_mbytes,
                 with_snapshot=False, max_size=0, crypto_key1=None, crypto_key2=None, lvol_priority_class=0,
@@ -384,11 +351,6 @@ def add_lvol_ha(name, size, host_id_or_name, ha_type, pool_id_or_name, use_comp,
     elif cl.prov_cap_warn and cl.prov_cap_warn < cluster_size_prov_util:
         logger.warning(f"Cluster provisioned cap warning, util: {cluster_size_prov_util}% of cluster util: {cl.prov_cap_warn}")
 
-    if not distr_vuid:
-        vuid = utils.get_random_vuid()
-    else:
-        vuid = distr_vuid
-
     if max_size > 0:
         if max_size < size:
             return False, f"Max size:{max_size} must be larger than size {size}"
@@ -412,8 +374,6 @@ def add_lvol_ha(name, size, host_id_or_name, ha_type, pool_id_or_name, use_comp,
     lvol.bdev_stack = []
     lvol.uuid = uid or str(uuid.uuid4())
     lvol.guid = utils.generate_hex_string(16)
-    lvol.vuid = vuid
-    lvol.lvol_bdev = f"LVOL_{vuid}"
 
     lvol.crypto_bdev = ''
     lvol.comp_bdev = ''
@@ -443,15 +403,35 @@ def add_lvol_ha(name, size, host_id_or_name, ha_type, pool_id_or_name, use_comp,
     lvol.node_id = host_node.get_id()
     lvol.lvs_name = host_node.lvstore
     lvol.subsys_port = host_node.lvol_subsys_port
-    lvol.top_bdev = f"{lvol.lvs_name}/{lvol.lvol_bdev}"
-    lvol.base_bdev = lvol.top_bdev
 
-    lvol_count = len(db_controller.get_lvols_by_node_id(host_node.get_id()))
+    lvol_count = db_controller.get_lvol_count_by_node_id(host_node.get_id())
     if lvol_count > host_node.max_lvol:
         error = f"Too many lvols on node: {host_node.get_id()}, max lvols reached: {lvol_count}"
         logger.error(error)
         return False, error
 
+    if use_crypto:
+        if crypto_key1 is None or crypto_key2 is None:
+            return False, "encryption keys for lvol not provided"
+        else:
+            success, err = validate_aes_xts_keys(crypto_key1, crypto_key2)
+            if not success:
+                return False, err
+
+    # reserved for the lvol until it is removed, failures past this point remove it
+    if not distr_vuid:
+        vuid = utils.get_random_vuid(lvol.uuid)
+        if not vuid:
+            return False, "No free VUID left"
+    else:
+        vuid = distr_vuid
+        if not utils.vuid_allocator('lvol').reserve(db_controller.kv_store, vuid, lvol.uuid):
+            return False, f"VUID {vuid} is in use or out of range"
+    lvol.vuid = vuid
+    lvol.lvol_bdev = f"LVOL_{vuid}"
+    lvol.top_bdev = f"{lvol.lvs_name}/{lvol.lvol_bdev}"
+    lvol.base_bdev = lvol.top_bdev
+
     lvol_dict: dict = {
         "type": "bdev_lvol",
         "name": lvol.lvol_bdev,
@@ -469,13 +449,6 @@ def add_lvol_ha(name, size, host_id_or_name, ha_type, pool_id_or_name, use_comp,
     lvol.bdev_stack = [lvol_dict]
 
     if use_crypto:
-        if crypto_key1 is None or crypto_key2 is None:
-            return False, "encryption keys for lvol not provided"
-        else:
-            success, err = validate_aes_xts_keys(crypto_key1, crypto_key2)
-            if not success:
-                return False, err
-
         lvol.crypto_bdev = f"crypto_{lvol.lvol_bdev}"
         lvol.bdev_stack.append({
             "type": "crypto",
@@ -512,48 +485,12 @@ def add_lvol_ha(name, size, host_id_or_name, ha_type, pool_id_or_name, use_comp,
 
     if ha_type == "ha":
         lvol.nodes = [host_node.get_id(), host_node.secondary_node_id]
-        primary_node = None
-        secondary_node = None
-        sec_node = db_controller.get_storage_node_by_id(host_node.secondary_node_id)
-        if host_node.status == StorageNode.STATUS_ONLINE:
-
-            if is_node_leader(host_node, lvol.lvs_name):
-                primary_node = host_node
-                if sec_node.status == StorageNode.STATUS_DOWN:
-                    msg = "Secondary node is in down status, can not create lvol"
-                    logger.error(msg)
-                    lvol.remove(db_controller.kv_store)
-                    return False, msg
-                elif sec_node.status == StorageNode.STATUS_ONLINE:
-                    secondary_node = sec_node
-
-            elif sec_node.status == StorageNode.STATUS_ONLINE:
-                if is_node_leader(sec_node, lvol.lvs_name):
-                    primary_node = sec_node
-                    secondary_node = host_node
-                else:
-                    # both nodes are non leaders and online, set primary as leader
-                    primary_node = host_node
-                    secondary_node = sec_node
-
-            else:
-                # sec node is not online, set primary as leader
-                primary_node = host_node
-                secondary_node = None
-
-        elif sec_node.status == StorageNode.STATUS_ONLINE:
-            # primary is not online but secondary is, create on secondary and set leader if needed,
-            secondary_node = None
-            primary_node = sec_node
-
-        else:
-            # both primary and secondary are not online
-            msg = "Host nodes are not online"
+        primary_node, secondary_node, msg = _get_ha_nodes(host_node, lvol.lvs_name)
+        if msg:
             logger.error(msg)
             lvol.remove(db_controller.kv_store)
             return False, msg
 
-
         if primary_node:
             lvol_bdev, error = add_lvol_on_node(lvol, primary_node)
             if error:
@@ -592,54 +529,122 @@ def add_lvol_ha(name, size, host_id_or_name, ha_type, pool_id_or_name, use_comp,
     return lvol.uuid, None
 
 
-def _create_bdev_stack(lvol, snode, is_primary=True):
-    rpc_client = RPCClient(snode.mgmt_ip, snode.rpc_port, snode.rpc_username, snode.rpc_password)
+def add_lvols_bulk(pool_id_or_name, volumes):
+    """Creates many lvols of a pool at once, see LVolBulkCreate.
+
+    `volumes` are dicts of add_lvol_ha parameters, see
+    lvol_bulk.VOLUME_DEFAULTS. Returns an (lvol id or False, error) tuple
+    per volume.
+    """
+    from simplyblock_core.lvol_bulk import LVolBulkCreate
+    return LVolBulkCreate(DBController(), pool_id_or_name, volumes).create()
+
 
-    created_bdevs = []
+def _record_bdev_stack(batch, lvol, is_primary=True):
+    """Records the calls creating the bdev stack of `lvol` in `batch`.
+
+    Returns a (bdev, first call, end call) tuple per bdev, the range of its
+    calls in the batch.
+    """
+    stack = []
     for bdev in lvol.bdev_stack:
         type = bdev['type']
-        name = bdev['name']
         params = bdev['params']
-        ret = None
+        first_call = len(batch.calls)
 
         if type == "bmap_init":
-            ret = rpc_client.ultra21_lvol_bmap_init(**params)
+            batch.ultra21_lvol_bmap_init(**params)
 
         elif type == "ultra_lvol":
-            ret = rpc_client.ultra21_lvol_mount_lvol(**params)
+            batch.ultra21_lvol_mount_lvol(**params)
 
         elif type == "crypto":
-            ret = _create_crypto_lvol(rpc_client, **params)
+            key_name = f"key_{params['name']}"
+            batch.lvol_crypto_key_create(key_name, params['key1'], params['key2'])
+            batch.lvol_crypto_create(params['name'], params['base_name'], key_name)
 
         elif type == "bdev_lvstore":
-            ret = rpc_client.create_lvstore(**params)
+            batch.create_lvstore(**params)
 
         elif type == "bdev_lvol":
             if is_primary:
-                ret = rpc_client.create_lvol(**params)
+                batch.create_lvol(**params)
             else:
-                ret = rpc_client.bdev_lvol_register(
+                batch.bdev_lvol_register(
                     lvol.lvol_bdev, lvol.lvs_name, lvol.lvol_uuid, lvol.blobid, lvol.lvol_priority_class)
 
         elif type == "bdev_lvol_clone":
             if is_primary:
-                ret = rpc_client.lvol_clone(**params)
+                batch.lvol_clone(**params)
             else:
-                ret = rpc_client.bdev_lvol_clone_register(
+                batch.bdev_lvol_clone_register(
                     lvol.lvol_bdev, lvol.snapshot_name, lvol.lvol_uuid, lvol.blobid)
 
         else:
             logger.debug(f"Unknown BDev type: {type}")
             continue
 
-        if ret:
-            bdev['status'] = "created"
-            created_bdevs.append(bdev)
-        else:
+        stack.append((bdev, first_call, len(batch.calls)))
+    return stack
+
+
+def _create_bdev_stacks(rpc_client, lvols, is_primary=True):
+    """Creates the bdev stacks of `lvols`, returns a (created bdevs, error) tuple per lvol.
+
+    Each call of a stack depends on the previous ones, so every round sends the
+    next call of each stack still being created, in one batch. A stack stops at
+    its first failing call and the bdevs created of it are rolled back.
+    """
+    stacks = []
+    for lvol in lvols:
+        recorder = rpc_client.batch()
+        stacks.append((_record_bdev_stack(recorder, lvol, is_primary), recorder.calls))
+
+    # number of calls of each stack which succeeded, until one failed
+    done = [0] * len(stacks)
+    failed = [False] * len(stacks)
+    for call in range(max((len(calls) for _, calls in stacks), default=0)):
+        pending = [i for i, (_, calls) in enumerate(stacks) if not failed[i] and call < len(calls)]
+        if not pending:
+            break
+        batch = rpc_client.batch()
+        batch.calls = [stacks[i][1][call] for i in pending]
+        for i, (ret, _) in zip(pending, batch.send()):
+            if ret:
+                done[i] += 1
+            else:
+                failed[i] = True
+
+    results: list = []
+    for (stack, _), calls_done, stack_failed in zip(stacks, done, failed):
+        created_bdevs = []
+        failed_bdev = None
+        for bdev, first_call, end_call in stack:
+            if end_call <= calls_done:
+                bdev['status'] = "created"
+                created_bdevs.append(bdev)
+                continue
+            failed_bdev = bdev
+            if bdev['type'] == "crypto" and calls_done > first_call:
+                rpc_client.lvol_crypto_key_delete(f"key_{bdev['params']['name']}")
+            break
+
+        if stack_failed and failed_bdev is not None:
             if created_bdevs:
                 # rollback
                 _remove_bdev_stack(created_bdevs[::-1], rpc_client)
-            return False, f"Failed to create BDev: {name}"
+            results.append(([], f"Failed to create BDev: {failed_bdev['name']}"))
+        else:
+            results.append((created_bdevs, None))
+    return results
+
+
+def _create_bdev_stack(lvol, snode, is_primary=True):
+    rpc_client = RPCClient(snode.mgmt_ip, snode.rpc_port, snode.rpc_username, snode.rpc_password)
+
+    _, error = _create_bdev_stacks(rpc_client, [lvol], is_primary)[0]
+    if error:
+        return False, error
 
     return True, None
 
@@ -1429,7 +1434,7 @@ def get_capacity(lvol_uuid, history, records_count=20, parse_sizes=True):
     else:
         records_number = 20
 
-    records_list = db_controller.get_lvol_stats(lvol, limit=records_number)
+    records_list = db_controller.get_lvol_stats(lvol, limit=records_number, records_count=records_count)
     cap_stats_keys = [
         "date",
         "size_total",
@@ -1472,7 +1477,7 @@ def get_io_stats(lvol_uuid, history, records_count=20, parse_sizes=True, with_si
     else:
         records_number = 20
 
-    records_list = db_controller.get_lvol_stats(lvol, limit=records_number)
+    records_list = db_controller.get_lvol_stats(lvol, limit=records_number, records_count=records_count)
     io_stats_keys = [
         "date",
         "read_bytes",
@@ -1531,100 +1536,34 @@ def get_io_stats(lvol_uuid, history, records_count=20, parse_sizes=True, with_si
     return out
 
 
-def migrate(lvol_id, node_id):
-
-    # lvol = db_controller.get_lvol_by_id(lvol_id)
-    # if not lvol:
-    #     logger.error(f"lvol not found: {lvol_id}")
-    #     return False
-    #
-    # old_node_id = lvol.node_id
-    # old_node = db_controller.get_storage_node_by_id(old_node_id)
-    # nodes = _get_next_3_nodes(old_node.cluster_id)
-    # if not nodes:
-    #     logger.error(f"No nodes found with enough resources to create the LVol")
-    #     return False
-    #
-    # if node_id:
-    #     nodes[0] = db_controller.get_storage_node_by_id(node_id)
-    #
-    # host_node = nodes[0]
-    # lvol.hostname = host_node.hostname
-    # lvol.node_id = host_node.get_id()
-    #
-    # if lvol.ha_type == 'single':
-    #     ret = add_lvol_on_node(lvol, host_node)
-    #     if not ret:
-    #         return ret
-    #
-    # elif lvol.ha_type == "ha":
-    #     three_nodes = nodes[:3]
-    #     nodes_ids = []
-    #     nodes_ips = []
-    #     for node in three_nodes:
-    #         nodes_ids.append(node.get_id())
-    #         port = 10000 + int(random.random() * 60000)
-    #         nodes_ips.append(f"{node.mgmt_ip}:{port}")
-    #
-    #     ha_address = ",".join(nodes_ips)
-    #     for index, node in enumerate(three_nodes):
-    #         ret = add_lvol_on_node(lvol, node, ha_address)
-    #         if not ret:
-    #             return ret
-    #     lvol.nodes = nodes_ids
-    #
-    # # host_node.lvols.append(lvol.uuid)
-    # # host_node.write_to_db(db_controller.kv_store)
-    # lvol.write_to_db(db_controller.kv_store)
-    #
-    # lvol_events.lvol_migrate(lvol, old_node_id, lvol.node_id)
-
-    return True
+def move(lvol_id, node_id, force=False):
+    """Adds a task migrating the lvol to the lvstore of the node while it stays online, see LVolMigration.
 
+    The source is removed once all hosts connected to the target, with
+    `force` right after the cutover. Returns the task id.
+    """
+    from simplyblock_core.controllers import tasks_controller
+    from simplyblock_core.lvol_migration import check_migration
 
-def move(lvol_id, node_id, force=False):
     db_controller = DBController()
     try:
         lvol = db_controller.get_lvol_by_id(lvol_id)
+        target_node = db_controller.get_storage_node_by_id(node_id)
     except KeyError as e:
         logger.error(e)
         return False
 
-    target_node = db_controller.get_storage_node_by_id(node_id)
-    if not target_node:
-        logger.error(f"Node not found: {target_node}")
-        return False
-
-    if lvol.node_id == target_node.get_id():
-        return True
-
-    if target_node.status != StorageNode.STATUS_ONLINE:
-        logger.error(f"Node is not online!: {target_node}, status: {target_node.status}")
+    error = check_migration(db_controller, lvol, target_node)
+    if error:
+        logger.error(error)
         return False
 
-    src_node = db_controller.get_storage_node_by_id(lvol.node_id)
-
-    if src_node.status == StorageNode.STATUS_ONLINE:
-        if not force:
-            logger.error(f"Node is online!: {src_node.get_id()}, use --force to force move")
-            return False
-
-    if migrate(lvol_id, node_id):
-        if src_node.status == StorageNode.STATUS_ONLINE:
-            # delete lvol
-            if lvol.ha_type == 'single':
-                delete_lvol_from_node(lvol_id, lvol.node_id, clear_data=False)
-            elif lvol.ha_type == "ha":
-                for nodes_id in lvol.nodes:
-                    delete_lvol_from_node(lvol_id, nodes_id, clear_data=False)
-
-            # remove from storage node
-            # src_node.lvols.remove(lvol_id)
-            # src_node.write_to_db(db_controller.kv_store)
-        return True
-    else:
-        logger.error("Failed to migrate lvol")
+    task_id = tasks_controller.add_lvol_mig_task(lvol, target_node.get_id(), force)
+    if not task_id:
+        logger.error(f"LVol is being migrated already: {lvol_id}")
         return False
+    logger.info(f"Added lvol migration task: {task_id}")
+    return task_id
 
 
 def inflate_lvol(lvol_id):
@@ -289,7 +289,7 @@ def get_io_stats(pool_id, history, records_count=20):
     else:
         records_number = 20
 
-    out = db_controller.get_pool_stats(pool, records_number)
+    out = db_controller.get_pool_stats(pool, records_number, records_count)
     new_records = utils.process_records(out, records_count)
 
     return utils.print_table([
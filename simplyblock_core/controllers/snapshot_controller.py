@@ -19,6 +19,10 @@ logger = lg.getLogger()
 db_controller = DBController()
 
 
+def _release_vuid(snap_id):
+    utils.vuid_allocator('snapshot').release(db_controller.kv_store, snap_id)
+
+
 def add(lvol_id, snapshot_name):
     try:
         lvol = db_controller.get_lvol_by_id(lvol_id)
@@ -81,7 +85,10 @@ def add(lvol_id, snapshot_name):
     if cluster.status not in [cluster.STATUS_ACTIVE, cluster.STATUS_DEGRADED]:
         return False, f"Cluster is not active, status: {cluster.status}"
 
-    snap_vuid = utils.get_random_snapshot_vuid()
+    snap_id = str(uuid.uuid4())
+    snap_vuid = utils.get_random_snapshot_vuid(snap_id)
+    if not snap_vuid:
+        return False, "No free snapshot VUID left"
     snap_bdev_name = f"SNAP_{snap_vuid}"
     size = lvol.size
     blobid = 0
@@ -94,6 +101,7 @@ def add(lvol_id, snapshot_name):
             logger.info("Creating Snapshot bdev")
             ret = rpc_client.lvol_create_snapshot(f"{lvol.lvs_name}/{lvol.lvol_bdev}", snap_bdev_name)
             if not ret:
+                _release_vuid(snap_id)
                 return False, f"Failed to create snapshot on node: {snode.get_id()}"
 
             snap_bdev = rpc_client.get_bdevs(f"{lvol.lvs_name}/{snap_bdev_name}")
@@ -106,6 +114,7 @@ def add(lvol_id, snapshot_name):
         else:
             msg = f"Host node is not online {snode.get_id()}"
             logger.error(msg)
+            _release_vuid(snap_id)
             return False, msg
 
     if lvol.ha_type == "ha":
@@ -122,6 +131,7 @@ def add(lvol_id, snapshot_name):
                     msg = "Secondary node is in down status, can not create snapshot"
                     logger.error(msg)
                     lvol.remove(db_controller.kv_store)
+                    _release_vuid(snap_id)
                     return False, msg
                 elif sec_node.status == StorageNode.STATUS_ONLINE:
                     secondary_node = sec_node
@@ -149,6 +159,7 @@ def add(lvol_id, snapshot_name):
             # both primary and secondary are not online
             msg = "Host nodes are not online"
             logger.error(msg)
+            _release_vuid(snap_id)
             return False, msg
 
         if primary_node:
@@ -158,6 +169,7 @@ def add(lvol_id, snapshot_name):
             logger.info("Creating Snapshot bdev")
             ret = rpc_client.lvol_create_snapshot(f"{lvol.lvs_name}/{lvol.lvol_bdev}", snap_bdev_name)
             if not ret:
+                _release_vuid(snap_id)
                 return False, f"Failed to create snapshot on node: {snode.get_id()}"
 
             snap_bdev = rpc_client.get_bdevs(f"{lvol.lvs_name}/{snap_bdev_name}")
@@ -168,6 +180,7 @@ def add(lvol_id, snapshot_name):
                 num_allocated_clusters = snap_bdev[0]["driver_specific"]["lvol"]["num_allocated_clusters"]
                 used_size = int(num_allocated_clusters*cluster_size)
             else:
+                _release_vuid(snap_id)
                 return False, f"Failed to create snapshot on node: {snode.get_id()}"
 
 
@@ -186,10 +199,11 @@ def add(lvol_id, snapshot_name):
                 ret = rpc_client.delete_lvol(f"{lvol.lvs_name}/{snap_bdev_name}")
                 if not ret:
                     logger.error(f"Failed to delete snap from node: {snode.get_id()}")
+                _release_vuid(snap_id)
                 return False, msg
 
     snap = SnapShot()
-    snap.uuid = str(uuid.uuid4())
+    snap.uuid = snap_id
     snap.snap_uuid = snap_uuid
     snap.size = size
     snap.used_size = used_size
@@ -429,13 +443,29 @@ def clone(snapshot_id, clone_name, new_size=0, pvc_name=None, pvc_namespace=None
             logger.error(msg)
             return False, msg
 
+    if new_size:
+        if snap.lvol.size >= new_size:
+            msg = f"New size {new_size} must be higher than the original size {snap.lvol.size}"
+            logger.error(msg)
+            return False, msg
+
+        if snap.lvol.max_size < new_size:
+            msg = f"New size {new_size} must be smaller than the max size {snap.lvol.max_size}"
+            logger.error(msg)
+            return False, msg
+
     lvol = LVol()
     lvol.uuid = str(uuid.uuid4())
+    clone_vuid = utils.get_random_vuid(lvol.uuid)
+    if not clone_vuid:
+        return False, "No free VUID left"
+    # the clone shares the distrib VUID of the snapshot's lvol
+    utils.vuid_allocator('lvol').reserve(db_controller.kv_store, snap.lvol.vuid, lvol.uuid, shared=True)
     lvol.lvol_name = clone_name
     lvol.size = snap.lvol.size
     lvol.max_size = snap.lvol.max_size
     lvol.base_bdev = snap.lvol.base_bdev
-    lvol.lvol_bdev = f"CLN_{utils.get_random_vuid()}"
+    lvol.lvol_bdev = f"CLN_{clone_vuid}"
     lvol.lvs_name = snap.lvol.lvs_name
     lvol.top_bdev = f"{lvol.lvs_name}/{lvol.lvol_bdev}"
     lvol.hostname = snode.hostname
@@ -487,15 +517,6 @@ def clone(snapshot_id, clone_name, new_size=0, pvc_name=None, pvc_namespace=None
         lvol.crypto_key2 = snap.lvol.crypto_key2
 
     if new_size:
-        if snap.lvol.size >= new_size:
-            msg = f"New size {new_size} must be higher than the original size {snap.lvol.size}"
-            logger.error(msg)
-            return False, msg
-
-        if snap.lvol.max_size < new_size:
-            msg = f"New size {new_size} must be smaller than the max size {snap.lvol.max_size}"
-            logger.error(msg)
-            return False, msg
         lvol.size = new_size
 
     lvol.write_to_db(db_controller.kv_store)
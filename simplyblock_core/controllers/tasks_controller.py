@@ -16,50 +16,55 @@ db = db_controller.DBController()
 
 
 def _validate_new_task_dev_restart(cluster_id, node_id, device_id):
-    tasks = db.get_job_tasks(cluster_id)
+    tasks = db.get_active_job_tasks(cluster_id, JobSchedule.FN_DEV_RESTART, device_id=device_id) + \
+        db.get_active_job_tasks(cluster_id, JobSchedule.FN_NODE_RESTART, node_id)
     for task in tasks:
-        if task.function_name == JobSchedule.FN_DEV_RESTART and task.device_id == device_id and task.canceled is False:
-            if task.status != JobSchedule.STATUS_DONE:
-                logger.info(f"Task found, skip adding new task: {task.get_id()}")
-                return False
-        elif task.function_name == JobSchedule.FN_NODE_RESTART and task.node_id == node_id and task.canceled is False:
-            if task.status != JobSchedule.STATUS_DONE:
-                logger.info(f"Task found, skip adding new task: {task.get_id()}")
-                return False
+        if task.canceled is False:
+            logger.info(f"Task found, skip adding new task: {task.get_id()}")
+            return False
     return True
 
 
 def _validate_new_task_node_restart(cluster_id, node_id):
-    tasks = db.get_job_tasks(cluster_id)
-    for task in tasks:
-        if task.function_name == JobSchedule.FN_NODE_RESTART and task.node_id == node_id:
-            if task.status != JobSchedule.STATUS_DONE and task.canceled is False:
-                return task.get_id()
+    for task in db.get_active_job_tasks(cluster_id, JobSchedule.FN_NODE_RESTART, node_id):
+        if task.canceled is False:
+            return task.get_id()
     return False
 
 
 def _add_task(function_name, cluster_id, node_id, device_id,
               max_retry=constants.TASK_EXEC_RETRY_COUNT, function_params=None, send_to_cluster_log=True):
+    task_obj = _new_task(function_name, cluster_id, node_id, device_id, max_retry, function_params)
+    if not task_obj:
+        return False
+    task_obj.write_to_db(db.kv_store)
+    if send_to_cluster_log:
+        tasks_events.task_create(task_obj)
+    return task_obj.uuid
+
+
+def _new_task(function_name, cluster_id, node_id, device_id,
+              max_retry=constants.TASK_EXEC_RETRY_COUNT, function_params=None):
 
     if function_name in [JobSchedule.FN_DEV_RESTART, JobSchedule.FN_FAILED_DEV_MIG]:
         if not _validate_new_task_dev_restart(cluster_id, node_id, device_id):
-            return False
+            return None
 
     if function_name == JobSchedule.FN_NODE_RESTART:
         task_id = _validate_new_task_node_restart(cluster_id, node_id)
         if task_id:
             logger.info(f"Task found, skip adding new task: {task_id}")
-            return False
+            return None
     elif function_name == JobSchedule.FN_NEW_DEV_MIG:
         task_id = get_new_device_mig_task(cluster_id, node_id, function_params['distr_name'])
         if task_id:
             logger.info(f"Task found, skip adding new task: {task_id}")
-            return False
+            return None
     elif function_name == JobSchedule.FN_DEV_MIG:
         task_id = get_device_mig_task(cluster_id, node_id, device_id, function_params['distr_name'])
         if task_id:
             logger.info(f"Task found, skip adding new task: {task_id}")
-            return False
+            return None
 
     task_obj = JobSchedule()
     task_obj.uuid = str(uuid.uuid4())
@@ -72,43 +77,42 @@ def _add_task(function_name, cluster_id, node_id, device_id,
         task_obj.function_params = function_params
     task_obj.max_retry = max_retry
     task_obj.status = JobSchedule.STATUS_NEW
-    task_obj.write_to_db(db.kv_store)
-    if send_to_cluster_log:
-        tasks_events.task_create(task_obj)
-    return task_obj.uuid
+    return task_obj
 
 
 def add_device_mig_task(device_id):
     device = db.get_storage_device_by_id(device_id)
-    tasks = db.get_job_tasks(device.cluster_id)
-    for task in tasks:
-        if task.function_name == JobSchedule.FN_BALANCING_AFTER_NODE_RESTART :
-            if task.status != JobSchedule.STATUS_DONE and task.canceled is False:
-                logger.info(f"Task found, skip adding new task: {task.get_id()}")
-                return False
+    for task in db.get_active_job_tasks(device.cluster_id, JobSchedule.FN_BALANCING_AFTER_NODE_RESTART):
+        if task.canceled is False:
+            logger.info(f"Task found, skip adding new task: {task.get_id()}")
+            return False
 
+    # sub tasks and their parent are committed together, runners never see a partial set
     sub_tasks = []
-    for node in db.get_storage_nodes_by_cluster_id(device.cluster_id):
-        if node.status == StorageNode.STATUS_REMOVED:
-            continue
+    with db.transaction() as tx:
+        for node in db.get_storage_nodes_by_cluster_id(device.cluster_id):
+            if node.status == StorageNode.STATUS_REMOVED:
+                continue
+
+            for bdev in node.lvstore_stack:
+                if bdev['type'] == "bdev_distr":
+                    sub_task = _new_task(JobSchedule.FN_DEV_MIG, device.cluster_id, node.get_id(), device.get_id(),
+                                         max_retry=-1, function_params={'distr_name': bdev['name']})
+                    if sub_task:
+                        sub_task.write_to_db(tx)
+                        sub_tasks.append(sub_task.uuid)
+        if sub_tasks:
+            task_obj = JobSchedule()
+            task_obj.uuid = str(uuid.uuid4())
+            task_obj.cluster_id = device.cluster_id
+            task_obj.date = int(time.time())
+            task_obj.function_name = JobSchedule.FN_BALANCING_AFTER_NODE_RESTART
+            task_obj.sub_tasks = sub_tasks
+            task_obj.status = JobSchedule.STATUS_NEW
+            task_obj.write_to_db(tx)
 
-        for bdev in node.lvstore_stack:
-            if bdev['type'] == "bdev_distr":
-                task_id = _add_task(JobSchedule.FN_DEV_MIG, device.cluster_id, node.get_id(), device.get_id(),
-                          max_retry=-1, function_params={'distr_name': bdev['name']}, send_to_cluster_log=False)
-                if task_id:
-                    sub_tasks.append(task_id)
     if sub_tasks:
-        task_obj = JobSchedule()
-        task_obj.uuid = str(uuid.uuid4())
-        task_obj.cluster_id = device.cluster_id
-        task_obj.date = int(time.time())
-        task_obj.function_name = JobSchedule.FN_BALANCING_AFTER_NODE_RESTART
-        task_obj.sub_tasks = sub_tasks
-        task_obj.status = JobSchedule.STATUS_NEW
-        task_obj.write_to_db(db.kv_store)
         tasks_events.task_create(task_obj)
-
         return True
 
 
@@ -233,34 +237,30 @@ def get_subtasks(master_task_id):
 
 
 def get_active_node_restart_task(cluster_id, node_id):
-    tasks = db.get_job_tasks(cluster_id)
-    for task in tasks:
-        if task.function_name == JobSchedule.FN_NODE_RESTART and task.node_id == node_id:
-            if task.status != JobSchedule.STATUS_DONE and task.canceled is False:
-                return task.uuid
+    for task in db.get_active_job_tasks(cluster_id, JobSchedule.FN_NODE_RESTART, node_id):
+        if task.canceled is False:
+            return task.uuid
     return False
 
 
 def get_active_dev_restart_task(cluster_id, device_id):
-    tasks = db.get_job_tasks(cluster_id)
-    for task in tasks:
-        if task.function_name == JobSchedule.FN_DEV_RESTART and task.device_id == device_id:
-            if task.status == JobSchedule.STATUS_RUNNING and task.canceled is False:
-                return task.uuid
+    for task in db.get_active_job_tasks(cluster_id, JobSchedule.FN_DEV_RESTART, device_id=device_id):
+        if task.status == JobSchedule.STATUS_RUNNING and task.canceled is False:
+            return task.uuid
     return False
 
 
 def get_active_node_mig_task(cluster_id, node_id, distr_name=None):
-    tasks = db.get_job_tasks(cluster_id)
+    tasks = []
+    for function_name in [JobSchedule.FN_FAILED_DEV_MIG, JobSchedule.FN_DEV_MIG, JobSchedule.FN_NEW_DEV_MIG]:
+        tasks += db.get_active_job_tasks(cluster_id, function_name, node_id)
     for task in tasks:
-        if task.function_name in [JobSchedule.FN_FAILED_DEV_MIG, JobSchedule.FN_DEV_MIG,
-                                  JobSchedule.FN_NEW_DEV_MIG] and task.node_id == node_id:
-            if task.status == JobSchedule.STATUS_RUNNING and task.canceled is False:
-                if distr_name:
-                    if "distr_name" in task.function_params and task.function_params["distr_name"] == distr_name:
-                        return task.uuid
-                else:
+        if task.status == JobSchedule.STATUS_RUNNING and task.canceled is False:
+            if distr_name:
+                if "distr_name" in task.function_params and task.function_params["distr_name"] == distr_name:
                     return task.uuid
+            else:
+                return task.uuid
     return False
 
 
@@ -293,55 +293,60 @@ def add_node_add_task(cluster_id, function_params):
 
 
 def get_active_node_tasks(cluster_id, node_id):
-    tasks = db.get_job_tasks(cluster_id)
     out = []
-    for task in tasks:
-        if task.node_id == node_id:
-            if task.status != JobSchedule.STATUS_DONE and task.canceled is False:
-                out.append(task)
+    for task in db.get_active_job_tasks(cluster_id):
+        if task.node_id == node_id and task.canceled is False:
+            out.append(task)
     return out
 
 
 def get_new_device_mig_task(cluster_id, node_id, distr_name, dev_id=None):
-    tasks = db.get_job_tasks(cluster_id)
-    for task in tasks:
-        if task.function_name == JobSchedule.FN_NEW_DEV_MIG and task.node_id == node_id:
-            if dev_id:
-                if task.device_id != dev_id:
-                    continue
-            if task.status != JobSchedule.STATUS_DONE and task.canceled is False \
-                    and "distr_name" in task.function_params and task.function_params["distr_name"] == distr_name:
-                return task.uuid
+    for task in db.get_active_job_tasks(cluster_id, JobSchedule.FN_NEW_DEV_MIG, node_id, dev_id):
+        if task.canceled is False \
+                and "distr_name" in task.function_params and task.function_params["distr_name"] == distr_name:
+            return task.uuid
     return False
 
 
 def get_device_mig_task(cluster_id, node_id, device_id, distr_name):
-    tasks = db.get_job_tasks(cluster_id)
-    for task in tasks:
-        if task.function_name == JobSchedule.FN_DEV_MIG and task.node_id == node_id and task.device_id == device_id:
-            if task.status != JobSchedule.STATUS_DONE and task.canceled is False \
-                    and "distr_name" in task.function_params and task.function_params["distr_name"] == distr_name:
-                return task.uuid
+    for task in db.get_active_job_tasks(cluster_id, JobSchedule.FN_DEV_MIG, node_id, device_id):
+        if task.canceled is False \
+                and "distr_name" in task.function_params and task.function_params["distr_name"] == distr_name:
+            return task.uuid
     return False
 
 
 def get_new_device_mig_task_for_device(cluster_id):
-    tasks = db.get_job_tasks(cluster_id)
-    for task in tasks:
-        if task.function_name == JobSchedule.FN_NEW_DEV_MIG:
-            if task.status != JobSchedule.STATUS_DONE and task.canceled is False:
-                return task.uuid
+    for task in db.get_active_job_tasks(cluster_id, JobSchedule.FN_NEW_DEV_MIG):
+        if task.canceled is False:
+            return task.uuid
     return False
 
 
 def get_failed_device_mig_task(cluster_id, device_id):
-    tasks = db.get_job_tasks(cluster_id)
-    for task in tasks:
-        if task.function_name == JobSchedule.FN_FAILED_DEV_MIG and task.device_id == device_id:
-            if task.status != JobSchedule.STATUS_DONE and task.canceled is False:
-                return task.uuid
+    for task in db.get_active_job_tasks(cluster_id, JobSchedule.FN_FAILED_DEV_MIG, device_id=device_id):
+        if task.canceled is False:
+            return task.uuid
     return False
 
 
 def add_port_allow_task(cluster_id, node_id, port_number):
     return _add_task(JobSchedule.FN_PORT_ALLOW, cluster_id, node_id, "", function_params={"port_number": port_number})
+
+
+def get_lvol_mig_task(cluster_id, lvol_id):
+    for task in db.get_active_job_tasks(cluster_id, JobSchedule.FN_LVOL_MIG):
+        if task.canceled is False and task.function_params.get("lvol_id") == lvol_id:
+            return task.uuid
+    return False
+
+
+def add_lvol_mig_task(lvol, target_node_id, force=False):
+    """Adds a task migrating `lvol` to the lvstore of `target_node_id`, one per source node runs at a time"""
+    node = db.get_storage_node_by_id(lvol.node_id)
+    task_id = get_lvol_mig_task(node.cluster_id, lvol.get_id())
+    if task_id:
+        logger.info(f"Task found, skip adding new task: {task_id}")
+        return False
+    return _add_task(JobSchedule.FN_LVOL_MIG, node.cluster_id, node.get_id(), "", function_params={
+        "lvol_id": lvol.get_id(), "target_node_id": target_node_id, "force": force})
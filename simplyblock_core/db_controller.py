@@ -1,15 +1,19 @@
 # coding=utf-8
+import copy
 import os.path
+import threading
 
 import fdb
-from typing import List
+from typing import Callable, Dict, List, Optional
 
 from simplyblock_core import constants
+from simplyblock_core.models.base_model import BaseModel, UnitOfWork, json_loads, transact
 from simplyblock_core.models.cluster import Cluster
 from simplyblock_core.models.events import EventObj
 from simplyblock_core.models.job_schedule import JobSchedule
 from simplyblock_core.models.lvol_model import LVol
 from simplyblock_core.models.mgmt_node import MgmtNode
+from simplyblock_core.models.node_probe import NodeProbe
 from simplyblock_core.models.nvme_device import NVMeDevice, JMDevice
 from simplyblock_core.models.pool import Pool
 from simplyblock_core.models.port_stat import PortStat
@@ -33,9 +37,77 @@ class Singleton(type):
 
 
 
+class ObjectCache:
+    """In-process read-through cache of decoded model objects.
+
+    Holds all objects of a (versioned) model type, keyed by DB id. An entry
+    is served without touching FDB as long as the watch on the type's
+    version key has not fired and this process has not written objects of
+    that type itself. Callers receive copies, so mutating a returned object
+    never leaks into the cache.
+    """
+
+    def __init__(self, kv_store):
+        self._kv_store = kv_store
+        self._entries: dict = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, model: BaseModel, predicate: Callable) -> list:
+        with self._lock:
+            objects = self._objects(model)
+        return [copy.deepcopy(obj) for obj in objects.values() if predicate(obj)]
+
+    def _objects(self, model):
+        entry = self._entries.get(model.name)
+        local_writes = BaseModel._local_writes[model.name]
+        if entry is not None and entry['local_writes'] == local_writes:
+            if not entry['watch'].is_ready():
+                self.hits += 1
+                return entry['objects']
+
+            # Watches also complete on errors and timeouts, only the version tells about changes
+            version, entry['watch'] = self._kv_store.get_and_watch(model.get_version_key())
+            if entry['version'] == version:
+                self.hits += 1
+                return entry['objects']
+
+        if entry is not None:
+            self.invalidations += 1
+        self.misses += 1
+        version, watch = self._kv_store.get_and_watch(model.get_version_key())
+        objects = {
+            k.decode(): model.__class__().from_dict(json_loads(v))
+            for k, v in self._kv_store.get_range_startswith(model.get_db_id().encode())
+        }
+        self._entries[model.name] = {
+            'version': version,
+            'watch': watch,
+            'local_writes': local_writes,
+            'objects': objects,
+        }
+        return objects
+
+    def get_stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'entries': sum(len(entry['objects']) for entry in self._entries.values()),
+        }
+
+
 class DBController(metaclass=Singleton):
 
     kv_store=None
+    _cache: Optional[ObjectCache] = None
+
+    # Bump when the layout of the `index/` keyspace changes to force a rebuild
+    INDEX_VERSION = 2
+    INDEX_VERSION_KEY = b"meta/index_version"
+    _indexes_ready = False
 
     def __init__(self):
         try:
@@ -47,23 +119,150 @@ class DBController(metaclass=Singleton):
         except Exception as e:
             print(e)
 
+    def enable_cache(self):
+        """Serves clusters, storage nodes and pools from an in-process ObjectCache
+        """
+        if self.kv_store is not None and self._cache is None:
+            self._cache = ObjectCache(self.kv_store)
+
+    def get_cache_stats(self) -> dict:
+        return self._cache.get_stats() if self._cache is not None else {}
+
+    def _from_cache(self, model: BaseModel, predicate: Callable = lambda _: True) -> Optional[list]:
+        """Returns copies of the cached objects matching `predicate`,
+        or None if caching is disabled or the cache could not be filled.
+        """
+        if self._cache is None:
+            return None
+        try:
+            return self._cache.get(model, predicate)
+        except Exception:
+            from simplyblock_core import utils
+            logger = utils.get_logger(__name__)
+            logger.exception('Error filling object cache from FDB')
+            return None
+
+    def transaction(self, chunk_size=0, max_retries=None) -> UnitOfWork:
+        """Returns a unit of work committing all writes and removals in one transaction
+
+            with db.transaction() as tx:
+                task.write_to_db(tx)
+                node.write_to_db(tx)
+
+        With a `chunk_size`, they are committed in transactions of that many
+        operations instead, see UnitOfWork.
+        """
+        return UnitOfWork(self.kv_store, chunk_size, max_retries)
+
+    def write_many(self, objects):
+        with self.transaction() as tx:
+            for obj in objects:
+                obj.write_to_db(tx)
+
+    def remove_many(self, objects):
+        with self.transaction() as tx:
+            for obj in objects:
+                obj.remove(tx)
+
+    def update_object(self, model: BaseModel, id, func: Callable):
+        """Atomically applies `func` to the stored object `id` of `model`'s type.
+
+        The object is read and written back in the same transaction, which is
+        retried on conflicts, so `func` may be called more than once and must
+        not have side effects besides modifying the object.
+
+        Returns the updated object.
+
+        Raises:
+            KeyError: If the object does not exist
+        """
+        key = model.get_db_id(id).encode()
+
+        def update(tr):
+            value = tr[key]
+            if not value.present():
+                raise KeyError(f'{model.name} {id} not found')
+            obj = model.__class__().from_dict(json_loads(bytes(value)))
+            func(obj)
+            obj._write_op()(tr)
+            return obj
+
+        obj = transact(self.kv_store, update)
+        BaseModel._local_writes[model.name] += 1
+        return obj
+
+    def rebuild_indexes(self, batch_size=100):
+        """Backfills the `index/` keyspace for all indexed object types.
+
+        Objects are re-read inside the indexing transaction, so concurrent
+        writers are never overwritten, and objects deleted in the meantime
+        are skipped.
+        """
+        for model in (StorageNode(), Pool(), LVol(), JobSchedule()):
+            keys = [k for k, _ in self.kv_store.get_range_startswith(model.get_db_id().encode())]  # type: ignore[union-attr]
+            for i in range(0, len(keys), batch_size):
+                transact(self.kv_store, lambda tr: self._index_objects(tr, model, keys[i:i + batch_size]))
+        self.kv_store.set(self.INDEX_VERSION_KEY, str(self.INDEX_VERSION).encode())  # type: ignore[union-attr]
+        self._indexes_ready = True
+
+    @staticmethod
+    def _index_objects(tr, model, keys):
+        values = [tr[key] for key in keys]
+        for key, value in zip(keys, values):
+            if value.present():
+                obj = model.__class__().from_dict(json_loads(bytes(value)))
+                for index_key in obj.get_index_keys():
+                    tr.set(index_key.encode(), key)
+
+    def _ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        if self.kv_store[self.INDEX_VERSION_KEY] != str(self.INDEX_VERSION).encode():  # type: ignore[index]
+            self.rebuild_indexes()
+        self._indexes_ready = True
+
+    def _get_by_index(self, model: BaseModel, attr, value) -> list:
+        """Returns all objects of `model`'s type whose indexed `attr` contains `value`.
+
+        Costs one range read over the matching index entries plus one
+        (pipelined) point read per match, instead of a scan over all objects.
+        """
+        if not self.kv_store:
+            return []
+        try:
+            self._ensure_indexes()
+            prefix = model.get_index_prefix(attr, value).encode()
+
+            def read(tr):
+                values = [tr[key] for _, key in tr.get_range_startswith(prefix)]
+                return [bytes(v) for v in values if v.present()]
+
+            objects = (model.__class__().from_dict(json_loads(v)) for v in transact(self.kv_store, read))
+            # value prefixes may collide (e.g. names containing "/"), so verify the match
+            return [obj for obj in objects if value in obj.get_index_values().get(attr, [])]
+        except Exception:
+            from simplyblock_core import utils
+            logger = utils.get_logger(__name__)
+            logger.exception('Error reading index from FDB')
+            return []
+
     def get_storage_nodes(self) -> List[StorageNode]:
-        ret = StorageNode().read_from_db(self.kv_store)
+        ret = self._from_cache(StorageNode())
+        if ret is None:
+            ret = StorageNode().read_from_db(self.kv_store)
         ret = sorted(ret, key=lambda x: x.create_dt)
         return ret
 
     def get_storage_nodes_by_cluster_id(self, cluster_id) -> List[StorageNode]:
-        ret = StorageNode().read_from_db(self.kv_store)
-        nodes = []
-        for n in ret:
-            if n.cluster_id == cluster_id:
-                nodes.append(n)
+        nodes = self._from_cache(StorageNode(), lambda n: n.cluster_id == cluster_id)
+        if nodes is None:
+            nodes = self._get_by_index(StorageNode(), 'cluster_id', cluster_id)
         return sorted(nodes, key=lambda x: x.create_dt)
 
     def get_storage_nodes_by_system_id(self, system_id) -> List[StorageNode]:
         return [
             node for node
-            in StorageNode().read_from_db(self.kv_store)
+            in self.get_storage_nodes()
             if node.system_uuid == system_id
         ]
 
@@ -75,13 +274,17 @@ class DBController(metaclass=Singleton):
         ]
 
     def get_storage_node_by_id(self, id) -> StorageNode:
-        ret = StorageNode().read_from_db(self.kv_store, id)
+        ret = self._from_cache(StorageNode(), lambda n: n.get_id() == id)
+        if ret is None:
+            ret = StorageNode().read_from_db(self.kv_store, id)
         if len(ret) == 0:
             raise KeyError(f'StorageNode {id} not found')
         return ret[0]
 
     def get_storage_device_by_id(self, id) -> NVMeDevice:
-        nodes = self.get_storage_nodes()
+        nodes = self._from_cache(StorageNode(), lambda n: id in n.get_index_values()['nvme_devices'])
+        if nodes is None:
+            nodes = self._get_by_index(StorageNode(), 'nvme_devices', id)
         try:
             return next(
                 device
@@ -94,60 +297,64 @@ class DBController(metaclass=Singleton):
 
 
     def get_pools(self, cluster_id=None) -> List[Pool]:
-        pools = []
+        pools = self._from_cache(Pool(), lambda p: not cluster_id or p.cluster_id == cluster_id)
+        if pools is not None:
+            return pools
         if cluster_id:
-            for pool in Pool().read_from_db(self.kv_store):
-                if pool.cluster_id == cluster_id:
-                    pools.append(pool)
-        else:
-            pools = Pool().read_from_db(self.kv_store)
-        return pools
+            return self._get_by_index(Pool(), 'cluster_id', cluster_id)
+        return Pool().read_from_db(self.kv_store)
 
     def get_pool_by_id(self, id) -> Pool:
-        ret = Pool().read_from_db(self.kv_store, id)
+        ret = self._from_cache(Pool(), lambda p: p.get_id() == id)
+        if ret is None:
+            ret = Pool().read_from_db(self.kv_store, id)
         if not ret:
             raise KeyError(f'Pool {id} not found')
         return ret[0]
 
     def get_pool_by_name(self, name) -> Pool:
-        pools = Pool().read_from_db(self.kv_store)
+        pools = self._from_cache(Pool(), lambda p: p.pool_name == name)
+        if pools is None:
+            pools = self._get_by_index(Pool(), 'pool_name', name)
         for pool in pools:
-            if pool.pool_name == name:
-                return pool
+            return pool
         raise KeyError(f'Pool {name} not found')
 
     def get_lvols(self, cluster_id=None) -> List[LVol]:
-        lvols = self.get_all_lvols()
         if not cluster_id:
-            return lvols
+            return self.get_all_lvols()
 
-        node_ids=[]
         cluster_lvols = []
         for node in self.get_storage_nodes_by_cluster_id(cluster_id):
-            node_ids.append(node.get_id())
-
-        for lvol in lvols:
-            if lvol.node_id in node_ids:
-                cluster_lvols.append(lvol)
-
-        return cluster_lvols
+            cluster_lvols.extend(self._get_by_index(LVol(), 'node_id', node.get_id()))
+        return sorted(cluster_lvols, key=lambda x: x.create_dt)
 
     def get_all_lvols(self) -> List[LVol]:
         lvols = LVol().read_from_db(self.kv_store)
         return sorted(lvols, key=lambda x: x.create_dt)
 
     def get_lvols_by_node_id(self, node_id) -> List[LVol]:
-        lvols = []
-        for lvol in self.get_lvols():
-            if lvol.node_id == node_id:
-                lvols.append(lvol)
+        lvols = self._get_by_index(LVol(), 'node_id', node_id)
         return sorted(lvols, key=lambda x: x.create_dt)
 
+    def get_lvol_count_by_node_id(self, node_id) -> int:
+        """Returns the number of lvols of the node, reading only their index entries"""
+        if not self.kv_store:
+            return 0
+        try:
+            self._ensure_indexes()
+            prefix = LVol().get_index_prefix('node_id', node_id).encode()
+            keys = transact(self.kv_store, lambda tr: [key for key, _ in tr.get_range_startswith(prefix)])
+            # entries of ids starting with `node_id/` are not the node's
+            return sum(b'/' not in key[len(prefix):] for key in keys)
+        except Exception:
+            from simplyblock_core import utils
+            logger = utils.get_logger(__name__)
+            logger.exception('Error reading index from FDB')
+            return 0
+
     def get_lvols_by_pool_id(self, pool_id) -> List[LVol]:
-        lvols = []
-        for lvol in self.get_lvols():
-            if lvol.pool_uuid == pool_id:
-                lvols.append(lvol)
+        lvols = self._get_by_index(LVol(), 'pool_uuid', pool_id)
         return sorted(lvols, key=lambda x: x.create_dt)
 
     def get_hostnames_by_pool_id(self, pool_id) -> List[str]:
@@ -175,9 +382,9 @@ class DBController(metaclass=Singleton):
         return lvols[0]
 
     def get_lvol_by_name(self, lvol_name) -> LVol:
-        for lvol in self.get_lvols():
-            if lvol.lvol_name == lvol_name:
-                return lvol
+        lvols = self._get_by_index(LVol(), 'lvol_name', lvol_name)
+        for lvol in sorted(lvols, key=lambda x: x.create_dt):
+            return lvol
         raise KeyError(f'LVol {lvol_name} not found')
 
     def get_mgmt_node_by_id(self, id) -> MgmtNode:
@@ -199,56 +406,68 @@ class DBController(metaclass=Singleton):
                 return node
         raise KeyError(f'No management node found for hostname {hostname}')
 
-    def get_lvol_stats(self, lvol, limit=20) -> List[LVolStatObject]:
+    def _read_stats(self, record, limit, records_count):
+        if records_count:
+            return record.read_history(self.kv_store, limit, records_count)
+        return record.read_samples(self.kv_store, limit)
+
+    def get_lvol_stats(self, lvol, limit=20, records_count=0) -> List[LVolStatObject]:
+        """Returns the last `limit` stats records of `lvol`, newest first.
+
+        Given the number of records the history is reduced to, `records_count`,
+        coarser rollups are returned for long windows, see StatsObject.read_history.
+        The other stats and capacity getters behave the same.
+        """
         if isinstance(lvol, str):
             lvol = self.get_lvol_by_id(lvol)
-        stats = LVolStatObject().read_from_db(self.kv_store, id="%s/%s" % (lvol.pool_uuid, lvol.uuid), limit=limit,
-                                              reverse=True)
-        return stats
+        return self._read_stats(LVolStatObject({"pool_id": lvol.pool_uuid, "uuid": lvol.uuid}), limit, records_count)
 
     def get_cached_lvol_stats(self, lvol_id, limit=20) -> List[CachedLVolStatObject]:
-        stats = CachedLVolStatObject().read_from_db(self.kv_store, id="%s/%s" % (lvol_id, lvol_id), limit=limit,
-                                                    reverse=True)
-        return stats
+        return CachedLVolStatObject({"cluster_id": lvol_id, "uuid": lvol_id}).read_samples(self.kv_store, limit)
 
-    def get_pool_stats(self, pool, limit=20) -> List[PoolStatObject]:
-        stats = PoolStatObject().read_from_db(self.kv_store, id="%s/%s" % (pool.get_id(), pool.get_id()), limit=limit,
-                                              reverse=True)
-        return stats
+    def get_pool_stats(self, pool, limit=20, records_count=0) -> List[PoolStatObject]:
+        return self._read_stats(
+            PoolStatObject({"pool_id": pool.get_id(), "uuid": pool.get_id()}), limit, records_count)
 
-    def get_cluster_stats(self, cluster, limit=20) -> List[ClusterStatObject]:
-        return self.get_cluster_capacity(cluster, limit)
+    def get_cluster_stats(self, cluster, limit=20, records_count=0) -> List[ClusterStatObject]:
+        return self.get_cluster_capacity(cluster, limit, records_count)
 
-    def get_node_stats(self, node, limit=20) -> List[NodeStatObject]:
-        return self.get_node_capacity(node, limit)
+    def get_node_stats(self, node, limit=20, records_count=0) -> List[NodeStatObject]:
+        return self.get_node_capacity(node, limit, records_count)
 
-    def get_device_stats(self, device, limit=20) -> List[DeviceStatObject]:
-        return self.get_device_capacity(device, limit)
+    def get_device_stats(self, device, limit=20, records_count=0) -> List[DeviceStatObject]:
+        return self.get_device_capacity(device, limit, records_count)
 
-    def get_cluster_capacity(self, cl, limit=1) -> List[ClusterStatObject]:
-        stats = ClusterStatObject().read_from_db(
-            self.kv_store, id="%s/%s" % (cl.get_id(), cl.get_id()), limit=limit, reverse=True)
-        return stats
+    def get_cluster_capacity(self, cl, limit=1, records_count=0) -> List[ClusterStatObject]:
+        return self._read_stats(
+            ClusterStatObject({"cluster_id": cl.get_id(), "uuid": cl.get_id()}), limit, records_count)
 
-    def get_node_capacity(self, node, limit=1) -> List[NodeStatObject]:
-        stats = NodeStatObject().read_from_db(
-            self.kv_store, id="%s/%s" % (node.cluster_id, node.get_id()), limit=limit, reverse=True)
-        return stats
+    def get_node_capacity(self, node, limit=1, records_count=0) -> List[NodeStatObject]:
+        return self._read_stats(
+            NodeStatObject({"cluster_id": node.cluster_id, "uuid": node.get_id()}), limit, records_count)
 
-    def get_device_capacity(self, device, limit=1) -> List[DeviceStatObject]:
-        stats = DeviceStatObject().read_from_db(
-            self.kv_store, id="%s/%s" % (device.cluster_id, device.get_id()), limit=limit, reverse=True)
-        return stats
+    def get_device_capacity(self, device, limit=1, records_count=0) -> List[DeviceStatObject]:
+        return self._read_stats(
+            DeviceStatObject({"cluster_id": device.cluster_id, "uuid": device.get_id()}), limit, records_count)
 
     def get_clusters(self) -> List[Cluster]:
-        return Cluster().read_from_db(self.kv_store)
+        ret = self._from_cache(Cluster())
+        if ret is None:
+            ret = Cluster().read_from_db(self.kv_store)
+        return ret
 
     def get_cluster_by_id(self, cluster_id) -> Cluster:
-        ret = Cluster().read_from_db(self.kv_store, id=cluster_id)
+        ret = self._from_cache(Cluster(), lambda c: c.get_id() == cluster_id)
+        if ret is None:
+            ret = Cluster().read_from_db(self.kv_store, id=cluster_id)
         if not ret:
             raise KeyError(f'Cluster {cluster_id} not found')
         return ret[0]
 
+    def get_node_probes(self, cluster_id) -> Dict[str, NodeProbe]:
+        """Returns the last probe results of the nodes of the cluster by node id"""
+        return {probe.node_id: probe for probe in NodeProbe().read_from_db(self.kv_store, id=f"{cluster_id}/")}
+
     def get_port_stats(self, node_id, port_id, limit=20) -> List[PortStat]:
         stats = PortStat().read_from_db(self.kv_store, id="%s/%s" % (node_id, port_id), limit=limit, reverse=True)
         return stats
@@ -257,13 +476,73 @@ class DBController(metaclass=Singleton):
         return EventObj().read_from_db(self.kv_store, id=event_id, limit=limit, reverse=reverse)
 
     def get_job_tasks(self, cluster_id, reverse=True, limit=0) -> List[JobSchedule]:
+        """Returns the task history of the cluster, archived tasks excluded"""
         return JobSchedule().read_from_db(self.kv_store, id=cluster_id, reverse=reverse, limit=limit)
 
+    def get_job_tasks_since(self, cluster_id, since) -> List[JobSchedule]:
+        """Returns the tasks of the cluster created at or after `since`, oldest first"""
+        begin = JobSchedule().get_db_id(f"{cluster_id}/{int(since)}").encode()
+        end = JobSchedule().get_db_id(f"{cluster_id}0").encode()  # '0' follows '/'
+        items = transact(self.kv_store, lambda tr: list(tr.get_range(begin, end)))
+        return [JobSchedule().from_dict(json_loads(bytes(value))) for _, value in items]
+
+    def get_active_job_tasks(self, cluster_id, function_name=None, node_id=None, device_id=None) -> List[JobSchedule]:
+        """Returns the tasks of the cluster which are not done, oldest first.
+
+        Only these tasks are read, through the `target` index if a function
+        name is given, otherwise through the `active` index.
+        """
+        if function_name:
+            return self._get_by_index(JobSchedule(), 'target', JobSchedule.target_key(
+                cluster_id, function_name, node_id or "", device_id or ""))
+        return self._get_by_index(JobSchedule(), 'active', cluster_id)
+
     def get_task_by_id(self, task_id) -> JobSchedule:
-        for task in self.get_job_tasks(" "):
-            if task.uuid == task_id:
-                return task
-        raise KeyError(f'Task {task_id} not found')
+        tasks = self._get_by_index(JobSchedule(), 'uuid', task_id)
+        if not tasks:
+            raise KeyError(f'Task {task_id} not found')
+        return tasks[0]
+
+    def archive_job_tasks(self, cluster_id, before, batch_size=100) -> int:
+        """Moves the done tasks of the cluster created before `before` to the `archive/` keyspace.
+
+        Archived tasks are still found by get_task_by_id, but no longer read
+        with the task history. Returns the number of archived tasks.
+        """
+        begin = JobSchedule().get_db_id(f"{cluster_id}/").encode()
+        end = JobSchedule().get_db_id(f"{cluster_id}/{int(before)}").encode()
+        archived = 0
+        while True:
+            items = transact(self.kv_store, lambda tr: list(tr.get_range(begin, end, limit=batch_size)))
+            if not items:
+                return archived
+            begin = bytes(items[-1][0]) + b'\x00'
+            with self.transaction() as tx:
+                for _, value in items:
+                    task = JobSchedule().from_dict(json_loads(bytes(value)))
+                    if task.status != JobSchedule.STATUS_DONE:
+                        continue
+                    task.remove(tx)
+                    task.object_type = "archive"
+                    BaseModel.write_to_db(task, tx)  # keeps updated_at
+                    archived += 1
+
+    def delete_archived_job_tasks(self, cluster_id, before, batch_size=100) -> int:
+        """Deletes the archived tasks of the cluster created before `before`, returns their number"""
+        archive = JobSchedule()
+        archive.object_type = "archive"
+        begin = archive.get_db_id(f"{cluster_id}/").encode()
+        end = archive.get_db_id(f"{cluster_id}/{int(before)}").encode()
+        deleted = 0
+        while True:
+            items = transact(self.kv_store, lambda tr: list(tr.get_range(begin, end, limit=batch_size)))
+            if not items:
+                return deleted
+            begin = bytes(items[-1][0]) + b'\x00'
+            with self.transaction() as tx:
+                for _, value in items:
+                    JobSchedule().from_dict(json_loads(bytes(value))).remove(tx)
+                    deleted += 1
 
     def get_snapshots_by_node_id(self, node_id) -> List[SnapShot]:
         ret = []
@@ -284,7 +563,7 @@ class DBController(metaclass=Singleton):
         raise KeyError(f'JMDeviec {jm_id} not found')
 
     def get_primary_storage_nodes_by_cluster_id(self, cluster_id) -> List[StorageNode]:
-        ret = StorageNode().read_from_db(self.kv_store)
+        ret = self.get_storage_nodes_by_cluster_id(cluster_id)
         nodes = []
         for n in ret:
             if n.cluster_id == cluster_id and not n.is_secondary_node:  # pass
@@ -292,7 +571,7 @@ class DBController(metaclass=Singleton):
         return sorted(nodes, key=lambda x: x.create_dt)
 
     def get_primary_storage_nodes_by_secondary_node_id(self, node_id) -> List[StorageNode]:
-        ret = StorageNode().read_from_db(self.kv_store)
+        ret = self.get_storage_nodes()
         nodes = []
         for node in ret:
             if node.secondary_node_id == node_id and node.lvstore:
@@ -0,0 +1,472 @@
+# coding=utf-8
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any
+
+from simplyblock_core import constants, utils
+from simplyblock_core.controllers import lvol_controller, lvol_events, pool_controller
+from simplyblock_core.lvol_placement import LVolPlacement
+from simplyblock_core.models.lvol_model import LVol
+from simplyblock_core.models.storage_node import StorageNode
+
+logger = utils.get_logger(__name__)
+
+# the parameters of a volume, named like those of lvol_controller.add_lvol_ha
+VOLUME_DEFAULTS = {
+    'name': None,
+    'size': 0,
+    'max_size': 0,
+    'host_id_or_name': None,
+    'ha_type': 'default',
+    'use_crypto': False,
+    'crypto_key1': None,
+    'crypto_key2': None,
+    'max_rw_iops': 0,
+    'max_rw_mbytes': 0,
+    'max_r_mbytes': 0,
+    'max_w_mbytes': 0,
+    'lvol_priority_class': 0,
+    'pvc_name': None,
+    'max_namespace_per_subsys': 1,
+}
+
+
+def _qos(volume):
+    """Returns the QoS limits of `volume`, None if it has none"""
+    limits = [volume['max_rw_iops'], volume['max_rw_mbytes'], volume['max_r_mbytes'], volume['max_w_mbytes']]
+    if not any(limits):
+        return None
+    return [limit if limit is not None and limit >= 0 else -1 for limit in limits]
+
+
+class LVolBulkCreate:
+    """Creates many lvols of a pool at once.
+
+    The pool, cluster, nodes and lvols are read once to validate the whole
+    batch: the provisioned capacity and the pool limit are accounted for
+    the volumes in their order, those exceeding them fail. Every volume is
+    placed on the online node with the fewest lvols, unless its host is
+    given, the VUIDs of all volumes are allocated in one transaction and
+    the lvols are written in creation in another.
+
+    The lvols are then created per host node, in RPC batches of `chunk`
+    lvols of which `workers` are in flight at once: the bdev stacks,
+    subsystems, listeners and namespaces on the primary, then on the
+    secondary, then the QoS limits. The lvols of a finished batch are set
+    online in one transaction, those a call failed for are rolled back and
+    removed.
+
+    `volumes` are dicts of VOLUME_DEFAULTS. `create` returns an (lvol id or
+    False, error) tuple per volume, in their order.
+    """
+
+    def __init__(self, db, pool_id_or_name, volumes,
+                 chunk=constants.LVOL_BULK_CHUNK_LVOLS, workers=constants.LVOL_BULK_WORKERS):
+        self.db = db
+        self.pool_id_or_name = pool_id_or_name
+        self.volumes = [{**VOLUME_DEFAULTS, **volume} for volume in volumes]
+        self.chunk = chunk
+        self.workers = workers
+        self.errors: dict = {}
+        self.created: dict = {}
+        self.duration = 0.0
+        self.pool: Any = None
+        self.cluster: Any = None
+        self._lock = threading.Lock()
+        self._nodes: list = []
+        self._lvols: list = []
+        self._cluster_size_total = 0
+        self._index: dict = {}
+        self._placement = LVolPlacement(db)
+
+    def _fail(self, index, error):
+        with self._lock:
+            self.errors.setdefault(index, error)
+
+    def _rpc_client(self, snode):
+        # a batch is not sent twice, retrying it after a timeout would repeat the calls executed before
+        return snode.rpc_client(timeout=constants.LVOL_BULK_RPC_TIMEOUT_SEC, retry=0)
+
+    def _load(self):
+        """Reads the pool, cluster, nodes and lvols, returns the error if no volume can be created"""
+        if not self.volumes:
+            return "No volumes given"
+        if len(self.volumes) > constants.LVOL_BULK_MAX_LVOLS:
+            return f"Too many volumes: {len(self.volumes)}, at most {constants.LVOL_BULK_MAX_LVOLS} per request"
+
+        for pool in self.db.get_pools():
+            if self.pool_id_or_name == pool.get_id() or self.pool_id_or_name == pool.pool_name:
+                self.pool = pool
+                break
+        if not self.pool:
+            return f"Pool not found: {self.pool_id_or_name}"
+        if self.pool.status != self.pool.STATUS_ACTIVE:
+            return f"Pool in not active: {self.pool_id_or_name}, status: {self.pool.status}"
+
+        self.cluster = self.db.get_cluster_by_id(self.pool.cluster_id)
+        if self.cluster.status not in [self.cluster.STATUS_ACTIVE, self.cluster.STATUS_DEGRADED]:
+            return f"Cluster is not active, status: {self.cluster.status}"
+
+        self._nodes = self.db.get_storage_nodes_by_cluster_id(self.cluster.get_id())
+        dev_count = 0
+        for node in self._nodes:
+            if node.status == StorageNode.STATUS_ONLINE:
+                for dev in node.nvme_devices:
+                    if dev.status == dev.STATUS_ONLINE:
+                        dev_count += 1
+                        self._cluster_size_total += dev.size
+        if not any(node.status == StorageNode.STATUS_ONLINE for node in self._nodes):
+            return "No online Storage nodes found"
+        if dev_count == 0:
+            return "No NVMe devices found in the cluster"
+        elif dev_count < 8:
+            logger.warning("Number of active cluster devices are less than 8")
+
+        self._lvols = self.db.get_lvols(self.cluster.get_id())
+        return None
+
+    def _check(self, volume, names):
+        """Returns the error of the parameters of `volume`, None if they are valid"""
+        name = volume['name']
+        size = volume['size']
+        if not name:
+            return "Name can not be empty"
+        if name in names:
+            return f"LVol name must be unique: {name}"
+        if size < utils.parse_size('100MiB'):
+            return "Size must be larger than 100M"
+        if 0 < self.pool.lvol_max_size < size:
+            return f"Pool Max LVol size is: {utils.humanbytes(self.pool.lvol_max_size)}, " \
+                   f"LVol size: {utils.humanbytes(size)} must be below this limit"
+        if 0 < volume['max_size'] < size:
+            return f"Max size:{volume['max_size']} must be larger than size {size}"
+        if _qos(volume) and self.pool.has_qos():
+            return "Both Lvol and Pool have QOS settings"
+        if volume['ha_type'] not in ['default', 'single', 'ha']:
+            return f"Invalid HA type: {volume['ha_type']}"
+        if volume['use_crypto']:
+            if volume['crypto_key1'] is None or volume['crypto_key2'] is None:
+                return "encryption keys for lvol not provided"
+            success, err = lvol_controller.validate_aes_xts_keys(volume['crypto_key1'], volume['crypto_key2'])
+            if not success:
+                return err
+        return None
+
+    def _place(self, volume, counts):
+        """Returns the host node of `volume` and the error if it can not be placed"""
+        host_id_or_name = volume['host_id_or_name']
+        if host_id_or_name:
+            nodes = [node for node in self._nodes if host_id_or_name in (node.get_id(), node.hostname)]
+            if not nodes:
+                return None, f"Can not find storage node: {host_id_or_name}"
+            node = nodes[0]
+            if node.status != StorageNode.STATUS_ONLINE:
+                return None, f"Storage node is not online. ID: {node.get_id()} status: {node.status}"
+            if counts.get(node.get_id(), 0) >= node.max_lvol:
+                return None, f"Too many lvols on node: {node.get_id()}, max lvols reached: {counts[node.get_id()]}"
+            return node, None
+
+        nodes = [node for node in self._nodes
+                 if node.status == StorageNode.STATUS_ONLINE and not node.is_secondary_node
+                 and counts.get(node.get_id(), 0) < node.max_lvol]
+        if not nodes:
+            return None, "No nodes found with enough resources to create the LVol"
+        # the counts include the lvols placed so far, the stats are those from before the request
+        scores = self._placement.scores(self._placement.loads(nodes, counts))
+        return min(nodes, key=lambda node: scores[node.get_id()]), None
+
+    def _lvol(self, volume, host_node, lvol_id, vuid, max_size):
+        lvol = LVol()
+        lvol.uuid = lvol_id
+        lvol.lvol_name = volume['name']
+        lvol.pvc_name = volume['pvc_name'] or ""
+        lvol.size = int(volume['size'])
+        lvol.max_size = int(volume['max_size'] or max_size or lvol.size * 10)
+        lvol.status = LVol.STATUS_IN_CREATION
+        lvol.create_dt = str(datetime.now())
+        lvol.ha_type = self.cluster.ha_type if volume['ha_type'] == 'default' else volume['ha_type']
+        lvol.guid = utils.generate_hex_string(16)
+        lvol.crypto_bdev = ''
+        lvol.comp_bdev = ''
+        lvol.mode = 'read-write'
+        lvol.lvol_type = 'lvol'
+        lvol.lvol_priority_class = volume['lvol_priority_class']
+        lvol.nqn = self.cluster.nqn + ":lvol:" + lvol.uuid
+        lvol.max_namespace_per_subsys = volume['max_namespace_per_subsys']
+        lvol.pool_uuid = self.pool.get_id()
+        lvol.pool_name = self.pool.pool_name
+
+        lvol.hostname = host_node.hostname
+        lvol.node_id = host_node.get_id()
+        lvol.lvs_name = host_node.lvstore
+        lvol.subsys_port = host_node.lvol_subsys_port
+        lvol.nodes = [host_node.get_id()]
+        if lvol.ha_type == "ha":
+            lvol.nodes.append(host_node.secondary_node_id)
+
+        lvol.vuid = vuid
+        lvol.lvol_bdev = f"LVOL_{vuid}"
+        lvol.top_bdev = f"{lvol.lvs_name}/{lvol.lvol_bdev}"
+        lvol.base_bdev = lvol.top_bdev
+        lvol_dict: dict = {
+            "type": "bdev_lvol",
+            "name": lvol.lvol_bdev,
+            "params": {
+                "name": lvol.lvol_bdev,
+                "size_in_mib": utils.convert_size(lvol.size, 'MiB'),
+                "lvs_name": lvol.lvs_name,
+                "lvol_priority_class": 0
+            }
+        }
+        if self.cluster.enable_qos and lvol.lvol_priority_class > 0:
+            lvol_dict["params"]["lvol_priority_class"] = lvol.lvol_priority_class
+        lvol.bdev_stack = [lvol_dict]
+
+        if volume['use_crypto']:
+            lvol.crypto_bdev = f"crypto_{lvol.lvol_bdev}"
+            lvol.bdev_stack.append({
+                "type": "crypto",
+                "name": lvol.crypto_bdev,
+                "params": {
+                    "name": lvol.crypto_bdev,
+                    "base_name": lvol.top_bdev,
+                    "key1": volume['crypto_key1'],
+                    "key2": volume['crypto_key2'],
+                }
+            })
+            lvol.lvol_type += ',crypto'
+            lvol.top_bdev = lvol.crypto_bdev
+            lvol.crypto_key1 = volume['crypto_key1']
+            lvol.crypto_key2 = volume['crypto_key2']
+        return lvol
+
+    def _prepare(self):
+        """Validates and places the volumes, allocates their VUIDs and writes their lvols in creation"""
+        names = {lvol.lvol_name for lvol in self._lvols if lvol.pool_uuid == self.pool.get_id()}
+        counts: dict = {}
+        cluster_size_prov = 0
+        for lvol in self._lvols:
+            counts[lvol.node_id] = counts.get(lvol.node_id, 0) + 1
+            cluster_size_prov += lvol.size
+        pool_total = 0
+        if self.pool.pool_max_size > 0:
+            pool_total = pool_controller.get_pool_total_capacity(self.pool.get_id())
+
+        accepted = []
+        for index, volume in enumerate(self.volumes):
+            size = volume['size']
+            error = self._check(volume, names)
+            if not error and self.pool.pool_max_size > 0 and pool_total + size > self.pool.pool_max_size:
+                error = f"Invalid LVol size: {utils.humanbytes(size)} Pool max size has reached " \
+                        f"{utils.humanbytes(pool_total + size)} of {utils.humanbytes(self.pool.pool_max_size)}"
+            prov_util = int(((cluster_size_prov + size) / self._cluster_size_total) * 100)
+            if not error and self.cluster.prov_cap_crit and self.cluster.prov_cap_crit < prov_util:
+                error = f"Cluster provisioned cap critical would be, util: {prov_util}% " \
+                        f"of cluster util: {self.cluster.prov_cap_crit}"
+            host_node = None
+            if not error:
+                host_node, error = self._place(volume, counts)
+            if error or host_node is None:
+                self._fail(index, error)
+                continue
+            names.add(volume['name'])
+            counts[host_node.get_id()] = counts.get(host_node.get_id(), 0) + 1
+            cluster_size_prov += size
+            pool_total += size
+            accepted.append((index, volume, host_node))
+
+        prov_util = int((cluster_size_prov / self._cluster_size_total) * 100)
+        if self.cluster.prov_cap_warn and self.cluster.prov_cap_warn < prov_util:
+            logger.warning(f"Cluster provisioned cap warning, util: {prov_util}% "
+                           f"of cluster util: {self.cluster.prov_cap_warn}")
+        if not accepted:
+            return []
+
+        records = self.db.get_cluster_capacity(self.cluster)
+        max_size = records[0]['size_total'] if records else 0
+        lvol_ids = [str(uuid.uuid4()) for _ in accepted]
+        vuids = utils.vuid_allocator('lvol').allocate_many(self.db.kv_store, lvol_ids)
+        lvols = []
+        for (index, volume, host_node), lvol_id, vuid in zip(accepted, lvol_ids, vuids):
+            if not vuid:
+                self._fail(index, "No free VUID left")
+                continue
+            self._index[lvol_id] = index
+            lvols.append((self._lvol(volume, host_node, lvol_id, vuid, max_size), host_node))
+        self.db.write_many([lvol for lvol, _ in lvols])
+        return lvols
+
+    def _batches(self, lvols):
+        """Groups the lvols per host node, returns (host, primary, secondary, lvols) batches"""
+        by_host: dict = {}
+        for lvol, host_node in lvols:
+            by_host.setdefault(host_node.get_id(), (host_node, []))[1].append(lvol)
+
+        batches = []
+        failed = []
+        for host_node, host_lvols in by_host.values():
+            for ha_type in ['single', 'ha']:
+                group = [lvol for lvol in host_lvols if lvol.ha_type == ha_type]
+                if not group:
+                    continue
+                secondary_node = None
+                if ha_type == 'single':
+                    primary_node, error = host_node, None
+                else:
+                    primary_node, secondary_node, error = lvol_controller._get_ha_nodes(host_node, host_node.lvstore)
+                if error:
+                    logger.error(error)
+                    for lvol in group:
+                        self._fail(self._index[lvol.get_id()], error)
+                    failed.extend(group)
+                    continue
+                for start in range(0, len(group), self.chunk):
+                    batches.append((host_node, primary_node, secondary_node, group[start:start + self.chunk]))
+        if failed:
+            self.db.remove_many(failed)
+        return batches
+
+    def _create_on_node(self, snode, lvols, is_primary):
+        """Creates the bdev stacks and subsystems of `lvols` on `snode` in batches, returns the lvols created"""
+        rpc_client = self._rpc_client(snode)
+        stacks = []
+        for lvol, (bdevs, error) in zip(lvols, lvol_controller._create_bdev_stacks(rpc_client, lvols, is_primary)):
+            if error:
+                logger.error(f"Failed to create lvol {lvol.get_id()} on node {snode.get_id()}: {error}")
+                self._fail(self._index[lvol.get_id()], error)
+                continue
+            stacks.append((lvol, bdevs))
+
+        batch = rpc_client.batch()
+        ranges = []
+        for lvol, bdevs in stacks:
+            first = len(batch.calls)
+            if is_primary:
+                min_cntlid = 1
+            else:
+                min_cntlid = 1000
+            batch.subsystem_create(lvol.nqn, lvol.ha_type, lvol.uuid, min_cntlid,
+                                   max_namespaces=constants.LVO_MAX_NAMESPACES_PER_SUBSYS)
+            ana_state = "optimized" if lvol.node_id == snode.get_id() else "non_optimized"
+            for iface in snode.data_nics:
+                if iface.ip4_address:
+                    batch.nvmf_subsystem_add_listener(
+                        lvol.nqn, iface.get_transport_type(), iface.ip4_address, lvol.subsys_port, ana_state)
+            ns_call = len(batch.calls)
+            batch.nvmf_subsystem_add_ns(lvol.nqn, lvol.top_bdev, lvol.uuid, lvol.guid)
+            if is_primary:
+                batch.get_bdevs(f"{lvol.lvs_name}/{lvol.lvol_bdev}")
+            ranges.append((lvol, bdevs, first, ns_call))
+        results = batch.send()
+
+        created = []
+        for lvol, bdevs, first, ns_call in ranges:
+            error = None
+            for result, err in results[first + 1:ns_call]:
+                if not result and not (isinstance(err, dict) and err.get("code") == -32602):
+                    error = f"Failed to create listener for {lvol.get_id()}"
+                    break
+            ns_id, _ = results[ns_call]
+            if not error and not ns_id:
+                error = "Failed to add bdev to subsystem"
+            if not error and is_primary:
+                found, _ = results[ns_call + 1]
+                if found:
+                    lvol.lvol_uuid = found[0]['uuid']
+                    lvol.blobid = found[0]['driver_specific']['lvol']['blobid']
+                else:
+                    error = "Failed to get lvol bdev"
+            if error:
+                logger.error(f"Failed to create lvol {lvol.get_id()} on node {snode.get_id()}: {error}")
+                rpc_client.subsystem_delete(lvol.nqn)
+                lvol_controller._remove_bdev_stack(bdevs[::-1], rpc_client)
+                self._fail(self._index[lvol.get_id()], error)
+                continue
+            lvol.ns_id = int(ns_id)
+            created.append(lvol)
+        return created
+
+    def _set_qos(self, host_node, lvols):
+        """Sets the QoS limits of the lvols having some, like set_lvol"""
+        limits = [(lvol, _qos(self.volumes[self._index[lvol.get_id()]])) for lvol in lvols]
+        limits = [(lvol, qos) for lvol, qos in limits if qos]
+        if not limits:
+            return
+        batch = self._rpc_client(host_node).batch()
+        for lvol, qos in limits:
+            batch.bdev_set_qos_limit(lvol.top_bdev, *qos)
+        for (lvol, qos), (result, error) in zip(limits, batch.send()):
+            if not result:
+                logger.error(f"Error setting qos limits of lvol {lvol.get_id()}: {error}")
+                continue
+            lvol.rw_ios_per_sec, lvol.rw_mbytes_per_sec, lvol.r_mbytes_per_sec, lvol.w_mbytes_per_sec = qos
+
+    def _build(self, host_node, primary_node, secondary_node, lvols):
+        """Creates a batch of lvols, those not created are removed and get an error"""
+        try:
+            self._build_batch(host_node, primary_node, secondary_node, lvols)
+        except Exception as e:
+            logger.exception(f"Failed to create lvols on node {host_node.get_id()}")
+            with self._lock:
+                failed = [lvol for lvol in lvols if self._index[lvol.get_id()] not in self.created]
+            for lvol in failed:
+                self._fail(self._index[lvol.get_id()], f"Failed to create LVol: {e}")
+            # releases their VUIDs
+            self.db.remove_many(failed)
+
+    def _build_batch(self, host_node, primary_node, secondary_node, lvols):
+        created = self._create_on_node(primary_node, lvols, True)
+        if secondary_node and created:
+            on_secondary = {lvol.get_id() for lvol in self._create_on_node(secondary_node, created, False)}
+            for lvol in created:
+                if lvol.get_id() not in on_secondary:
+                    lvol_controller.delete_lvol_from_node(lvol.get_id(), primary_node.get_id())
+            created = [lvol for lvol in created if lvol.get_id() in on_secondary]
+
+        if created:
+            rpc_client = self._rpc_client(host_node)
+            rpc_client.bdev_lvol_add_to_group(self.pool.numeric_id, [lvol.top_bdev for lvol in created])
+            rpc_client.bdev_lvol_set_qos_limit(
+                self.pool.numeric_id, self.pool.max_rw_ios_per_sec, self.pool.max_rw_mbytes_per_sec,
+                self.pool.max_r_mbytes_per_sec, self.pool.max_w_mbytes_per_sec)
+            self._set_qos(host_node, created)
+            for lvol in created:
+                lvol.status = LVol.STATUS_ONLINE
+            self.db.write_many(created)
+            with self._lock:
+                for lvol in created:
+                    self.created[self._index[lvol.get_id()]] = lvol.get_id()
+            for lvol in created:
+                lvol_events.lvol_create(lvol)
+
+        created_ids = {lvol.get_id() for lvol in created}
+        failed = [lvol for lvol in lvols if lvol.get_id() not in created_ids]
+        if failed:
+            self.db.remove_many(failed)
+        with self._lock:
+            done = len(self.created) + len(self.errors)
+        logger.info(f"Created {done}/{len(self.volumes)} lvols in pool {self.pool.get_id()}")
+
+    def create(self):
+        """Creates the volumes, returns an (lvol id or False, error) tuple per volume"""
+        start = time.monotonic()
+        error = self._load()
+        if error:
+            logger.error(error)
+            return [(False, error)] * len(self.volumes)
+
+        batches = self._batches(self._prepare())
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bulk") as executor:
+            for future in [executor.submit(self._build, *batch) for batch in batches]:
+                if future.exception() is not None:
+                    logger.error(f"Failed to create lvols: {future.exception()}")
+
+        self.duration = time.monotonic() - start
+        logger.info(f"Created {len(self.created)} of {len(self.volumes)} lvols in pool {self.pool_id_or_name} "
+                    f"in {self.duration:.2f}s, {len(self.errors)} failed")
+        return [(self.created[index], None) if index in self.created
+                else (False, self.errors.get(index, "Failed to create LVol"))
+                for index in range(len(self.volumes))]
@@ -0,0 +1,489 @@
+# coding=utf-8
+import copy
+import time
+
+from simplyblock_core import constants, utils
+from simplyblock_core.controllers import lvol_controller, lvol_events
+from simplyblock_core.lvol_restore import LVolRestore
+from simplyblock_core.models.job_schedule import JobSchedule
+from simplyblock_core.models.lvol_model import LVol
+from simplyblock_core.models.storage_node import StorageNode
+
+logger = utils.get_logger(__name__)
+
+PHASE_PREPARE = 'prepare'
+PHASE_COPY = 'copy'
+PHASE_CUTOVER = 'cutover'
+PHASE_EXPOSE = 'expose'
+PHASE_DRAIN = 'drain'
+
+# phases a failure is rolled back in, from the cutover on the lvol is served by the target
+_ROLLBACK_PHASES = (PHASE_PREPARE, PHASE_COPY)
+
+
+class LVolMigrationException(Exception):
+    pass
+
+
+def check_migration(db, lvol, target_node):
+    """Returns why `lvol` can not be moved to `target_node`, empty if it can"""
+    if lvol.status != LVol.STATUS_ONLINE:
+        return f"LVol is not online: {lvol.get_id()}, status: {lvol.status}"
+    if lvol.namespace or lvol.cloned_from_snap:
+        return f"LVol is a namespace or a clone, can not be moved: {lvol.get_id()}"
+    for other in db.get_lvols(target_node.cluster_id):
+        if other.namespace == lvol.get_id():
+            return f"LVol has namespaces, can not be moved: {lvol.get_id()}"
+    for snap in db.get_snapshots():
+        if snap.lvol and snap.lvol.get_id() == lvol.get_id():
+            return f"LVol has snapshots, can not be moved: {lvol.get_id()}"
+    return check_migration_target(db, lvol, target_node)
+
+
+def check_migration_target(db, lvol, target_node):
+    """Returns why `target_node` can not take `lvol`, empty if it can, the lvol itself is not checked"""
+    if target_node.status != StorageNode.STATUS_ONLINE:
+        return f"Node is not online: {target_node.get_id()}, status: {target_node.status}"
+    if target_node.is_secondary_node:
+        return f"Node is a secondary node: {target_node.get_id()}"
+    if target_node.get_id() in lvol.nodes or target_node.lvstore == lvol.lvs_name:
+        return f"LVol is already on node: {target_node.get_id()}"
+    if lvol.ha_type == "ha" and not target_node.secondary_node_id:
+        return f"Node has no secondary node for the HA lvol: {target_node.get_id()}"
+    if db.get_lvol_count_by_node_id(target_node.get_id()) >= target_node.max_lvol:
+        return f"Too many lvols on node: {target_node.get_id()}"
+    return ""
+
+
+class LVolMigration:
+    """Moves an lvol to the lvstore of another node while its hosts keep using it.
+
+    `step` runs one phase of the migration task, or a part of it, the state
+    is kept in the function params of the task:
+
+    prepare: creates the lvol on the target primary, exposes it on a
+        temporary subsystem and attaches that as an NVMe bdev on the source
+        primary.
+    copy: snapshots the lvol on the source and ships the clusters written
+        since the previous snapshot with a shallow copy, until a copy is at
+        most LVOL_MIGRATION_CUTOVER_CLUSTERS or LVOL_MIGRATION_MAX_PASSES ran.
+    cutover: pauses I/O by setting the listeners of the source inaccessible,
+        ships the last snapshot and puts the NVMe bdev in place of the lvol
+        in the source subsystem. Hosts still connected to the source write to
+        the target from then on. A last copy not done within
+        LVOL_MIGRATION_CUTOVER_TIMEOUT_SEC resumes I/O and continues as a
+        copy pass.
+    expose: creates the subsystems of the lvol on the target nodes and
+        switches the lvol over to them in the DB.
+    drain: removes the lvol from the source once the hosts connected to the
+        target, or `force` is set, or after LVOL_MIGRATION_DRAIN_TIMEOUT_SEC.
+
+    Failures before the cutover are retried up to the max retries of the
+    task, then everything created is rolled back. From the cutover on the
+    target has the only current copy of the data and the phases are
+    retried until they succeed.
+    """
+
+    def __init__(self, db, task):
+        self.db = db
+        self.task = task
+        self.params = task.function_params
+        self.lvol = db.get_lvol_by_id(self.params['lvol_id'])
+        self.mig_nqn = f"{self.lvol.nqn}:migration"
+        self.mig_controller = f"mig_{self.lvol.vuid}"
+        self.proxy_crypto = f"crypto_mig_{self.lvol.vuid}"
+
+    @property
+    def phase(self):
+        return self.params.get('phase', PHASE_PREPARE)
+
+    def _save(self):
+        self.task.function_params = self.params
+        self.task.write_to_db(self.db.kv_store)
+
+    def _node(self, node_id, online=True):
+        if not node_id:
+            return None
+        node = self.db.get_storage_node_by_id(node_id)
+        if online and node.status != StorageNode.STATUS_ONLINE:
+            raise LVolMigrationException(f"Node is not online: {node_id}, status: {node.status}")
+        return node
+
+    def _source_nodes(self, online=True):
+        source = self.params['source']
+        return self._node(source['primary'], online), self._node(source['secondary'], online)
+
+    def _target_nodes(self, online=True):
+        target = self.params['target']
+        return self._node(target['primary'], online), self._node(target['secondary'], online)
+
+    def step(self):
+        """Runs the next phase of the migration, returns True once it is done"""
+        if self.task.canceled and self.phase in _ROLLBACK_PHASES:
+            self.rollback()
+            self.task.function_result = "canceled"
+            self.task.status = JobSchedule.STATUS_DONE
+            self._save()
+            return True
+
+        steps = {
+            PHASE_PREPARE: self.prepare,
+            PHASE_COPY: self.copy,
+            PHASE_CUTOVER: self.cutover,
+            PHASE_EXPOSE: self.expose,
+            PHASE_DRAIN: self.drain,
+        }
+        done = steps[self.phase]()
+        self._save()
+        return done
+
+    def _check_rpc(self, ret, msg):
+        if not ret:
+            raise LVolMigrationException(msg)
+        return ret
+
+    def prepare(self):
+        lvol = self.lvol
+        target_node = self._node(self.params['target_node_id'])
+        source_host = self._node(lvol.node_id, online=False)
+        error = check_migration(self.db, lvol, target_node)
+        if error:
+            raise LVolMigrationException(error)
+
+        source_primary, source_secondary = source_host, None
+        target_primary, target_secondary = target_node, None
+        if lvol.ha_type == "ha":
+            source_primary, source_secondary, error = lvol_controller._get_ha_nodes(source_host, lvol.lvs_name)
+            if error:
+                raise LVolMigrationException(error)
+            target_primary, target_secondary, error = lvol_controller._get_ha_nodes(
+                target_node, target_node.lvstore)
+            if error:
+                raise LVolMigrationException(error)
+        if source_primary.status != StorageNode.STATUS_ONLINE:
+            raise LVolMigrationException(f"Node is not online: {source_primary.get_id()}")
+
+        # the lvol is rewritten for the target once exposed there
+        self.params['source'] = {
+            'node_id': lvol.node_id,
+            'primary': source_primary.get_id(),
+            'secondary': source_secondary.get_id() if source_secondary else "",
+            'lvs_name': lvol.lvs_name,
+            'bdev_stack': lvol.bdev_stack,
+        }
+        self.params['target'] = {
+            'primary': target_primary.get_id(),
+            'secondary': target_secondary.get_id() if target_secondary else "",
+        }
+        self.params.update({'snapshots': [], 'copied': [], 'operation_id': "", 'mig_bdev': ""})
+        self.params['target']['lvs_name'] = target_node.lvstore
+        self._save()
+        try:
+            self.params['mig_bdev'] = self._attach_target(source_primary, target_primary)
+        except LVolMigrationException:
+            # a partially created target is not reused by the next attempt
+            self.rollback()
+            raise
+        self.params['phase'] = PHASE_COPY
+        self.task.function_result = "copying"
+        logger.info(f"Migrating lvol {lvol.get_id()} from node {source_primary.get_id()} "
+                    f"to node {target_primary.get_id()}")
+        return False
+
+    def _attach_target(self, source_primary, target_primary):
+        """Creates the lvol on the target and attaches it to the source primary, returns its NVMe bdev"""
+        lvol = self.lvol
+        target = self.params['target']
+        target_bdev = f"{target['lvs_name']}/{lvol.lvol_bdev}"
+        target_rpc = target_primary.rpc_client()
+        self._check_rpc(target_rpc.create_lvol(
+            lvol.lvol_bdev, utils.convert_size(lvol.size, 'MiB'), target['lvs_name'], lvol.lvol_priority_class),
+            f"Failed to create lvol on node: {target_primary.get_id()}")
+        bdevs = self._check_rpc(target_rpc.get_bdevs(target_bdev),
+                                f"Failed to get lvol bdev on node: {target_primary.get_id()}")
+        target['lvol_uuid'] = bdevs[0]['uuid']
+        target['blobid'] = bdevs[0]['driver_specific']['lvol']['blobid']
+
+        # the raw lvol, the data of crypto lvols is shipped encrypted
+        self._check_rpc(target_rpc.subsystem_create(self.mig_nqn, lvol.ha_type, lvol.uuid, 1, max_namespaces=1),
+                        f"Failed to create subsystem {self.mig_nqn}")
+        self._check_rpc(target_rpc.nvmf_subsystem_add_ns(self.mig_nqn, target_bdev),
+                        f"Failed to add namespace to subsystem {self.mig_nqn}")
+        iface = next(iface for iface in target_primary.data_nics if iface.ip4_address)
+        self._check_rpc(target_rpc.listeners_create(
+            self.mig_nqn, iface.get_transport_type(), iface.ip4_address, target_primary.lvol_subsys_port),
+            f"Failed to create listener for {self.mig_nqn}")
+
+        bdevs = self._check_rpc(source_primary.rpc_client().bdev_nvme_attach_controller_tcp(
+            self.mig_controller, self.mig_nqn, iface.ip4_address, target_primary.lvol_subsys_port),
+            f"Failed to attach {self.mig_nqn} on node: {source_primary.get_id()}")
+        return bdevs[0]
+
+    def _snapshot(self, source_primary, source_secondary):
+        """Snapshots the lvol on the source, returns the name of the snapshot"""
+        lvol = self.lvol
+        snap_name = f"MIG_{lvol.vuid}_{len(self.params['snapshots'])}"
+        rpc_client = source_primary.rpc_client()
+        self._check_rpc(rpc_client.lvol_create_snapshot(f"{lvol.lvs_name}/{lvol.lvol_bdev}", snap_name),
+                        f"Failed to create snapshot {snap_name}")
+        self.params['snapshots'].append(snap_name)
+        self._save()
+        if source_secondary:
+            bdevs = self._check_rpc(rpc_client.get_bdevs(f"{lvol.lvs_name}/{snap_name}"),
+                                    f"Failed to get snapshot bdev {snap_name}")
+            self._check_rpc(source_secondary.rpc_client().bdev_lvol_snapshot_register(
+                f"{lvol.lvs_name}/{lvol.lvol_bdev}", snap_name, bdevs[0]['uuid'],
+                bdevs[0]['driver_specific']['lvol']['blobid']),
+                f"Failed to register snapshot {snap_name} on node: {source_secondary.get_id()}")
+        return snap_name
+
+    def _start_copy(self, source_primary):
+        snap_name = self.params['snapshots'][len(self.params['copied'])]
+        ret = self._check_rpc(source_primary.rpc_client().bdev_lvol_start_shallow_copy(
+            f"{self.lvol.lvs_name}/{snap_name}", self.params['mig_bdev']),
+            f"Failed to start copying snapshot {snap_name}")
+        self.params['operation_id'] = ret['operation_id']
+        self._save()
+
+    def _check_copy(self, source_primary):
+        """Returns True if the running copy completed, False if it is in progress"""
+        ret = self._check_rpc(source_primary.rpc_client().bdev_lvol_check_shallow_copy(
+            self.params['operation_id']), "Failed to check copy")
+        if ret['state'] == "in progress":
+            return False
+        self.params['operation_id'] = ""
+        if ret['state'] != "complete":
+            # started again from the same snapshot
+            raise LVolMigrationException(f"Failed to copy snapshot: {ret.get('error')}")
+        self.params['copied'].append(ret['total_clusters'])
+        logger.info(f"Copied {ret['total_clusters']} clusters of lvol {self.lvol.get_id()}")
+        return True
+
+    def copy(self):
+        source_primary, source_secondary = self._source_nodes()
+        if self.params['operation_id']:
+            self._check_copy(source_primary)
+            return False
+        copied = self.params['copied']
+        if len(copied) < len(self.params['snapshots']):
+            self._start_copy(source_primary)
+        elif copied and (copied[-1] <= constants.LVOL_MIGRATION_CUTOVER_CLUSTERS or
+                         len(copied) >= constants.LVOL_MIGRATION_MAX_PASSES):
+            self.params['phase'] = PHASE_CUTOVER
+        else:
+            self._snapshot(source_primary, source_secondary)
+            self._start_copy(source_primary)
+        return False
+
+    def _set_ana_state(self, nodes, ana_state):
+        for node in nodes:
+            rpc_client = node.rpc_client()
+            for iface in node.data_nics:
+                if iface.ip4_address:
+                    self._check_rpc(rpc_client.nvmf_subsystem_listener_set_ana_state(
+                        self.lvol.nqn, iface.ip4_address, self.lvol.subsys_port, ana=ana_state),
+                        f"Failed to set ANA state {ana_state} on node: {node.get_id()}")
+
+    def _resume(self, source_primary, source_secondary):
+        try:
+            self._set_ana_state([source_primary], "optimized")
+            if source_secondary:
+                self._set_ana_state([source_secondary], "non_optimized")
+        except LVolMigrationException as e:
+            logger.error(e)
+
+    def _swap_namespace(self, rpc_client):
+        """Puts the NVMe bdev of the target in place of the lvol in the source subsystem"""
+        lvol = self.lvol
+        proxy = self.params['mig_bdev']
+        if "crypto" in lvol.lvol_type:
+            # the target has the data as encrypted by the source
+            self._check_rpc(rpc_client.lvol_crypto_create(self.proxy_crypto, proxy, f"key_{lvol.crypto_bdev}"),
+                            f"Failed to create crypto bdev {self.proxy_crypto}")
+            proxy = self.proxy_crypto
+        error = None
+        if not rpc_client.nvmf_subsystem_remove_ns(lvol.nqn, lvol.ns_id):
+            error = f"Failed to remove namespace from subsystem {lvol.nqn}"
+        elif not rpc_client.nvmf_subsystem_add_ns(lvol.nqn, proxy, lvol.uuid, lvol.guid, lvol.ns_id):
+            rpc_client.nvmf_subsystem_add_ns(lvol.nqn, lvol.top_bdev, lvol.uuid, lvol.guid, lvol.ns_id)
+            error = f"Failed to add namespace to subsystem {lvol.nqn}"
+        if error:
+            if proxy == self.proxy_crypto:
+                rpc_client.lvol_crypto_delete(self.proxy_crypto)
+            raise LVolMigrationException(error)
+
+    def cutover(self):
+        """Ships the last snapshot while I/O is paused and swaps the source namespace for the NVMe bdev"""
+        lvol = self.lvol
+        source_primary, source_secondary = self._source_nodes()
+        source_nodes = [node for node in (source_primary, source_secondary) if node]
+        rpc_client = source_primary.rpc_client()
+        started = time.monotonic()
+        try:
+            self._set_ana_state(source_nodes, "inaccessible")
+            self._snapshot(source_primary, source_secondary)
+            self._start_copy(source_primary)
+            while not self._check_copy(source_primary):
+                if time.monotonic() - started > constants.LVOL_MIGRATION_CUTOVER_TIMEOUT_SEC:
+                    # the copy goes on while I/O is resumed, the next attempt continues from there
+                    logger.warning(f"Last copy of lvol {lvol.get_id()} timed out, resuming I/O")
+                    self._resume(source_primary, source_secondary)
+                    self.params['phase'] = PHASE_COPY
+                    return False
+                time.sleep(0.2)
+
+            self._swap_namespace(rpc_client)
+        except LVolMigrationException:
+            self._resume(source_primary, source_secondary)
+            self.params['phase'] = PHASE_COPY
+            raise
+
+        # the source secondary still has the lvol of the source lvstore behind its namespace
+        if source_secondary:
+            source_secondary.rpc_client().subsystem_delete(lvol.nqn)
+        self._set_ana_state([source_primary], "non_optimized")
+        logger.info(f"Cutover of lvol {lvol.get_id()} done, I/O paused for {time.monotonic() - started:.2f}s")
+        self.params['phase'] = PHASE_EXPOSE
+        self.task.function_result = "exposing on target"
+        return False
+
+    def _migrated_lvol(self, target_primary):
+        """Returns the lvol as served by the target nodes"""
+        lvol = copy.deepcopy(self.lvol)
+        target = self.params['target']
+        target_node = self._node(self.params['target_node_id'], online=False)
+        lvol.node_id = target_node.get_id()
+        lvol.hostname = target_node.hostname
+        lvol.nodes = [target_node.get_id()]
+        if lvol.ha_type == "ha":
+            lvol.nodes.append(target_node.secondary_node_id)
+        lvol.lvs_name = target['lvs_name']
+        lvol.subsys_port = target_primary.lvol_subsys_port
+        lvol.lvol_uuid = target['lvol_uuid']
+        lvol.blobid = target['blobid']
+        lvol.base_bdev = f"{lvol.lvs_name}/{lvol.lvol_bdev}"
+        lvol.top_bdev = lvol.crypto_bdev if "crypto" in lvol.lvol_type else lvol.base_bdev
+        for bdev in lvol.bdev_stack:
+            if bdev['type'] == "bdev_lvol":
+                bdev['params']['lvs_name'] = lvol.lvs_name
+            elif bdev['type'] == "crypto":
+                bdev['params']['base_name'] = lvol.base_bdev
+        return lvol
+
+    def expose(self):
+        source_primary, _ = self._source_nodes(online=False)
+        target_primary, target_secondary = self._target_nodes()
+        lvol = self._migrated_lvol(target_primary)
+
+        # controller ids of the target and source subsystems of the NQN must not overlap
+        subsystems = source_primary.rpc_client().subsystem_list(lvol.nqn) \
+            if source_primary.status == StorageNode.STATUS_ONLINE else []
+        min_cntlid = 1
+        if not subsystems or subsystems[0].get('min_cntlid', 1) < constants.LVOL_MIGRATION_CNTLID_OFFSET:
+            min_cntlid = constants.LVOL_MIGRATION_CNTLID_OFFSET
+
+        for node, ana_state, cntlid in [(target_primary, "optimized", min_cntlid),
+                                        (target_secondary, "non_optimized", min_cntlid + 1000)]:
+            if not node:
+                continue
+            rpc_client = node.rpc_client()
+            if rpc_client.subsystem_list(lvol.nqn):
+                # left by a failed attempt
+                rpc_client.subsystem_delete(lvol.nqn)
+            if node is target_secondary and not rpc_client.get_bdevs(lvol.base_bdev):
+                self._check_rpc(rpc_client.bdev_lvol_register(
+                    lvol.lvol_bdev, lvol.lvs_name, lvol.lvol_uuid, lvol.blobid, lvol.lvol_priority_class),
+                    f"Failed to register lvol on node: {node.get_id()}")
+            restore = LVolRestore(self.db, node, [lvol], ana_state, cntlid)
+            restore.create_subsystems()
+            restore.start()
+            errors = restore.wait()
+            if errors:
+                raise LVolMigrationException(f"Failed to expose lvol on node {node.get_id()}: "
+                                             f"{errors[lvol.get_id()]}")
+
+        lvol.status = LVol.STATUS_ONLINE
+        lvol.write_to_db(self.db.kv_store)
+        lvol_events.lvol_migrate(lvol, self.params['source']['node_id'], lvol.node_id)
+        self.params['phase'] = PHASE_DRAIN
+        self.params['drain_since'] = int(time.time())
+        self.task.function_result = "waiting for hosts to connect to the target"
+        return False
+
+    def _hosts(self, node):
+        controllers = node.rpc_client().nvmf_subsystem_get_controllers(self.lvol.nqn) or []
+        return {controller['hostnqn'] for controller in controllers}
+
+    def drain(self):
+        source_primary, source_secondary = self._source_nodes(online=False)
+        if source_primary.status == StorageNode.STATUS_ONLINE and not self.params.get('force') and \
+                time.time() - self.params['drain_since'] < constants.LVOL_MIGRATION_DRAIN_TIMEOUT_SEC:
+            target_hosts: set = set()
+            for node in self._target_nodes(online=False):
+                if node and node.status == StorageNode.STATUS_ONLINE:
+                    target_hosts |= self._hosts(node)
+            waiting = self._hosts(source_primary) - target_hosts
+            if waiting:
+                logger.info(f"Waiting for {len(waiting)} hosts to connect lvol {self.lvol.get_id()} on the target")
+                return False
+
+        source = self.params['source']
+        for node in (source_primary, source_secondary):
+            if not node or node.status != StorageNode.STATUS_ONLINE:
+                # the node drops the lvol when it is restarted, it is not in the DB anymore
+                continue
+            rpc_client = node.rpc_client()
+            if rpc_client.subsystem_list(self.lvol.nqn):
+                rpc_client.subsystem_delete(self.lvol.nqn)
+            if node is source_primary:
+                if "crypto" in self.lvol.lvol_type:
+                    rpc_client.lvol_crypto_delete(self.proxy_crypto)
+                rpc_client.bdev_nvme_detach_controller(self.mig_controller)
+            lvol_controller._remove_bdev_stack(copy.deepcopy(source['bdev_stack'])[::-1], rpc_client)
+            for snap_name in self.params['snapshots'][::-1]:
+                rpc_client.delete_lvol(f"{source['lvs_name']}/{snap_name}")
+
+        target_primary, _ = self._target_nodes(online=False)
+        target_primary.rpc_client().subsystem_delete(self.mig_nqn)
+        logger.info(f"Migration of lvol {self.lvol.get_id()} done")
+        self.task.function_result = "Done"
+        self.task.status = JobSchedule.STATUS_DONE
+        return True
+
+    def rollback(self):
+        """Removes what the migration created, only before the cutover"""
+        if 'source' not in self.params:
+            return
+        lvol = self.lvol
+        source_primary, source_secondary = self._source_nodes(online=False)
+        target_primary, _ = self._target_nodes(online=False)
+        source_primary.rpc_client().bdev_nvme_detach_controller(self.mig_controller)
+        # deleted newest first, the lvol takes over the clusters of each
+        for node in (source_primary, source_secondary):
+            if node:
+                rpc_client = node.rpc_client()
+                for snap_name in self.params.get('snapshots', [])[::-1]:
+                    rpc_client.delete_lvol(f"{self.params['source']['lvs_name']}/{snap_name}")
+        rpc_client = target_primary.rpc_client()
+        rpc_client.subsystem_delete(self.mig_nqn)
+        rpc_client.delete_lvol(f"{self.params['target']['lvs_name']}/{lvol.lvol_bdev}")
+        self.params.update({'snapshots': [], 'copied': [], 'operation_id': "", 'mig_bdev': ""})
+        self.params['phase'] = PHASE_PREPARE
+        logger.info(f"Rolled back the migration of lvol {lvol.get_id()}")
+
+    def fail(self, error):
+        """Counts a failed step, rolls back once the task is out of retries before the cutover.
+
+        Returns True if the task is done.
+        """
+        self.task.retry += 1
+        self.task.function_result = str(error)
+        if self.phase in _ROLLBACK_PHASES and 0 <= self.task.max_retry <= self.task.retry:
+            self.rollback()
+            self.task.function_result = f"failed: {error}"
+            self.task.status = JobSchedule.STATUS_DONE
+            self._save()
+            return True
+        self.task.status = JobSchedule.STATUS_SUSPENDED
+        self._save()
+        return False
@@ -0,0 +1,116 @@
+# coding=utf-8
+import random
+import threading
+import time
+
+from simplyblock_core import constants, utils
+from simplyblock_core.stats_frame import StatsFrame
+
+logger = utils.get_logger(__name__)
+
+# node stats fields the placement scores the nodes on, besides their lvol count
+STATS_METRICS = ('read_io_ps', 'write_io_ps', 'read_bytes_ps', 'write_bytes_ps', 'size_util', 'cpu_busy')
+# percentages, scored against 100 instead of against the most loaded node
+_PERCENT_METRICS = ('size_util', 'cpu_busy')
+
+
+class NodeStatsSnapshot:
+    """The recent load of the storage nodes, shared by the placements of a process.
+
+    The mean of the last `samples` stats records of a node is read at most
+    once every `ttl` seconds. The collector writes a record every few
+    seconds, so placing many lvols in a row does not read the stats of every
+    node for each of them.
+    """
+
+    def __init__(self, ttl=constants.LVOL_PLACEMENT_STATS_TTL_SEC, samples=constants.LVOL_PLACEMENT_STATS_SAMPLES):
+        self.ttl = ttl
+        self.samples = samples
+        self._lock = threading.Lock()
+        # node id -> (read time, stats)
+        self._stats: dict = {}
+
+    def get(self, db, node) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._stats.get(node.get_id())
+        if cached is not None and now - cached[0] < self.ttl:
+            return cached[1]
+        records = db.get_node_stats(node, limit=self.samples)
+        stats = dict.fromkeys(STATS_METRICS, 0)
+        stats.update(StatsFrame.from_records(records, STATS_METRICS).mean())
+        with self._lock:
+            self._stats[node.get_id()] = (now, stats)
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+
+_snapshot = NodeStatsSnapshot()
+
+
+class LVolPlacement:
+    """Scores the storage nodes by their load to place new lvols.
+
+    The score of a node is the weighted mean of its metrics, the lvol count
+    and the STATS_METRICS, each scaled to 0-1: the percentages against 100,
+    the others against the most loaded of the nodes compared. `weights` maps
+    the metrics to their relative weight, LVOL_PLACEMENT_WEIGHTS by default.
+    """
+
+    def __init__(self, db, weights=None, snapshot=None):
+        self.db = db
+        self.weights = {metric: weight for metric, weight in (weights or constants.LVOL_PLACEMENT_WEIGHTS).items()
+                        if weight}
+        self.snapshot = snapshot or _snapshot
+
+    def loads(self, nodes, lvol_counts) -> dict:
+        """Returns the metrics of each node by node id, `lvol_counts` are the lvols per node id"""
+        loads = {}
+        for node in nodes:
+            load = {'lvol': lvol_counts.get(node.get_id(), 0)}
+            if any(metric in self.weights for metric in STATS_METRICS):
+                load.update(self.snapshot.get(self.db, node))
+            loads[node.get_id()] = load
+        return loads
+
+    def scores(self, loads) -> dict:
+        """Returns the score of each node of `loads`, from 0 for idle to 1 for fully loaded"""
+        total_weight = sum(self.weights.values())
+        if not loads or not total_weight:
+            return dict.fromkeys(loads, 0.0)
+        scale = {}
+        for metric in self.weights:
+            if metric in _PERCENT_METRICS:
+                scale[metric] = 100
+            else:
+                scale[metric] = max(load.get(metric, 0) for load in loads.values())
+        scores = {}
+        for node_id, load in loads.items():
+            score = 0.0
+            for metric, weight in self.weights.items():
+                if scale[metric] > 0:
+                    score += weight * min(load.get(metric, 0) / scale[metric], 1.0)
+            scores[node_id] = score / total_weight
+        return scores
+
+    def select(self, nodes, lvol_counts, count=3, rng=random):
+        """Returns up to `count` of `nodes`, drawn at random by their headroom, in drawing order.
+
+        A node is drawn with a probability of its squared headroom, one minus
+        its score, over that of the nodes not drawn yet. Concurrent placements
+        working from the same stats spread over the lightly loaded nodes
+        instead of all picking the least loaded one.
+        """
+        scores = self.scores(self.loads(nodes, lvol_counts))
+        logger.debug(f"Node placement scores: {scores}")
+        candidates = {node.get_id(): node for node in nodes}
+        drawn: list = []
+        while candidates and len(drawn) < count:
+            weights = [max(1.0 - scores[node_id], 0.01) ** 2 for node_id in candidates]
+            node_id = rng.choices(list(candidates), weights)[0]
+            drawn.append(candidates.pop(node_id))
+        logger.debug(f"Selected nodes: {[node.get_id() for node in drawn]}")
+        return drawn
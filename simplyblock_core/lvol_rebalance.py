@@ -0,0 +1,206 @@
+# coding=utf-8
+import time
+
+from simplyblock_core import constants, utils
+from simplyblock_core.lvol_migration import check_migration_target
+from simplyblock_core.models.job_schedule import JobSchedule
+from simplyblock_core.models.lvol_model import LVol
+from simplyblock_core.models.stats import SAMPLE_SECONDS
+from simplyblock_core.models.storage_node import StorageNode
+from simplyblock_core.stats_frame import StatsFrame
+
+logger = utils.get_logger(__name__)
+
+# rebalanced metrics and the stats fields they add up, capacity is the provisioned size of the lvols
+METRICS = {
+    'iops': ('read_io_ps', 'write_io_ps'),
+    'throughput': ('read_bytes_ps', 'write_bytes_ps'),
+    'capacity': (),
+}
+_STATS_FIELDS = ('read_io_ps', 'write_io_ps', 'read_bytes_ps', 'write_bytes_ps')
+
+
+def _series(records, metric):
+    """Returns the values of `metric` of each stats record"""
+    frame = StatsFrame.from_records(records, _STATS_FIELDS)
+    columns = [frame.columns[field] for field in METRICS[metric] if field in frame.columns]
+    return [sum(values) for values in zip(*columns)] if columns else [0] * frame.count
+
+
+class RebalancePlanner:
+    """Plans lvol migrations moving load off the storage nodes which stay hot.
+
+    A node is hot for a metric when, for each of its last `window` stats
+    records, the metric is above the cluster mean by more than `trigger`.
+    The lvols of a hot node are moved, most loaded first, to the least
+    loaded nodes until it is within `settle` above the mean. A move is only
+    planned if its target stays within `settle` above the mean, so that the
+    next plan does not move the lvol back. The gap between `trigger` and
+    `settle` keeps nodes near the threshold from flapping.
+
+    At most `max_moves` migrations run in the cluster at once. The lvols
+    migrated during the last `cooldown` seconds are not moved again. Nodes a
+    migration ran from or to within the window are neither source nor
+    target, their stats do not show the migration yet.
+    """
+
+    def __init__(self, db, cluster_id, window=constants.LVOL_REBALANCE_WINDOW,
+                 trigger=constants.LVOL_REBALANCE_TRIGGER, settle=constants.LVOL_REBALANCE_SETTLE,
+                 max_moves=constants.LVOL_REBALANCE_MAX_MOVES, cooldown=constants.LVOL_REBALANCE_COOLDOWN_SEC):
+        self.db = db
+        self.cluster_id = cluster_id
+        self.window = window
+        self.trigger = trigger
+        self.settle = settle
+        self.max_moves = max_moves
+        self.cooldown = cooldown
+        self.nodes: dict = {}
+        # node id -> metric -> mean over the window, updated by the planned moves
+        self.loads: dict = {}
+        # node id -> metric -> lowest value over the window
+        self.sustained: dict = {}
+        self._lvol_loads: dict = {}
+
+    def _migrations(self):
+        """Returns the number of running migrations, the lvols in cooldown and the nodes migrated from or to"""
+        active = [task for task in self.db.get_active_job_tasks(self.cluster_id, JobSchedule.FN_LVOL_MIG)
+                  if not task.canceled]
+        lvol_ids = {task.function_params.get('lvol_id') for task in active}
+        node_ids = set()
+        for task in active:
+            node_ids.update([task.node_id, task.function_params.get('target_node_id')])
+
+        now = time.time()
+        since = now - max(self.cooldown, self.window * SAMPLE_SECONDS)
+        for task in self.db.get_job_tasks_since(self.cluster_id, since):
+            if task.function_name != JobSchedule.FN_LVOL_MIG or task.canceled or task.status != JobSchedule.STATUS_DONE:
+                continue
+            if now - task.date <= self.cooldown:
+                lvol_ids.add(task.function_params.get('lvol_id'))
+            if now - task.date <= self.window * SAMPLE_SECONDS:
+                node_ids.update([task.node_id, task.function_params.get('target_node_id')])
+        return len(active), lvol_ids, node_ids
+
+    def _load_nodes(self):
+        for node in self.db.get_storage_nodes_by_cluster_id(self.cluster_id):
+            if node.status != StorageNode.STATUS_ONLINE or node.is_secondary_node:
+                continue
+            records = self.db.get_node_stats(node, limit=self.window)
+            if len(records) < self.window:
+                logger.debug(f"Not enough stats records of node {node.get_id()}: {len(records)}")
+                continue
+            self.nodes[node.get_id()] = node
+            self.loads[node.get_id()] = {}
+            self.sustained[node.get_id()] = {}
+            for metric in METRICS:
+                if metric == 'capacity':
+                    size = sum(lvol.size for lvol in self.db.get_lvols_by_node_id(node.get_id()))
+                    self.loads[node.get_id()][metric] = size
+                    self.sustained[node.get_id()][metric] = size
+                    continue
+                series = _series(records, metric)
+                self.loads[node.get_id()][metric] = sum(series) / len(series)
+                self.sustained[node.get_id()][metric] = min(series)
+
+    def mean(self, metric):
+        return sum(load[metric] for load in self.loads.values()) / len(self.loads) if self.loads else 0
+
+    def lvol_load(self, lvol):
+        """Returns the mean of each metric of `lvol` over the window"""
+        if lvol.get_id() not in self._lvol_loads:
+            records = self.db.get_lvol_stats(lvol, limit=self.window)
+            load = {metric: sum(_series(records, metric)) / len(records) if records else 0
+                    for metric in METRICS if metric != 'capacity'}
+            load['capacity'] = lvol.size
+            self._lvol_loads[lvol.get_id()] = load
+        return self._lvol_loads[lvol.get_id()]
+
+    def hot_nodes(self, metric):
+        """Returns the ids of the nodes hot for `metric`, hottest first"""
+        threshold = max(self.mean(metric) * (1 + self.trigger), constants.LVOL_REBALANCE_MIN_LOAD[metric])
+        hot = [node_id for node_id in self.loads
+               if threshold > 0 and self.sustained[node_id][metric] > threshold]
+        return sorted(hot, key=lambda node_id: self.loads[node_id][metric], reverse=True)
+
+    def _move(self, lvol, source_id, metric, limit, excluded_nodes):
+        """Returns the node to move `lvol` to, None if no node can take it"""
+        load = self.lvol_load(lvol)[metric]
+        if not load:
+            return None
+        for target_id in sorted(self.loads, key=lambda node_id: self.loads[node_id][metric]):
+            if target_id == source_id or target_id in excluded_nodes:
+                continue
+            target_load = self.loads[target_id][metric]
+            # the move must narrow the gap between both nodes, not swap them
+            if target_load + load > limit or load >= self.loads[source_id][metric] - target_load:
+                continue
+            if check_migration_target(self.db, lvol, self.nodes[target_id]):
+                continue
+            return target_id
+        return None
+
+    def plan(self):
+        """Returns the moves to make, as dicts of the lvol, source and target node and the reason"""
+        running, cooldown_lvols, migrated_nodes = self._migrations()
+        budget = self.max_moves - running
+        if budget <= 0:
+            logger.info(f"{running} lvol migrations running, not planning more")
+            return []
+        self._load_nodes()
+        if len(self.loads) < 2:
+            return []
+
+        # lvols which can not be migrated, only the targets are checked for the lvols picked
+        moved = set(cooldown_lvols)
+        for snap in self.db.get_snapshots():
+            if snap.lvol:
+                moved.add(snap.lvol.get_id())
+        for lvol in self.db.get_lvols(self.cluster_id):
+            if lvol.namespace or lvol.cloned_from_snap:
+                moved.update([lvol.get_id(), lvol.namespace])
+
+        moves: list = []
+        for metric in METRICS:
+            mean = self.mean(metric)
+            limit = mean * (1 + self.settle)
+            for source_id in self.hot_nodes(metric):
+                if source_id in migrated_nodes:
+                    continue
+                reason = f"{metric} {int(self.sustained[source_id][metric])} > " \
+                         f"{int(mean * (1 + self.trigger))} for {self.window} samples"
+                lvols = [lvol for lvol in self.db.get_lvols_by_node_id(source_id)
+                         if lvol.get_id() not in moved and lvol.status == LVol.STATUS_ONLINE]
+                lvols.sort(key=lambda lvol: self.lvol_load(lvol)[metric], reverse=True)
+                for lvol in lvols:
+                    if len(moves) >= budget or self.loads[source_id][metric] <= limit:
+                        break
+                    target_id = self._move(lvol, source_id, metric, limit, migrated_nodes)
+                    if target_id is None:
+                        continue
+                    for name, value in self.lvol_load(lvol).items():
+                        self.loads[source_id][name] -= value
+                        self.loads[target_id][name] += value
+                    moved.add(lvol.get_id())
+                    moves.append({
+                        'lvol_id': lvol.get_id(),
+                        'lvol_name': lvol.lvol_name,
+                        'source': source_id,
+                        'target': target_id,
+                        'metric': metric,
+                        'load': int(self.lvol_load(lvol)[metric]),
+                        'reason': reason,
+                    })
+        return moves
+
+    def apply(self, moves):
+        """Adds the migration tasks of `moves`, returns their task ids"""
+        from simplyblock_core.controllers import tasks_controller
+
+        task_ids = []
+        for move in moves:
+            task_id = tasks_controller.add_lvol_mig_task(self.db.get_lvol_by_id(move['lvol_id']), move['target'])
+            if task_id:
+                logger.info(f"Moving lvol {move['lvol_id']} from node {move['source']} to node {move['target']}, "
+                            f"{move['reason']}")
+                task_ids.append(task_id)
+        return task_ids
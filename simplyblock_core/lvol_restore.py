@@ -0,0 +1,183 @@
+# coding=utf-8
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from simplyblock_core import constants, utils
+from simplyblock_core.models.lvol_model import LVol
+from simplyblock_core.models.pool import Pool
+
+logger = utils.get_logger(__name__)
+
+
+def _error(method, error):
+    if isinstance(error, dict) and error.get('message'):
+        return f"{method}: {error['message']}"
+    return f"{method}: {error or 'failed'}"
+
+
+class LVolRestore:
+    """Restores the NVMe-oF subsystems of the lvols of a node after its lvstore was recreated.
+
+    `create_subsystems` creates the subsystem of each NQN, ahead of the
+    examination of the lvstore. Once the lvol bdevs are back, `start` adds
+    the crypto bdevs, namespaces, listeners and QoS limits of the lvols in
+    the background and `wait` returns when all are done. The calls are sent
+    in RPC batches of `chunk` lvols, of which `workers` are in flight at
+    once, the lvols of each finished batch are set online in one
+    transaction.
+
+    The lvols a call failed for are kept in `errors` with the first error,
+    and left as they are in the DB.
+    """
+
+    def __init__(self, db, snode, lvols, ana_state="optimized", min_cntlid=1,
+                 chunk=constants.LVOL_RESTORE_CHUNK_LVOLS, workers=constants.LVOL_RESTORE_WORKERS):
+        self.db = db
+        self.snode = snode
+        self.lvols = lvols
+        self.ana_state = ana_state
+        self.min_cntlid = min_cntlid
+        self.chunk = chunk
+        self.workers = workers
+        self.errors: dict = {}
+        self.restored = 0
+        self.duration = 0.0
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._executor = None
+        self._futures: list = []
+        self._pools: dict = {}
+
+    def _rpc_client(self):
+        # a batch is not sent twice, retrying it after a timeout would repeat the calls executed before
+        return self.snode.rpc_client(timeout=constants.LVOL_RESTORE_RPC_TIMEOUT_SEC, retry=0)
+
+    def _chunks(self, items):
+        return [items[start:start + self.chunk] for start in range(0, len(items), self.chunk)]
+
+    def _send(self, calls_by_lvol):
+        """Sends the calls recorded per lvol in one batch, keeps the first error of each lvol.
+
+        `calls_by_lvol` is a list of (lvol, record) where record(batch) adds
+        the calls of the lvol. Returns the lvols whose calls all succeeded.
+        """
+        batch = self._rpc_client().batch()
+        ranges = []
+        for lvol, record in calls_by_lvol:
+            first = len(batch.calls)
+            record(batch)
+            ranges.append((lvol, first, len(batch.calls)))
+        methods = [method for method, _ in batch.calls]
+        results = batch.send()
+
+        succeeded = []
+        for lvol, first, end in ranges:
+            failed = [_error(methods[i], error) for i, (result, error) in enumerate(results[first:end], first)
+                      if not result]
+            if failed:
+                with self._lock:
+                    self.errors.setdefault(lvol.get_id(), failed[0])
+            else:
+                succeeded.append(lvol)
+        return succeeded
+
+    def create_subsystems(self):
+        """Creates the subsystem of each NQN of the lvols, returns the number of failed lvols"""
+        self._start = time.monotonic()
+        first_by_nqn: dict = {}
+        for lvol in self.lvols:
+            first_by_nqn.setdefault(lvol.nqn, lvol)
+
+        def subsystem(lvol):
+            return lambda batch: batch.subsystem_create(
+                lvol.nqn, lvol.ha_type, lvol.uuid, self.min_cntlid,
+                max_namespaces=constants.LVO_MAX_NAMESPACES_PER_SUBSYS)
+
+        chunks = self._chunks([(lvol, subsystem(lvol)) for lvol in first_by_nqn.values()])
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="restore") as executor:
+            list(executor.map(self._send, chunks))
+        logger.info(f"Created {len(first_by_nqn)} subsystems on node {self.snode.get_id()} "
+                    f"in {time.monotonic() - self._start:.2f}s")
+        return len(self.errors)
+
+    def _qos(self, lvol):
+        """Returns the QoS limits of `lvol` to apply, None if it has none or they are set on its pool"""
+        if not lvol.has_qos():
+            return None
+        if lvol.pool_uuid not in self._pools:
+            try:
+                self._pools[lvol.pool_uuid] = self.db.get_pool_by_id(lvol.pool_uuid)
+            except KeyError as e:
+                logger.error(e)
+                self._pools[lvol.pool_uuid] = None
+        pool = self._pools[lvol.pool_uuid]
+        if pool is None or pool.status == Pool.STATUS_INACTIVE or pool.has_qos():
+            return None
+        return lvol.rw_ios_per_sec, lvol.rw_mbytes_per_sec, lvol.r_mbytes_per_sec, lvol.w_mbytes_per_sec
+
+    def _lvol_calls(self, lvol, listeners):
+        qos = self._qos(lvol)
+
+        def record(batch):
+            if "crypto" in lvol.lvol_type:
+                key_name = f"key_{lvol.crypto_bdev}"
+                batch.lvol_crypto_key_create(key_name, lvol.crypto_key1, lvol.crypto_key2)
+                batch.lvol_crypto_create(lvol.crypto_bdev, f"{lvol.lvs_name}/{lvol.lvol_bdev}", key_name)
+            batch.nvmf_subsystem_add_ns(lvol.nqn, lvol.top_bdev, lvol.uuid, lvol.guid, nsid=lvol.ns_id)
+            if listeners:
+                for iface in self.snode.data_nics:
+                    if iface.ip4_address:
+                        batch.listeners_create(lvol.nqn, iface.get_transport_type(), iface.ip4_address,
+                                               lvol.subsys_port, ana_state=self.ana_state)
+            if qos:
+                batch.bdev_set_qos_limit(lvol.top_bdev, *qos)
+
+        return record
+
+    def _add(self, calls_by_lvol):
+        restored = self._send(calls_by_lvol)
+        if restored:
+            lvols = []
+            for lvol in restored:
+                try:
+                    lvol = self.db.get_lvol_by_id(lvol.get_id())
+                except KeyError:
+                    continue
+                lvol.status = LVol.STATUS_ONLINE
+                lvol.io_error = False
+                lvol.health_check = True
+                lvols.append(lvol)
+            self.db.write_many(lvols)
+        with self._lock:
+            self.restored += len(restored)
+            done = self.restored + len(self.errors)
+        logger.info(f"Restored {done}/{len(self.lvols)} lvols on node {self.snode.get_id()}")
+
+    def start(self):
+        """Starts adding the lvols to their subsystems, returns without waiting for them"""
+        listeners = set()
+        calls_by_lvol = []
+        for lvol in self.lvols:
+            if lvol.get_id() in self.errors:
+                continue
+            calls_by_lvol.append((lvol, self._lvol_calls(lvol, lvol.nqn not in listeners)))
+            listeners.add(lvol.nqn)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="restore")
+        self._futures = [self._executor.submit(self._add, chunk) for chunk in self._chunks(calls_by_lvol)]
+
+    def wait(self):
+        """Waits for the lvols started, returns the errors by lvol id"""
+        if self._executor is not None:
+            wait(self._futures)
+            self._executor.shutdown()
+            for future in self._futures:
+                if future.exception() is not None:
+                    logger.error(f"Failed to restore lvols on node {self.snode.get_id()}: {future.exception()}")
+            self._executor = None
+        self.duration = time.monotonic() - self._start
+        for lvol_id, error in self.errors.items():
+            logger.error(f"Failed to restore lvol {lvol_id} on node {self.snode.get_id()}: {error}")
+        logger.info(f"Restored {self.restored} of {len(self.lvols)} lvols on node {self.snode.get_id()} "
+                    f"in {self.duration:.2f}s, {len(self.errors)} failed")
+        return self.errors
@@ -2,16 +2,168 @@
 import pprint
 
 import json
-from inspect import ismethod
+import struct
+from inspect import isfunction, ismethod
 import sys
-from typing import Mapping, Type
-from collections import ChainMap
+from typing import Any, Callable, List, Mapping, Tuple, Type
+from collections import ChainMap, defaultdict
+
+try:
+    import orjson
+except ImportError:  # optional, speeds up (de)serialization of DB records
+    orjson = None  # type: ignore[assignment]
+
+
+def json_dumps(data) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # e.g. integers exceeding 64 bit, leave those to the stdlib
+    return json.dumps(data).encode()
+
+
+def json_loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+_PLAIN_TYPES = frozenset([str, int, float, bool, type(None)])
+
+
+def _scalar_decoder(dtype):
+    def decode(value):
+        if type(value) is dtype:
+            return value
+        try:
+            return dtype(value)
+        except Exception:
+            if type(value) is list and dtype is int:
+                return len(value)
+            return value
+    return decode
+
+
+def _field_decoder(dtype) -> Callable[[Any], Any]:
+    """Returns the function converting a raw JSON value into a field of type `dtype`"""
+    if dtype in (int, float, str, bool):
+        return _scalar_decoder(dtype)
+
+    if hasattr(dtype, '__origin__'):
+        if dtype.__origin__ is list:
+            if hasattr(dtype, "__args__") and hasattr(dtype.__args__[0], "from_dict"):
+                item_type = dtype.__args__[0]
+                return lambda value: [item_type().from_dict(item) for item in value]
+        elif dtype.__origin__ == Mapping:
+            if hasattr(dtype, "__args__") and hasattr(dtype.__args__[1], "from_dict"):
+                item_type = dtype.__args__[1]
+                return lambda value: {k: item_type().from_dict(v) for k, v in value.items()}
+            return dtype
+        return lambda value: value
+
+    return dtype
+
+
+def transact(kv_store, func, max_retries=None):
+    """Runs `func(tr)` in a single FDB transaction and returns its result.
+
+    If `kv_store` is already a transaction, `func` is simply applied to it and
+    committing is left to the owner of that transaction. Otherwise a new
+    transaction is created and retried on retryable FDB errors, at most
+    `max_retries` times if given, the last error is raised then.
+    """
+    if not hasattr(kv_store, 'create_transaction'):
+        return func(kv_store)
+    tr = kv_store.create_transaction()
+    retries = 0
+    while True:
+        try:
+            result = func(tr)
+            tr.commit().wait()
+            return result
+        except Exception as e:
+            if max_retries is not None and retries >= max_retries:
+                raise
+            retries += 1
+            # re-raises anything that is not a retryable FDBError
+            tr.on_error(e).wait()
+
+
+class UnitOfWork:
+    """Collects object writes and removals and commits them in one FDB transaction.
+
+    Pass it instead of a kv_store to `write_to_db`/`remove`. The state of an
+    object is captured at that call, so the collected operations can be
+    replayed if the transaction conflicts. Used as a context manager, see
+    `DBController.transaction`, the operations are committed on a clean exit.
+
+    With a `chunk_size`, the operations are committed whenever that many are
+    collected, each chunk in a transaction of its own, which keeps large
+    units within the FDB transaction limits. The chunks committed stay
+    committed if the unit is discarded.
+
+    Operations declaring the keys they read get these keys read up front,
+    the reads of all operations are issued before the first one is waited on.
+    """
+
+    def __init__(self, kv_store, chunk_size=0, max_retries=None):
+        self.kv_store = kv_store
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self._ops: List[Tuple[str, Callable, tuple]] = []
+
+    def add(self, name, op, reads=()):
+        """Adds `op`, called as `op(tr)`, or `op(tr, values)` with the futures of the `reads` keys"""
+        self._ops.append((name, op, tuple(reads)))
+        if self.chunk_size and len(self._ops) >= self.chunk_size:
+            self.commit()
+
+    def commit(self):
+        if self._ops:
+            transact(self.kv_store, self._apply, self.max_retries)
+            for name, _, _ in self._ops:
+                BaseModel._local_writes[name] += 1
+        self._ops = []
+
+    def _apply(self, tr):
+        keys = dict.fromkeys(key for _, _, reads in self._ops for key in reads)
+        prefetched = {key: tr[key] for key in keys}
+        for _, op, reads in self._ops:
+            if reads:
+                # a key read by more than one operation is read again, after the earlier writes
+                op(tr, {key: prefetched.pop(key) for key in reads if key in prefetched})
+            else:
+                op(tr)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
 
 
 class BaseModel(object):
 
     _STATUS_CODE_MAP: dict = {}
 
+    # Attributes mirrored into the `index/<name>/<attr>/<value>/<id>` keyspace,
+    # kept consistent with the object by write_to_db and remove.
+    _INDEXES: tuple = ()
+
+    # VUID spaces the VUIDs reserved by the object are taken from, released
+    # by remove, see VUIDAllocator.
+    _VUID_SPACES: tuple = ()
+
+    # Bump `meta/version/<name>` on every write, so that object caches can
+    # watch a single key per type for invalidation.
+    _VERSIONED: bool = False
+
+    # Per-process count of committed writes per type, lets caches observe
+    # this process' own writes before the FDB watch fires.
+    _local_writes: dict = defaultdict(int)
+
     id: str = ""
     uuid: str = ""
     name: str = ""
@@ -23,6 +175,31 @@ class BaseModel(object):
     object_type: str= "object"
 
 
+    # Field schema compiled once per class, see _compile_schema
+    _fields: Tuple[str, ...] = ()
+    _field_types: Tuple[Tuple[str, Type], ...] = ()
+    _decoders: Tuple[Tuple[str, Callable[[Any], Any]], ...] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._compile_schema()
+
+    @classmethod
+    def _compile_schema(cls):
+        """Resolves the serialized fields and their decoders for this class.
+
+        Annotations are inherited through the MRO, so this walks them once at
+        class creation instead of on every from_dict/to_dict call.
+        """
+        field_types = []
+        for s, t in cls.all_annotations().items():
+            default = getattr(cls, s, None)
+            if not s.startswith("_") and not (isfunction(default) or ismethod(default)):
+                field_types.append((s, t))
+        cls._field_types = tuple(field_types)
+        cls._fields = tuple(s for s, _ in field_types)
+        cls._decoders = tuple((s, _field_decoder(t)) for s, t in field_types)
+
     def __init__(self, data=None):
         self.name = self.__class__.__name__
         self.from_dict(data)
@@ -50,11 +227,24 @@ class BaseModel(object):
         return self.uuid
 
     def get_attrs_map(self):
-        _attribute_map = {}
-        for s , t in self.all_annotations().items():
-            if not s.startswith("_") and not ismethod(getattr(self, s)):
-                _attribute_map[s]= {"type": t, "default": getattr(self, s)}
-        return _attribute_map
+        return {s: {"type": t, "default": getattr(self, s)} for s, t in self._field_types}
+
+    def get_index_values(self) -> Mapping[str, list]:
+        return {attr: [getattr(self, attr)] for attr in self._INDEXES}
+
+    def get_index_keys(self) -> List[str]:
+        return [
+            self.get_index_prefix(attr, value) + self.get_id()
+            for attr, values in self.get_index_values().items()
+            for value in values
+            if value not in (None, "")
+        ]
+
+    def get_index_prefix(self, attr, value):
+        return "index/%s/%s/%s/" % (self.name, attr, value)
+
+    def get_version_key(self):
+        return ("meta/version/%s" % self.name).encode()
 
     def get_db_id(self, use_this_id=None):
         if use_this_id:
@@ -63,49 +253,29 @@ class BaseModel(object):
             return "%s/%s/%s" % (self.object_type, self.name, self.get_id())
 
     def from_dict(self, data):
-        for attr, value_dict in self.get_attrs_map().items():
-            value = value_dict['default']
-            if data is not None and attr in data:
-                dtype = value_dict['type']
-                value = data[attr]
-                if dtype in [int, float, str, bool]:
-                    try:
-                        value = dtype(value)
-                    except Exception:
-                        if type(value) is list and dtype is int:
-                            value = len(value)
-
-                elif hasattr(dtype, '__origin__'):
-                    if dtype.__origin__ is list:
-                        if hasattr(dtype, "__args__") and hasattr(dtype.__args__[0], "from_dict"):
-                            value = [dtype.__args__[0]().from_dict(item) for item in data[attr]]
-                        else:
-                            value = data[attr]
-                    elif dtype.__origin__ == Mapping:
-                        if hasattr(dtype, "__args__") and hasattr(dtype.__args__[1], "from_dict"):
-                            value = {item: dtype.__args__[1]().from_dict(data[attr][item]) for item in data[attr]}
-                        else:
-                            value = value_dict['type'](data[attr])
-                else:
-                    value = value_dict['type'](data[attr])
-            setattr(self, attr, value)
+        # Attributes missing from `data` keep their current (default) value
+        if data is not None:
+            for attr, decode in self._decoders:
+                if attr in data:
+                    setattr(self, attr, decode(data[attr]))
         self.id = self.uuid
         return self
 
     def to_dict(self):
         result: dict = {}
-        for attr in self.get_attrs_map():
+        for attr in self._fields:
             value = getattr(self, attr)
-            if isinstance(value, list):
-                result[attr] = list(map(lambda x: x.to_dict() if hasattr(x, "to_dict") else x, value))
+            if type(value) in _PLAIN_TYPES:
+                result[attr] = value
+            elif isinstance(value, list):
+                result[attr] = [x.to_dict() if hasattr(x, "to_dict") else x for x in value]
             elif hasattr(value, "to_dict"):
                 result[attr] = value.to_dict()
             elif isinstance(value, dict):
-                result[attr] = dict(map(
-                    lambda item: (item[0], item[1].to_dict())
-                    if hasattr(item[1], "to_dict") else item,
-                    value.items()
-                ))
+                result[attr] = {
+                    k: v.to_dict() if hasattr(v, "to_dict") else v
+                    for k, v in value.items()
+                }
             else:
                 result[attr] = value
 
@@ -128,7 +298,7 @@ class BaseModel(object):
             objects = []
             prefix = self.get_db_id(id)
             for k, v in kv_store.get_range_startswith(prefix.strip().encode('utf-8'),  limit=limit, reverse=reverse):
-                objects.append(self.__class__().from_dict(json.loads(v)))
+                objects.append(self.__class__().from_dict(json_loads(v)))
             return objects
         except Exception:
             from simplyblock_core import utils
@@ -147,21 +317,75 @@ class BaseModel(object):
         if not kv_store:
             from simplyblock_core.db_controller import DBController
             kv_store = DBController().kv_store
+        if isinstance(kv_store, UnitOfWork):
+            kv_store.add(self.name, self._write_op(), self._write_reads())
+            return True
         try:
-            prefix = self.get_db_id()
-            st = json.dumps(self.to_dict())
-            kv_store.set(prefix.encode(), st.encode())
+            transact(kv_store, self._write_op())
+            BaseModel._local_writes[self.name] += 1
             return True
         except Exception as e:
             print(f"Error Writing to FDB! {e}")
             exit(1)
 
+    def _write_reads(self):
+        """Returns the keys the write operation reads from, prefetched by UnitOfWork"""
+        return ()
+
+    def _write_op(self):
+        """Returns a replayable operation writing the current state of this object"""
+        key = self.get_db_id().encode()
+        value = json_dumps(self.to_dict())
+        index_keys = self.get_index_keys()
+
+        def write(tr):
+            if self._INDEXES:
+                for index_key in set(self._stored_index_keys(tr, key)) - set(index_keys):
+                    tr.clear(index_key.encode())
+                for index_key in index_keys:
+                    tr.set(index_key.encode(), key)
+            if self._VERSIONED:
+                tr.add(self.get_version_key(), struct.pack('<q', 1))
+            tr.set(key, value)
+
+        return write
+
+    def _stored_index_keys(self, tr, key):
+        value = tr[key]
+        if not value.present():
+            return []
+        return self.__class__().from_dict(json_loads(bytes(value))).get_index_keys()
+
     def remove(self, kv_store):
-        prefix = self.get_db_id()
-        return kv_store.clear(prefix.encode())
+        if isinstance(kv_store, UnitOfWork):
+            return kv_store.add(self.name, self._remove_op())
+        ret = transact(kv_store, self._remove_op())
+        BaseModel._local_writes[self.name] += 1
+        return ret
+
+    def _remove_op(self):
+        """Returns a replayable operation removing this object"""
+        key = self.get_db_id().encode()
+        index_keys = self.get_index_keys()
+        allocators = []
+        if self._VUID_SPACES:
+            from simplyblock_core.vuid_allocator import VUIDAllocator
+            allocators = [VUIDAllocator(space) for space in self._VUID_SPACES]
+
+        def remove(tr):
+            if self._INDEXES:
+                for index_key in set(self._stored_index_keys(tr, key)) | set(index_keys):
+                    tr.clear(index_key.encode())
+            for allocator in allocators:
+                allocator.release(tr, self.get_id())
+            if self._VERSIONED:
+                tr.add(self.get_version_key(), struct.pack('<q', 1))
+            tr.clear(key)
+
+        return remove
 
     def keys(self):
-        return self.get_attrs_map().keys()
+        return dict.fromkeys(self._fields).keys()
 
     def get_status_code(self):
         if self.status in self._STATUS_CODE_MAP:
@@ -180,11 +404,14 @@ class BaseModel(object):
         return not self == other
 
     def __getitem__(self, item):
-        if isinstance(item, str) and item in self.get_attrs_map().keys():
+        if isinstance(item, str) and item in self._fields:
             return getattr(self, item)
         return False
 
 
+BaseModel._compile_schema()
+
+
 class BaseNodeObject(BaseModel):
 
     STATUS_ONLINE = 'online'
@@ -29,6 +29,8 @@ class Cluster(BaseModel):
 
     }
 
+    _VERSIONED = True
+
     auth_hosts_only: bool = False
     blk_size: int = 0
     cap_crit: int = 90
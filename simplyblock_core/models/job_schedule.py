@@ -18,10 +18,18 @@ class JobSchedule(BaseModel):
     FN_NEW_DEV_MIG = "new_device_migration"
     FN_NODE_ADD = "node_add"
     FN_PORT_ALLOW = "port_allow"
+    FN_LVOL_MIG = "lvol_migration"
     FN_BALANCING_AFTER_NODE_RESTART = "balancing_on_restart"
     FN_BALANCING_AFTER_DEV_REMOVE = "balancing_on_dev_rem"
     FN_BALANCING_AFTER_DEV_EXPANSION = "balancing_on_dev_add"
 
+    # `active` (cluster) and `target` (function, node, device) only index
+    # tasks which are not done, they make up the queue of a cluster
+    _INDEXES = ('uuid', 'active', 'target')
+
+    # the task scheduler watches the version key for new and changed tasks
+    _VERSIONED = True
+
     canceled: bool = False
     cluster_id: str = ""
     date: int = 0
@@ -38,6 +46,19 @@ class JobSchedule(BaseModel):
         self.updated_at = str(datetime.datetime.now(datetime.timezone.utc))
         super().write_to_db(kv_store)
 
-
     def get_id(self):
         return "%s/%s/%s" % (self.cluster_id, self.date, self.uuid)
+
+    def get_index_values(self):
+        values: dict = {'uuid': [self.uuid], 'active': [], 'target': []}
+        if self.status != self.STATUS_DONE:
+            values['active'] = [self.cluster_id]
+            values['target'] = sorted({
+                self.target_key(self.cluster_id, self.function_name, node_id, device_id)
+                for node_id in ['', self.node_id] for device_id in ['', self.device_id]})
+        return values
+
+    @staticmethod
+    def target_key(cluster_id, function_name, node_id="", device_id=""):
+        """Returns the `target` index value, an empty node or device id matches any"""
+        return "%s:%s:%s:%s" % (cluster_id, function_name, node_id, device_id)
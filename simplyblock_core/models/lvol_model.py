@@ -20,6 +20,9 @@ class LVol(BaseModel):
         STATUS_IN_CREATION: 4,
     }
 
+    _INDEXES = ('node_id', 'pool_uuid', 'lvol_name')
+    _VUID_SPACES = ('lvol',)
+
     base_bdev: str = ""
     bdev_stack: List = []
     blobid: int = 0
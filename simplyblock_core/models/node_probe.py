@@ -0,0 +1,22 @@
+# coding=utf-8
+
+from simplyblock_core.models.base_model import BaseModel
+
+
+class NodeProbe(BaseModel):
+    """Reachability of a storage node as last probed by the node monitor or the health check service"""
+
+    api: bool = False
+    cluster_id: str = ""
+    data_nics: dict = {}  # ip -> ping result
+    date: float = 0
+    duration_ms: int = 0
+    node_id: str = ""
+    ping: bool = False
+    ports: dict = {}  # port -> whether the firewall of the node allows it
+    rpc: bool = False
+    spdk_process: bool = False
+    timed_out: bool = False
+
+    def get_id(self):
+        return "%s/%s" % (self.cluster_id, self.node_id)
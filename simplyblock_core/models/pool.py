@@ -15,6 +15,9 @@ class Pool(BaseModel):
         STATUS_INACTIVE: 2,
     }
 
+    _INDEXES = ('cluster_id', 'pool_name')
+    _VERSIONED = True
+
     cluster_id: str = ""
     groups: List[str] = []
     lvol_max_size: int = 0
@@ -10,6 +10,8 @@ class SnapShot(BaseModel):
     STATUS_OFFLINE = 'offline'
     STATUS_IN_DELETION = 'in_deletion'
 
+    _VUID_SPACES = ('snapshot',)
+
     base_bdev: str = ""
     blobid: int = 0
     cluster_id: str = ""
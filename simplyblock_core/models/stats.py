@@ -1,15 +1,131 @@
 # coding=utf-8
-import json
+import struct
 import uuid
 
-from simplyblock_core.models.base_model import BaseModel
+from simplyblock_core.models.base_model import BaseModel, json_dumps, json_loads
+
+
+# Samples of a series are packed into one `stats/<name>/<series>/<block>` key
+# per BLOCK_SECONDS instead of one JSON object per sample.
+BLOCK_SECONDS = 60
+
+_BLOCK_VERSION = 1
+_BLOCK_HEADER = struct.Struct('<BBHH')  # version, column count, attributes length, sample count
+
+# Integer fields stored per sample, in block column order. Columns may be
+# appended, anything else requires a new _BLOCK_VERSION.
+_COLUMNS = (
+    'date', 'record_duration', 'record_start_time', 'record_end_time', 'connected_clients',
+    'size_total', 'size_used', 'size_free', 'size_util', 'size_prov', 'size_prov_util',
+    'read_bytes', 'read_bytes_ps', 'read_io', 'read_io_ps', 'read_latency_ticks', 'read_latency_ps',
+    'write_bytes', 'write_bytes_ps', 'write_io', 'write_io_ps', 'write_latency_ticks', 'write_latency_ps',
+    'unmap_bytes', 'unmap_bytes_ps', 'unmap_io', 'unmap_io_ps', 'unmap_latency_ticks', 'unmap_latency_ps',
+    'collection_lag_ms', 'cpu_busy',
+)
+
+# String fields identifying the series, stored once per block
+_ATTRIBUTES = ('cluster_id', 'pool_id', 'uuid')
+
+# Rollup tiers and their bucket length in seconds, finest first. Completed
+# blocks are added to the sum/min/max aggregate of their bucket in every tier,
+# the finest tier has one bucket per block.
+ROLLUP_TIERS = (('1m', 60), ('1h', 3600), ('1d', 86400))
+
+# Seconds between samples, as assumed by utils.parse_history_param
+SAMPLE_SECONDS = 5
+
+
+def _encode_varint(buf, value):
+    value = value * 2 if value >= 0 else -value * 2 - 1  # zigzag
+    while value > 0x7f:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _decode_varints(data, offset, count):
+    values: list = []
+    value = shift = 0
+    while len(values) < count:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append(value >> 1 if not value & 1 else -(value >> 1) - 1)
+        value = shift = 0
+    return values, offset
+
+
+def encode_block(attributes, rows):
+    """Packs samples, given as rows of _COLUMNS values, into a columnar block.
+
+    Each column is stored as its first value followed by the deltas between
+    consecutive samples, zigzag varint encoded. Counters and gauges change
+    slowly between samples, so most values take one to three bytes.
+    """
+    attrs = json_dumps(attributes)
+    buf = bytearray(_BLOCK_HEADER.pack(_BLOCK_VERSION, len(rows[0]) if rows else 0, len(attrs), len(rows)))
+    buf += attrs
+    for column in zip(*rows):
+        previous = 0
+        for value in column:
+            _encode_varint(buf, value - previous)
+            previous = value
+    return bytes(buf)
+
+
+def decode_block(data):
+    """Returns the attributes and rows of a block packed by encode_block
+
+    Raises:
+        ValueError: If the block format is not supported.
+    """
+    version, column_count, attrs_length, count = _BLOCK_HEADER.unpack_from(data)
+    if version != _BLOCK_VERSION:
+        raise ValueError(f'Unsupported stats block version: {version}')
+    offset = _BLOCK_HEADER.size
+    attributes = json_loads(data[offset:offset + attrs_length])
+    offset += attrs_length
+    columns = []
+    for _ in range(column_count):
+        deltas, offset = _decode_varints(data, offset, count)
+        column, value = [], 0
+        for delta in deltas:
+            value += delta
+            column.append(value)
+        columns.append(column)
+    # columns appended since the block was written default to 0
+    columns.extend([0] * count for _ in range(len(_COLUMNS) - column_count))
+    return attributes, [list(row) for row in zip(*columns[:len(_COLUMNS)])]
+
+
+def _aggregate(rows):
+    """Returns the count and the sum, min and max rows of `rows`"""
+    columns = list(zip(*rows))
+    return len(rows), [sum(c) for c in columns], [min(c) for c in columns], [max(c) for c in columns]
+
+
+def _merge_rollup(tr, key, value, attributes, count, total, low, high):
+    """Merges an aggregate into the rollup bucket at `key`, a block of its sum, min and max rows,
+    `value` is the stored bucket"""
+    if value.present():
+        stored, (stored_total, stored_low, stored_high) = decode_block(bytes(value))
+        count += stored['count']
+        total = [a + b for a, b in zip(total, stored_total)]
+        low = [min(a, b) for a, b in zip(low, stored_low)]
+        high = [max(a, b) for a, b in zip(high, stored_high)]
+    tr.set(key, encode_block(dict(attributes, count=count), [total, low, high]))
 
 
 class StatsObject(BaseModel):
 
     capacity_dict: dict = {}
     cluster_id: str = ""
+    collection_lag_ms: int = 0
     connected_clients: int = 0
+    cpu_busy: int = 0
     date: int = 0
     read_bytes: int = 0
     read_bytes_ps: int = 0
@@ -41,8 +157,25 @@ class StatsObject(BaseModel):
     write_latency_ticks: int = 0
 
 
+    def get_series_id(self):
+        return f"{self.cluster_id}/{self.uuid}"
+
     def get_id(self):
-        return f"{self.cluster_id}/{self.uuid}/{self.date}/{self.record_duration}"
+        return f"{self.get_series_id()}/{self.date}/{self.record_duration}"
+
+    def get_block_prefix(self):
+        return "stats/%s/%s/" % (self.name, self.get_series_id())
+
+    def get_block_key(self, date=None):
+        date = self.date if date is None else date
+        return "%s%010d" % (self.get_block_prefix(), date - date % BLOCK_SECONDS)
+
+    def get_rollup_prefix(self, tier):
+        return "rollup/%s/%s/%s/" % (tier, self.name, self.get_series_id())
+
+    def get_rollup_key(self, tier, date=None):
+        date = self.date if date is None else date
+        return "%s%010d" % (self.get_rollup_prefix(tier), date - date % dict(ROLLUP_TIERS)[tier])
 
     def __add__(self, other):
         data = {
@@ -68,14 +201,174 @@ class StatsObject(BaseModel):
                     data[attr] = self_dict[attr] - other_dict[attr]
         return StatsObject(data)
 
+    def _write_reads(self):
+        return (self.get_block_key().encode(),)
+
+    def _write_op(self):
+        """Returns a replayable operation adding this sample to its block"""
+        key = self.get_block_key().encode()
+        attributes = {attr: getattr(self, attr) for attr in _ATTRIBUTES}
+        row = [int(getattr(self, column)) for column in _COLUMNS]
+
+        def write(tr, values=None):
+            stored = self._stored_rows(tr, key, values.get(key) if values else None)
+            if not stored:
+                self._roll_up(tr, key, attributes)
+            rows = [r for r in stored if r[0] != row[0]]
+            rows.append(row)
+            rows.sort(key=lambda r: r[0])
+            tr.set(key, encode_block(attributes, rows))
+
+        return write
+
+    def _roll_up(self, tr, key, attributes):
+        """Adds the block preceding the new block at `key` to the rollup tiers.
+
+        A block is complete once the next one is started. Its bucket in the
+        finest tier marks it as rolled up, so that it is only counted once.
+        Samples arriving for a block after that are kept raw only.
+        """
+        previous = list(tr.get_range(self.get_block_prefix().encode(), key, limit=1, reverse=True))
+        if not previous:
+            return
+        block_key, value = previous[0]
+        date = int(bytes(block_key)[-10:])
+        # the buckets of all tiers are read at once
+        keys = [self.get_rollup_key(tier, date).encode() for tier, _ in ROLLUP_TIERS]
+        buckets = [tr[rollup_key] for rollup_key in keys]
+        if buckets[0].present():
+            return
+        aggregate = _aggregate(decode_block(bytes(value))[1])
+        for rollup_key, bucket in zip(keys, buckets):
+            _merge_rollup(tr, rollup_key, bucket, attributes, *aggregate)
+
+    def _remove_op(self):
+        """Returns a replayable operation removing this sample from its block,
+        the rollups it was aggregated into are left as they are"""
+        key = self.get_block_key().encode()
+        attributes = {attr: getattr(self, attr) for attr in _ATTRIBUTES}
+
+        def remove(tr):
+            rows = [r for r in self._stored_rows(tr, key) if r[0] != self.date]
+            if rows:
+                tr.set(key, encode_block(attributes, rows))
+            else:
+                tr.clear(key)
+
+        return remove
+
+    @staticmethod
+    def _stored_rows(tr, key, value=None):
+        if value is None:
+            value = tr[key]
+        if not value.present():
+            return []
+        return decode_block(bytes(value))[1]
+
+    def _from_block(self, value):
+        attributes, rows = decode_block(bytes(value))
+        return [self.__class__(dict(attributes, **dict(zip(_COLUMNS, row)))) for row in rows]
+
+    def read_samples(self, kv_store, limit=0):
+        """Returns up to `limit` (all if 0) samples of this series, newest first.
+
+        Samples written before the block layout are read from their individual
+        `object/` keys once the blocks are exhausted.
+        """
+        if not kv_store:
+            return []
+        try:
+            objects = []
+            for _, v in kv_store.get_range_startswith(self.get_block_prefix().encode('utf-8'), reverse=True):
+                objects.extend(reversed(self._from_block(v)))
+                if limit and len(objects) >= limit:
+                    return objects[:limit]
+        except Exception:
+            from simplyblock_core import utils
+            logger = utils.get_logger(__name__)
+            logger.exception('Error reading from FDB')
+            return []
+
+        legacy = self.read_from_db(
+            kv_store, id=self.get_series_id() + "/", limit=limit - len(objects) if limit else 0, reverse=True)
+        if objects:
+            legacy = [obj for obj in legacy if obj.date < objects[-1].date]
+        return objects + legacy
+
+    def read_rollups(self, kv_store, tier, limit=0):
+        """Returns up to `limit` (all if 0) rollup buckets of `tier`, newest first.
+
+        Each bucket is a dict with its start `date`, the sample `count` and the
+        `sum`, `min`, `max` and `avg` of every integer field.
+        """
+        if not kv_store:
+            return []
+        try:
+            rollups = []
+            prefix = self.get_rollup_prefix(tier).encode('utf-8')
+            for k, v in kv_store.get_range_startswith(prefix, limit=limit, reverse=True):
+                attributes, (total, low, high) = decode_block(bytes(v))
+                count = attributes['count']
+                rollups.append({
+                    "date": int(bytes(k)[len(prefix):]),
+                    "count": count,
+                    "sum": dict(zip(_COLUMNS, total)),
+                    "min": dict(zip(_COLUMNS, low)),
+                    "max": dict(zip(_COLUMNS, high)),
+                    "avg": {column: int(value / count) for column, value in zip(_COLUMNS, total)},
+                })
+            return rollups
+        except Exception:
+            from simplyblock_core import utils
+            logger = utils.get_logger(__name__)
+            logger.exception('Error reading from FDB')
+            return []
+
+    def read_history(self, kv_store, limit, records_count):
+        """Returns the last `limit` samples, newest first, for a history of `records_count` records.
+
+        Reads the coarsest rollup tier that has at least `records_count`
+        buckets in the window, each bucket returned as a record of its
+        averages, so that the cost does not grow with the window. Windows too
+        short for any tier are read from the raw samples.
+        """
+        window = limit * SAMPLE_SECONDS
+        for tier, seconds in reversed(ROLLUP_TIERS):
+            if seconds * records_count > window:
+                continue
+            rollups = self.read_rollups(kv_store, tier, limit=-(-window // seconds))
+            if len(rollups) >= records_count:
+                return [self._from_rollup(rollup, seconds) for rollup in rollups]
+        return self.read_samples(kv_store, limit)
+
+    def _from_rollup(self, rollup, seconds):
+        data = dict(rollup['avg'], **{attr: getattr(self, attr) for attr in _ATTRIBUTES})
+        data.update({
+            "date": rollup['date'],
+            "record_duration": seconds,
+            "record_start_time": rollup['min']['date'],
+            "record_end_time": rollup['max']['date'],
+        })
+        return self.__class__(data)
+
+    def get_last(self, kv_store):
+        objects = self.read_samples(kv_store, limit=1)
+        if objects:
+            return objects[0]
+        return None
+
     def get_range(self, kv_store, start_date, end_date):
+        """Returns the samples of this series with start_date <= date < end_date, oldest first"""
         try:
-            prefix = f"{self.object_type}/{self.name}/{self.cluster_id}/{self.uuid}"
-            start_key = f"{prefix}/{start_date}"
-            end_key = f"{prefix}/{end_date}"
             objects = []
-            for k, v in kv_store.db.get_range(start_key.encode('utf-8'), end_key.encode('utf-8')):
-                objects.append(self.__class__().from_dict(json.loads(v)))
+            legacy_prefix = self.get_db_id(self.get_series_id())
+            for k, v in kv_store.get_range(
+                    f"{legacy_prefix}/{start_date}".encode('utf-8'), f"{legacy_prefix}/{end_date}".encode('utf-8')):
+                objects.append(self.__class__().from_dict(json_loads(v)))
+            for k, v in kv_store.get_range(
+                    self.get_block_key(start_date).encode('utf-8'),
+                    self.get_block_key(end_date + BLOCK_SECONDS).encode('utf-8')):
+                objects.extend(obj for obj in self._from_block(v) if start_date <= obj.date < end_date)
             return objects
         except Exception as e:
             print(f"Error reading from FDB: {e}")
@@ -96,8 +389,11 @@ class ClusterStatObject(StatsObject):
 
 class LVolStatObject(StatsObject):
 
+    def get_series_id(self):
+        return "%s/%s" % (self.pool_id, self.uuid)
+
     def get_id(self):
-        return "%s/%s/%s" % (self.pool_id, self.uuid, self.date)
+        return "%s/%s" % (self.get_series_id(), self.date)
 
 
 class PoolStatObject(LVolStatObject):
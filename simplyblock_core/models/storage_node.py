@@ -15,6 +15,10 @@ logger = utils.get_logger(__name__)
 
 class StorageNode(BaseNodeObject):
 
+    _INDEXES = ('cluster_id',)
+    _VUID_SPACES = ('lvol',)
+    _VERSIONED = True
+
     alceml_cpu_cores: List[int] = []
     alceml_cpu_index: int = 0
     alceml_worker_cpu_cores: List[int] = []
@@ -101,6 +105,11 @@ class StorageNode(BaseNodeObject):
     physical_label: int = 0
     hublvol: HubLVol = None  # type: ignore[assignment]
 
+    def get_index_values(self):
+        values = dict(super().get_index_values())
+        values['nvme_devices'] = [device.get_id() for device in self.nvme_devices]
+        return values
+
     def rpc_client(self, **kwargs):
         """Return rpc client to this node
         """
@@ -0,0 +1,276 @@
+# coding=utf-8
+import time
+import zlib
+from typing import Optional
+
+from simplyblock_core import constants, utils
+from simplyblock_core.models.base_model import json_dumps, json_loads, transact
+
+logger = utils.get_logger(__name__)
+
+VIEWS = ('bdevs', 'subsystems', 'lvstores', 'stats')
+# the stats are counters, whoever turns them into rates reads them itself, the
+# lvstores tell the leadership, which must not be taken from a copy up to the ttl old
+SHARED_VIEWS = ('bdevs', 'subsystems')
+CHECK_VIEWS = ('bdevs', 'subsystems', 'lvstores')
+
+
+def _index_bdevs(bdevs):
+    names = {}
+    for bdev in bdevs:
+        names[bdev['name']] = bdev
+        for alias in bdev.get('aliases') or []:
+            names[alias] = bdev
+    return names
+
+
+# view: (records the request in a batch, indexes its result)
+_REQUESTS = {
+    'bdevs': (lambda batch: batch.get_bdevs(), _index_bdevs),
+    'subsystems': (lambda batch: batch.subsystem_list(), lambda subsystems: {s['nqn']: s for s in subsystems}),
+    'lvstores': (lambda batch: batch.bdev_lvol_get_lvstores(), lambda lvstores: {s['name']: s for s in lvstores}),
+    'stats': (lambda batch: batch.get_lvol_stats(), lambda stats: {s['name']: s for s in stats['bdevs']}),
+}
+
+
+def _not_found(error):
+    """Returns whether `error` is SPDK's answer for a bdev which does not exist"""
+    return isinstance(error, dict) and error.get('code') == -19
+
+
+def _slim(bdev):
+    """Returns the fields of `bdev` kept in the BdevCache"""
+    slim = {'name': bdev['name'], 'aliases': bdev.get('aliases') or []}
+    for field in BdevCache.CAPACITY_FIELDS:
+        slim[field] = bdev.get(field)
+    lvol = (bdev.get('driver_specific') or {}).get('lvol')
+    if lvol is not None:
+        slim['driver_specific'] = {'lvol': {'num_allocated_clusters': lvol.get('num_allocated_clusters', 0)}}
+    return slim
+
+
+def _prefix(node_id, view=''):
+    return f"cache/NodeState/{node_id}/{view + '/' if view else ''}".encode('utf-8')
+
+
+class NodeState:
+    """The views of one node, each empty until fetched.
+
+    `bdevs` maps the names and aliases of the bdevs to their info,
+    `subsystems` the NQNs to the subsystems, `lvstores` the lvstore names to
+    their info and `stats` the bdev names to their iostat. `dates` holds the
+    time each fetched view was read from the node, a view which could not be
+    fetched stays empty and is listed in `failed`.
+    """
+
+    def __init__(self, node_id):
+        self.node_id = node_id
+        self.bdevs: dict = {}
+        self.subsystems: dict = {}
+        self.lvstores: dict = {}
+        self.stats: dict = {}
+        self.dates: dict = {}
+        self.failed: set = set()
+        # the names looked up while `bdevs` only holds the bdevs requested by name
+        self.names: Optional[set] = None
+
+    def missing(self, views, bdev_names=None):
+        missing = [view for view in views if view not in self.dates]
+        if 'bdevs' in views and 'bdevs' in self.dates and self.names is not None \
+                and (bdev_names is None or not self.names.issuperset(bdev_names)):
+            missing.append('bdevs')
+        return missing
+
+    def set(self, view, result, date):
+        if result is None or result is False:
+            logger.error(f"Failed to get the {view} of node {self.node_id}")
+            self.failed.add(view)
+            result = {}
+        else:
+            result = _REQUESTS[view][1](result)
+        setattr(self, view, result)
+        self.dates[view] = date
+        if view == 'bdevs':
+            self.names = None
+
+    def add_bdevs(self, names, bdevs, date):
+        """Adds the `bdevs` found by requesting `names`"""
+        if self.names is None:
+            self.bdevs = {}
+            self.names = set()
+        self.bdevs.update(_index_bdevs(bdevs))
+        self.names.update(names)
+        self.dates['bdevs'] = date
+
+
+class BdevCache:
+    """The bdevs of the nodes, kept across the monitor cycles of a process.
+
+    A node is listed completely with bdev_get_bdevs once every
+    `list_interval` seconds. In between, the bdevs a cycle needs are requested
+    by name, of a cached bdev only the capacity fields are refreshed, and bdevs
+    which are no longer found are dropped. Only the name, aliases and capacity
+    of the bdevs are kept.
+    """
+
+    CAPACITY_FIELDS = ('block_size', 'num_blocks')
+
+    def __init__(self, list_interval=constants.NODE_STATE_BDEV_LIST_INTERVAL_SEC):
+        self.list_interval = list_interval
+        self._bdevs: dict = {}
+        self._listed: dict = {}
+
+    def listing_due(self, node_id, now):
+        return now - self._listed.get(node_id, 0) >= self.list_interval
+
+    def replace(self, node_id, bdevs, date):
+        self._bdevs[node_id] = {bdev['name']: _slim(bdev) for bdev in bdevs}
+        self._listed[node_id] = date
+
+    def update(self, node_id, results):
+        """Applies the (name, result, error) of requests by name, returns the cached bdevs found
+
+        Only the bdevs the node reports as not existing are dropped, failed
+        requests leave the cache as it is.
+        """
+        cached = self._bdevs.setdefault(node_id, {})
+        found = []
+        for name, result, error in results:
+            if not result:
+                if not _not_found(error):
+                    continue
+                for key, bdev in list(cached.items()):
+                    if key == name or name in bdev['aliases']:
+                        del cached[key]
+                continue
+            fresh = _slim(result[0])
+            bdev = cached.get(fresh['name'])
+            if bdev is None:
+                bdev = cached[fresh['name']] = fresh
+            else:
+                for field in self.CAPACITY_FIELDS:
+                    bdev[field] = fresh[field]
+                if 'driver_specific' in fresh:
+                    bdev['driver_specific'] = fresh['driver_specific']
+            found.append(bdev)
+        return found
+
+
+class NodeStateSnapshot:
+    """Fetches the views of the storage nodes at most once per monitor cycle.
+
+    `get` returns the state of a node, the requested views which were not
+    fetched yet are requested with one RPC batch. A node which does not
+    answer is not asked again, its views stay empty. Take a new snapshot for
+    every cycle.
+
+    With `db` and `ttl`, the fetched shared views are stored in FDB, and views
+    stored by another service within the last `ttl` seconds are used instead
+    of fetching them.
+
+    With a `bdev_cache`, callers passing the `bdev_names` they look for get a
+    `bdevs` view of just those bdevs, requested by name instead of listing all
+    bdevs of the node, see BdevCache. Callers passing no names get all bdevs.
+    """
+
+    def __init__(self, db=None, ttl=0, timeout=3, retry=2, bdev_cache=None):
+        self.db = db
+        self.ttl = ttl
+        self.timeout = timeout
+        self.retry = retry
+        self.bdev_cache = bdev_cache
+        self._states: dict = {}
+        self.requests = 0
+        self.shared = 0
+        self.response_bytes = 0
+        self.decode_time = 0.0
+
+    def get(self, node, views=CHECK_VIEWS, bdev_names=None) -> NodeState:
+        state = self._states.get(node.get_id())
+        if state is None:
+            state = self._states[node.get_id()] = NodeState(node.get_id())
+        missing = state.missing(views, bdev_names)
+        if missing and self.db is not None and self.ttl:
+            load = [view for view in missing if view not in state.dates]
+            if load:
+                self._load(state, load)
+                missing = state.missing(views, bdev_names)
+        if missing:
+            self._fetch(node, state, missing, bdev_names)
+        return state
+
+    def get_stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "shared_views": self.shared,
+            "response_bytes": self.response_bytes,
+            "decode_ms": round(self.decode_time * 1000, 1),
+        }
+
+    def _fetch(self, node, state, views, bdev_names=None):
+        now = time.time()
+        names: list = []
+        by_name = 'bdevs' in views and bdev_names is not None and self.bdev_cache is not None \
+            and not self.bdev_cache.listing_due(node.get_id(), now)
+        if by_name:
+            views = [view for view in views if view != 'bdevs']
+            names = sorted(set(bdev_names) - (state.names or set()))
+
+        batch = node.rpc_client(timeout=self.timeout, retry=self.retry).batch()
+        for view in views:
+            _REQUESTS[view][0](batch)
+        for name in names:
+            batch.get_bdevs(name)
+        results = batch.send()
+        if results:
+            self.requests += 1
+            self.response_bytes += batch.response_bytes
+            self.decode_time += batch.decode_time
+
+        for view, (result, _) in zip(views, results):
+            state.set(view, result, now)
+            if view == 'bdevs' and self.bdev_cache is not None and view not in state.failed:
+                self.bdev_cache.replace(node.get_id(), result, now)
+        if by_name:
+            found = results[len(views):]
+            bdevs = self.bdev_cache.update(node.get_id(), [
+                (name, result, error) for name, (result, error) in zip(names, found)])
+            if len(found) < len(names) or any(not result and not _not_found(error) for result, error in found):
+                # the view is failed unless each bdev was found or reported as not existing
+                state.set('bdevs', None, now)
+            else:
+                state.add_bdevs(names, bdevs, now)
+
+        if self.db is not None and self.ttl:
+            shared = {view: result for view, (result, _) in zip(views, results)
+                      if view in SHARED_VIEWS and view not in state.failed}
+            if shared:
+                transact(self.db.kv_store, lambda tr: self._store(tr, node.get_id(), shared, now))
+
+    @staticmethod
+    def _store(tr, node_id, results, date):
+        chunk = constants.NODE_STATE_CHUNK_BYTES
+        for view, result in results.items():
+            prefix = _prefix(node_id, view)
+            blob = zlib.compress(json_dumps({'date': date, 'result': result}))
+            tr.clear_range(prefix, prefix[:-1] + b'0')
+            for index, start in enumerate(range(0, len(blob), chunk)):
+                tr.set(prefix + b'%06d' % index, blob[start:start + chunk])
+
+    def _load(self, state, views):
+        items = transact(self.db.kv_store, lambda tr: list(tr.get_range_startswith(_prefix(state.node_id))))
+        blobs: dict = {}
+        for key, value in items:
+            view = bytes(key).decode('utf-8').split('/')[3]
+            blobs.setdefault(view, []).append(bytes(value))
+
+        oldest = time.time() - self.ttl
+        for view in views:
+            if view not in SHARED_VIEWS or view not in blobs:
+                continue
+            stored = json_loads(zlib.decompress(b''.join(blobs[view])))
+            if stored['date'] >= oldest:
+                state.set(view, stored['result'], stored['date'])
+                if view == 'bdevs' and self.bdev_cache is not None:
+                    self.bdev_cache.replace(state.node_id, stored['result'], stored['date'])
+                self.shared += 1
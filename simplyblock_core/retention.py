@@ -0,0 +1,142 @@
+# coding=utf-8
+import time
+from collections import defaultdict
+
+from simplyblock_core import constants, utils
+from simplyblock_core.models.base_model import transact
+from simplyblock_core.models.stats import BLOCK_SECONDS, ROLLUP_TIERS
+
+logger = utils.get_logger(__name__)
+
+STATS_TYPES = ('ClusterStatObject', 'NodeStatObject', 'DeviceStatObject',
+               'PoolStatObject', 'LVolStatObject', 'CachedLVolStatObject')
+
+
+def stats_retention(name, tier, raw_retention):
+    """Returns the seconds the `tier` ('raw' or a rollup tier) of the `name` stats are kept"""
+    default = dict(constants.STATS_ROLLUP_RETENTION_SEC, raw=raw_retention)
+    return constants.STATS_RETENTION_SEC.get(name, {}).get(tier, default[tier])
+
+
+def _next_prefix(prefix):
+    """Returns the first key after all keys starting with `prefix`, which ends with '/'"""
+    return prefix[:-1] + b'0'
+
+
+class RetentionEngine:
+    """Trims the stats, rollup and event keyspaces and the archived tasks.
+
+    Each keyspace is walked series by series, a series being the keys that
+    share the ids following the keyspace prefix, e.g. the cluster and node id
+    of `stats/NodeStatObject/<cluster>/<node>/<date>`. The keys of a series
+    older than the retention of the keyspace are cleared in transactions of at
+    most `batch_keys` keys and `batch_bytes` bytes. Series of objects which no
+    longer exist are cleared entirely, once their newest key is older than
+    `orphan_grace` seconds.
+    """
+
+    def __init__(self, db, batch_keys=constants.RETENTION_BATCH_KEYS,
+                 batch_bytes=constants.RETENTION_BATCH_BYTES, orphan_grace=constants.RETENTION_ORPHAN_GRACE_SEC):
+        self.db = db
+        self.batch_keys = batch_keys
+        self.batch_bytes = batch_bytes
+        self.orphan_grace = orphan_grace
+
+    def keyspaces(self, raw_retention):
+        """Returns (prefix, retention, span, depth, scale, live set name) of every trimmed keyspace.
+
+        `span` is the seconds covered by a key from the date in it, a key is
+        only cleared once all of its span is past the retention. `depth` is the
+        number of ids of a series, `scale` the unit of the dates in the keys per
+        second. Series whose last id is not in the live set of the objects are
+        orphans.
+        """
+        keyspaces = []
+        for name in STATS_TYPES:
+            retention = stats_retention(name, 'raw', raw_retention)
+            keyspaces.append((f"stats/{name}/", retention, BLOCK_SECONDS, 2, 1, name))
+            keyspaces.append((f"object/{name}/", retention, 0, 2, 1, name))  # samples written before the blocks
+            for tier, seconds in ROLLUP_TIERS:
+                keyspaces.append((f"rollup/{tier}/{name}/", stats_retention(name, tier, raw_retention), seconds,
+                                  2, 1, name))
+        keyspaces.append(("object/EventObj/", constants.EVENT_RETENTION_SEC, 0, 1, 1000, 'EventObj'))
+        return keyspaces
+
+    def run(self, raw_retention, live=None, now=None):
+        """Runs one pass over all keyspaces, returns the keys and bytes reclaimed per keyspace prefix.
+
+        `live` maps the stats type names and 'EventObj' to the ids of the
+        existing clusters, nodes, devices, pools or volumes. Orphans are only
+        reaped for the names it contains.
+        """
+        now = time.time() if now is None else now
+        live = live or {}
+        report: dict = defaultdict(lambda: {'keys': 0, 'bytes': 0})
+        for prefix, retention, span, depth, scale, name in self.keyspaces(raw_retention):
+            try:
+                self.trim_keyspace(prefix.encode(), int((now - retention - span) * scale), depth,
+                                   live.get(name), int((now - self.orphan_grace) * scale), report[prefix])
+            except Exception as e:
+                logger.error(f"Failed to trim {prefix}: {e}")
+
+        before = int(now - constants.TASK_RETENTION_SEC)
+        for cluster in self.db.get_clusters():
+            try:
+                deleted = self.db.delete_archived_job_tasks(cluster.get_id(), before)
+                report['archive/JobSchedule/']['keys'] += deleted
+            except Exception as e:
+                logger.error(f"Failed to delete archived tasks of cluster {cluster.get_id()}: {e}")
+        return dict(report)
+
+    def trim_keyspace(self, prefix, cutoff, depth, live, orphan_cutoff, report):
+        for series, ids in self._series(prefix, depth):
+            end = _next_prefix(series)
+            if live is not None and ids[-1] not in live:
+                newest = transact(self.db.kv_store, lambda tr: list(tr.get_range(series, end, limit=1, reverse=True)))
+                if newest and self._date(series, newest[0][0]) < orphan_cutoff:
+                    logger.info(f"Reaping orphaned series {series.decode()}")
+                    self.trim(series, end, report)
+                    continue
+            self.trim(series, series + b'%010d' % cutoff, report)
+
+    def _series(self, prefix, depth):
+        """Yields the prefix and the ids of every series in the keyspace, skipping over their keys"""
+        begin, end = prefix, _next_prefix(prefix)
+        while True:
+            first = transact(self.db.kv_store, lambda tr: list(tr.get_range(begin, end, limit=1)))
+            if not first:
+                return
+            ids = bytes(first[0][0])[len(prefix):].split(b'/')[:depth]
+            series = prefix + b'/'.join(ids) + b'/'
+            yield series, [i.decode() for i in ids]
+            begin = _next_prefix(series)
+
+    @staticmethod
+    def _date(series, key):
+        try:
+            return int(bytes(key)[len(series):].split(b'/')[0])
+        except ValueError:
+            return 0
+
+    def trim(self, begin, end, report):
+        """Clears [begin, end) in bounded transactions, counting the keys and bytes into `report`"""
+        while True:
+            def clear(tr):
+                keys = size = 0
+                last = None
+                for key, value in tr.get_range(begin, end, limit=self.batch_keys):
+                    keys += 1
+                    size += len(key) + len(value)
+                    last = bytes(key)
+                    if size >= self.batch_bytes:
+                        break
+                if last is not None:
+                    tr.clear_range(begin, last + b'\x00')
+                return keys, size, last
+
+            keys, size, last = transact(self.db.kv_store, clear)
+            report['keys'] += keys
+            report['bytes'] += size
+            if last is None or (keys < self.batch_keys and size < self.batch_bytes):
+                return
+            begin = last + b'\x00'
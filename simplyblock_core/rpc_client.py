@@ -1,6 +1,8 @@
 import json
+import threading
+import time
 from json import JSONDecodeError
-from typing import Any, Optional
+from typing import Any, Dict, Optional, Tuple
 
 import requests
 from requests.exceptions import ConnectionError, HTTPError, Timeout, TooManyRedirects
@@ -81,6 +83,118 @@ class RPCException(Exception):
 _response_validator = jsonschema.validators.validator_for(_response_schema)(_response_schema)  # type: ignore[call-arg]
 
 
+class RPCConnection:
+    """Keep-alive HTTP connections to one RPC endpoint, shared by all RPCClients of the process.
+
+    Holds one session per retry policy, as retries are configured per
+    connection pool, and collects request, latency and reuse metrics.
+    """
+
+    def __init__(self, url, username, password):
+        self.url = url
+        self.auth = (username, password)
+        self._lock = threading.Lock()
+        self._sessions: Dict[int, requests.Session] = {}
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.latency_total = 0.0
+        self.response_bytes = 0
+        self.decode_total = 0.0
+
+    def session(self, retry) -> requests.Session:
+        with self._lock:
+            if retry not in self._sessions:
+                session = requests.session()
+                session.auth = self.auth
+                session.verify = False
+                retries = Retry(total=retry, backoff_factor=1, connect=retry, read=retry,
+                                allowed_methods=RPCClient.DEFAULT_ALLOWED_METHODS)
+                session.mount("http://", HTTPAdapter(
+                    pool_connections=1, pool_maxsize=constants.RPC_POOL_MAXSIZE, max_retries=retries))
+                self._sessions[retry] = session
+            return self._sessions[retry]
+
+    def record(self, latency, failed):
+        """Accounts a request, connections failing repeatedly are evicted from the registry"""
+        with self._lock:
+            self.requests += 1
+            self.latency_total += latency
+            if failed:
+                self.errors += 1
+                self.consecutive_errors += 1
+            else:
+                self.consecutive_errors = 0
+            evict = self.consecutive_errors >= constants.RPC_POOL_EVICT_AFTER_ERRORS
+        if evict:
+            _evict(self)
+
+    def record_payload(self, size, decode_time):
+        """Accounts the size and JSON decode time of a response body"""
+        with self._lock:
+            self.response_bytes += size
+            self.decode_total += decode_time
+
+    def connections_opened(self):
+        count = 0
+        for session in list(self._sessions.values()):
+            adapter = session.get_adapter(self.url)
+            assert isinstance(adapter, HTTPAdapter)
+            pools = adapter.poolmanager.pools
+            count += sum(pools[key].num_connections for key in pools.keys())
+        return count
+
+    def get_stats(self) -> dict:
+        opened = self.connections_opened()
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "connections": opened,
+            "reuse_ratio": round(1 - opened / self.requests, 3) if self.requests else 0.0,
+            "avg_latency_ms": round(self.latency_total * 1000 / self.requests, 1) if self.requests else 0.0,
+            "response_bytes": self.response_bytes,
+            "avg_decode_ms": round(self.decode_total * 1000 / self.requests, 1) if self.requests else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+
+
+_connections: Dict[Tuple[str, int, str], RPCConnection] = {}
+_connections_lock = threading.Lock()
+
+
+def get_connection(ip_address, port, username, password) -> RPCConnection:
+    """Returns the shared connection to the RPC endpoint at ip_address:port"""
+    key = (ip_address, port, username)
+    with _connections_lock:
+        connection = _connections.get(key)
+        if connection is None or connection.auth[1] != password:
+            connection = _connections[key] = RPCConnection(
+                'http://%s:%s/' % (ip_address, port), username, password)
+        return connection
+
+
+def _evict(connection):
+    with _connections_lock:
+        for key, value in list(_connections.items()):
+            if value is connection:
+                logger.warning(f"Evicting RPC connection to {connection.url} after "
+                               f"{connection.consecutive_errors} consecutive errors")
+                del _connections[key]
+    connection.close()
+
+
+def get_connection_stats() -> dict:
+    """Returns request, error, connection reuse and latency metrics per RPC endpoint"""
+    with _connections_lock:
+        connections = list(_connections.values())
+    return {connection.url: connection.get_stats() for connection in connections}
+
+
 class RPCClient:
 
     # ref: https://spdk.io/doc/jsonrpc.html
@@ -93,12 +207,32 @@ class RPCClient:
         self.username = username
         self.password = password
         self.timeout = timeout
-        self.session = requests.session()
-        self.session.auth = (self.username, self.password)
-        self.session.verify = False
-        retries = Retry(total=retry, backoff_factor=1, connect=retry, read=retry,
-                        allowed_methods=self.DEFAULT_ALLOWED_METHODS)
-        self.session.mount("http://", HTTPAdapter(max_retries=retries))
+        self.connection = get_connection(ip_address, port, username, password)
+        self.session = self.connection.session(retry)
+        # size and decode time of the responses received by this client
+        self.response_bytes = 0
+        self.decode_time = 0.0
+
+    def _post(self, payload):
+        start = time.monotonic()
+        failed = True
+        try:
+            response = self.session.post(self.url, data=json.dumps(payload), timeout=self.timeout)
+            failed = False
+            return response
+        finally:
+            self.connection.record(time.monotonic() - start, failed)
+
+    def _decode(self, response):
+        """Returns the decoded JSON body of `response`, accounting its size and decode time"""
+        start = time.monotonic()
+        try:
+            return response.json()
+        finally:
+            decode_time = time.monotonic() - start
+            self.response_bytes += len(response.content)
+            self.decode_time += decode_time
+            self.connection.record_payload(len(response.content), decode_time)
 
     def _request(self, method, params=None):
         ret, _ = self._request2(method, params)
@@ -110,7 +244,7 @@ class RPCClient:
             payload['params'] = params
         try:
             logger.debug("Requesting method: %s, params: %s", method, params)
-            response = self.session.post(self.url, data=json.dumps(payload), timeout=self.timeout)
+            response = self._post(payload)
         except Exception as e:
             logger.error(e)
             return False, str(e)
@@ -123,7 +257,7 @@ class RPCClient:
         error = None
         if ret_code == 200:
             try:
-                data = response.json()
+                data = self._decode(response)
                 if method != "bdev_get_bdevs":
                     logger.debug("Response json: %s", json.dumps(data))
             except Exception:
@@ -147,13 +281,13 @@ class RPCClient:
     def _request3(self, method: str, **kwargs):
         logger.debug("Requesting method: %s, params: %s", method, kwargs)
         try:
-            response = self.session.post(self.url, data=json.dumps({
+            response = self._post({
                 'id': 1,
                 'method': method,
                 'params': kwargs,
-            }), timeout=self.timeout)
+            })
             response.raise_for_status()
-            data = response.json()
+            data = self._decode(response)
             _response_validator.validate(data)
         except (
                 ConnectionError, Timeout, TooManyRedirects, HTTPError,  # requests
@@ -168,6 +302,56 @@ class RPCClient:
         return data['result']
 
 
+    def _request_batch(self, calls):
+        """Sends the (method, params) calls as JSON-RPC batch requests of up to RPC_BATCH_MAX_CALLS calls
+
+        Returns a (result, error) tuple per call, in the order of `calls`. The
+        calls of a batch the node does not answer with a list are sent one by one.
+        """
+        results: list = []
+        for start in range(0, len(calls), constants.RPC_BATCH_MAX_CALLS):
+            chunk = calls[start:start + constants.RPC_BATCH_MAX_CALLS]
+            payload = []
+            for index, (method, params) in enumerate(chunk):
+                call = {'id': index, 'method': method}
+                if params:
+                    call['params'] = params
+                payload.append(call)
+
+            logger.debug("Requesting batch: %s", [method for method, _ in chunk])
+            try:
+                response = self._post(payload)
+            except Exception as e:
+                logger.error(e)
+                results.extend([(False, str(e))] * len(chunk))
+                continue
+
+            data = None
+            if response.status_code == 200:
+                try:
+                    data = self._decode(response)
+                except Exception:
+                    logger.debug("Response ret_content: %s", response.content)
+            if not isinstance(data, list):
+                # e.g. a node not upgraded yet, its proxy does not take batch requests
+                logger.warning("Invalid batch response, http status: %s, sending the calls one by one",
+                               response.status_code)
+                results.extend(RPCClient._request2(self, method, params) for method, params in chunk)
+                continue
+
+            # responses may come in any order, they are matched by id
+            responses = {item.get('id'): item for item in data if isinstance(item, dict)}
+            for index, (method, _) in enumerate(chunk):
+                item = responses.get(index, {})
+                if item.get('error') is not None:
+                    logger.error(f"Batch call {method} failed: {item['error']}")
+                results.append((item.get('result'), item.get('error')))
+        return results
+
+    def batch(self):
+        """Returns an RPCBatch sending calls to this node in one request"""
+        return RPCBatch(self)
+
     def get_version(self):
         return self._request("spdk_get_version")
 
@@ -961,8 +1145,10 @@ class RPCClient:
         }
         return self._request("bdev_raid_remove_base_bdev", params)
 
-    def bdev_lvol_get_lvstores(self, name):
-        params = {"lvs_name": name}
+    def bdev_lvol_get_lvstores(self, name=None):
+        params = None
+        if name:
+            params = {"lvs_name": name}
         return self._request("bdev_lvol_get_lvstores", params)
 
     def bdev_lvol_resize(self, name, size_in_mib):
@@ -976,6 +1162,17 @@ class RPCClient:
         params = {"name": name}
         return self._request("bdev_lvol_inflate", params)
 
+    def bdev_lvol_start_shallow_copy(self, src_lvol_name, dst_bdev_name):
+        params = {
+            "src_lvol_name": src_lvol_name,
+            "dst_bdev_name": dst_bdev_name,
+        }
+        return self._request("bdev_lvol_start_shallow_copy", params)
+
+    def bdev_lvol_check_shallow_copy(self, operation_id):
+        params = {"operation_id": operation_id}
+        return self._request("bdev_lvol_check_shallow_copy", params)
+
     def bdev_distrib_toggle_cluster_full(self, name, cluster_full=False):
         params = {
             "name": name,
@@ -1185,3 +1382,46 @@ class RPCClient:
             "jm_vuid": jm_vuid,
         }
         return self._request("bdev_distrib_check_inflight_io", params)
+
+
+class RPCBatch(RPCClient):
+    """Records the calls made through the RPCClient methods and sends them as one JSON-RPC batch request.
+
+    Only methods passing the response through unchanged can be batched, the
+    values they return while recording are meaningless. The calls are
+    executed by the node in order, a failing call does not stop the others.
+
+        batch = rpc_client.batch()
+        for device in devices:
+            batch.alceml_get_capacity(device.alceml_name)
+        for result, error in batch.send():
+            ...
+    """
+
+    def __init__(self, client):
+        self.ip_address = client.ip_address
+        self.port = client.port
+        self.url = client.url
+        self.username = client.username
+        self.password = client.password
+        self.timeout = client.timeout
+        self.connection = client.connection
+        self.session = client.session
+        self.response_bytes = 0
+        self.decode_time = 0.0
+        self.calls: list = []
+
+    def _request2(self, method, params=None):
+        self.calls.append((method, params))
+        return None, None
+
+    def _request3(self, method: str, **kwargs):
+        self.calls.append((method, kwargs))
+        return None
+
+    def send(self):
+        """Sends the recorded calls, returns a (result, error) tuple per call in call order"""
+        calls, self.calls = self.calls, []
+        if not calls:
+            return []
+        return self._request_batch(calls)
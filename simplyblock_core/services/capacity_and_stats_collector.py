@@ -1,10 +1,11 @@
 # coding=utf-8
 import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 
 from simplyblock_core import constants, db_controller, utils
 from simplyblock_core.models.nvme_device import NVMeDevice
 from simplyblock_core.models.storage_node import StorageNode
-from simplyblock_core.rpc_client import RPCClient
+from simplyblock_core.rpc_client import RPCClient, get_connection_stats
 from simplyblock_core.models.stats import DeviceStatObject, NodeStatObject, ClusterStatObject
 
 logger = utils.get_logger(__name__)
@@ -12,13 +13,79 @@ logger = utils.get_logger(__name__)
 
 last_object_record: dict[str, DeviceStatObject] = {}
 
-
-def add_device_stats(cl, device, capacity_dict, stats_dict):
-    now = int(time.time())
+# Exact time of the last sample per device, the rates are computed from it
+last_sample_time: dict[str, float] = {}
+
+# Busy and idle ticks of the reactors per node at the last sample, by lcore
+last_reactor_ticks: dict[str, dict] = {}
+
+
+def collect_node_stats(node):
+    """Fetches the raw stats and capacities of the devices of `node`, runs in the worker pool
+
+    Returns the time the stats were sampled, a list of (device, capacity_dict,
+    stats_dict) and the reactors of the node.
+    """
+    rpc_client = RPCClient(
+        node.mgmt_ip, node.rpc_port,
+        node.rpc_username, node.rpc_password,
+        timeout=5, retry=2)
+
+    devices = []
+    for device in node.nvme_devices:
+        logger.info("Getting device stats: %s", device.uuid)
+        if device.status not in [NVMeDevice.STATUS_ONLINE, NVMeDevice.STATUS_READONLY, NVMeDevice.STATUS_CANNOT_ALLOCATE]:
+            logger.info(f"Device is skipped: {device.get_id()} status: {device.status}")
+            continue
+        devices.append(device)
+
+    # the io stats, the reactors and all device capacities are fetched with one request
+    batch = rpc_client.batch()
+    batch.get_lvol_stats()
+    batch.framework_get_reactors()
+    for device in devices:
+        batch.alceml_get_capacity(device.alceml_name)
+    (ret, _), (reactors, _), *capacities = batch.send()
+    sampled_at = time.time()
+
+    node_devs_stats = {}
+    if ret:
+        node_devs_stats = {b['name']: b for b in ret['bdevs']}
+
+    samples = []
+    for device, (capacity_dict, _) in zip(devices, capacities):
+        if device.nvme_bdev in node_devs_stats:
+            samples.append((device, capacity_dict, node_devs_stats[device.nvme_bdev]))
+    return sampled_at, samples, reactors
+
+
+def get_cpu_busy(node_id, reactors):
+    """Returns the share of the reactor ticks spent busy since the last sample of the node, in percent"""
+    if not reactors or 'reactors' not in reactors:
+        return 0
+    ticks = {reactor['lcore']: (reactor.get('busy', 0), reactor.get('idle', 0)) for reactor in reactors['reactors']}
+    last = last_reactor_ticks.get(node_id, {})
+    last_reactor_ticks[node_id] = ticks
+    busy = total = 0
+    for lcore, (core_busy, core_idle) in ticks.items():
+        if lcore not in last:
+            continue
+        # the counters restart with the node
+        busy_diff = core_busy - last[lcore][0]
+        idle_diff = core_idle - last[lcore][1]
+        if busy_diff >= 0 and idle_diff >= 0:
+            busy += busy_diff
+            total += busy_diff + idle_diff
+    return int(busy * 100 / total) if total > 0 else 0
+
+
+def add_device_stats(cl, device, capacity_dict, stats_dict, tx, sampled_at, lag_ms):
+    now = int(sampled_at)
     data = {
         "cluster_id": cl.get_id(),
         "uuid": device.get_id(),
-        "date": now}
+        "date": now,
+        "collection_lag_ms": lag_ms}
 
     if capacity_dict and capacity_dict['res'] == 1:
         size_total = int(capacity_dict['npages_nmax']*capacity_dict['pba_page_size'])
@@ -60,7 +127,7 @@ def add_device_stats(cl, device, capacity_dict, stats_dict):
             last_record = DeviceStatObject(data={"uuid": device.get_id(), "cluster_id": cl.get_id()}
                                            ).get_last(db.kv_store)
         if last_record:
-            time_diff = (now - last_record.date)
+            time_diff = sampled_at - last_sample_time.get(device.get_id(), last_record.date)
             if time_diff > 0:
                 data['read_bytes_ps'] = int((data['read_bytes'] - last_record['read_bytes']) / time_diff)
                 data['read_io_ps'] = int((data['read_io'] - last_record['read_io']) / time_diff)
@@ -80,13 +147,14 @@ def add_device_stats(cl, device, capacity_dict, stats_dict):
         logger.error("Error getting stats")
 
     stat_obj = DeviceStatObject(data=data)
-    stat_obj.write_to_db(db.kv_store)
+    stat_obj.write_to_db(tx)
     last_object_record[device.get_id()] = stat_obj
+    last_sample_time[device.get_id()] = sampled_at
 
     return stat_obj
 
 
-def add_node_stats(node, records):
+def add_node_stats(cl, node, records, tx, sampled_at, lag_ms, cpu_busy=0):
     size_used = 0
     size_total = 0
     data = {}
@@ -109,18 +177,20 @@ def add_node_stats(node, records):
     data.update({
         "cluster_id": cl.get_id(),
         "uuid": node.get_id(),
-        "date": int(time.time()),
+        "date": int(sampled_at),
+        "collection_lag_ms": lag_ms,
+        "cpu_busy": cpu_busy,
         "size_util": size_util,
         "size_prov": size_prov,
         "size_prov_util": size_prov_util
     })
     stat_obj = NodeStatObject(data=data)
-    stat_obj.write_to_db(db.kv_store)
+    stat_obj.write_to_db(tx)
 
     return stat_obj
 
 
-def add_cluster_stats(cl, records):
+def add_cluster_stats(cl, records, tx, sampled_at):
 
     if not records:
         return False
@@ -137,32 +207,35 @@ def add_cluster_stats(cl, records):
     data.update({
         "cluster_id": cl.get_id(),
         "uuid": cl.get_id(),
-        "date": int(time.time()),
+        "date": int(sampled_at),
+        "collection_lag_ms": max(record.collection_lag_ms for record in records),
+        "cpu_busy": int(records_sum.cpu_busy / len(records)),
 
         "size_util": size_util,
         "size_prov_util": size_prov_util
     })
 
     stat_obj = ClusterStatObject(data=data)
-    stat_obj.write_to_db(db.kv_store)
+    stat_obj.write_to_db(tx)
 
     return stat_obj
 
 
 
-# get DB controller
-db = db_controller.DBController()
+def collect(clusters, tick):
+    """Runs one sampling cycle scheduled at `tick`.
 
-logger.info("Starting capacity and stats collector...")
-while True:
-
-    clusters = db.get_clusters()
+    The nodes are queried concurrently. Nodes not answering within
+    DEV_STAT_COLLECTOR_DEADLINE_SEC are not waited for and not queried again
+    until they answer. Their late sample is recorded with the next cycle,
+    which does not query them again either.
+    """
+    jobs = []
     for cl in clusters:
         snodes = db.get_storage_nodes_by_cluster_id(cl.get_id())
         if not snodes:
             logger.error(f"Cluster has no storage nodes: {cl.get_id()}")
 
-        node_records = []
         for node in snodes:
             logger.info("Node: %s", node.get_id())
             if node.status != StorageNode.STATUS_ONLINE:
@@ -173,32 +246,82 @@ while True:
                 logger.error("No devices found in node: %s", node.get_id())
                 continue
 
-            rpc_client = RPCClient(
-                node.mgmt_ip, node.rpc_port,
-                node.rpc_username, node.rpc_password,
-                timeout=5, retry=2)
-
-            node_devs_stats = {}
-            ret = rpc_client.get_lvol_stats()
-            if ret:
-                node_devs_stats = {b['name']: b for b in ret['bdevs']}
-
-            devices_records = []
-            for device in node.nvme_devices:
-                logger.info("Getting device stats: %s", device.uuid)
-                if device.status not in [NVMeDevice.STATUS_ONLINE, NVMeDevice.STATUS_READONLY, NVMeDevice.STATUS_CANNOT_ALLOCATE]:
-                    logger.info(f"Device is skipped: {device.get_id()} status: {device.status}")
+            if node.get_id() in in_flight:
+                node_tick, future = in_flight[node.get_id()]
+                if not future.done():
+                    logger.warning(f"Node {node.get_id()} has not answered since {node_tick:.0f}, skipping")
+                    continue
+                # the late sample is this cycle's sample of the node
+                jobs.append((cl, node, node_tick, future))
+                continue
+
+            in_flight[node.get_id()] = (tick, executor.submit(collect_node_stats, node))
+            jobs.append((cl, node, *in_flight[node.get_id()]))
+
+    deadline = tick + constants.DEV_STAT_COLLECTOR_DEADLINE_SEC
+    wait([future for _, _, _, future in jobs], timeout=max(0.0, deadline - time.time()))
+
+    for cl in clusters:
+        # the records of a cycle are committed in chunks of bounded transactions
+        with db.transaction(constants.STATS_COMMIT_CHUNK, constants.STATS_COMMIT_MAX_RETRIES) as tx:
+            node_records = []
+            for node_cl, node, node_tick, future in jobs:
+                if node_cl is not cl:
+                    continue
+                if not future.done():
+                    logger.warning(f"Node {node.get_id()} missed the collection deadline")
+                    continue
+                del in_flight[node.get_id()]
+                if future.exception() is not None:
+                    logger.error(f"Failed to collect stats of node {node.get_id()}: {future.exception()}")
                     continue
-                capacity_dict = rpc_client.alceml_get_capacity(device.alceml_name)
-                if device.nvme_bdev in node_devs_stats:
-                    stats_dict = node_devs_stats[device.nvme_bdev]
-                    record = add_device_stats(cl, device, capacity_dict, stats_dict)
+
+                sampled_at, samples, reactors = future.result()
+                lag_ms = int((sampled_at - node_tick) * 1000)
+                devices_records = []
+                for device, capacity_dict, stats_dict in samples:
+                    record = add_device_stats(cl, device, capacity_dict, stats_dict, tx, sampled_at, lag_ms)
                     if record:
                         devices_records.append(record)
 
-            node_record = add_node_stats(node, devices_records)
-            node_records.append(node_record)
+                cpu_busy = get_cpu_busy(node.get_id(), reactors)
+                node_record = add_node_stats(cl, node, devices_records, tx, sampled_at, lag_ms, cpu_busy)
+                node_records.append(node_record)
+
+            add_cluster_stats(cl, node_records, tx, tick)
 
-        add_cluster_stats(cl, node_records)
+        if node_records:
+            logger.info(f"Cluster {cl.get_id()}: collected {len(node_records)} node samples, "
+                        f"collection lag max {max(r.collection_lag_ms for r in node_records)}ms")
+
+
+# get DB controller
+db = db_controller.DBController()
 
-    time.sleep(constants.DEV_STAT_COLLECTOR_INTERVAL_SEC)
+executor = ThreadPoolExecutor(max_workers=constants.DEV_STAT_COLLECTOR_WORKERS)
+in_flight: dict[str, tuple[float, Future]] = {}
+
+if __name__ == "__main__":
+    db.enable_cache()
+
+    logger.info("Starting capacity and stats collector...")
+    interval = constants.DEV_STAT_COLLECTOR_INTERVAL_SEC
+    next_tick = time.time()
+    while True:
+        tick = next_tick
+        try:
+            collect(db.get_clusters(), tick)
+        except Exception as e:
+            logger.exception(f"Collection cycle failed: {e}")
+
+        logger.debug(f"DB cache: {db.get_cache_stats()}")
+        logger.debug(f"RPC connections: {get_connection_stats()}")
+
+        # keep a fixed cadence, intervals overrun by a cycle are skipped
+        next_tick = tick + interval
+        now = time.time()
+        if next_tick < now:
+            skipped = int((now - next_tick) // interval) + 1
+            logger.warning(f"Collection cycle took {now - tick:.1f}s, skipping {skipped} interval(s)")
+            next_tick += skipped * interval
+        time.sleep(next_tick - now)
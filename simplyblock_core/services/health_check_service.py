@@ -7,7 +7,8 @@ from simplyblock_core.controllers import health_controller, storage_events, devi
 from simplyblock_core.models.cluster import Cluster
 from simplyblock_core.models.nvme_device import NVMeDevice
 from simplyblock_core.models.storage_node import StorageNode
-from simplyblock_core.rpc_client import RPCClient
+from simplyblock_core.node_state import NodeStateSnapshot
+from simplyblock_core.rpc_client import RPCClient, get_connection_stats
 from simplyblock_core import constants, db_controller, distr_controller, storage_node_ops
 
 logger = utils.get_logger(__name__)
@@ -26,27 +27,42 @@ def set_node_health_check(snode, health_check_status):
     storage_events.snode_health_check_change(snode, snode.health_check, old_status, caused_by="monitor")
 
 
-def set_device_health_check(cluster_id, device, health_check_status):
-    if device.health_check == health_check_status:
+def set_devices_health_check(snode, devices_health_check):
+    """Updates the health check of several devices of `snode` in one atomic node update
+
+    `devices_health_check` maps device ids to their new health check status.
+    """
+    changes = {
+        device.get_id(): (device, device.health_check)
+        for device in snode.nvme_devices
+        if device.get_id() in devices_health_check and device.health_check != devices_health_check[device.get_id()]
+    }
+    if not changes:
         return
-    nodes = db.get_storage_nodes_by_cluster_id(cluster_id)
-    for node in nodes:
-        if node.nvme_devices:
-            for dev in node.nvme_devices:
-                if dev.get_id() == device.get_id():
-                    old_status = dev.health_check
-                    dev.health_check = health_check_status
-                    node.write_to_db()
-                    device_events.device_health_check_change(
-                        dev, dev.health_check, old_status, caused_by="monitor")
-                    return
+
+    def update(node):
+        for dev in node.nvme_devices:
+            if dev.get_id() in changes:
+                dev.health_check = devices_health_check[dev.get_id()]
+
+    db.update_object(StorageNode(), snode.get_id(), update)
+    for device, old_status in changes.values():
+        device_events.device_health_check_change(
+            device, devices_health_check[device.get_id()], old_status, caused_by="monitor")
 
 
 # get DB controller
 db = db_controller.DBController()
+db.enable_cache()
+prober = health_controller.NodeProber(db)
+
+CHECKED_STATUSES = [StorageNode.STATUS_ONLINE, StorageNode.STATUS_UNREACHABLE,
+                    StorageNode.STATUS_SUSPENDED, StorageNode.STATUS_DOWN]
 
 logger.info("Starting health check service")
 while True:
+    # the views of each node are fetched once per cycle, and shared with the other monitors
+    snapshot = NodeStateSnapshot(db, ttl=constants.NODE_STATE_TTL_SEC)
     clusters = db.get_clusters()
     for cluster in clusters:
         cluster_id = cluster.get_id()
@@ -54,28 +70,29 @@ while True:
         if not snodes:
             logger.warning("storage nodes list is empty")
 
+        # recent probes of the node monitor are reused, the other nodes are probed at once
+        probes = prober.get(cluster_id, [snode for snode in snodes if snode.status in CHECKED_STATUSES],
+                            max_age=constants.HEALTH_PROBE_MAX_AGE_SEC)
         for snode in snodes:
             logger.info("Node: %s, status %s", snode.get_id(), snode.status)
 
-            if snode.status not in [StorageNode.STATUS_ONLINE, StorageNode.STATUS_UNREACHABLE,
-                                    StorageNode.STATUS_SUSPENDED, StorageNode.STATUS_DOWN]:
+            if snode.status not in CHECKED_STATUSES:
                 logger.info(f"Node status is: {snode.status}, skipping")
                 set_node_health_check(snode, False)
-                for device in snode.nvme_devices:
-                    set_device_health_check(cluster_id, device, False)
+                set_devices_health_check(snode, {device.get_id(): False for device in snode.nvme_devices})
                 continue
+            probe = probes[snode.get_id()]
 
             # 1- check node ping
-            ping_check = health_controller._check_node_ping(snode.mgmt_ip)
+            ping_check = probe.ping
             logger.info(f"Check: ping mgmt ip {snode.mgmt_ip} ... {ping_check}")
 
             # 2- check node API
-            node_api_check = health_controller._check_node_api(snode.mgmt_ip)
+            node_api_check = probe.api
             logger.info(f"Check: node API {snode.mgmt_ip}:5000 ... {node_api_check}")
 
             # 3- check node RPC
-            node_rpc_check = health_controller._check_node_rpc(
-                snode.mgmt_ip, snode.rpc_port, snode.rpc_username, snode.rpc_password)
+            node_rpc_check = probe.rpc
             logger.info(f"Check: node RPC {snode.mgmt_ip}:{snode.rpc_port} ... {node_rpc_check}")
 
             is_node_online = ping_check and node_api_check and node_rpc_check
@@ -92,24 +109,11 @@ while True:
                     timeout=3, retry=2)
                 connected_devices = []
 
-                node_bdevs = rpc_client.get_bdevs()
-                if node_bdevs:
-                    # node_bdev_names = [b['name'] for b in node_bdevs]
-                    node_bdev_names = {}
-                    for b in node_bdevs:
-                        node_bdev_names[b['name']] = b
-                        for al in b['aliases']:
-                            node_bdev_names[al] = b
-                else:
-                    node_bdev_names = {}
-
-                subsystem_list = rpc_client.subsystem_list() or []
-                subsystems = {
-                        subsystem['nqn']: subsystem
-                        for subsystem
-                        in subsystem_list
-                }
+                state = snapshot.get(snode)
+                node_bdev_names = state.bdevs
+                subsystems = state.subsystems
 
+                devices_health_check = {}
                 for device in snode.nvme_devices:
                     passed = True
 
@@ -140,10 +144,12 @@ while True:
 
                     passed &= health_controller.check_subsystem(device.nvmf_nqn, nqns=subsystems)
 
-                    set_device_health_check(cluster_id, device, passed)
+                    devices_health_check[device.get_id()] = passed
                     if device.status == NVMeDevice.STATUS_ONLINE:
                         node_devices_check &= passed
 
+                set_devices_health_check(snode, devices_health_check)
+
                 logger.info(f"Node remote device: {len(snode.remote_devices)}")
 
                 for remote_device in snode.remote_devices:
@@ -216,18 +222,18 @@ while True:
 
                     lvstore_stack = snode.lvstore_stack
                     lvstore_check &= health_controller._check_node_lvstore(
-                        lvstore_stack, snode, auto_fix=True, node_bdev_names=node_bdev_names)
+                        lvstore_stack, snode, auto_fix=True, snapshot=snapshot)
 
                     if snode.secondary_node_id:
 
-                        lvstore_check &= health_controller._check_node_hublvol(
-                            snode, node_bdev_names=node_bdev_names, node_lvols_nqns=subsystems)
+                        lvstore_check &= health_controller._check_node_hublvol(snode, snapshot=snapshot)
 
                         second_node_1 = db.get_storage_node_by_id(snode.secondary_node_id)
                         if second_node_1 and second_node_1.status == StorageNode.STATUS_ONLINE:
                             lvstore_check &= health_controller._check_node_lvstore(
-                                lvstore_stack, second_node_1, auto_fix=True, stack_src_node=snode)
-                            lvstore_check &= health_controller._check_sec_node_hublvol(second_node_1, auto_fix=True)
+                                lvstore_stack, second_node_1, auto_fix=True, stack_src_node=snode, snapshot=snapshot)
+                            lvstore_check &= health_controller._check_sec_node_hublvol(
+                                second_node_1, auto_fix=True, snapshot=snapshot)
 
                     lvol_port_check = False
                     # if node_api_check:
@@ -239,7 +245,10 @@ while True:
                             ports.append(second_node_1.lvol_subsys_port)
 
                     for port in ports:
-                        lvol_port_check = health_controller._check_port_on_node(snode, port)
+                        if str(port) in probe.ports:
+                            lvol_port_check = probe.ports[str(port)]
+                        else:
+                            lvol_port_check = health_controller._check_port_on_node(snode, port)
                         logger.info(
                             f"Check: node {snode.mgmt_ip}, port: {port} ... {lvol_port_check}")
                         if not lvol_port_check:
@@ -248,5 +257,8 @@ while True:
                 health_check_status = is_node_online and node_devices_check and node_remote_devices_check and lvstore_check
             set_node_health_check(snode, bool(health_check_status))
 
+    logger.debug(f"Node state: {snapshot.get_stats()}")
+    logger.debug(f"DB cache: {db.get_cache_stats()}")
+    logger.debug(f"RPC connections: {get_connection_stats()}")
     time.sleep(constants.HEALTH_CHECK_INTERVAL_SEC)
 
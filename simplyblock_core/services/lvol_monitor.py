@@ -9,7 +9,8 @@ from simplyblock_core.models.lvol_model import LVol
 from simplyblock_core.controllers import health_controller, lvol_events, tasks_controller, lvol_controller
 from simplyblock_core.models.nvme_device import NVMeDevice
 from simplyblock_core.models.storage_node import StorageNode
-from simplyblock_core.rpc_client import RPCClient
+from simplyblock_core.node_state import BdevCache, NodeStateSnapshot
+from simplyblock_core.rpc_client import RPCClient, get_connection_stats
 
 logger = utils.get_logger(__name__)
 
@@ -126,10 +127,14 @@ def process_lvol_delete_try_again(lvol):
 
 # get DB controller
 db = db_controller.DBController()
+db.enable_cache()
+bdev_cache = BdevCache()
 
 logger.info("Starting LVol monitor...")
 while True:
 
+    # the views of each node are fetched once per cycle, and shared with the other monitors
+    snapshot = NodeStateSnapshot(db, ttl=constants.NODE_STATE_TTL_SEC, bdev_cache=bdev_cache)
     for cluster in db.get_clusters():
 
         if cluster.status in [Cluster.STATUS_INACTIVE, Cluster.STATUS_UNREADY, Cluster.STATUS_IN_ACTIVATION]:
@@ -137,41 +142,24 @@ while True:
             continue
 
         for snode in db.get_storage_nodes_by_cluster_id(cluster.get_id()):
-            node_bdev_names = []
-            node_lvols_nqns = {}
-            sec_node_bdev_names = {}
-            sec_node_lvols_nqns = {}
+            node_bdev_names: dict = {}
             sec_node = None
 
+            # only the bdevs of the lvols and snapshots of the node are requested
+            lvols = db.get_lvols_by_node_id(snode.get_id())
+            snapshots = db.get_snapshots_by_node_id(snode.get_id())
+            lvols_bdev_names = [name for lvol in lvols for name in health_controller.lvol_bdev_names(lvol)]
+
             if snode.status in [StorageNode.STATUS_ONLINE, StorageNode.STATUS_SUSPENDED, StorageNode.STATUS_DOWN]:
-                node_bdevs = snode.rpc_client().get_bdevs()
-                if node_bdevs:
-                    node_bdev_names = [b['name'] for b in node_bdevs]
-                    for bdev in node_bdevs:
-                        if "aliases" in bdev and bdev["aliases"]:
-                            node_bdev_names.extend(bdev['aliases'])
-                ret = snode.rpc_client().subsystem_list()
-                if ret:
-                    for sub in ret:
-                        node_lvols_nqns[sub['nqn']] = sub
+                node_bdev_names = snapshot.get(
+                    snode, bdev_names=lvols_bdev_names + [snap.snap_bdev for snap in snapshots]).bdevs
 
             if snode.secondary_node_id:
                 sec_node = db.get_storage_node_by_id(snode.secondary_node_id)
-                if sec_node and sec_node.status==StorageNode.STATUS_ONLINE:
-                    sec_rpc_client = RPCClient(
-                        sec_node.mgmt_ip, sec_node.rpc_port,
-                        sec_node.rpc_username, sec_node.rpc_password, timeout=3, retry=2)
-                    ret = sec_rpc_client.get_bdevs()
-                    if ret:
-                        for bdev in ret:
-                            sec_node_bdev_names[bdev['name']] = bdev
-
-                    ret = sec_rpc_client.subsystem_list()
-                    if ret:
-                        for sub in ret:
-                            sec_node_lvols_nqns[sub['nqn']] = sub
-
-            for lvol in db.get_lvols_by_node_id(snode.get_id()):
+                if sec_node and sec_node.status == StorageNode.STATUS_ONLINE:
+                    snapshot.get(sec_node, bdev_names=lvols_bdev_names)
+
+            for lvol in lvols:
 
                 if lvol.status == LVol.STATUS_IN_CREATION:
                     continue
@@ -181,18 +169,16 @@ while True:
                     leader_node = None
                     snode = db.get_storage_node_by_id(snode.get_id())
                     if snode.status in [StorageNode.STATUS_ONLINE, StorageNode.STATUS_SUSPENDED, StorageNode.STATUS_DOWN]:
-                        ret = snode.rpc_client().bdev_lvol_get_lvstores(snode.lvstore)
-                        if not ret:
+                        lvs_info = snapshot.get(snode, ('lvstores',)).lvstores.get(snode.lvstore)
+                        if not lvs_info:
                             raise Exception("Failed to get LVol info")
-                        lvs_info = ret[0]
                         if "lvs leadership" in lvs_info and lvs_info['lvs leadership']:
                             leader_node = snode
 
                     if not leader_node and sec_node:
-                        ret = sec_node.rpc_client().bdev_lvol_get_lvstores(snode.lvstore)
-                        if not ret:
+                        lvs_info = snapshot.get(sec_node, ('lvstores',)).lvstores.get(snode.lvstore)
+                        if not lvs_info:
                             raise Exception("Failed to get LVol info")
-                        lvs_info = ret[0]
                         if "lvs leadership" in lvs_info and lvs_info['lvs leadership']:
                             leader_node = sec_node
 
@@ -288,8 +274,7 @@ while True:
                     continue
 
                 passed = True
-                ret = health_controller.check_lvol_on_node(
-                    lvol.get_id(), lvol.node_id, node_bdev_names, node_lvols_nqns)
+                ret = health_controller.check_lvol_on_node(lvol.get_id(), lvol.node_id, snapshot=snapshot)
                 if not ret:
                     passed = False
 
@@ -297,7 +282,7 @@ while True:
                     sec_node = db.get_storage_node_by_id(snode.secondary_node_id)
                     if sec_node and sec_node.status == StorageNode.STATUS_ONLINE:
                         ret = health_controller.check_lvol_on_node(
-                            lvol.get_id(), snode.secondary_node_id, sec_node_bdev_names, sec_node_lvols_nqns)
+                            lvol.get_id(), snode.secondary_node_id, snapshot=snapshot)
                         if not ret:
                             passed = False
 
@@ -308,9 +293,12 @@ while True:
                     if passed:
                         set_lvol_status(lvol, LVol.STATUS_ONLINE)
 
-                    for snap in db.get_snapshots_by_node_id(snode.get_id()):
+                    for snap in snapshots:
                         present = health_controller.check_bdev(snap.snap_bdev, bdev_names=node_bdev_names)
                         set_snapshot_health_check(snap, present)
                         passed &= present
 
+    logger.debug(f"Node state: {snapshot.get_stats()}")
+    logger.debug(f"DB cache: {db.get_cache_stats()}")
+    logger.debug(f"RPC connections: {get_connection_stats()}")
     time.sleep(constants.LVOL_MONITOR_INTERVAL_SEC)
@@ -0,0 +1,29 @@
+# coding=utf-8
+import time
+
+from simplyblock_core import constants, db_controller, utils
+from simplyblock_core.lvol_rebalance import RebalancePlanner
+from simplyblock_core.models.cluster import Cluster
+
+logger = utils.get_logger(__name__)
+
+# get DB controller
+db = db_controller.DBController()
+
+logger.info(f"Starting LVol rebalancer service, dry run: {constants.LVOL_REBALANCE_DRY_RUN}")
+while True:
+    for cluster in db.get_clusters():
+        if cluster.status not in [Cluster.STATUS_ACTIVE, Cluster.STATUS_DEGRADED]:
+            continue
+        try:
+            planner = RebalancePlanner(db, cluster.get_id())
+            moves = planner.plan()
+            for move in moves:
+                logger.info(f"Planned move of lvol {move['lvol_id']} from node {move['source']} "
+                            f"to node {move['target']}, {move['reason']}")
+            if moves and not constants.LVOL_REBALANCE_DRY_RUN:
+                planner.apply(moves)
+        except Exception:
+            logger.exception(f"Error rebalancing the lvols of cluster {cluster.get_id()}")
+
+    time.sleep(constants.LVOL_REBALANCE_INTERVAL_SEC)
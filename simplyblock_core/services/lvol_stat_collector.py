@@ -7,12 +7,14 @@ from simplyblock_core.models.cluster import Cluster
 from simplyblock_core.models.lvol_model import LVol
 from simplyblock_core.models.stats import LVolStatObject, PoolStatObject
 from simplyblock_core.models.storage_node import StorageNode
-from simplyblock_core.rpc_client import RPCClient
+from simplyblock_core.node_state import BdevCache, NodeStateSnapshot
 
 logger = utils.get_logger(__name__)
 
 last_object_record: dict[str, LVolStatObject] = {}
 
+STAT_VIEWS = ('bdevs', 'stats')
+
 
 def sum_stats(stats_list):
     if not stats_list or len(stats_list) == 0:
@@ -35,7 +37,7 @@ def sum_stats(stats_list):
     return ret
 
 
-def add_lvol_stats(cluster, lvol, stats_list, capacity_dict=None):
+def add_lvol_stats(cluster, lvol, stats_list, tx, capacity_dict=None):
     now = int(time.time())
     data = {
         "pool_id": lvol.pool_uuid,
@@ -151,13 +153,13 @@ def add_lvol_stats(cluster, lvol, stats_list, capacity_dict=None):
         logger.error("Error getting stats")
 
     stat_obj = LVolStatObject(data=data)
-    stat_obj.write_to_db(db.kv_store)
+    stat_obj.write_to_db(tx)
     last_object_record[lvol.get_id()] = stat_obj
 
     return stat_obj
 
 
-def add_pool_stats(pool, records):
+def add_pool_stats(pool, records, tx):
 
     if not records:
         return False
@@ -172,134 +174,87 @@ def add_pool_stats(pool, records):
     })
 
     stat_obj = PoolStatObject(data=data)
-    stat_obj.write_to_db(db.kv_store)
+    stat_obj.write_to_db(tx)
     return stat_obj
 
 
-# get DB controller
-db = db_controller.DBController()
+def collect_cluster_stats(cluster, snapshot):
+    if cluster.status in [Cluster.STATUS_INACTIVE, Cluster.STATUS_UNREADY, Cluster.STATUS_IN_ACTIVATION]:
+        logger.warning(f"Cluster {cluster.get_id()} is in {cluster.status} state, skipping")
+        return
 
-logger.info("Starting stats collector...")
-while True:
+    pools_lvols_stats: dict[str, list[LVolStatObject]] = {}
+    # the records of a cycle are committed in chunks of bounded transactions
+    tx = db.transaction(constants.STATS_COMMIT_CHUNK, constants.STATS_COMMIT_MAX_RETRIES)
+    for snode in db.get_storage_nodes_by_cluster_id(cluster.get_id()):
 
-    for cluster in db.get_clusters():
+        lvol_list = db.get_lvols_by_node_id(snode.get_id())
 
-        if cluster.status in [Cluster.STATUS_INACTIVE, Cluster.STATUS_UNREADY, Cluster.STATUS_IN_ACTIVATION]:
-            logger.warning(f"Cluster {cluster.get_id()} is in {cluster.status} state, skipping")
+        if not lvol_list:
             continue
 
-        all_node_bdev_names: dict[str, dict[str, dict]] = {}
-        all_node_lvols_nqns: dict[str, dict[str, str]] = {}
-        all_node_lvols_stats: dict[str, dict] = {}
-
-        pools_lvols_stats: dict[str, list[LVolStatObject]] = {}
-        for snode in db.get_storage_nodes_by_cluster_id(cluster.get_id()):
+        # only the capacity of the lvols is needed, their bdevs are requested by name
+        bdev_names = [lvol.lvol_uuid for lvol in lvol_list]
+        node_state = None
+        if snode.status in [StorageNode.STATUS_ONLINE, StorageNode.STATUS_SUSPENDED, StorageNode.STATUS_DOWN]:
+            node_state = snapshot.get(snode, STAT_VIEWS, bdev_names)
 
-            lvol_list = db.get_lvols_by_node_id(snode.get_id())
+        sec_state = None
+        if snode.secondary_node_id:
+            sec_node = db.get_storage_node_by_id(snode.secondary_node_id)
+            if sec_node and sec_node.status == StorageNode.STATUS_ONLINE:
+                sec_state = snapshot.get(sec_node, STAT_VIEWS, bdev_names)
 
-            if not lvol_list:
+        for lvol in lvol_list:
+            if lvol.status in [LVol.STATUS_IN_CREATION, LVol.STATUS_IN_DELETION]:
                 continue
 
-            if snode.status in [StorageNode.STATUS_ONLINE, StorageNode.STATUS_SUSPENDED, StorageNode.STATUS_DOWN]:
+            capacity_dict = {}
+            stats = []
+            logger.info("Getting lVol stats: %s from node: %s", lvol.uuid, snode.get_id())
+            if node_state is not None:
+                if lvol.lvol_uuid in node_state.stats:
+                    stats.append(node_state.stats[lvol.lvol_uuid])
+                capacity_dict = node_state.bdevs.get(lvol.lvol_uuid, {})
+
+            if lvol.ha_type == "ha" and sec_state is not None:
+                logger.info("Getting lVol stats: %s from node: %s", lvol.uuid, sec_state.node_id)
+                if lvol.lvol_uuid in sec_state.stats:
+                    stats.append(sec_state.stats[lvol.lvol_uuid])
+                if not capacity_dict:
+                    capacity_dict = sec_state.bdevs.get(lvol.lvol_uuid, {})
+
+            record = add_lvol_stats(cluster, lvol, stats, tx, capacity_dict)
+            if record:
+                if lvol.pool_uuid in pools_lvols_stats and pools_lvols_stats[lvol.pool_uuid]:
+                    pools_lvols_stats[lvol.pool_uuid].append(record)
+                else:
+                    pools_lvols_stats[lvol.pool_uuid] = [record]
 
-                rpc_client = RPCClient(
-                    snode.mgmt_ip, snode.rpc_port,
-                    snode.rpc_username, snode.rpc_password, timeout=3, retry=2)
+    for pool in db.get_pools(cluster_id=cluster.get_id()):
 
-                if snode.get_id() in all_node_bdev_names and all_node_bdev_names[snode.get_id()]:
-                    node_bdev_names = all_node_bdev_names[snode.get_id()]
-                else:
-                    node_bdevs = rpc_client.get_bdevs()
-                    if node_bdevs:
-                        node_bdev_names = {b['name']: b for b in node_bdevs}
-                        all_node_bdev_names[snode.get_id()] = node_bdev_names
+        if pool.get_id() in pools_lvols_stats:
+            stat_records = pools_lvols_stats[pool.get_id()]
+            if stat_records:
+                add_pool_stats(pool, stat_records, tx)
 
-                if snode.get_id() in all_node_lvols_nqns and all_node_lvols_nqns[snode.get_id()]:
-                    node_lvols_nqns = all_node_lvols_nqns[snode.get_id()]
-                else:
-                    ret = rpc_client.subsystem_list()
-                    if ret:
-                        node_lvols_nqns = {}
-                        for sub in ret:
-                            node_lvols_nqns[sub['nqn']] = sub
-                        all_node_lvols_nqns[snode.get_id()] = node_lvols_nqns
-
-                if snode.get_id() in all_node_lvols_stats and all_node_lvols_stats[snode.get_id()]:
-                    node_lvols_stats = all_node_lvols_stats[snode.get_id()]
-                else:
-                    ret = rpc_client.get_lvol_stats()
-                    if ret:
-                        node_lvols_stats = {}
-                        for st in ret['bdevs']:
-                            node_lvols_stats[st['name']] = st
-                        all_node_lvols_stats[snode.get_id()] = node_lvols_stats
-
-            if snode.secondary_node_id:
-                sec_node = db.get_storage_node_by_id(snode.secondary_node_id)
-                if sec_node and sec_node.status==StorageNode.STATUS_ONLINE:
-                    sec_rpc_client = RPCClient(
-                        sec_node.mgmt_ip, sec_node.rpc_port,
-                        sec_node.rpc_username, sec_node.rpc_password, timeout=3, retry=2)
-
-                    if sec_node.get_id() not in all_node_bdev_names or not all_node_bdev_names[sec_node.get_id()]:
-                        ret = sec_rpc_client.get_bdevs()
-                        if ret:
-                            # node_bdev_names = {}
-                            node_bdev_names = {b['name']: b for b in ret}
-                            all_node_bdev_names[sec_node.get_id()] = node_bdev_names
-
-                    if sec_node.get_id() not in all_node_lvols_nqns or not all_node_lvols_nqns[sec_node.get_id()]:
-                        ret = sec_rpc_client.subsystem_list()
-                        if ret:
-                            node_lvols_nqns = {}
-                            for sub in ret:
-                                node_lvols_nqns[sub['nqn']] = sub
-                            all_node_lvols_nqns[sec_node.get_id()] = node_lvols_nqns
-
-                    if sec_node.get_id() not in all_node_lvols_stats or not all_node_lvols_stats[sec_node.get_id()]:
-                        ret = sec_rpc_client.get_lvol_stats()
-                        if ret:
-                            sec_node_lvols_stats = {}
-                            for st in ret['bdevs']:
-                                sec_node_lvols_stats[st['name']] = st
-                            all_node_lvols_stats[sec_node.get_id()] = sec_node_lvols_stats
-
-            for lvol in lvol_list:
-                if lvol.status in [LVol.STATUS_IN_CREATION, LVol.STATUS_IN_DELETION]:
-                    continue
-
-                capacity_dict = {}
-                stats = []
-                logger.info("Getting lVol stats: %s from node: %s", lvol.uuid, snode.get_id())
-                if snode.get_id() in all_node_lvols_stats and lvol.lvol_uuid in all_node_lvols_stats[snode.get_id()]:
-                    stats.append(all_node_lvols_stats[snode.get_id()][lvol.lvol_uuid])
-
-                if snode.get_id() in all_node_bdev_names and lvol.lvol_uuid in all_node_bdev_names[snode.get_id()]:
-                    capacity_dict = all_node_bdev_names[snode.get_id()][lvol.lvol_uuid]
-
-                if lvol.ha_type == "ha":
-                    sec_node = db.get_storage_node_by_id(snode.secondary_node_id)
-                    if sec_node and sec_node.status == StorageNode.STATUS_ONLINE:
-                        logger.info("Getting lVol stats: %s from node: %s", lvol.uuid, sec_node.get_id())
-                        if lvol.lvol_uuid in all_node_lvols_stats[sec_node.get_id()]:
-                            stats.append(all_node_lvols_stats[sec_node.get_id()][lvol.lvol_uuid])
-
-                    if not capacity_dict and sec_node.get_id() in all_node_bdev_names \
-                            and lvol.lvol_uuid in all_node_bdev_names[sec_node.get_id()]:
-                        capacity_dict = all_node_bdev_names[sec_node.get_id()][lvol.lvol_uuid]
-
-                record = add_lvol_stats(cluster, lvol, stats, capacity_dict)
-                if record:
-                    if lvol.pool_uuid in pools_lvols_stats and pools_lvols_stats[lvol.pool_uuid]:
-                        pools_lvols_stats[lvol.pool_uuid].append(record)
-                    else:
-                        pools_lvols_stats[lvol.pool_uuid] = [record]
-
-        for pool in db.get_pools(cluster_id=cluster.get_id()):
-
-            if pool.get_id() in pools_lvols_stats:
-                stat_records = pools_lvols_stats[pool.get_id()]
-                if stat_records:
-                    add_pool_stats(pool, stat_records)
+    tx.commit()
+
+
+# get DB controller
+db = db_controller.DBController()
+bdev_cache = BdevCache()
+
+logger.info("Starting stats collector...")
+while True:
+
+    # the bdevs are shared with the monitors, the stats are always read from the nodes
+    snapshot = NodeStateSnapshot(db, ttl=constants.NODE_STATE_TTL_SEC, bdev_cache=bdev_cache)
+    for cluster in db.get_clusters():
+        try:
+            collect_cluster_stats(cluster, snapshot)
+        except Exception as e:
+            logger.exception(f"Failed to collect the stats of cluster {cluster.get_id()}: {e}")
 
+    logger.debug(f"Node state: {snapshot.get_stats()}")
     time.sleep(constants.LVOL_STAT_COLLECTOR_INTERVAL_SEC)
@@ -1,6 +1,7 @@
 # coding=utf-8
 import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 
 
 from simplyblock_core import constants, db_controller, utils, rpc_client, distr_controller
@@ -15,24 +16,47 @@ utils.init_sentry_sdk()
 
 # get DB controller
 db = db_controller.DBController()
+db.enable_cache()
 
 EVENTS_LIST = ['SPDK_BDEV_EVENT_REMOVE', "error_open", 'error_read', "error_write", "error_unmap",
                "error_write_cannot_allocate"]
 
+# (cluster id, storage id) -> id of the node holding the device, rebuilt per cluster on misses
+device_nodes: dict[tuple[str, int], str] = {}
+device_nodes_lock = threading.Lock()
+
+
+def find_device(cluster_id, storage_id):
+    """Returns the device with the cluster wide `storage_id` and its node, or (None, None)"""
+    for rebuild in [False, True]:
+        if rebuild:
+            with device_nodes_lock:
+                for key in [key for key in device_nodes if key[0] == cluster_id]:
+                    del device_nodes[key]
+                for node in db.get_storage_nodes_by_cluster_id(cluster_id):
+                    for dev in node.nvme_devices:
+                        device_nodes[(cluster_id, dev.cluster_device_order)] = node.get_id()
+
+        node_id = device_nodes.get((cluster_id, storage_id))
+        if node_id is None:
+            continue
+        try:
+            node = db.get_storage_node_by_id(node_id)
+        except KeyError:
+            continue
+        for dev in node.nvme_devices:
+            if dev.cluster_device_order == storage_id:
+                return dev, node
+    return None, None
+
+
 def process_device_event(event):
     if event.message in EVENTS_LIST:
         node_id = event.node_id
         storage_id = event.storage_id
         event_node_obj = db.get_storage_node_by_id(node_id)
 
-        device_obj = None
-        device_node_obj = None
-        for node in db.get_storage_nodes():
-            for dev in node.nvme_devices:
-                if dev.cluster_device_order == storage_id:
-                    device_obj = dev
-                    device_node_obj = node
-                    break
+        device_obj, device_node_obj = find_device(event_node_obj.cluster_id, storage_id)
 
         if device_obj is None or device_node_obj is None:
             logger.info(f"Device not found!, storage id: {storage_id} from node: {node_id}")
@@ -127,12 +151,13 @@ def process_event(event):
         if event.vuid >= 0:
             process_lvol_event(event)
 
-    event.write_to_db(db.kv_store)
-
 
-def start_event_collector_on_node(node_id):
-    logger.info(f"Starting Distr event collector on node: {node_id}")
+def collect_node_events(node_id):
+    """Processes the pending distr events of a node, runs in the worker pool
 
+    Returns True if events are left after DISTR_EVENT_COLLECTOR_MAX_PAGES pages.
+    Repeated events are coalesced, the events of a page are written at once.
+    """
     snode = db.get_storage_node_by_id(node_id)
     client = rpc_client.RPCClient(
         snode.mgmt_ip,
@@ -141,81 +166,88 @@ def start_event_collector_on_node(node_id):
         snode.rpc_password,
         timeout=2, retry=2)
 
-    try:
-        while True:
-            page = 1
-            events_groups = {}
-            while True:
-                try:
-                    events = client.distr_status_events_discard_then_get(
-                        0, constants.DISTR_EVENT_COLLECTOR_NUM_OF_EVENTS * page)
-                    if events is False:
-                        logger.error("No events received")
-                        return
-
-                    if events:
-                        logger.info(f"Found events: {len(events)}")
-                        for event_dict in events:
-                            if "storage_ID" in event_dict:
-                                sid = event_dict['storage_ID']
-                            elif "vuid" in event_dict:
-                                sid = event_dict['vuid']
-                            else:
-                                logger.error(f"Unknown event: {event_dict}")
-                                continue
-
-                            # Ignore type errors, this can be simplified to avoid them
-                            et = event_dict['event_type']
-                            msg = event_dict['status']
-                            if sid not in events_groups:
-                                events_groups[sid] = {et:{msg: 1}}
-                            elif et not in events_groups[sid]:
-                                events_groups[sid][et]: {msg: 1}  # type: ignore
-                            elif msg not in events_groups[sid][et]:
-                                events_groups[sid][et][msg]: 1  # type: ignore
-                            else:
-                                events_groups[sid][et][msg].count += 1  # type: ignore
-                                events_groups[sid][et][msg].write_to_db()  # type: ignore
-                                logger.info(f"Event {msg} already processed")
-                                continue
-
-                            event = events_controller.log_distr_event(snode.cluster_id, snode.get_id(), event_dict)
-                            logger.info(f"Processing event: {event.get_id()}")
-                            process_event(event)
-                            events_groups[sid][et][msg] = event
-
-                        logger.info(f"Discarding events: {len(events)}")
-                        client.distr_status_events_discard_then_get(len(events), 0)
-                        page *= 10
-                    else:
-                        logger.info("no events found, sleeping")
-                        break
-                except Exception as e:
-                    logger.error("Failed to process distr events")
-                    logger.exception(e)
-                    break
-
-            time.sleep(constants.DISTR_EVENT_COLLECTOR_INTERVAL_SEC)
-    except Exception as e:
-        logger.error(e)
-
-    logger.info(f"Stopping Distr event collector on node: {node_id}")
-
-
-threads_maps: dict[str, threading.Thread] = {}
-
+    if node_id not in coalescers:
+        coalescers[node_id] = events_controller.DistrEventCoalescer(
+            snode.cluster_id, node_id, constants.DISTR_EVENT_COALESCE_WINDOW_SEC)
+    coalescer = coalescers[node_id]
+    coalescer.expire()
+
+    # the events of a page are discarded with the request for the next one
+    discard = 0
+    page = constants.DISTR_EVENT_COLLECTOR_NUM_OF_EVENTS
+    for _ in range(constants.DISTR_EVENT_COLLECTOR_MAX_PAGES):
+        events = client.distr_status_events_discard_then_get(discard, page)
+        if events is False:
+            logger.error(f"No events received from node: {node_id}")
+            return False
+        if not events:
+            return False
+
+        logger.info(f"Found events: {len(events)}")
+        updated = {}
+        try:
+            for event_dict in events:
+                event, new = coalescer.add(event_dict)
+                if event is None:
+                    logger.error(f"Unknown event: {event_dict}")
+                    continue
+                if new:
+                    logger.info(f"Processing event: {event.get_id()}")
+                    try:
+                        process_event(event)
+                    except Exception:
+                        # the page is not discarded, the event is processed again with the next poll
+                        coalescer.forget(event_dict)
+                        raise
+                else:
+                    logger.debug(f"Event {event.message} already processed, count: {event.count}")
+                updated[event.get_id()] = event
+        finally:
+            db.write_many(updated.values())
+
+        discard = len(events)
+        page = min(page * 10, constants.DISTR_EVENT_COLLECTOR_MAX_EVENTS)
+
+    logger.info(f"Discarding events: {discard}")
+    client.distr_status_events_discard_then_get(discard, 0)
+    return True
+
+
+executor = ThreadPoolExecutor(max_workers=constants.DISTR_EVENT_COLLECTOR_WORKERS)
+in_flight: dict[str, Future] = {}
+next_poll: dict[str, float] = {}
+coalescers: dict[str, events_controller.DistrEventCoalescer] = {}
+
+logger.info("Starting Distr event collector...")
 while True:
-    clusters = db.get_clusters()
-    for cluster in clusters:
-        cluster_id = cluster.get_id()
-
-        nodes = db.get_storage_nodes_by_cluster_id(cluster_id)
-        for snode in nodes:
+    now = time.time()
+    node_ids = set()
+    for cluster in db.get_clusters():
+        for snode in db.get_storage_nodes_by_cluster_id(cluster.get_id()):
             node_id = snode.get_id()
-            # logger.info(f"Checking node {snode.hostname}")
-            if node_id not in threads_maps or threads_maps[node_id].is_alive() is False:
-                t = threading.Thread(target=start_event_collector_on_node, args=(node_id,))
-                t.start()
-                threads_maps[node_id] = t
-
-    time.sleep(5)
+            node_ids.add(node_id)
+            if node_id not in in_flight and next_poll.get(node_id, 0) <= now:
+                in_flight[node_id] = executor.submit(collect_node_events, node_id)
+
+    for node_id in set(coalescers) - node_ids:
+        del coalescers[node_id]
+
+    # wake up as soon as a node finished, it may have more events pending
+    timeout = min([t - now for n, t in next_poll.items() if n not in in_flight and n in node_ids] +
+                  [constants.DISTR_EVENT_COLLECTOR_INTERVAL_SEC])
+    if in_flight:
+        wait(in_flight.values(), timeout=max(0.0, timeout), return_when=FIRST_COMPLETED)
+    else:
+        time.sleep(max(0.0, timeout))
+
+    for node_id, future in list(in_flight.items()):
+        if not future.done():
+            continue
+        del in_flight[node_id]
+        more = False
+        try:
+            more = future.result()
+        except Exception as e:
+            logger.error(f"Failed to process distr events of node: {node_id}")
+            logger.exception(e)
+        next_poll[node_id] = time.time() + (0 if more else constants.DISTR_EVENT_COLLECTOR_INTERVAL_SEC)
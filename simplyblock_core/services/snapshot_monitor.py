@@ -8,7 +8,7 @@ from simplyblock_core.models.cluster import Cluster
 from simplyblock_core.controllers import health_controller
 from simplyblock_core.models.snapshot import SnapShot
 from simplyblock_core.models.storage_node import StorageNode
-from simplyblock_core.rpc_client import RPCClient
+from simplyblock_core.node_state import BdevCache, NodeStateSnapshot
 
 logger = utils.get_logger(__name__)
 
@@ -67,10 +67,13 @@ def set_snap_offline(snap):
 
 # get DB controller
 db = db_controller.DBController()
+bdev_cache = BdevCache()
 
 logger.info("Starting LVol monitor...")
 while True:
 
+    # the views of each node are fetched once per cycle, and shared with the other monitors
+    snapshot = NodeStateSnapshot(db, ttl=constants.NODE_STATE_TTL_SEC, bdev_cache=bdev_cache)
     for cluster in db.get_clusters():
 
         if cluster.status in [Cluster.STATUS_INACTIVE, Cluster.STATUS_UNREADY, Cluster.STATUS_IN_ACTIVATION]:
@@ -78,48 +81,19 @@ while True:
             continue
 
         for snode in db.get_storage_nodes_by_cluster_id(cluster.get_id()):
-            node_bdev_names = []
-            node_lvols_nqns = {}
-            sec_node_bdev_names = {}
-            sec_node_lvols_nqns = {}
+            node_bdev_names: dict = {}
             sec_node = None
 
+            snapshots = db.get_snapshots_by_node_id(snode.get_id())
             if snode.status in [StorageNode.STATUS_ONLINE, StorageNode.STATUS_SUSPENDED, StorageNode.STATUS_DOWN]:
-
-                rpc_client = RPCClient(
-                    snode.mgmt_ip, snode.rpc_port,
-                    snode.rpc_username, snode.rpc_password, timeout=3, retry=2)
-                node_bdevs = rpc_client.get_bdevs()
-                if node_bdevs:
-                    node_bdev_names = [b['name'] for b in node_bdevs]
-                    for bdev in node_bdevs:
-                        if "aliases" in bdev and bdev["aliases"]:
-                            node_bdev_names.extend(bdev['aliases'])
-
-                ret = rpc_client.subsystem_list()
-                if ret:
-                    for sub in ret:
-                        node_lvols_nqns[sub['nqn']] = sub
+                node_bdev_names = snapshot.get(snode, bdev_names=[snap.snap_bdev for snap in snapshots]).bdevs
 
             if snode.secondary_node_id:
                 sec_node = db.get_storage_node_by_id(snode.secondary_node_id)
-                if sec_node and sec_node.status==StorageNode.STATUS_ONLINE:
-                    sec_rpc_client = RPCClient(
-                        sec_node.mgmt_ip, sec_node.rpc_port,
-                        sec_node.rpc_username, sec_node.rpc_password, timeout=3, retry=2)
-                    ret = sec_rpc_client.get_bdevs()
-                    if ret:
-                        for bdev in ret:
-                            sec_node_bdev_names[bdev['name']] = bdev
-
-                    ret = sec_rpc_client.subsystem_list()
-                    if ret:
-                        for sub in ret:
-                            sec_node_lvols_nqns[sub['nqn']] = sub
 
             if snode.lvstore_status == "ready":
 
-                for snap in db.get_snapshots_by_node_id(snode.get_id()):
+                for snap in snapshots:
                     if snap.status == SnapShot.STATUS_ONLINE:
 
                         present = health_controller.check_bdev(snap.snap_bdev, bdev_names=node_bdev_names)
@@ -131,18 +105,16 @@ while True:
                         leader_node = None
                         if snode.status in [StorageNode.STATUS_ONLINE, StorageNode.STATUS_SUSPENDED,
                                             StorageNode.STATUS_DOWN]:
-                            ret = snode.rpc_client().bdev_lvol_get_lvstores(snode.lvstore)
-                            if not ret:
+                            lvs_info = snapshot.get(snode, ('lvstores',)).lvstores.get(snode.lvstore)
+                            if not lvs_info:
                                 raise Exception("Failed to get LVol store info")
-                            lvs_info = ret[0]
                             if "lvs leadership" in lvs_info and lvs_info['lvs leadership']:
                                 leader_node = snode
 
                         if not leader_node and sec_node:
-                            ret = sec_node.rpc_client().bdev_lvol_get_lvstores(sec_node.lvstore)
-                            if not ret:
+                            lvs_info = snapshot.get(sec_node, ('lvstores',)).lvstores.get(sec_node.lvstore)
+                            if not lvs_info:
                                 raise Exception("Failed to get LVol store info")
-                            lvs_info = ret[0]
                             if "lvs leadership" in lvs_info and lvs_info['lvs leadership']:
                                 leader_node = sec_node
 
@@ -233,5 +205,5 @@ while True:
                             logger.info(f"Snap deletion error, id: {snap.get_id()}, error code: {ret}")
                             logger.error("Failed to update snapshot for deletion")
 
-
+    logger.debug(f"Node state: {snapshot.get_stats()}")
     time.sleep(constants.LVOL_MONITOR_INTERVAL_SEC)
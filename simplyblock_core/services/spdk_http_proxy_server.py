@@ -1,12 +1,17 @@
 #!/usr/bin/env python3
 
+import asyncio
 import base64
+import functools
+import itertools
 import json
 import logging
 import os
+import re
 import socket
 import sys
 
+from http import HTTPStatus
 from http.server import HTTPServer
 from http.server import ThreadingHTTPServer
 from http.server import BaseHTTPRequestHandler
@@ -30,6 +35,96 @@ def get_env_var(name, default=None, is_required=False):
     return os.environ.get(name, default)
 
 
+class JSONFramer:
+    """Splits a stream of bytes into JSON objects and arrays.
+
+    New data is scanned once for the bracket depth, strings removed, with C
+    level passes only; nothing is parsed again when more data arrives. A
+    message ends where the depth gets back to 0, at the n-th bracket of the
+    data unless strings hold brackets, then the messages are cut by decoding.
+    """
+
+    # everything up to a string continuing in the next chunk
+    _scan = re.compile(rb'(?:[^"]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.DOTALL)
+    _strings = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+    _not_brackets = bytes(sorted(set(range(256)) - set(b'{}[]')))
+    _depth_change = {ord('{'): 1, ord('['): 1, ord('}'): -1, ord(']'): -1}
+    _decoder = json.JSONDecoder()
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.scanned = 0
+        self.depth = 0
+
+    def feed(self, data):
+        """Adds `data`, returns the messages completed by it"""
+        self.buffer += data
+        start = self.scanned
+        segment = bytes(self.buffer[start:])
+        if b'\\' in segment:
+            end = self._scan.match(segment).end()  # type: ignore[union-attr]
+            outside = self._strings.sub(b'', segment[:end])
+        else:
+            # without escapes the quotes alternate, every other part is a string
+            parts = segment.split(b'"')
+            end = len(segment)
+            if len(parts) % 2 == 0:
+                # a string continues in the next chunk
+                end = segment.rfind(b'"')
+                parts.pop()
+            outside = b''.join(parts[0::2])
+
+        brackets = outside.translate(None, self._not_brackets)
+        depths = list(itertools.accumulate(map(self._depth_change.__getitem__, brackets), initial=self.depth))
+        self.scanned += end
+        self.depth = depths[-1]
+
+        ends = []
+        index = 0
+        while True:
+            try:
+                index = depths.index(0, index + 1)
+            except ValueError:
+                break
+            ends.append(index)
+        if not ends:
+            return []
+
+        if len(segment[:end].translate(None, self._not_brackets)) == len(brackets):
+            offsets = []
+            pos = 0
+            count = 0
+            for index in ends:
+                nth_bracket = re.compile(rb'(?:[^{}\[\]]*[{}\[\]]){%d}' % (index - count))
+                pos = nth_bracket.match(segment, pos).end()  # type: ignore[union-attr]
+                count = index
+                offsets.append(start + pos)
+        else:
+            offsets = self._decode_offsets(len(ends))
+
+        messages = []
+        pos = 0
+        for offset in offsets:
+            messages.append(bytes(self.buffer[pos:offset]).strip())
+            pos = offset
+        del self.buffer[:pos]
+        self.scanned -= pos
+        return messages
+
+    def _decode_offsets(self, count):
+        """Returns the end offsets of the first `count` messages of the buffer"""
+        # latin-1 keeps the offsets of the bytes, the structure is all ascii
+        text = self.buffer.decode('latin-1')
+        offsets = []
+        pos = 0
+        for _ in range(count):
+            while text[pos].isspace():
+                pos += 1
+            _, pos = self._decoder.raw_decode(text, pos)
+            offsets.append(pos)
+        return offsets
+
+
 def rpc_call(req):
     req_data = json.loads(req.decode('ascii'))
     params = ""
@@ -39,60 +134,96 @@ def rpc_call(req):
     sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
     sock.settimeout(TIMEOUT)
     sock.connect(rpc_sock)
-    sock.sendall(req)
-
-    if 'id' not in req_data:
+    try:
+        sock.sendall(req)
+
+        if 'id' not in req_data:
+            return None
+
+        framer = JSONFramer()
+        messages: list = []
+        while not messages:
+            newdata = sock.recv(1024*1024)
+            if newdata == b'':
+                break
+            messages = framer.feed(newdata)
+    finally:
         sock.close()
-        return None
 
-    buf = ''
-    closed = False
-    response = None
+    if messages:
+        buf = messages[0].decode('ascii')
+    else:
+        buf = framer.buffer.decode('ascii')
+        if len(buf) > 0:
+            raise ValueError('Invalid response')
 
-    while not closed:
-        newdata = sock.recv(1024*1024*1024)
-        if newdata == b'':
-            closed = True
-        buf += newdata.decode('ascii')
-        try:
-            response = json.loads(buf)
-        except ValueError:
-            continue  # incomplete response; keep buffering
-        break
+    logger.debug(f"Response data: {buf}")
 
-    sock.close()
+    return buf
 
-    if not response and len(buf) > 0:
-        raise ValueError('Invalid response')
 
-    logger.debug(f"Response data: {buf}")
+def rpc_error(request_id, code, message):
+    return json.dumps({"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}})
 
-    return buf
+
+def rpc_batch(req):
+    """Forwards the calls of a JSON-RPC batch request one by one, SPDK does not accept batches
+
+    Returns the responses as a JSON array in request order, None if all calls are notifications.
+    """
+    calls = json.loads(req.decode('ascii'))
+    if not calls:
+        return rpc_error(None, -32600, "Invalid Request")
+
+    responses = []
+    for call in calls:
+        if not isinstance(call, dict):
+            responses.append(rpc_error(None, -32600, "Invalid Request"))
+            continue
+        try:
+            response = rpc_call(json.dumps(call).encode('ascii'))
+        except (OSError, ValueError) as e:
+            logger.error(f"Request function: {call.get('method')} failed: {e}")
+            response = rpc_error(call.get('id'), -32603, str(e))
+        if response is not None:
+            responses.append(response)
+
+    if not responses:
+        return None
+    return '[' + ','.join(responses) + ']'
 
 
 class ServerHandler(BaseHTTPRequestHandler):
 
     key = ""
+    # headers and body are sent separately, do not wait for the ack in between
+    disable_nagle_algorithm = True
 
-    def do_HEAD(self):
+    def do_HEAD(self, content_length=0):
         self.send_response(200)
         self.send_header('Content-type', 'text/html')
+        self.send_header('Content-Length', str(content_length))
         self.end_headers()
 
     def do_HEAD_no_content(self):
         self.send_response(204)
         self.send_header('Content-type', 'text/html')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def do_AUTHHEAD(self):
         self.send_response(401)
         self.send_header('WWW-Authenticate', 'text/html')
         self.send_header('Content-type', 'text/html')
+        self.send_header('Content-Length', '0')
+        # the request body is not read, the connection can not be reused
+        self.send_header('Connection', 'close')
         self.end_headers()
 
     def do_INTERNALERROR(self):
         self.send_response(500)
         self.send_header('Content-type', 'text/html')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def do_POST(self):
@@ -120,10 +251,14 @@ class ServerHandler(BaseHTTPRequestHandler):
                         break
 
             try:
-                response = rpc_call(data_string)
+                if data_string.lstrip().startswith(b'['):
+                    response = rpc_batch(data_string)
+                else:
+                    response = rpc_call(data_string)
                 if response is not None:
-                    self.do_HEAD()
-                    self.wfile.write(bytes(response.encode(encoding='ascii')))
+                    body = response.encode(encoding='ascii')
+                    self.do_HEAD(len(body))
+                    self.wfile.write(body)
                 else:
                     self.do_HEAD_no_content()
 
@@ -137,6 +272,12 @@ def run_server(host, port, user, password, is_threading_enabled=False):
 
     try:
         ServerHandler.key = key
+        if is_threading_enabled:
+            # Keep-alive lets the control plane reuse its connections. Idle
+            # connections are closed after KEEP_ALIVE_TIMEOUT. A single
+            # threaded server would not serve other clients meanwhile.
+            ServerHandler.protocol_version = 'HTTP/1.1'
+            ServerHandler.timeout = KEEP_ALIVE_TIMEOUT
         httpd = (ThreadingHTTPServer if is_threading_enabled else HTTPServer)((host, port), ServerHandler)
         httpd.timeout = TIMEOUT
         logger.info('Started RPC http proxy server')
@@ -146,8 +287,212 @@ def run_server(host, port, user, password, is_threading_enabled=False):
         httpd.socket.close()
 
 
+class SPDKConnection:
+    """Persistent connection to the SPDK RPC socket, concurrent requests are multiplexed on it.
+
+    Requests are sent with proxy wide unique ids, responses are matched by id
+    and get the id of the client request back. SPDK writes the id ahead of the
+    result, it is replaced in the response bytes without decoding them. The
+    connection is opened again on the next request after SPDK closed it.
+    """
+
+    _ids = itertools.count(1)
+    _response_id = re.compile(rb'\s*\{\s*(?:"jsonrpc"\s*:\s*"2\.0"\s*,\s*)?"id"\s*:\s*(\d+)\s*[,}]')
+
+    def __init__(self):
+        self.writer = None
+        self.reader_task = None
+        self.pending = {}
+        self.lock = asyncio.Lock()
+
+    async def _connect(self):
+        async with self.lock:
+            if self.writer is None or self.writer.is_closing():
+                reader, writer = await asyncio.open_unix_connection(rpc_sock)
+                self.writer = writer
+                self.pending = {}
+                self.reader_task = asyncio.ensure_future(self._read(reader, writer, self.pending))
+            return self.writer, self.pending
+
+    async def _read(self, reader, writer, pending):
+        framer = JSONFramer()
+        try:
+            while True:
+                data = await reader.read(1024*1024)
+                if not data:
+                    break
+                for message in framer.feed(data):
+                    match = self._response_id.match(message)
+                    response_id = int(match.group(1)) if match else json.loads(message).get('id')
+                    future = pending.pop(response_id, None)
+                    if future is not None and not future.done():
+                        future.set_result((message, match))
+        except (OSError, ValueError) as e:
+            logger.error(f"SPDK connection failed: {e}")
+        finally:
+            writer.close()
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("SPDK connection closed"))
+            pending.clear()
+
+    async def call(self, request):
+        """Sends `request` to SPDK, returns the encoded response or None for notifications"""
+        writer, pending = await self._connect()
+        if 'id' not in request:
+            writer.write(json.dumps(request).encode('ascii'))
+            await writer.drain()
+            return None
+
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        pending[request_id] = future
+        try:
+            writer.write(json.dumps(dict(request, id=request_id)).encode('ascii'))
+            await writer.drain()
+            message, match = await asyncio.wait_for(future, TIMEOUT)
+        finally:
+            pending.pop(request_id, None)
+
+        if match:
+            return message[:match.start(1)] + json.dumps(request['id']).encode('ascii') + message[match.end(1):]
+        response = json.loads(message)
+        response['id'] = request['id']
+        return json.dumps(response).encode('ascii')
+
+
+async def async_rpc_call(connections, request):
+    if not isinstance(request, dict) or 'method' not in request:
+        raise ValueError('Invalid request')
+    logger.debug(f"Request function: {request['method']}, params: {request.get('params', '')}")
+    connection = min(connections, key=lambda c: len(c.pending))
+    return await connection.call(request)
+
+
+async def async_rpc_batch(connections, calls):
+    """Forwards the calls of a batch request one after the other, like rpc_batch"""
+    if not calls:
+        return rpc_error(None, -32600, "Invalid Request").encode('ascii')
+
+    responses = []
+    for call in calls:
+        try:
+            response = await async_rpc_call(connections, call)
+        except (OSError, ValueError, asyncio.TimeoutError) as e:
+            request_id = call.get('id') if isinstance(call, dict) else None
+            response = rpc_error(request_id, -32603, str(e)).encode('ascii')
+        if response is not None:
+            responses.append(response)
+
+    if not responses:
+        return None
+    return b'[' + b','.join(responses) + b']'
+
+
+async def read_request(reader):
+    """Reads an HTTP request, returns the method, version, headers and body, None once the client is gone"""
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEP_ALIVE_TIMEOUT)
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, OSError):
+        return None
+
+    request_line, *header_lines = head.decode('latin-1').rstrip('\r\n').split('\r\n')
+    method, _, version = request_line.split(' ', 2)
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    body = b''
+    if 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    elif 'chunked' in headers.get('transfer-encoding', ''):
+        while True:
+            chunk_length = int((await reader.readline()).strip(), 16)
+            if chunk_length != 0:
+                body += await reader.readexactly(chunk_length)
+            await reader.readline()
+            if chunk_length == 0:
+                break
+    return method, version, headers, body
+
+
+async def write_response(writer, status, body=b'', close=False):
+    lines = [f'HTTP/1.1 {status.value} {status.phrase}', 'Content-type: text/html', f'Content-Length: {len(body)}']
+    if status == HTTPStatus.UNAUTHORIZED:
+        lines.append('WWW-Authenticate: text/html')
+    if close:
+        lines.append('Connection: close')
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+    writer.write(body)
+    await writer.drain()
+
+
+async def handle_client(reader, writer, key, connections):
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except ValueError:
+                await write_response(writer, HTTPStatus.BAD_REQUEST, close=True)
+                break
+            if request is None:
+                break
+            method, version, headers, body = request
+            connection_header = headers.get('connection', '').lower()
+            close = connection_header == 'close' or (version == 'HTTP/1.0' and connection_header != 'keep-alive')
+
+            if method != 'POST':
+                await write_response(writer, HTTPStatus.NOT_IMPLEMENTED, close=close)
+            elif headers.get('authorization') != 'Basic ' + key:
+                await write_response(writer, HTTPStatus.UNAUTHORIZED, close=close)
+            else:
+                try:
+                    data = json.loads(body.decode('ascii'))
+                    if isinstance(data, list):
+                        response = await async_rpc_batch(connections, data)
+                    else:
+                        response = await async_rpc_call(connections, data)
+                except (OSError, ValueError, asyncio.TimeoutError) as e:
+                    logger.error(f"Request failed: {e}")
+                    await write_response(writer, HTTPStatus.INTERNAL_SERVER_ERROR, close=close)
+                else:
+                    if response is None:
+                        await write_response(writer, HTTPStatus.NO_CONTENT, close=close)
+                    else:
+                        await write_response(writer, HTTPStatus.OK, response, close=close)
+            if close:
+                break
+    except (OSError, asyncio.IncompleteReadError):
+        pass  # client is gone
+    finally:
+        writer.close()
+
+
+def run_async_server(host, port, user, password):
+    """Serves all clients from one asyncio loop over SPDK_CONNECTIONS persistent SPDK connections"""
+    key = base64.b64encode((user+':'+password).encode(encoding='ascii')).decode('ascii')
+
+    async def serve():
+        connections = [SPDKConnection() for _ in range(SPDK_CONNECTIONS)]
+        server = await asyncio.start_server(
+            functools.partial(handle_client, key=key, connections=connections), host, port)
+        logger.info('Started RPC http proxy server (asyncio)')
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        logger.info('Shutting down server')
+
+
 TIMEOUT = int(get_env_var("TIMEOUT", is_required=False, default=60*5))
+KEEP_ALIVE_TIMEOUT = int(get_env_var("KEEP_ALIVE_TIMEOUT", is_required=False, default=60))
 is_threading_enabled = get_env_var("MULTI_THREADING_ENABLED", is_required=False, default=False)
+is_async_enabled = str(get_env_var("ASYNC_ENABLED", is_required=False, default="")).lower() in ("1", "true", "yes")
+SPDK_CONNECTIONS = int(get_env_var("SPDK_CONNECTIONS", is_required=False, default=2))
+rpc_sock = get_env_var("RPC_SOCK", is_required=False, default=rpc_sock)
 server_ip = get_env_var("SERVER_IP", is_required=True, default="")
 rpc_port = get_env_var("RPC_PORT", is_required=True)
 rpc_username = get_env_var("RPC_USERNAME", is_required=True)
@@ -159,4 +504,7 @@ except Exception:
     rpc_port = 8080
 
 is_threading_enabled = bool(is_threading_enabled)
-run_server(server_ip, rpc_port, rpc_username, rpc_password, is_threading_enabled=is_threading_enabled)
+if is_async_enabled:
+    run_async_server(server_ip, rpc_port, rpc_username, rpc_password)
+else:
+    run_server(server_ip, rpc_port, rpc_username, rpc_password, is_threading_enabled=is_threading_enabled)
@@ -3,7 +3,7 @@ import time
 from datetime import datetime, timezone
 
 
-from simplyblock_core import constants, db_controller, cluster_ops, storage_node_ops, utils
+from simplyblock_core import constants, db_controller, cluster_ops, rpc_client, storage_node_ops, utils
 from simplyblock_core.controllers import health_controller, device_controller, tasks_controller
 from simplyblock_core.models.cluster import Cluster
 from simplyblock_core.models.job_schedule import JobSchedule
@@ -16,6 +16,7 @@ logger = utils.get_logger(__name__)
 
 # get DB controller
 db = db_controller.DBController()
+db.enable_cache()
 
 utils.init_sentry_sdk()
 
@@ -32,14 +33,13 @@ def is_new_migrated_node(cluster_id, node):
             distr_names.append(item["name"])
 
     if dev_lst:
-        tasks = db.get_job_tasks(cluster_id)
+        tasks = db.get_active_job_tasks(cluster_id, JobSchedule.FN_NEW_DEV_MIG, node.get_id())
         for task in tasks:
-            if task.function_name == JobSchedule.FN_NEW_DEV_MIG and task.node_id == node.get_id():
-                if task.device_id not in dev_lst:
-                    continue
-                if task.status != JobSchedule.STATUS_DONE and task.canceled is False:
-                    if "distr_name" in task.function_params and task.function_params["distr_name"] in distr_names:
-                        return True
+            if task.device_id not in dev_lst:
+                continue
+            if task.canceled is False:
+                if "distr_name" in task.function_params and task.function_params["distr_name"] in distr_names:
+                    return True
     return False
 
 
@@ -132,10 +132,8 @@ def update_cluster_status(cluster_id):
     logger.info("cluster_new_status: %s", next_current_status)
 
     task_pending = 0
-    for task in db.get_job_tasks(cluster_id):
-        if task.status != JobSchedule.STATUS_DONE and task.function_name in [
-            JobSchedule.FN_DEV_MIG, JobSchedule.FN_NEW_DEV_MIG, JobSchedule.FN_FAILED_DEV_MIG]:
-            task_pending += 1
+    for function_name in [JobSchedule.FN_DEV_MIG, JobSchedule.FN_NEW_DEV_MIG, JobSchedule.FN_FAILED_DEV_MIG]:
+        task_pending += len(db.get_active_job_tasks(cluster_id, function_name))
 
     cluster = db.get_cluster_by_id(cluster_id)
     cluster.is_re_balancing = task_pending  > 0
@@ -227,6 +225,31 @@ def set_node_down(node):
     if node.status != StorageNode.STATUS_DOWN:
         storage_node_ops.set_node_status(node.get_id(), StorageNode.STATUS_DOWN)
 
+def is_monitored(snode):
+    if snode.status not in [StorageNode.STATUS_ONLINE, StorageNode.STATUS_UNREACHABLE,
+                            StorageNode.STATUS_SCHEDULABLE, StorageNode.STATUS_DOWN]:
+        logger.info(f"Node status is: {snode.status}, skipping")
+        return False
+
+    if snode.status == StorageNode.STATUS_ONLINE and snode.lvstore_status == "in_creation":
+        logger.info(f"Node lvstore is in creation: {snode.get_id()}, skipping")
+        return False
+    return True
+
+
+def get_node_ports(snode):
+    ports = [snode.nvmf_port]
+    if snode.lvstore_stack_secondary_1:
+        for n in db.get_primary_storage_nodes_by_secondary_node_id(snode.get_id()):
+            if n.lvstore_status == "ready":
+                ports.append(n.lvol_subsys_port)
+    if not snode.is_secondary_node:
+        ports.append(snode.lvol_subsys_port)
+    return ports
+
+
+prober = health_controller.NodeProber(db)
+
 logger.info("Starting node monitor")
 while True:
     clusters = db.get_clusters()
@@ -236,69 +259,54 @@ while True:
             logger.info(f"Cluster status is: {cluster.status}, skipping monitoring")
             continue
 
-        nodes = db.get_storage_nodes_by_cluster_id(cluster_id)
+        # all nodes are probed at once, so that an unreachable node does not delay the others
+        nodes = [snode for snode in db.get_storage_nodes_by_cluster_id(cluster_id) if is_monitored(snode)]
+        probes = prober.get(cluster_id, nodes, {
+            snode.get_id(): get_node_ports(snode) for snode in nodes if snode.lvstore_status == "ready"})
         for snode in nodes:
 
             # get fresh node object, something could have changed until the last for loop is reached
             snode = db.get_storage_node_by_id(snode.get_id())
-
-            if snode.status not in [StorageNode.STATUS_ONLINE, StorageNode.STATUS_UNREACHABLE,
-                                    StorageNode.STATUS_SCHEDULABLE, StorageNode.STATUS_DOWN]:
-                logger.info(f"Node status is: {snode.status}, skipping")
-                continue
-
-            if snode.status == StorageNode.STATUS_ONLINE and snode.lvstore_status == "in_creation":
-                logger.info(f"Node lvstore is in creation: {snode.get_id()}, skipping")
+            if not is_monitored(snode):
                 continue
 
             logger.info(f"Checking node {snode.hostname}")
+            probe = probes[snode.get_id()]
 
             # 1- check node ping
-            ping_check = health_controller._check_node_ping(snode.mgmt_ip)
+            ping_check = probe.ping
             logger.info(f"Check: ping mgmt ip {snode.mgmt_ip} ... {ping_check}")
-            if not ping_check:
-                time.sleep(1)
-                ping_check = health_controller._check_node_ping(snode.mgmt_ip)
-                logger.info(f"Check 2: ping mgmt ip {snode.mgmt_ip} ... {ping_check}")
 
             # 2- check node API
-            node_api_check = health_controller._check_node_api(snode.mgmt_ip)
+            node_api_check = probe.api
             logger.info(f"Check: node API {snode.mgmt_ip}:5000 ... {node_api_check}")
 
             if snode.status == StorageNode.STATUS_SCHEDULABLE and not ping_check and not node_api_check:
                 continue
 
-            spdk_process = False
-            if node_api_check:
-                # 3- check spdk_process
-                spdk_process = health_controller._check_spdk_process_up(snode.mgmt_ip, snode.rpc_port)
+            # 3- check spdk_process
+            spdk_process = node_api_check and probe.spdk_process
             logger.info(f"Check: spdk process {snode.mgmt_ip}:5000 ... {spdk_process}")
 
-                # 4- check rpc
-            node_rpc_check = health_controller._check_node_rpc(
-                snode.mgmt_ip, snode.rpc_port, snode.rpc_username, snode.rpc_password, timeout=5, retry=2)
+            # 4- check rpc
+            node_rpc_check = probe.rpc
             logger.info(f"Check: node RPC {snode.mgmt_ip}:{snode.rpc_port} ... {node_rpc_check}")
 
             node_port_check = True
 
             if spdk_process and node_rpc_check and snode.lvstore_status == "ready":
-                ports = [snode.nvmf_port]
-                if snode.lvstore_stack_secondary_1:
-                    for n in db.get_primary_storage_nodes_by_secondary_node_id(snode.get_id()):
-                        if n.lvstore_status == "ready":
-                            ports.append(n.lvol_subsys_port)
-                if not snode.is_secondary_node:
-                    ports.append(snode.lvol_subsys_port)
-
-                for port in ports:
-                    ret = health_controller._check_port_on_node(snode, port)
+                for port in get_node_ports(snode):
+                    if str(port) in probe.ports:
+                        ret = probe.ports[str(port)]
+                    else:
+                        ret = health_controller._check_port_on_node(snode, port)
                     logger.info(f"Check: node port {snode.mgmt_ip}, {port} ... {ret}")
                     node_port_check &= ret
 
                 node_data_nic_ping_check = False
                 for data_nic in snode.data_nics:
                     if data_nic.ip4_address:
-                        data_ping_check = health_controller._check_node_ping(data_nic.ip4_address)
+                        data_ping_check = probe.data_nics.get(data_nic.ip4_address, False)
                         logger.info(f"Check: ping data nic {data_nic.ip4_address} ... {data_ping_check}")
                         node_data_nic_ping_check |= data_ping_check
 
@@ -376,5 +384,7 @@ while True:
 
         update_cluster_status(cluster_id)
 
+    logger.debug(f"DB cache: {db.get_cache_stats()}")
+    logger.debug(f"RPC connections: {rpc_client.get_connection_stats()}")
     logger.info(f"Sleeping for {constants.NODE_MONITOR_INTERVAL_SEC} seconds")
     time.sleep(constants.NODE_MONITOR_INTERVAL_SEC)
@@ -0,0 +1,37 @@
+# coding=utf-8
+from simplyblock_core import db_controller, utils
+from simplyblock_core.lvol_migration import LVolMigration, LVolMigrationException
+from simplyblock_core.models.cluster import Cluster
+from simplyblock_core.models.job_schedule import JobSchedule
+
+logger = utils.get_logger(__name__)
+
+# get DB controller
+db = db_controller.DBController()
+
+
+def run_task(task):
+    # get new task object because it could be changed from cancel task
+    task = db.get_task_by_id(task.uuid)
+
+    if db.get_cluster_by_id(task.cluster_id).status == Cluster.STATUS_IN_ACTIVATION:
+        return False
+
+    try:
+        migration = LVolMigration(db, task)
+    except KeyError as e:
+        logger.error(e)
+        task.function_result = "lvol not found"
+        task.status = JobSchedule.STATUS_DONE
+        task.write_to_db(db.kv_store)
+        return True
+
+    if task.status != JobSchedule.STATUS_RUNNING:
+        task.status = JobSchedule.STATUS_RUNNING
+        task.write_to_db(db.kv_store)
+
+    try:
+        return migration.step()
+    except LVolMigrationException as e:
+        logger.error(f"Migration of lvol {task.function_params['lvol_id']}, {migration.phase}: {e}")
+        return migration.fail(e)
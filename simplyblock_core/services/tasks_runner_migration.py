@@ -1,5 +1,4 @@
 # coding=utf-8
-import time
 from datetime import datetime, timezone
 
 from simplyblock_core import db_controller, utils
@@ -122,12 +121,10 @@ def task_runner(task):
 # get DB controller
 db = db_controller.DBController()
 
-logger.info("Starting Tasks runner...")
-
 
 def update_master_task(task):
     master_task = None
-    tasks = db.get_job_tasks(cl.get_id(), reverse=False)
+    tasks = db.get_active_job_tasks(task.cluster_id, JobSchedule.FN_BALANCING_AFTER_NODE_RESTART)
     for t in tasks:
         if task.uuid in t.sub_tasks:
             master_task = t
@@ -167,47 +164,38 @@ def update_master_task(task):
         return True
 
 
-while True:
-    clusters = db.get_clusters()
-    if not clusters:
-        logger.error("No clusters found!")
-    else:
-        for cl in clusters:
-            tasks = db.get_job_tasks(cl.get_id(), reverse=False)
-            for task in tasks:
-                if task.function_name == JobSchedule.FN_DEV_MIG and task.status != JobSchedule.STATUS_DONE:
-                    task = db.get_task_by_id(task.uuid)
-                    if task.status in [JobSchedule.STATUS_NEW, JobSchedule.STATUS_SUSPENDED]:
-                        active_task = False
-                        suspended_task= False
-                        for t in db.get_job_tasks(task.cluster_id):
-                            if t.function_name in [JobSchedule.FN_FAILED_DEV_MIG, JobSchedule.FN_DEV_MIG,
-                                                      JobSchedule.FN_NEW_DEV_MIG] and t.node_id == task.node_id:
-                                if "distr_name" in t.function_params and t.function_params[
-                                    "distr_name"] == task.function_params['distr_name'] and t.canceled is False:
-                                    if t.status == JobSchedule.STATUS_RUNNING:
-                                        active_task = True
-                                    elif t.status == JobSchedule.STATUS_SUSPENDED and t.function_name == JobSchedule.FN_NEW_DEV_MIG:
-                                        suspended_task = True
-                            if active_task and suspended_task:
-                                break
-                        if active_task or suspended_task:
-                            logger.info("task found on same node, retry")
-                            continue
-                    elif task.status == JobSchedule.STATUS_RUNNING:
-                        pass
-
-                    res = task_runner(task)
-                    update_master_task(task)
-                    if res:
-                        node_task = tasks_controller.get_active_node_tasks(task.cluster_id, task.node_id)
-                        if not node_task:
-                            logger.info("no task found on same node, resuming compression")
-                            node = db.get_storage_node_by_id(task.node_id)
-                            rpc_client = RPCClient(
-                                node.mgmt_ip, node.rpc_port, node.rpc_username, node.rpc_password, timeout=5, retry=2)
-                            ret = rpc_client.jc_suspend_compression(jm_vuid=node.jm_vuid, suspend=False)
-                            if not ret:
-                                logger.error("Failed to resume JC compression")
-
-    time.sleep(3)
+def run_task(task):
+    task = db.get_task_by_id(task.uuid)
+    if task.status in [JobSchedule.STATUS_NEW, JobSchedule.STATUS_SUSPENDED]:
+        active_task = False
+        suspended_task = False
+        node_tasks = []
+        for function_name in [JobSchedule.FN_FAILED_DEV_MIG, JobSchedule.FN_DEV_MIG,
+                              JobSchedule.FN_NEW_DEV_MIG]:
+            node_tasks += db.get_active_job_tasks(task.cluster_id, function_name, task.node_id)
+        for t in node_tasks:
+            if "distr_name" in t.function_params and t.function_params[
+                "distr_name"] == task.function_params['distr_name'] and t.canceled is False:
+                if t.status == JobSchedule.STATUS_RUNNING:
+                    active_task = True
+                elif t.status == JobSchedule.STATUS_SUSPENDED and t.function_name == JobSchedule.FN_NEW_DEV_MIG:
+                    suspended_task = True
+            if active_task and suspended_task:
+                break
+        if active_task or suspended_task:
+            logger.info("task found on same node, retry")
+            return False
+
+    res = task_runner(task)
+    update_master_task(task)
+    if res:
+        node_task = tasks_controller.get_active_node_tasks(task.cluster_id, task.node_id)
+        if not node_task:
+            logger.info("no task found on same node, resuming compression")
+            node = db.get_storage_node_by_id(task.node_id)
+            rpc_client = RPCClient(
+                node.mgmt_ip, node.rpc_port, node.rpc_username, node.rpc_password, timeout=5, retry=2)
+            ret = rpc_client.jc_suspend_compression(jm_vuid=node.jm_vuid, suspend=False)
+            if not ret:
+                logger.error("Failed to resume JC compression")
+    return res
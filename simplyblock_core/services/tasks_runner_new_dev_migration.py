@@ -131,31 +131,20 @@ def task_runner(task):
     task.write_to_db(db.kv_store)
     return False
 
+def run_task(task):
+    # get new task object because it could be changed from cancel task
+    task = db.get_task_by_id(task.uuid)
+    if task.status in [JobSchedule.STATUS_NEW, JobSchedule.STATUS_SUSPENDED]:
+        active_task = tasks_controller.get_active_node_mig_task(
+            task.cluster_id, task.node_id, task.function_params["distr_name"])
+        if active_task:
+            logger.info("task found on same node, retry")
+            return False
+    return task_runner(task)
+
+
 logger = utils.get_logger(__name__)
 
 
 # get DB controller
 db = db_controller.DBController()
-logger.info("Starting Tasks runner...")
-while True:
-    time.sleep(3)
-    clusters = db.get_clusters()
-    if not clusters:
-        logger.error("No clusters found!")
-    else:
-        for cl in clusters:
-            tasks = db.get_job_tasks(cl.get_id(), reverse=False)
-            for task in tasks:
-                if task.function_name == JobSchedule.FN_NEW_DEV_MIG:
-                    if task.status in [JobSchedule.STATUS_NEW, JobSchedule.STATUS_SUSPENDED]:
-                        active_task = tasks_controller.get_active_node_mig_task(
-                            task.cluster_id, task.node_id,  task.function_params["distr_name"])
-                        if active_task:
-                            logger.info("task found on same node, retry")
-                            continue
-                    if task.status != JobSchedule.STATUS_DONE:
-                        # get new task object because it could be changed from cancel task
-                        task = db.get_task_by_id(task.uuid)
-                        res = task_runner(task)
-                        if not res:
-                            time.sleep(2)
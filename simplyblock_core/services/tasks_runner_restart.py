@@ -33,12 +33,9 @@ def _get_device(task):
 
 
 def _validate_no_task_node_restart(cluster_id, node_id):
-    tasks = db.get_job_tasks(cluster_id)
-    for task in tasks:
-        if task.function_name == JobSchedule.FN_NODE_RESTART and task.node_id == node_id:
-            if task.status != JobSchedule.STATUS_DONE:
-                logger.info(f"Task found, skip adding new task: {task.get_id()}")
-                return False
+    for task in db.get_active_job_tasks(cluster_id, JobSchedule.FN_NODE_RESTART, node_id):
+        logger.info(f"Task found, skip adding new task: {task.get_id()}")
+        return False
     return True
 
 
@@ -213,29 +210,7 @@ def task_runner_node(task):
     return False
 
 
-logger.info("Starting Tasks runner...")
-while True:
-    clusters = db.get_clusters()
-    if not clusters:
-        logger.error("No clusters found!")
-    else:
-        for cl in clusters:
-            tasks = db.get_job_tasks(cl.get_id(), reverse=False)
-            for task in tasks:
-                delay_seconds = constants.TASK_EXEC_INTERVAL_SEC
-                if task.function_name in [JobSchedule.FN_DEV_RESTART, JobSchedule.FN_NODE_RESTART]:
-                    while task.status != JobSchedule.STATUS_DONE:
-                        # get new task object because it could be changed from cancel task
-                        task = db.get_task_by_id(task.uuid)
-                        res = task_runner(task)
-                        if res:
-                            if task.status == JobSchedule.STATUS_DONE:
-                                break
-                        else:
-                            if task.retry <= 3:
-                                delay_seconds *= 1
-                            else:
-                                delay_seconds *= 2
-                        time.sleep(delay_seconds)
-
-    time.sleep(constants.TASK_EXEC_INTERVAL_SEC)
+def run_task(task):
+    # get new task object because it could be changed from cancel task
+    task = db.get_task_by_id(task.uuid)
+    return task_runner(task)
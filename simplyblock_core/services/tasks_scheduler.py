@@ -0,0 +1,34 @@
+# coding=utf-8
+from simplyblock_core import constants, db_controller, utils
+from simplyblock_core.models.job_schedule import JobSchedule
+from simplyblock_core.services import (
+    tasks_runner_failed_migration,
+    tasks_runner_lvol_migration,
+    tasks_runner_migration,
+    tasks_runner_new_dev_migration,
+    tasks_runner_node_add,
+    tasks_runner_port_allow,
+    tasks_runner_restart,
+)
+from simplyblock_core.task_scheduler import TaskScheduler
+
+logger = utils.get_logger(__name__)
+
+# function name -> (executor pool, seconds between the steps of a task, step)
+handlers = {
+    JobSchedule.FN_DEV_RESTART: ('restart', constants.TASK_EXEC_INTERVAL_SEC, tasks_runner_restart.run_task),
+    JobSchedule.FN_NODE_RESTART: ('restart', constants.TASK_EXEC_INTERVAL_SEC, tasks_runner_restart.run_task),
+    JobSchedule.FN_DEV_MIG: ('migration', 3, tasks_runner_migration.run_task),
+    JobSchedule.FN_FAILED_DEV_MIG: ('migration', 3, tasks_runner_failed_migration.run_task),
+    JobSchedule.FN_NEW_DEV_MIG: ('migration', 2, tasks_runner_new_dev_migration.run_task),
+    JobSchedule.FN_NODE_ADD: ('node_add', 5, tasks_runner_node_add.run_task),
+    JobSchedule.FN_PORT_ALLOW: ('port_allow', 5, tasks_runner_port_allow.run_task),
+    JobSchedule.FN_LVOL_MIG: ('lvol_migration', 2, tasks_runner_lvol_migration.run_task),
+}
+
+# get DB controller
+db = db_controller.DBController()
+
+logger.info("Starting Tasks scheduler...")
+TaskScheduler(db, handlers, constants.TASK_SCHEDULER_WORKERS, constants.TASK_SCHEDULER_TASKS_PER_NODE,
+              constants.TASK_SCHEDULER_CLUSTER_POOLS).run()
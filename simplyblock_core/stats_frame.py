@@ -0,0 +1,100 @@
+# coding=utf-8
+from array import array
+
+
+def _column(values):
+    """Returns the numbers of `values` as an array, None if none is a number.
+
+    Values which are not numbers count as 0. Integers are kept in an
+    array('q'), unless one is a float or does not fit 64 bits.
+    """
+    kinds = set(map(type, values))
+    numeric = {kind for kind in kinds if issubclass(kind, (int, float))}
+    if not numeric:
+        return None
+    if numeric != kinds:
+        values = [value if isinstance(value, (int, float)) else 0 for value in values]
+    if any(issubclass(kind, float) for kind in numeric):
+        return array('d', values)
+    try:
+        return array('q', values)
+    except OverflowError:
+        return list(values)
+
+
+def _interpolate(ordered, q):
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class StatsFrame:
+    """Stats records held as one column of numbers per key.
+
+    The records are dicts or models, such as the StatsObjects, of which the
+    values of `keys` are read once, the keys of the first record by default.
+    Keys without any numeric value are left out, non-numeric values of the
+    other keys count as 0. The aggregates return a dict of the numeric keys,
+    in the order of `keys`.
+    """
+
+    def __init__(self, columns, count):
+        self.columns = columns
+        self.count = count
+
+    @classmethod
+    def from_records(cls, records, keys=None):
+        if not records:
+            return cls({}, 0)
+        if not keys:
+            keys = records[0].keys()
+        columns: dict = {}
+        is_dict = isinstance(records[0], dict)
+        for key in keys:
+            if is_dict:
+                values = [record[key] for record in records]
+            else:
+                values = [getattr(record, key, False) for record in records]
+            column = _column(values)
+            if column is not None:
+                columns[key] = column
+        return cls(columns, len(records))
+
+    def sum(self):
+        return {key: sum(column) for key, column in self.columns.items()}
+
+    def mean(self):
+        """The integer mean of each key, a single record is returned as is"""
+        if self.count == 1:
+            return {key: column[0] for key, column in self.columns.items()}
+        return {key: int(sum(column) / self.count) for key, column in self.columns.items()}
+
+    def min(self):
+        return {key: min(column) for key, column in self.columns.items()}
+
+    def max(self):
+        return {key: max(column) for key, column in self.columns.items()}
+
+    def percentile(self, q):
+        """The `q`th percentile of each key, interpolated linearly between the closest records"""
+        if not self.count:
+            return {}
+        return {key: _interpolate(sorted(column), q) for key, column in self.columns.items()}
+
+    def slice(self, start, stop):
+        stop = min(stop, self.count)
+        return StatsFrame({key: column[start:stop] for key, column in self.columns.items()},
+                          max(stop - start, 0))
+
+    def downsample(self, records_count):
+        """Returns the means of `records_count` buckets of consecutive records.
+
+        All buckets hold the same number of records, the records left over
+        after the last bucket are dropped.
+        """
+        if not self.count:
+            return []
+        records_count = min(records_count, self.count)
+        per_record = self.count // records_count
+        return [self.slice(i * per_record, (i + 1) * per_record).mean() for i in range(records_count)]
@@ -2,7 +2,6 @@
 import datetime
 import json
 import os
-from concurrent.futures import ThreadPoolExecutor
 from typing import Any, List
 
 import threading
@@ -19,6 +18,7 @@ from simplyblock_core.controllers import lvol_controller, storage_events, snapsh
     device_controller, tasks_controller, health_controller, tcp_ports_events
 from simplyblock_core.db_controller import DBController
 from simplyblock_core.fw_api_client import FirewallClient
+from simplyblock_core.lvol_restore import LVolRestore
 from simplyblock_core.models.iface import IFace
 from simplyblock_core.models.job_schedule import JobSchedule
 from simplyblock_core.models.lvol_model import LVol
@@ -2147,9 +2147,9 @@ def shutdown_storage_node(node_id, force=False):
     logger.info("Setting node status to offline")
     set_node_status(node_id, StorageNode.STATUS_OFFLINE)
 
-    tasks = db_controller.get_job_tasks(snode.cluster_id)
+    tasks = db_controller.get_active_job_tasks(snode.cluster_id)
     for task in tasks:
-        if task.node_id == node_id and task.status != JobSchedule.STATUS_DONE:
+        if task.node_id == node_id:
             if task.function_name in [JobSchedule.FN_DEV_MIG, JobSchedule.FN_FAILED_DEV_MIG,
                                       JobSchedule.FN_NEW_DEV_MIG]:
                 task.canceled = True
@@ -2404,7 +2404,7 @@ def get_node_capacity(node_id, history, records_count=20, parse_sizes=True):
     else:
         records_number = 20
 
-    records = db_controller.get_node_capacity(this_node, records_number)
+    records = db_controller.get_node_capacity(this_node, records_number, records_count)
     cap_stats_keys = [
         "date",
         "size_total",
@@ -2449,7 +2449,7 @@ def get_node_iostats_history(node_id, history, records_count=20, parse_sizes=Tru
     else:
         records_number = 20
 
-    records = db_controller.get_node_stats(node, records_number)
+    records = db_controller.get_node_stats(node, records_number, records_count)
 
     io_stats_keys = [
         "date",
@@ -2947,10 +2947,8 @@ def recreate_lvstore_on_sec(secondary_node):
             return False
 
         ### 2- create lvols nvmf subsystems
-        for lvol in lvol_list:
-            logger.info("creating subsystem %s", lvol.nqn)
-            secondary_rpc_client.subsystem_create(lvol.nqn, lvol.ha_type, lvol.uuid, 1000,
-                                                  max_namespaces=constants.LVO_MAX_NAMESPACES_PER_SUBSYS)
+        restore = LVolRestore(db_controller, secondary_node, lvol_list, "non_optimized", min_cntlid=1000)
+        restore.create_subsystems()
 
         if primary_node.status in [StorageNode.STATUS_ONLINE, StorageNode.STATUS_RESTARTING]:
 
@@ -2987,9 +2985,8 @@ def recreate_lvstore_on_sec(secondary_node):
             tcp_ports_events.port_allowed(primary_node, primary_node.lvol_subsys_port)
 
         ### 7- add lvols to subsystems
-        executor = ThreadPoolExecutor(max_workers=50)
-        for lvol in lvol_list:
-            executor.submit(add_lvol_thread, lvol, secondary_node, lvol_ana_state="non_optimized")
+        restore.start()
+        restore.wait()
 
         primary_node = db_controller.get_storage_node_by_id(primary_node.get_id())
         primary_node.lvstore_status = "ready"
@@ -3043,10 +3040,8 @@ def recreate_lvstore(snode, force=False):
         lvol_ana_state = "inaccessible"
 
     ### 2- create lvols nvmf subsystems
-    for lvol in lvol_list:
-        logger.info("creating subsystem %s", lvol.nqn)
-        rpc_client.subsystem_create(lvol.nqn, lvol.ha_type, lvol.uuid, 1,
-                                    max_namespaces=constants.LVO_MAX_NAMESPACES_PER_SUBSYS)
+    restore = LVolRestore(db_controller, snode, lvol_list, lvol_ana_state)
+    restore.create_subsystems()
 
     if sec_node:
 
@@ -3147,10 +3142,8 @@ def recreate_lvstore(snode, force=False):
             logger.error("Error creating hublvol: %s", e.message)
             # return False
 
-    ### 9- add lvols to subsystems
-    executor = ThreadPoolExecutor(max_workers=50)
-    for lvol in lvol_list:
-        executor.submit(add_lvol_thread, lvol, snode, lvol_ana_state)
+    ### 9- add lvols to subsystems, in the background while the secondary reconnects
+    restore.start()
 
     if sec_node:
         if sec_node.status in [StorageNode.STATUS_ONLINE, StorageNode.STATUS_DOWN]:
@@ -3166,6 +3159,8 @@ def recreate_lvstore(snode, force=False):
             fw_api.firewall_set_port(snode.lvol_subsys_port, "tcp", "allow", sec_node.rpc_port)
             tcp_ports_events.port_allowed(sec_node, snode.lvol_subsys_port)
 
+    restore.wait()
+
     if prim_node_suspend:
         logger.info("Node restart interrupted because secondary node is unreachable")
         logger.info("Node status changed to suspended")
@@ -3194,42 +3189,6 @@ def recreate_lvstore(snode, force=False):
     return True
 
 
-def add_lvol_thread(lvol, snode, lvol_ana_state="optimized"):
-    db_controller = DBController()
-
-    rpc_client = RPCClient(
-        snode.mgmt_ip, snode.rpc_port,
-        snode.rpc_username, snode.rpc_password, timeout=10, retry=2)
-
-    if "crypto" in lvol.lvol_type:
-        base = f"{lvol.lvs_name}/{lvol.lvol_bdev}"
-        ret = lvol_controller._create_crypto_lvol(
-            rpc_client, lvol.crypto_bdev, base, lvol.crypto_key1, lvol.crypto_key2)
-        if not ret:
-            msg = f"Failed to create crypto lvol on node {snode.get_id()}"
-            logger.error(msg)
-            return False, msg
-
-    logger.info("Add BDev to subsystem")
-    ret = rpc_client.nvmf_subsystem_add_ns(lvol.nqn, lvol.top_bdev, lvol.uuid, lvol.guid, nsid=lvol.ns_id)
-    for iface in snode.data_nics:
-        if iface.ip4_address:
-            logger.info("adding listener for %s on IP %s" % (lvol.nqn, iface.ip4_address))
-            ret = rpc_client.listeners_create(
-                lvol.nqn, iface.get_transport_type(), iface.ip4_address, lvol.subsys_port, ana_state=lvol_ana_state)
-
-    lvol_obj = db_controller.get_lvol_by_id(lvol.get_id())
-    lvol_obj.status = LVol.STATUS_ONLINE
-    lvol_obj.io_error = False
-    lvol_obj.health_check = True
-    lvol_obj.write_to_db()
-    # set QOS
-    if lvol.rw_ios_per_sec or lvol.rw_mbytes_per_sec or lvol.r_mbytes_per_sec or lvol.w_mbytes_per_sec :
-        lvol_controller.set_lvol(lvol.uuid, lvol.rw_ios_per_sec, lvol.rw_mbytes_per_sec,
-                 lvol.r_mbytes_per_sec , lvol.w_mbytes_per_sec)
-    return True, None
-
-
 def get_sorted_ha_jms(current_node):
     db_controller = DBController()
     jm_count = {}
@@ -3340,7 +3299,7 @@ def create_lvstore(snode, ndcs, npcs, distr_bs, distr_chunk_bs, page_size_in_blo
     jm_ids = []
     lvol_subsys_port = utils.get_next_port(snode.cluster_id)
     if snode.enable_ha_jm:
-        jm_vuid = utils.get_random_vuid()
+        jm_vuid = utils.get_random_vuid(snode.get_id())
         jm_ids = get_sorted_ha_jms(snode)
         logger.debug(f"online_jms: {str(jm_ids)}")
         snode.remote_jm_devices = _connect_to_remote_jm_devs(snode, jm_ids)
@@ -3352,9 +3311,7 @@ def create_lvstore(snode, ndcs, npcs, distr_bs, distr_chunk_bs, page_size_in_blo
     if ndcs > 1:
         write_protection = True
     for _ in range(snode.number_of_distribs):
-        distrib_vuid = utils.get_random_vuid()
-        while distrib_vuid in distrib_vuids:
-            distrib_vuid = utils.get_random_vuid()
+        distrib_vuid = utils.get_random_vuid(snode.get_id())
 
         distrib_name = f"distrib_{distrib_vuid}"
         lvstore_stack.extend(
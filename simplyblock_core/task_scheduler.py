@@ -0,0 +1,180 @@
+# coding=utf-8
+import heapq
+import itertools
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from simplyblock_core import constants, utils
+from simplyblock_core.models.job_schedule import JobSchedule
+
+logger = utils.get_logger(__name__)
+
+
+class TaskScheduler:
+    """Runs the active job tasks of all clusters, one step at a time.
+
+    `handlers` maps a task function name to (pool, interval, run). `run(task)`
+    executes one step of the task in a worker thread of `pool`, `workers` maps
+    the pools to their number of threads. At most `tasks_per_node` tasks of a
+    pool run on a node at the same time, tasks of different nodes progress in
+    parallel. Of the `cluster_pools`, one task runs per cluster at a time.
+
+    Tasks are queued by due time. A task which is not done after a step is due
+    again after the `interval` of its handler, doubled for every consecutive
+    step which counted a retry, up to `max_backoff` seconds. New and changed
+    tasks are picked up when the JobSchedule version key changes, see `watch`,
+    and every `reload_interval` seconds.
+    """
+
+    def __init__(self, db, handlers, workers, tasks_per_node=1, cluster_pools=(),
+                 max_backoff=constants.TASK_SCHEDULER_MAX_BACKOFF_SEC,
+                 reload_interval=constants.TASK_SCHEDULER_RELOAD_INTERVAL_SEC):
+        self.db = db
+        self.handlers = handlers
+        self.tasks_per_node = tasks_per_node
+        self.cluster_pools = cluster_pools
+        self.max_backoff = max_backoff
+        self.reload_interval = reload_interval
+        self._pools = {pool: ThreadPoolExecutor(max_workers=count, thread_name_prefix=f"tasks-{pool}")
+                       for pool, count in workers.items()}
+        self._queue: list = []  # (due, seq, task uuid), entries not matching _due are stale
+        self._seq = itertools.count()
+        self._due: dict = {}  # task uuid -> due time, for queued tasks
+        self._tasks: dict = {}  # task uuid -> task, for queued and running tasks
+        self._failures: dict = defaultdict(int)  # task uuid -> consecutive steps counting a retry
+        self._running: dict = defaultdict(set)  # (pool, node or cluster id) -> uuids of the running tasks
+        self._waiting: dict = defaultdict(list)  # (pool, node or cluster id) -> uuids due while it was busy
+        self._finished: queue.Queue = queue.Queue()
+        self._wakeup = threading.Event()
+        self._changed = threading.Event()
+        self._next_load = 0.0
+
+    def watch(self):
+        """Wakes up the scheduler whenever a task is written, runs in its own thread"""
+        key = JobSchedule().get_version_key()
+        version = None
+        while True:
+            try:
+                current, watch = self.db.kv_store.get_and_watch(key)
+            except Exception:
+                logger.exception("Error watching the job tasks")
+                time.sleep(1)
+                continue
+            if current != version:
+                version = current
+                self._changed.set()
+                self._wakeup.set()
+            try:
+                watch.wait()
+            except Exception:
+                # Watches also complete on errors and timeouts, only the version tells about changes
+                pass
+
+    def run(self):
+        threading.Thread(target=self.watch, name="tasks-watch", daemon=True).start()
+        while True:
+            self.run_once()
+
+    def run_once(self, max_wait=None):
+        """Loads new tasks, starts the due steps and waits for a step to finish or tasks to change"""
+        self._wakeup.clear()
+        now = time.time()
+        if self._changed.is_set() or now >= self._next_load:
+            self._changed.clear()
+            self._next_load = now + self.reload_interval
+            self.load()
+        self._collect()
+        self._start_due()
+
+        timeout = self._next_load - time.time()
+        if self._queue:
+            timeout = min(timeout, self._queue[0][0] - time.time())
+        if max_wait is not None:
+            timeout = min(timeout, max_wait)
+        self._wakeup.wait(max(0.0, timeout))
+
+    def load(self):
+        """Queues the active tasks which are new, and the canceled ones again right away"""
+        now = time.time()
+        active = set()
+        for cluster in self.db.get_clusters():
+            for task in self.db.get_active_job_tasks(cluster.get_id()):
+                if task.function_name not in self.handlers:
+                    continue
+                active.add(task.uuid)
+                known = self._tasks.get(task.uuid)
+                if known is None:
+                    self._tasks[task.uuid] = task
+                    self._push(task.uuid, now)
+                elif task.uuid in self._due and task.canceled and not known.canceled:
+                    self._tasks[task.uuid] = task
+                    self._push(task.uuid, now)
+
+        # tasks done or deleted elsewhere, running and waiting ones are dropped once they finish
+        for uuid in [uuid for uuid in self._due if uuid not in active]:
+            del self._due[uuid]
+            del self._tasks[uuid]
+            self._failures.pop(uuid, None)
+
+    def _push(self, uuid, due):
+        self._due[uuid] = due
+        heapq.heappush(self._queue, (due, next(self._seq), uuid))
+
+    def _start_due(self):
+        now = time.time()
+        while self._queue and self._queue[0][0] <= now:
+            due, _, uuid = heapq.heappop(self._queue)
+            if self._due.get(uuid) != due:
+                continue
+            del self._due[uuid]
+
+            task = self._tasks[uuid]
+            pool, _, run = self.handlers[task.function_name]
+            key = self._key(pool, task)
+            if len(self._running[key]) >= (1 if pool in self.cluster_pools else self.tasks_per_node):
+                self._waiting[key].append(uuid)
+                continue
+            self._running[key].add(uuid)
+            self._pools[pool].submit(self._step, task, run)
+
+    def _key(self, pool, task):
+        """Returns the key the running tasks of `pool` are limited by"""
+        return pool, task.cluster_id if pool in self.cluster_pools else task.node_id
+
+    def _step(self, task, run):
+        try:
+            run(task)
+        except Exception:
+            logger.exception(f"Error running task {task.uuid}")
+        self._finished.put(task.uuid)
+        self._wakeup.set()
+
+    def _collect(self):
+        while not self._finished.empty():
+            uuid = self._finished.get()
+            task = self._tasks[uuid]
+            pool, interval, _ = self.handlers[task.function_name]
+            key = self._key(pool, task)
+            self._running[key].discard(uuid)
+            now = time.time()
+            for waiting in self._waiting.pop(key, []):
+                self._push(waiting, now)
+
+            try:
+                current = self.db.get_task_by_id(uuid)
+            except KeyError:
+                current = None
+            if current is None or current.status == JobSchedule.STATUS_DONE:
+                del self._tasks[uuid]
+                self._failures.pop(uuid, None)
+                continue
+
+            if current.retry > task.retry:
+                self._failures[uuid] += 1
+            else:
+                self._failures[uuid] = 0
+            self._tasks[uuid] = current
+            self._push(uuid, now + min(interval * 2 ** self._failures[uuid], self.max_backoff))
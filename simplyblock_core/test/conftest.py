@@ -0,0 +1,45 @@
+import pytest
+
+from simplyblock_core.db_controller import DBController, Singleton
+from simplyblock_core.rpc_client import RPCClient
+from simplyblock_core.test.test_db_controller import FakeDatabase
+
+
+class FakeRPC:
+    """The RPC calls made by the test, by management IP, answered by `answer(ip, method, params)`"""
+
+    def __init__(self):
+        # (ip, [(method, params)]) of each batch and (ip, method, params) of each single call
+        self.batches: list = []
+        self.single: list = []
+        self.answer = lambda ip, method, params: (True, None)
+
+    def methods(self):
+        """Returns the methods of each batch"""
+        return [(ip, [method for method, _ in calls]) for ip, calls in self.batches]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """A DBController on a FakeDatabase, also returned by DBController()"""
+    controller = DBController()
+    controller.kv_store = FakeDatabase()  # type: ignore[assignment]
+    monkeypatch.setitem(Singleton._instances, DBController, controller)
+    return controller
+
+
+@pytest.fixture
+def rpc(monkeypatch):
+    rpc = FakeRPC()
+
+    def request_batch(client, calls):
+        rpc.batches.append((client.ip_address, calls))
+        return [rpc.answer(client.ip_address, method, params) for method, params in calls]
+
+    def request2(client, method, params=None):
+        rpc.single.append((client.ip_address, method, params))
+        return rpc.answer(client.ip_address, method, params)
+
+    monkeypatch.setattr(RPCClient, '_request_batch', request_batch)
+    monkeypatch.setattr(RPCClient, '_request2', request2)
+    return rpc
@@ -0,0 +1,430 @@
+import struct
+import threading
+
+import pytest
+
+from simplyblock_core.db_controller import DBController
+from simplyblock_core.models.cluster import Cluster
+from simplyblock_core.models.job_schedule import JobSchedule
+from simplyblock_core.models.lvol_model import LVol
+from simplyblock_core.models.nvme_device import NVMeDevice
+from simplyblock_core.models.pool import Pool
+from simplyblock_core.models.base_model import BaseModel, transact
+from simplyblock_core.models.stats import DeviceStatObject, LVolStatObject, _COLUMNS, decode_block, encode_block
+from simplyblock_core.models.storage_node import StorageNode
+
+
+class _Done:
+    def wait(self):
+        pass
+
+
+class _Value:
+    def __init__(self, value):
+        self._value = value
+
+    def present(self):
+        return self._value is not None
+
+    def __bytes__(self):
+        return self._value
+
+
+class FakeConflict(Exception):
+    """Raised on commit when a key read by the transaction was written since it started"""
+
+
+class FakeTransaction:
+    """Minimal in-memory stand-in for `fdb.Transaction`, with optimistic conflict detection"""
+
+    def __init__(self, db):
+        self._db = db
+        self._reset()
+
+    def _reset(self):
+        self._writes: dict = {}
+        self._reads: set = set()
+        self._ranges: list = []
+        self._version = self._db.version
+
+    def _view(self):
+        with self._db.lock:
+            data = dict(self._db.data)
+        data.update(self._writes)
+        return {k: v for k, v in data.items() if v is not None}
+
+    def _conflicts(self, keys):
+        return any(key in self._reads or any(begin <= key < end for begin, end in self._ranges) for key in keys)
+
+    def __getitem__(self, key):
+        self._reads.add(key)
+        return _Value(self._view().get(key))
+
+    def get_range_startswith(self, prefix, limit=0, reverse=False):
+        self._ranges.append((prefix, prefix + b'\xff'))
+        items = sorted((k, v) for k, v in self._view().items() if k.startswith(prefix))
+        if reverse:
+            items.reverse()
+        return items[:limit] if limit else items
+
+    def get_range(self, begin, end, limit=0, reverse=False):
+        self._ranges.append((begin, end))
+        items = sorted((k, v) for k, v in self._view().items() if begin <= k < end)
+        if reverse:
+            items.reverse()
+        return items[:limit] if limit else items
+
+    def set(self, key, value):
+        self._writes[key] = value
+
+    def clear(self, key):
+        self._writes[key] = None
+
+    def clear_range(self, begin, end):
+        for key in self._view():
+            if begin <= key < end:
+                self._writes[key] = None
+
+    def add(self, key, param):
+        current = struct.unpack('<q', self._view().get(key, bytes(8)))[0]
+        self._writes[key] = struct.pack('<q', current + struct.unpack('<q', param)[0])
+
+    def commit(self):
+        with self._db.lock:
+            if any(self._conflicts(keys) for version, keys in self._db.log if version > self._version):
+                self._db.conflicts += 1
+                raise FakeConflict()
+            self._db.commits += 1
+            self._db.version += 1
+            self._db.log.append((self._db.version, set(self._writes)))
+            for key, value in self._writes.items():
+                if value is None:
+                    self._db.data.pop(key, None)
+                else:
+                    self._db.data[key] = value
+        return _Done()
+
+    def on_error(self, e):
+        if not isinstance(e, FakeConflict):
+            raise e
+        self._reset()
+        return _Done()
+
+
+class _Watch:
+    def __init__(self, db, key):
+        self._db = db
+        self._key = key
+        self._value = db.data.get(key)
+
+    def is_ready(self):
+        return self._db.data.get(self._key) != self._value
+
+
+class FakeDatabase:
+    """Minimal in-memory stand-in for `fdb.Database`"""
+
+    def __init__(self):
+        self.data: dict = {}
+        self.commits = 0
+        self.reads = 0
+        self.conflicts = 0
+        self.version = 0
+        self.log: list = []
+        self.lock = threading.RLock()
+
+    def create_transaction(self):
+        return FakeTransaction(self)
+
+    def __getitem__(self, key):
+        return self.data.get(key)
+
+    def get_range_startswith(self, prefix, limit=0, reverse=False):
+        return FakeTransaction(self).get_range_startswith(prefix, limit, reverse)
+
+    def get_range(self, begin, end):
+        return FakeTransaction(self).get_range(begin, end)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+    def get_and_watch(self, key):
+        self.reads += 1
+        return self.data.get(key), _Watch(self, key)
+
+
+def _lvol(uuid, node_id, pool_uuid='pool-1'):
+    return LVol({'uuid': uuid, 'lvol_name': f'name-{uuid}', 'node_id': node_id, 'pool_uuid': pool_uuid})
+
+
+def test_index_lookup(db):
+    for i in range(3):
+        _lvol(f'lvol-{i}', 'node-1').write_to_db(db.kv_store)
+    _lvol('lvol-3', 'node-2', 'pool-2').write_to_db(db.kv_store)
+
+    assert {lvol.uuid for lvol in db.get_lvols_by_node_id('node-1')} == {'lvol-0', 'lvol-1', 'lvol-2'}
+    assert [lvol.uuid for lvol in db.get_lvols_by_pool_id('pool-2')] == ['lvol-3']
+    assert db.get_lvol_by_name('name-lvol-3').uuid == 'lvol-3'
+    with pytest.raises(KeyError):
+        db.get_lvol_by_name('missing')
+
+
+def test_index_follows_updates_and_removal(db):
+    lvol = _lvol('lvol-0', 'node-1')
+    lvol.write_to_db(db.kv_store)
+
+    lvol.node_id = 'node-2'
+    lvol.write_to_db(db.kv_store)
+    assert db.get_lvols_by_node_id('node-1') == []
+    assert [lv.uuid for lv in db.get_lvols_by_node_id('node-2')] == ['lvol-0']
+
+    lvol.remove(db.kv_store)
+    assert db.get_lvols_by_node_id('node-2') == []
+    assert not [k for k in db.kv_store.data if k.startswith(b'index/')]
+
+
+def test_index_value_prefix_collision(db):
+    Pool({'uuid': 'p1', 'pool_name': 'a', 'cluster_id': 'c'}).write_to_db(db.kv_store)
+    Pool({'uuid': 'p2', 'pool_name': 'a/b', 'cluster_id': 'c'}).write_to_db(db.kv_store)
+    assert db.get_pool_by_name('a').uuid == 'p1'
+    assert db.get_pool_by_name('a/b').uuid == 'p2'
+    assert {p.uuid for p in db.get_pools('c')} == {'p1', 'p2'}
+
+
+def test_storage_device_lookup(db):
+    node = StorageNode({'uuid': 'n1', 'cluster_id': 'c'})
+    node.nvme_devices = [NVMeDevice({'uuid': 'd1'}), NVMeDevice({'uuid': 'd2'})]
+    node.write_to_db(db.kv_store)
+
+    assert db.get_storage_device_by_id('d2').get_id() == 'd2'
+    assert [n.get_id() for n in db.get_storage_nodes_by_cluster_id('c')] == ['n1']
+    with pytest.raises(KeyError):
+        db.get_storage_device_by_id('d3')
+
+
+def test_rebuild_indexes(db):
+    _lvol('lvol-0', 'node-1').write_to_db(db.kv_store)
+    for key in [k for k in db.kv_store.data if k.startswith(b'index/')]:
+        del db.kv_store.data[key]
+
+    assert [lv.uuid for lv in db.get_lvols_by_node_id('node-1')] == ['lvol-0']
+    assert db.kv_store[DBController.INDEX_VERSION_KEY] == str(DBController.INDEX_VERSION).encode()
+
+
+def _task(uuid, date, function_name, node_id='', device_id='', status=JobSchedule.STATUS_NEW):
+    return JobSchedule({'uuid': uuid, 'cluster_id': 'c', 'date': date, 'function_name': function_name,
+                        'node_id': node_id, 'device_id': device_id, 'status': status})
+
+
+def test_task_queue(db):
+    _task('t0', 100, JobSchedule.FN_DEV_RESTART, 'n1', 'd1', JobSchedule.STATUS_DONE).write_to_db(db.kv_store)
+    _task('t1', 101, JobSchedule.FN_DEV_RESTART, 'n1', 'd1').write_to_db(db.kv_store)
+    _task('t2', 102, JobSchedule.FN_DEV_RESTART, 'n2', 'd2').write_to_db(db.kv_store)
+    _task('t3', 103, JobSchedule.FN_NODE_RESTART, 'n1').write_to_db(db.kv_store)
+
+    assert [t.uuid for t in db.get_active_job_tasks('c')] == ['t1', 't2', 't3']
+    assert [t.uuid for t in db.get_active_job_tasks('c', JobSchedule.FN_DEV_RESTART)] == ['t1', 't2']
+    assert [t.uuid for t in db.get_active_job_tasks('c', JobSchedule.FN_DEV_RESTART, device_id='d2')] == ['t2']
+    assert [t.uuid for t in db.get_active_job_tasks('c', JobSchedule.FN_DEV_RESTART, 'n1', 'd1')] == ['t1']
+    assert [t.uuid for t in db.get_active_job_tasks('c', JobSchedule.FN_NODE_RESTART, 'n1')] == ['t3']
+    assert db.get_task_by_id('t0').status == JobSchedule.STATUS_DONE
+
+    task = db.get_task_by_id('t1')
+    task.status = JobSchedule.STATUS_DONE
+    task.write_to_db(db.kv_store)
+    assert [t.uuid for t in db.get_active_job_tasks('c', JobSchedule.FN_DEV_RESTART)] == ['t2']
+    with pytest.raises(KeyError):
+        db.get_task_by_id('missing')
+
+
+def test_archive_job_tasks(db):
+    _task('t0', 100, JobSchedule.FN_NODE_ADD, status=JobSchedule.STATUS_DONE).write_to_db(db.kv_store)
+    _task('t1', 101, JobSchedule.FN_NODE_ADD).write_to_db(db.kv_store)
+    _task('t2', 102, JobSchedule.FN_NODE_ADD, status=JobSchedule.STATUS_DONE).write_to_db(db.kv_store)
+    _task('t3', 200, JobSchedule.FN_NODE_ADD, status=JobSchedule.STATUS_DONE).write_to_db(db.kv_store)
+
+    assert db.archive_job_tasks('c', 150, batch_size=2) == 2
+    assert [t.uuid for t in db.get_job_tasks('c', reverse=False)] == ['t1', 't3']
+    assert [t.uuid for t in db.get_active_job_tasks('c')] == ['t1']
+    archived = db.get_task_by_id('t2')
+    assert archived.object_type == 'archive' and archived.status == JobSchedule.STATUS_DONE
+    assert db.archive_job_tasks('c', 150) == 0
+    assert [t.uuid for t in db.get_job_tasks_since('c', 101)] == ['t1', 't3']
+    assert db.get_job_tasks_since('c', 201) == []
+
+
+def test_cache_hits_and_copies(db):
+    Cluster({'uuid': 'c1', 'cluster_name': 'first'}).write_to_db(db.kv_store)
+    db.enable_cache()
+
+    cluster = db.get_cluster_by_id('c1')
+    cluster.cluster_name = 'changed locally'
+    reads = db.kv_store.reads
+    assert db.get_cluster_by_id('c1').cluster_name == 'first'
+    assert [c.get_id() for c in db.get_clusters()] == ['c1']
+    assert db.kv_store.reads == reads
+    assert db.get_cache_stats()['misses'] == 1
+    assert db.get_cache_stats()['hits'] == 2
+
+
+def test_cache_invalidation(db):
+    Cluster({'uuid': 'c1', 'cluster_name': 'first'}).write_to_db(db.kv_store)
+    db.enable_cache()
+    db.get_clusters()
+
+    # own writes are visible immediately
+    Cluster({'uuid': 'c2'}).write_to_db(db.kv_store)
+    assert {c.get_id() for c in db.get_clusters()} == {'c1', 'c2'}
+
+    # writes by other processes are detected through the version watch
+    other = FakeTransaction(db.kv_store)
+    Cluster({'uuid': 'c1', 'cluster_name': 'renamed'})._write_op()(other)
+    other.commit()
+    assert db.get_cluster_by_id('c1').cluster_name == 'renamed'
+    assert db.get_cache_stats()['invalidations'] == 2
+
+
+def test_transaction_commits_once(db):
+    lvols = [_lvol(f'lvol-{i}', 'node-1') for i in range(3)]
+    with db.transaction() as tx:
+        for lvol in lvols:
+            lvol.write_to_db(tx)
+        lvols[0].node_id = 'node-2'  # state is captured when written
+    assert db.kv_store.commits == 1
+    assert len(db.get_lvols_by_node_id('node-1')) == 3
+
+    commits = db.kv_store.commits
+    db.remove_many(lvols[1:])
+    assert db.kv_store.commits == commits + 1
+    assert [lv.uuid for lv in db.get_lvols_by_node_id('node-1')] == ['lvol-0']
+
+
+def test_transaction_discarded_on_error(db):
+    with pytest.raises(RuntimeError):
+        with db.transaction() as tx:
+            _lvol('lvol-0', 'node-1').write_to_db(tx)
+            raise RuntimeError()
+    assert db.kv_store.data == {}
+
+
+def test_transaction_chunks(db, monkeypatch):
+    base = 1700000000 - 1700000000 % 60
+    reads: list = []
+    writes: list = []
+    get_key = FakeTransaction.__getitem__
+    set_key = FakeTransaction.set
+
+    def read(tr, key):
+        reads.append(len(writes))
+        return get_key(tr, key)
+
+    def write(tr, key, value):
+        writes.append(key)
+        set_key(tr, key, value)
+
+    monkeypatch.setattr(FakeTransaction, '__getitem__', read)
+    monkeypatch.setattr(FakeTransaction, 'set', write)
+
+    with db.transaction(chunk_size=3) as tx:
+        for i in range(4):
+            DeviceStatObject({'cluster_id': 'c', 'uuid': f'd{i}', 'date': base}).write_to_db(tx)
+        DeviceStatObject({'cluster_id': 'c', 'uuid': 'd3', 'date': base + 5}).write_to_db(tx)
+    assert db.kv_store.commits == 2
+
+    # the blocks of a chunk are read before the first one is written, the block
+    # written twice is read again after its first write
+    assert reads == [0, 0, 0, 3, 4]
+    assert [r.date for r in DeviceStatObject({'cluster_id': 'c', 'uuid': 'd3'}).read_samples(db.kv_store)] == \
+        [base + 5, base]
+
+
+def test_transaction_max_retries(db, monkeypatch):
+    attempts = []
+
+    def conflict(tr):
+        attempts.append(1)
+        raise FakeConflict()
+
+    with pytest.raises(FakeConflict):
+        transact(db.kv_store, conflict, max_retries=2)
+    assert len(attempts) == 3
+
+
+def test_update_object(db):
+    _lvol('lvol-0', 'node-1').write_to_db(db.kv_store)
+
+    def move(lvol):
+        lvol.node_id = 'node-2'
+
+    assert db.update_object(LVol(), 'lvol-0', move).node_id == 'node-2'
+    assert db.get_lvol_by_id('lvol-0').node_id == 'node-2'
+    assert db.get_lvols_by_node_id('node-1') == []
+    with pytest.raises(KeyError):
+        db.update_object(LVol(), 'missing', move)
+
+
+def test_stats_block_encoding():
+    rows = [[1700000000 + i, 2 ** 62, -i, 0] + [i * 7] * (len(_COLUMNS) - 4) for i in range(12)]
+    attributes = {'cluster_id': 'c', 'pool_id': '', 'uuid': 'd'}
+    assert decode_block(encode_block(attributes, rows)) == (attributes, rows)
+
+    # blocks written before a column was appended
+    assert decode_block(encode_block(attributes, [row[:-1] for row in rows]))[1] == [row[:-1] + [0] for row in rows]
+
+
+def test_stats_samples(db):
+    base = 1700000000 - 1700000000 % 60
+    for i in range(15):
+        DeviceStatObject({'cluster_id': 'c', 'uuid': 'd1', 'date': base + i * 5, 'read_io': i * 100}
+                         ).write_to_db(db.kv_store)
+    DeviceStatObject({'cluster_id': 'c', 'uuid': 'd10', 'date': base}).write_to_db(db.kv_store)
+
+    assert len([k for k in db.kv_store.data if k.startswith(b'stats/DeviceStatObject/c/d1/')]) == 2
+    device = NVMeDevice({'uuid': 'd1', 'cluster_id': 'c'})
+    records = db.get_device_stats(device, 3)
+    assert [r.read_io for r in records] == [1400, 1300, 1200]
+    assert records[0].uuid == 'd1' and records[0].cluster_id == 'c'
+    assert len(db.get_device_stats(device, 0)) == 15
+
+    records = DeviceStatObject({'cluster_id': 'c', 'uuid': 'd1'}).get_range(db.kv_store, base + 50, base + 65)
+    assert [r.date for r in records] == [base + 50, base + 55, base + 60]
+
+    records[0].remove(db.kv_store)
+    assert len(db.get_device_stats(device, 0)) == 14
+
+
+def test_stats_legacy_records(db):
+    lvol = _lvol('lvol-0', 'node-1')
+    for date in (100, 105):
+        BaseModel._write_op(LVolStatObject({'pool_id': 'pool-1', 'uuid': 'lvol-0', 'date': date}))(db.kv_store)
+    LVolStatObject({'pool_id': 'pool-1', 'uuid': 'lvol-0', 'date': 110}).write_to_db(db.kv_store)
+
+    assert [r.date for r in db.get_lvol_stats(lvol, 2)] == [110, 105]
+    assert [r.date for r in db.get_lvol_stats(lvol, 0)] == [110, 105, 100]
+    assert db.get_lvol_stats(lvol, 1)[0].pool_id == 'pool-1'
+
+
+def test_stats_rollups(db):
+    base = 1700000000 - 1700000000 % 3600
+    for i in range(361):  # the last sample starts the 31st minute, completing the 30th
+        DeviceStatObject({'cluster_id': 'c', 'uuid': 'd1', 'date': base + i * 5, 'read_io_ps': i}
+                         ).write_to_db(db.kv_store)
+    DeviceStatObject({'cluster_id': 'c', 'uuid': 'd1', 'date': base, 'read_io_ps': 0}).write_to_db(db.kv_store)
+
+    record = DeviceStatObject({'cluster_id': 'c', 'uuid': 'd1'})
+    minutes = record.read_rollups(db.kv_store, '1m')
+    assert len(minutes) == 30
+    assert minutes[-1]['date'] == base
+    assert minutes[-1]['count'] == 12
+    assert (minutes[-1]['min']['read_io_ps'], minutes[-1]['max']['read_io_ps']) == (0, 11)
+    assert minutes[-1]['sum']['read_io_ps'] == sum(range(12))
+    assert record.read_rollups(db.kv_store, '1h')[0]['count'] == 360
+
+    device = NVMeDevice({'uuid': 'd1', 'cluster_id': 'c'})
+    history = db.get_device_stats(device, 360, records_count=20)
+    assert len(history) == 30
+    assert history[0].date == base + 29 * 60
+    assert history[0].record_duration == 60
+    assert history[0].read_io_ps == int(sum(range(348, 360)) / 12)
+    assert len(db.get_device_stats(device, 360, records_count=100)) == 360  # too short for 1m buckets
+    assert len(db.get_device_stats(device, 0)) == 361
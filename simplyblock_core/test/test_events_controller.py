@@ -0,0 +1,31 @@
+from simplyblock_core.controllers import events_controller
+
+
+def _event(sid, status='error_write'):
+    return {'event_type': 'device_status', 'status': status, 'storage_ID': sid}
+
+
+def test_distr_event_coalescer():
+    coalescer = events_controller.DistrEventCoalescer('cluster_1', 'node_1', window=60)
+
+    first, new = coalescer.add(_event(1), now=100)
+    assert new and first.count == 1 and first.storage_id == 1 and first.node_id == 'node_1'
+    for now in [101, 150]:
+        event, new = coalescer.add(_event(1), now=now)
+        assert event is first and not new
+    assert first.count == 3
+
+    assert coalescer.add(_event(2), now=150)[1]
+    assert coalescer.add(_event(1, 'error_read'), now=150)[1]
+    assert coalescer.add({'event_type': 'device_status', 'status': 'error_read', 'vuid': 1}, now=150)[1]
+    assert coalescer.add({'event_type': 'device_status', 'status': 'error_read'}) == (None, False)
+
+    # a new record is started once the window of the first one has passed
+    event, new = coalescer.add(_event(1), now=160)
+    assert new and event is not first and event.count == 1
+    coalescer.expire(now=215)
+    assert len(coalescer._events) == 1
+
+    # an event which failed to be processed is new again
+    coalescer.forget(_event(1))
+    assert coalescer.add(_event(1), now=216)[1]
@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+from simplyblock_core import constants, utils
+from simplyblock_core.controllers import health_controller
+from simplyblock_core.models.iface import IFace
+from simplyblock_core.models.storage_node import StorageNode
+
+
+def _node(uuid, ip, nics=()):
+    return StorageNode({'uuid': uuid, 'cluster_id': 'c', 'mgmt_ip': ip, 'rpc_port': 8080,
+                        'data_nics': [IFace({'ip4_address': nic}).to_dict() for nic in nics]})
+
+
+@pytest.fixture
+def checks(monkeypatch):
+    calls: list = []
+
+    def reachable(ip, *args):
+        calls.append(ip)
+        if ip == '10.0.0.3':
+            time.sleep(2)
+        return True
+
+    monkeypatch.setattr(utils, 'ping_hosts', lambda ips, *args: {ip: ip != '10.0.0.3' for ip in ips})
+    monkeypatch.setattr(constants, 'HEALTH_PROBE_PING_RETRY_SEC', 0)
+    monkeypatch.setattr(health_controller, '_check_node_api', reachable)
+    monkeypatch.setattr(health_controller, '_check_spdk_process_up', reachable)
+    monkeypatch.setattr(health_controller, '_check_node_rpc', reachable)
+    monkeypatch.setattr(health_controller, '_check_port_on_node', lambda node, port: port != 4421)
+    return calls
+
+
+def test_probe_deadline(checks):
+    prober = health_controller.NodeProber(None, deadline=0.5)
+    nodes = [_node('n1', '10.0.0.1', ['10.0.1.1']), _node('n2', '10.0.0.2'), _node('n3', '10.0.0.3')]
+
+    start = time.monotonic()
+    probes = prober.probe(nodes, {'n1': [4420, 4421]})
+    assert time.monotonic() - start < 1
+
+    # the unreachable node does not delay the others, its unfinished checks count as failed
+    n1, n2, n3 = probes['n1'], probes['n2'], probes['n3']
+    assert n1.ping and n1.api and n1.spdk_process and n1.rpc and not n1.timed_out
+    assert n1.data_nics == {'10.0.1.1': True} and n1.ports == {'4420': True, '4421': False}
+    assert n2.rpc and n2.ports == {} and n2.duration_ms < 500
+    assert n3.timed_out and not (n3.ping or n3.api or n3.rpc) and n3.duration_ms >= 500
+
+
+def test_failed_pings_are_retried(checks, monkeypatch):
+    pinged: list = []
+
+    def ping_hosts(ips, *args):
+        pinged.append(sorted(ips))
+        # the data nic replies to the second ping only
+        return {ip: ip == '10.0.0.1' or len(pinged) > 1 for ip in ips}
+
+    rpc_args: list = []
+
+    def check_node_rpc(ip, port, username, password, *args):
+        rpc_args.append(args)
+        return True
+
+    monkeypatch.setattr(utils, 'ping_hosts', ping_hosts)
+    monkeypatch.setattr(health_controller, '_check_node_rpc', check_node_rpc)
+    probe = health_controller.NodeProber(None, deadline=0.5).probe([_node('n1', '10.0.0.1', ['10.0.1.1'])])['n1']
+
+    assert pinged == [['10.0.0.1', '10.0.1.1'], ['10.0.1.1']]
+    assert probe.ping and probe.data_nics == {'10.0.1.1': True}
+    assert rpc_args == [(5, 2)]
+
+
+def test_probes_are_shared(checks, db):
+    prober = health_controller.NodeProber(db, deadline=0.5)
+    node = _node('n1', '10.0.0.1')
+
+    assert prober.get('c', [node], {'n1': [4420]})['n1'].api
+    assert len(checks) == 3
+    stored = db.get_node_probes('c')['n1']
+    assert stored.ports == {'4420': True}
+
+    # another service reuses the stored probe while it is recent and covers the ports it needs
+    other = health_controller.NodeProber(db, deadline=0.5)
+    assert other.get('c', [node], max_age=30)['n1'].date == stored.date
+    assert len(checks) == 3
+    other.get('c', [node], {'n1': [4421]}, max_age=30)
+    assert len(checks) == 6
+    other.get('c', [node])
+    assert len(checks) == 9
@@ -0,0 +1,138 @@
+import pytest
+
+from simplyblock_core.controllers import lvol_controller
+from simplyblock_core.lvol_bulk import LVolBulkCreate
+from simplyblock_core.models.cluster import Cluster
+from simplyblock_core.models.iface import IFace
+from simplyblock_core.models.lvol_model import LVol
+from simplyblock_core.models.nvme_device import NVMeDevice
+from simplyblock_core.models.pool import Pool
+from simplyblock_core.models.storage_node import StorageNode
+from simplyblock_core.rpc_client import RPCClient
+from simplyblock_core.vuid_allocator import VUIDAllocator
+
+GiB = 1024 ** 3
+
+
+def _answer(ip, method, params):
+    if method == 'bdev_lvol_create' and params['size_in_mib'] == 999:
+        return None, {'code': -1, 'message': 'No space'}
+    if method == 'bdev_lvol_create':
+        return f"uuid-{params['lvol_name']}", None
+    if method == 'bdev_get_bdevs':
+        return [{'uuid': f"uuid-{params['name']}", 'driver_specific': {'lvol': {'blobid': 7}}}], None
+    return 1 if method == 'nvmf_subsystem_add_ns' else True, None
+
+
+@pytest.fixture
+def db(db, rpc):
+    rpc.answer = _answer
+    Cluster({'uuid': 'c1', 'status': Cluster.STATUS_ACTIVE, 'nqn': 'nqn:c1', 'ha_type': 'single'}).write_to_db(
+        db.kv_store)
+    Pool({'uuid': 'p1', 'pool_name': 'pool', 'cluster_id': 'c1', 'status': Pool.STATUS_ACTIVE,
+          'pool_max_size': 8 * GiB}).write_to_db(db.kv_store)
+    for i in (1, 2):
+        StorageNode({'uuid': f'n{i}', 'cluster_id': 'c1', 'status': StorageNode.STATUS_ONLINE, 'max_lvol': 3,
+                     'lvstore': f'lvs_{i}', 'mgmt_ip': f'10.0.0.{i}', 'rpc_port': 8080,
+                     'data_nics': [IFace({'ip4_address': f'10.1.0.{i}'}).to_dict()],
+                     'nvme_devices': [NVMeDevice({'status': NVMeDevice.STATUS_ONLINE, 'size': 100 * GiB}).to_dict()],
+                     }).write_to_db(db.kv_store)
+    LVol({'uuid': 'existing', 'lvol_name': 'taken', 'node_id': 'n1', 'pool_uuid': 'p1', 'size': GiB}).write_to_db(
+        db.kv_store)
+    return db
+
+
+def test_bulk_create(rpc, db):
+    volumes = [
+        {'name': 'v0', 'size': GiB},
+        {'name': 'taken', 'size': GiB},
+        {'name': 'v1', 'size': GiB, 'max_rw_iops': 1000},
+        {'name': 'v2', 'size': 10 * 1024 ** 2},
+        {'name': 'v3', 'size': 999 * 1024 ** 2},
+        {'name': 'v0', 'size': GiB},
+        {'name': 'v4', 'size': GiB},
+        {'name': 'v5', 'size': 2 * GiB},
+        {'name': 'v6', 'size': GiB},
+        {'name': 'v7', 'size': 2 * GiB},
+    ]
+    results = LVolBulkCreate(db, 'pool', volumes).create()
+
+    errors = [error for _, error in results]
+    assert errors[1] == 'LVol name must be unique: taken'
+    assert errors[3] == 'Size must be larger than 100M'
+    assert errors[4].startswith('Failed to create BDev: LVOL_')
+    assert errors[5] == 'LVol name must be unique: v0'
+    # the nodes are full with 3 lvols each, the failed one included
+    assert errors[8] == 'No nodes found with enough resources to create the LVol'
+    # the pool has 8GiB, 1GiB of it provisioned before
+    assert errors[9].startswith('Invalid LVol size')
+    created = [lvol_id for lvol_id, _ in results if lvol_id]
+    assert len(created) == 4 and [results[i][1] for i in (0, 2, 6, 7)] == [None] * 4
+
+    lvols = [db.get_lvol_by_id(lvol_id) for lvol_id in created]
+    assert {lvol.status for lvol in lvols} == {LVol.STATUS_ONLINE}
+    assert [lvol.lvol_name for lvol in lvols] == ['v0', 'v1', 'v4', 'v5']
+    assert all(lvol.lvol_uuid == f'uuid-{lvol.lvs_name}/{lvol.lvol_bdev}' and lvol.blobid == 7 for lvol in lvols)
+    assert lvols[1].rw_ios_per_sec == 1000
+    assert len({lvol.vuid for lvol in lvols}) == 4
+    assert sorted(lvol.node_id for lvol in db.get_lvols()) == ['n1', 'n1', 'n1', 'n2', 'n2']
+
+    # one batch per node for the lvols, one for the QoS limits
+    creates = [calls for _, calls in rpc.batches if calls[0][0] == 'bdev_lvol_create']
+    assert len(creates) == 2
+    assert sum(method == 'bdev_set_qos_limit' for _, calls in rpc.batches for method, _ in calls) == 1
+
+    # the failed lvol stops at its failing bdev, no subsystem is created for it, it is
+    # removed and its VUID released
+    assert rpc.single == []
+    assert sorted(params['model_number'] for _, calls in rpc.batches for method, params in calls
+                  if method == 'nvmf_create_subsystem') == sorted(created)
+    assert len(db.get_lvols()) == 5
+    allocator = VUIDAllocator('lvol')
+    assert all(allocator.owners(db.kv_store, lvol.vuid) == [lvol.get_id()] for lvol in lvols)
+    assert len(db.kv_store.get_range_startswith(b'vuid/lvol/owner/')) == 4
+
+
+def test_bulk_create_fails_all_on_inactive_pool(rpc, db):
+    pool = db.get_pool_by_id('p1')
+    pool.status = Pool.STATUS_INACTIVE
+    pool.write_to_db(db.kv_store)
+
+    results = LVolBulkCreate(db, 'p1', [{'name': 'v0', 'size': GiB}, {'name': 'v1', 'size': GiB}]).create()
+    assert results == [(False, 'Pool in not active: p1, status: inactive')] * 2
+    assert not rpc.batches
+
+
+def test_bdev_stacks_stop_at_first_failure(rpc):
+    def lvol(name):
+        return LVol({'uuid': name, 'bdev_stack': [
+            {'type': 'bdev_lvol', 'name': f'LVOL_{name}',
+             'params': {'name': f'LVOL_{name}', 'size_in_mib': 1024, 'lvs_name': 'lvs'}},
+            {'type': 'crypto', 'name': f'crypto_{name}',
+             'params': {'name': f'crypto_{name}', 'base_name': f'lvs/LVOL_{name}', 'key1': 'k1', 'key2': 'k2'}},
+        ]})
+
+    # the crypto key of the second lvol exists already
+    rpc.answer = lambda ip, method, params: (not (method == 'accel_crypto_key_create'
+                                                  and params['name'] == 'key_crypto_b'), None)
+    lvols = [lvol('a'), lvol('b')]
+    results = lvol_controller._create_bdev_stacks(RPCClient('10.0.0.1', 8080, '', ''), lvols)
+
+    # one batch per call of the stacks, the crypto bdev is not created without its key
+    assert [methods for _, methods in rpc.methods()] == [['bdev_lvol_create'] * 2, ['accel_crypto_key_create'] * 2, ['bdev_crypto_create']]
+    assert results[0] == (lvols[0].bdev_stack, None)
+    assert results[1] == ([], 'Failed to create BDev: crypto_b')
+    # the lvol created for it is rolled back
+    assert [method for _, method, _ in rpc.single] == ['bdev_lvol_delete']
+
+
+def test_failed_batch_is_removed(rpc, db, monkeypatch):
+    def fail(*args):
+        raise RuntimeError('connection lost')
+
+    monkeypatch.setattr(LVolBulkCreate, '_set_qos', fail)
+    results = LVolBulkCreate(db, 'pool', [{'name': 'v0', 'size': GiB}, {'name': 'v1', 'size': GiB}]).create()
+
+    assert results == [(False, 'Failed to create LVol: connection lost')] * 2
+    assert [lvol.get_id() for lvol in db.get_lvols()] == ['existing']
+    assert not db.kv_store.get_range_startswith(b'vuid/lvol/owner/')
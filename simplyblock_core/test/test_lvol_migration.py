@@ -0,0 +1,270 @@
+from collections import defaultdict
+
+import pytest
+
+from simplyblock_core import constants, lvol_migration
+from simplyblock_core.lvol_migration import LVolMigration, LVolMigrationException, check_migration
+from simplyblock_core.models.cluster import Cluster
+from simplyblock_core.models.iface import IFace
+from simplyblock_core.models.job_schedule import JobSchedule
+from simplyblock_core.models.lvol_model import LVol
+from simplyblock_core.models.pool import Pool
+from simplyblock_core.models.snapshot import SnapShot
+from simplyblock_core.models.storage_node import StorageNode
+
+NQN = 'nqn:c1:lvol:l1'
+
+
+class FakeSPDK:
+    """The bdevs, subsystems and connected hosts of the nodes, by management IP"""
+
+    def __init__(self):
+        self.bdevs: dict = defaultdict(dict)
+        self.subsystems: dict = defaultdict(dict)
+        self.hosts: dict = defaultdict(list)
+        self.leaders = {'10.0.0.1', '10.0.0.3'}
+        self.calls: list = []
+        self.failing: set = set()
+        # clusters of the snapshots copied, in copy order, and the states reported for the copies
+        self.clusters = [5000, 300, 40, 3]
+        self.in_progress = 0
+
+    def call(self, ip, method, params):
+        self.calls.append((ip, method, params))
+        if method in self.failing:
+            return None, {'code': -1, 'message': 'failed'}
+        bdevs = self.bdevs[ip]
+        subsystems = self.subsystems[ip]
+        if method == 'bdev_lvol_get_lvstores':
+            return [{'lvs leadership': ip in self.leaders}], None
+        if method in ('bdev_lvol_create', 'bdev_lvol_register'):
+            name = f"{params['lvs_name']}/{params['lvol_name']}"
+            bdevs[name] = {'uuid': params.get('registered_uuid', f'uuid-{ip}'), 'blobid': params.get('blobid', 9)}
+            return bdevs[name]['uuid'], None
+        if method == 'bdev_lvol_snapshot':
+            bdevs[f"{params['lvol_name'].split('/')[0]}/{params['snapshot_name']}"] = {'uuid': 'snap', 'blobid': 3}
+            return 'snap', None
+        if method == 'bdev_lvol_snapshot_register':
+            bdevs[f"{params['lvol_name'].split('/')[0]}/{params['snapshot_name']}"] = {'uuid': 'snap', 'blobid': 3}
+            return True, None
+        if method == 'bdev_get_bdevs':
+            bdev = bdevs.get(params['name'])
+            if not bdev:
+                return None, {'code': -19, 'message': 'No such device'}
+            return [{'name': params['name'], 'uuid': bdev['uuid'], 'driver_specific': {'lvol': {'blobid': bdev['blobid']}}}], None
+        if method in ('bdev_lvol_delete', 'bdev_nvme_detach_controller', 'bdev_crypto_delete'):
+            return bdevs.pop(params['name'], None) is not None, None
+        if method == 'bdev_crypto_create':
+            bdevs[params['name']] = {'base': params['base_bdev_name']}
+            return params['name'], None
+        if method == 'bdev_nvme_attach_controller':
+            bdevs[params['name']] = {'nqn': params['subnqn'], 'traddr': params['traddr']}
+            return [f"{params['name']}n1"], None
+        if method == 'bdev_lvol_start_shallow_copy':
+            return {'operation_id': len(self.calls)}, None
+        if method == 'bdev_lvol_check_shallow_copy':
+            if self.in_progress:
+                self.in_progress -= 1
+                return {'state': 'in progress', 'copied_clusters': 0, 'total_clusters': 0}, None
+            total = self.clusters.pop(0)
+            return {'state': 'complete', 'copied_clusters': total, 'total_clusters': total}, None
+        if method == 'nvmf_create_subsystem':
+            subsystems[params['nqn']] = {'nqn': params['nqn'], 'min_cntlid': params['min_cntlid'],
+                                         'namespaces': [], 'listeners': {}}
+            return True, None
+        if method == 'nvmf_delete_subsystem':
+            return subsystems.pop(params['nqn'], None) is not None, None
+        if method == 'nvmf_get_subsystems':
+            return list(subsystems.values()), None
+        if method == 'nvmf_subsystem_add_ns':
+            namespace = params['namespace']
+            nsid = namespace.get('nsid', 1)
+            subsystems[params['nqn']]['namespaces'].append({'nsid': nsid, 'bdev_name': namespace['bdev_name'],
+                                                            'uuid': namespace.get('uuid')})
+            return nsid, None
+        if method == 'nvmf_subsystem_remove_ns':
+            subsystem = subsystems[params['nqn']]
+            subsystem['namespaces'] = [ns for ns in subsystem['namespaces'] if ns['nsid'] != params['nsid']]
+            return True, None
+        if method in ('nvmf_subsystem_add_listener', 'nvmf_subsystem_listener_set_ana_state'):
+            subsystems[params['nqn']]['listeners'][params['listen_address']['traddr']] = params.get('ana_state')
+            return True, None
+        if method == 'nvmf_subsystem_get_controllers':
+            return [{'hostnqn': host} for host in self.hosts[ip] if params['nqn'] in subsystems], None
+        return True, None
+
+    def methods(self, ip):
+        return [method for call_ip, method, _ in self.calls if call_ip == ip]
+
+
+@pytest.fixture
+def spdk(rpc, monkeypatch):
+    spdk = FakeSPDK()
+    rpc.answer = spdk.call
+    monkeypatch.setattr(lvol_migration.time, 'sleep', lambda seconds: None)
+    return spdk
+
+
+@pytest.fixture
+def db(db, spdk):
+
+    Cluster({'uuid': 'c1', 'status': Cluster.STATUS_ACTIVE, 'nqn': 'nqn:c1'}).write_to_db(db.kv_store)
+    Pool({'uuid': 'p1', 'cluster_id': 'c1', 'status': Pool.STATUS_ACTIVE}).write_to_db(db.kv_store)
+    # n1 and n3 are the primaries of lvs_1 and lvs_3, n2 and n4 their secondaries
+    for i in (1, 2, 3, 4):
+        primary = i % 2 == 1
+        StorageNode({'uuid': f'n{i}', 'cluster_id': 'c1', 'status': StorageNode.STATUS_ONLINE, 'max_lvol': 10,
+                     'lvstore': f'lvs_{i if primary else i - 1}', 'is_secondary_node': not primary,
+                     'secondary_node_id': f'n{i + 1}' if primary else '', 'lvol_subsys_port': 9100 + i,
+                     'mgmt_ip': f'10.0.0.{i}', 'rpc_port': 8080,
+                     'data_nics': [IFace({'ip4_address': f'10.1.{i}.{nic}'}).to_dict() for nic in (1, 2)],
+                     }).write_to_db(db.kv_store)
+
+    lvol = LVol({'uuid': 'l1', 'lvol_name': 'vol', 'node_id': 'n1', 'nodes': ['n1', 'n2'], 'pool_uuid': 'p1',
+                 'status': LVol.STATUS_ONLINE, 'ha_type': 'ha', 'size': 2 * 1024 ** 3, 'vuid': 7, 'nqn': NQN,
+                 'lvs_name': 'lvs_1', 'lvol_bdev': 'LVOL_7', 'lvol_uuid': 'uuid-src', 'blobid': 5, 'ns_id': 1,
+                 'guid': 'guid', 'subsys_port': 9101, 'lvol_type': 'lvol,crypto', 'crypto_bdev': 'crypto_LVOL_7',
+                 'crypto_key1': 'k1', 'crypto_key2': 'k2', 'top_bdev': 'crypto_LVOL_7', 'base_bdev': 'lvs_1/LVOL_7',
+                 'bdev_stack': [
+                     {'type': 'bdev_lvol', 'name': 'LVOL_7', 'params': {
+                         'name': 'LVOL_7', 'size_in_mib': 2048, 'lvs_name': 'lvs_1', 'lvol_priority_class': 0}},
+                     {'type': 'crypto', 'name': 'crypto_LVOL_7', 'params': {
+                         'name': 'crypto_LVOL_7', 'base_name': 'lvs_1/LVOL_7', 'key1': 'k1', 'key2': 'k2'}},
+                 ]})
+    lvol.write_to_db(db.kv_store)
+
+    # the lvol as served by the source nodes
+    for ip, ana_state in [('10.0.0.1', 'optimized'), ('10.0.0.2', 'non_optimized')]:
+        spdk.bdevs[ip].update({'lvs_1/LVOL_7': {'uuid': 'uuid-src', 'blobid': 5}, 'crypto_LVOL_7': {}})
+        spdk.subsystems[ip][NQN] = {
+            'nqn': NQN, 'min_cntlid': 1 if ana_state == 'optimized' else 1000,
+            'namespaces': [{'nsid': 1, 'bdev_name': 'crypto_LVOL_7', 'uuid': 'l1'}],
+            'listeners': {f'10.1.{ip[-1]}.{nic}': ana_state for nic in (1, 2)}}
+    return db
+
+
+def _task(db, **params):
+    task = JobSchedule({'uuid': 't1', 'cluster_id': 'c1', 'node_id': 'n1', 'function_name': JobSchedule.FN_LVOL_MIG,
+                        'status': JobSchedule.STATUS_NEW, 'max_retry': 2,
+                        'function_params': {'lvol_id': 'l1', 'target_node_id': 'n3', **params}})
+    task.write_to_db(db.kv_store)
+    return task
+
+
+def _step(db):
+    migration = LVolMigration(db, db.get_task_by_id('t1'))
+    try:
+        return migration.step()
+    except LVolMigrationException as e:
+        return migration.fail(e)
+
+
+def test_migration(spdk, db):
+    _task(db)
+    assert _step(db) is False
+    params = db.get_task_by_id('t1').function_params
+    assert params['phase'] == 'copy' and params['mig_bdev'] == 'mig_7n1'
+    assert params['source']['primary'] == 'n1' and params['target'] == {
+        'primary': 'n3', 'secondary': 'n4', 'lvs_name': 'lvs_3', 'lvol_uuid': 'uuid-10.0.0.3', 'blobid': 9}
+    # the raw target lvol is attached to the source primary through a temporary subsystem
+    assert spdk.subsystems['10.0.0.3'][f'{NQN}:migration']['namespaces'][0]['bdev_name'] == 'lvs_3/LVOL_7'
+    assert spdk.bdevs['10.0.0.1']['mig_7'] == {'nqn': f'{NQN}:migration', 'traddr': '10.1.3.1'}
+
+    # a snapshot is taken and copied per pass until a pass copies at most LVOL_MIGRATION_CUTOVER_CLUSTERS
+    while db.get_task_by_id('t1').function_params['phase'] == 'copy':
+        _step(db)
+    params = db.get_task_by_id('t1').function_params
+    assert params['snapshots'] == ['MIG_7_0', 'MIG_7_1', 'MIG_7_2'] and params['copied'] == [5000, 300, 40]
+    assert 'lvs_1/MIG_7_2' in spdk.bdevs['10.0.0.2']
+    copies = [params for ip, method, params in spdk.calls if method == 'bdev_lvol_start_shallow_copy']
+    assert [copy['src_lvol_name'] for copy in copies] == ['lvs_1/MIG_7_0', 'lvs_1/MIG_7_1', 'lvs_1/MIG_7_2']
+    assert {copy['dst_bdev_name'] for copy in copies} == {'mig_7n1'}
+
+    spdk.calls.clear()
+    _step(db)
+    assert db.get_task_by_id('t1').function_params['phase'] == 'expose'
+    # I/O is paused on all source paths before the last snapshot and resumed on the swapped namespace
+    methods = spdk.methods('10.0.0.1')
+    assert methods.index('nvmf_subsystem_listener_set_ana_state') < methods.index('bdev_lvol_snapshot') < \
+        methods.index('nvmf_subsystem_remove_ns') < methods.index('nvmf_subsystem_add_ns')
+    assert [params['ana_state'] for ip, method, params in spdk.calls
+            if method == 'nvmf_subsystem_listener_set_ana_state'] == ['inaccessible'] * 4 + ['non_optimized'] * 2
+    assert spdk.bdevs['10.0.0.1']['crypto_mig_7'] == {'base': 'mig_7n1'}
+    assert spdk.subsystems['10.0.0.1'][NQN]['namespaces'] == [{'nsid': 1, 'bdev_name': 'crypto_mig_7', 'uuid': 'l1'}]
+    assert spdk.subsystems['10.0.0.1'][NQN]['listeners'] == {'10.1.1.1': 'non_optimized', '10.1.1.2': 'non_optimized'}
+    assert NQN not in spdk.subsystems['10.0.0.2']
+
+    _step(db)
+    lvol = db.get_lvol_by_id('l1')
+    assert (lvol.node_id, lvol.nodes, lvol.lvs_name, lvol.subsys_port) == ('n3', ['n3', 'n4'], 'lvs_3', 9103)
+    assert (lvol.lvol_uuid, lvol.blobid, lvol.top_bdev, lvol.status) == (
+        'uuid-10.0.0.3', 9, 'crypto_LVOL_7', LVol.STATUS_ONLINE)
+    assert lvol.bdev_stack[0]['params']['lvs_name'] == 'lvs_3' and lvol.bdev_stack[1]['params']['base_name'] == 'lvs_3/LVOL_7'
+    # controller ids distinct from those of the source subsystems of the NQN
+    target, secondary = spdk.subsystems['10.0.0.3'][NQN], spdk.subsystems['10.0.0.4'][NQN]
+    assert (target['min_cntlid'], secondary['min_cntlid']) == (2000, 3000)
+    assert set(target['listeners'].values()) == {'optimized'} and set(secondary['listeners'].values()) == {'non_optimized'}
+    assert target['namespaces'][0]['bdev_name'] == 'crypto_LVOL_7'
+    assert 'lvs_3/LVOL_7' in spdk.bdevs['10.0.0.4']
+
+    # the source stays until the hosts connected to it reach the target
+    spdk.hosts['10.0.0.1'] = ['host-a']
+    assert _step(db) is False
+    spdk.hosts['10.0.0.3'] = ['host-a']
+    assert _step(db) is True
+    task = db.get_task_by_id('t1')
+    assert (task.status, task.function_result) == (JobSchedule.STATUS_DONE, "Done")
+    assert NQN not in spdk.subsystems['10.0.0.1'] and f'{NQN}:migration' not in spdk.subsystems['10.0.0.3']
+    assert spdk.bdevs['10.0.0.1'] == {} and spdk.bdevs['10.0.0.2'] == {}
+    assert 'lvs_3/LVOL_7' in spdk.bdevs['10.0.0.3']
+
+
+def test_cutover_timeout_resumes_io(spdk, db, monkeypatch):
+    monkeypatch.setattr(constants, 'LVOL_MIGRATION_CUTOVER_TIMEOUT_SEC', 0)
+    _task(db)
+    spdk.clusters = [40, 3]
+    _step(db)
+    _step(db)
+    _step(db)
+    _step(db)
+    assert db.get_task_by_id('t1').function_params['phase'] == 'cutover'
+
+    spdk.in_progress = 3
+    _step(db)
+    params = db.get_task_by_id('t1').function_params
+    # the last copy continues in the background, hosts are back on the source
+    assert params['phase'] == 'copy' and params['operation_id'] and params['copied'] == [40]
+    assert set(spdk.subsystems['10.0.0.1'][NQN]['listeners'].values()) == {'optimized'}
+    assert set(spdk.subsystems['10.0.0.2'][NQN]['listeners'].values()) == {'non_optimized'}
+    assert spdk.subsystems['10.0.0.1'][NQN]['namespaces'][0]['bdev_name'] == 'crypto_LVOL_7'
+
+
+def test_failure_before_cutover_rolls_back(spdk, db):
+    _task(db)
+    spdk.failing.add('bdev_nvme_attach_controller')
+    assert _step(db) is False
+    task = db.get_task_by_id('t1')
+    assert (task.status, task.retry) == (JobSchedule.STATUS_SUSPENDED, 1)
+    assert 'lvs_3/LVOL_7' not in spdk.bdevs['10.0.0.3'] and f'{NQN}:migration' not in spdk.subsystems['10.0.0.3']
+
+    spdk.failing.clear()
+    _step(db)
+    _step(db)
+    assert 'lvs_1/MIG_7_0' in spdk.bdevs['10.0.0.2']
+    # out of retries: the snapshots, the target lvol and its subsystem are removed
+    spdk.failing.add('bdev_lvol_check_shallow_copy')
+    assert _step(db) is True
+    task = db.get_task_by_id('t1')
+    assert task.status == JobSchedule.STATUS_DONE and task.function_result.startswith("failed")
+    assert 'lvs_1/MIG_7_0' not in spdk.bdevs['10.0.0.1'] and 'lvs_1/MIG_7_0' not in spdk.bdevs['10.0.0.2']
+    assert 'mig_7' not in spdk.bdevs['10.0.0.1'] and 'lvs_3/LVOL_7' not in spdk.bdevs['10.0.0.3']
+    assert db.get_lvol_by_id('l1').node_id == 'n1'
+
+
+def test_check_migration(spdk, db):
+    lvol = db.get_lvol_by_id('l1')
+    assert check_migration(db, lvol, db.get_storage_node_by_id('n3')) == ""
+    assert "already" in check_migration(db, lvol, db.get_storage_node_by_id('n1'))
+    assert "secondary" in check_migration(db, lvol, db.get_storage_node_by_id('n4'))
+    SnapShot({'uuid': 's1', 'lvol': lvol.to_dict()}).write_to_db(db.kv_store)
+    assert "snapshots" in check_migration(db, lvol, db.get_storage_node_by_id('n3'))
@@ -0,0 +1,85 @@
+import random
+from collections import Counter
+
+from simplyblock_core.lvol_placement import LVolPlacement, NodeStatsSnapshot
+from simplyblock_core.models.lvol_model import LVol
+from simplyblock_core.models.stats import NodeStatObject
+from simplyblock_core.models.storage_node import StorageNode
+
+
+def _node(uuid, stats, db):
+    node = StorageNode({'uuid': uuid, 'cluster_id': 'c1', 'status': StorageNode.STATUS_ONLINE})
+    for i, record in enumerate(stats):
+        NodeStatObject({'cluster_id': 'c1', 'uuid': uuid, 'date': 1700000000 + i * 5, **record}
+                       ).write_to_db(db.kv_store)
+    return node
+
+
+def test_scores(db):
+    nodes = [
+        _node('idle', [{'read_io_ps': 0, 'size_util': 10}], db),
+        _node('hot', [{'read_io_ps': 1000, 'write_bytes_ps': 10 ** 9, 'cpu_busy': 80, 'size_util': 10}] * 2, db),
+        _node('full', [{'read_io_ps': 100, 'size_util': 90}, {'read_io_ps': 300, 'size_util': 90}], db),
+    ]
+    counts = {'idle': 5, 'hot': 5, 'full': 5}
+    placement = LVolPlacement(db, snapshot=NodeStatsSnapshot())
+    loads = placement.loads(nodes, counts)
+    # the mean of the recent samples
+    assert loads['full']['read_io_ps'] == 200 and loads['full']['lvol'] == 5
+    scores = placement.scores(loads)
+    assert scores['idle'] < scores['full'] < scores['hot'] <= 1
+
+    # only the weighted metrics count
+    placement = LVolPlacement(db, weights={'lvol': 1, 'size_util': 1}, snapshot=NodeStatsSnapshot())
+    scores = placement.scores(placement.loads(nodes, counts))
+    assert scores['idle'] == scores['hot'] < scores['full']
+
+    placement = LVolPlacement(db, weights={'lvol': 1, 'cpu_busy': 0}, snapshot=NodeStatsSnapshot())
+    assert placement.loads(nodes, counts)['hot'] == {'lvol': 5}
+    assert placement.scores(placement.loads(nodes, {'idle': 1, 'hot': 4, 'full': 0})) == \
+        {'idle': 0.25, 'hot': 1.0, 'full': 0.0}
+
+
+def test_snapshot_reads_stats_once_per_ttl(db, monkeypatch):
+    node = _node('n1', [{'read_io_ps': 10}], db)
+    reads = []
+    get_node_stats = db.get_node_stats
+
+    def read(n, limit):
+        reads.append(limit)
+        return get_node_stats(n, limit)
+
+    monkeypatch.setattr(db, 'get_node_stats', read)
+
+    snapshot = NodeStatsSnapshot(ttl=60, samples=4)
+    assert snapshot.get(db, node)['read_io_ps'] == 10
+    assert snapshot.get(db, node)['cpu_busy'] == 0
+    assert reads == [4]
+    snapshot.ttl = 0
+    snapshot.get(db, node)
+    assert reads == [4, 4]
+
+
+def test_select_prefers_headroom(db):
+    nodes = [
+        _node('idle', [{'cpu_busy': 5}], db),
+        _node('busy', [{'read_io_ps': 5000, 'write_io_ps': 5000, 'cpu_busy': 95}], db),
+        _node('mid', [{'read_io_ps': 1000, 'write_io_ps': 1000, 'cpu_busy': 40}], db),
+        _node('new', [], db),
+    ]
+    placement = LVolPlacement(db, snapshot=NodeStatsSnapshot())
+    rng = random.Random(0)
+    counts = {'idle': 10, 'busy': 10, 'mid': 10, 'new': 0}
+    draws = [placement.select(nodes, counts, 3, rng) for _ in range(500)]
+    assert all(len({node.get_id() for node in drawn}) == 3 for drawn in draws)
+    first = Counter(drawn[0].get_id() for drawn in draws)
+    assert first['new'] > first['idle'] > first['mid'] > first['busy']
+    assert len(placement.select(nodes[:2], counts, 3, rng)) == 2
+
+
+def test_lvol_count_by_node_id(db):
+    for i, node_id in enumerate(['n1', 'n1', 'n2', 'n1/x']):
+        LVol({'uuid': f'lvol-{i}', 'node_id': node_id}).write_to_db(db.kv_store)
+    assert db.get_lvol_count_by_node_id('n1') == 2
+    assert db.get_lvol_count_by_node_id('n2') == 1
+    assert db.get_lvol_count_by_node_id('n3') == 0
@@ -0,0 +1,121 @@
+import time
+
+import pytest
+
+from simplyblock_core import cluster_ops
+from simplyblock_core.controllers import tasks_controller
+from simplyblock_core.lvol_rebalance import RebalancePlanner
+from simplyblock_core.models.cluster import Cluster
+from simplyblock_core.models.job_schedule import JobSchedule
+from simplyblock_core.models.lvol_model import LVol
+from simplyblock_core.models.stats import LVolStatObject, NodeStatObject
+from simplyblock_core.models.storage_node import StorageNode
+
+WINDOW = 4
+# IOPS of the lvols by node, the mean node load is 25000
+LVOLS = {
+    'n1': {'a': 25000, 'b': 15000, 'c': 12000, 'd': 8000},
+    'n2': {'e': 20000},
+    'n3': {'f': 10000},
+    'n4': {'g': 10000},
+}
+
+
+@pytest.fixture
+def db(db, monkeypatch):
+    monkeypatch.setattr(tasks_controller, 'db', db)
+
+    Cluster({'uuid': 'c1', 'status': Cluster.STATUS_ACTIVE}).write_to_db(db.kv_store)
+    for node_id, lvols in LVOLS.items():
+        StorageNode({'uuid': node_id, 'cluster_id': 'c1', 'status': StorageNode.STATUS_ONLINE, 'max_lvol': 10,
+                     'lvstore': f'lvs_{node_id}'}).write_to_db(db.kv_store)
+        for lvol_id, iops in lvols.items():
+            LVol({'uuid': lvol_id, 'lvol_name': f'vol-{lvol_id}', 'node_id': node_id, 'nodes': [node_id],
+                  'pool_uuid': 'p1', 'status': LVol.STATUS_ONLINE, 'ha_type': 'single',
+                  'lvs_name': f'lvs_{node_id}'}).write_to_db(db.kv_store)
+            _stats(db, LVolStatObject, {'pool_id': 'p1', 'uuid': lvol_id}, [iops] * WINDOW)
+        _stats(db, NodeStatObject, {'cluster_id': 'c1', 'uuid': node_id}, [sum(lvols.values())] * WINDOW)
+    return db
+
+
+def _stats(db, cls, series, iops):
+    for i, value in enumerate(iops):
+        cls({**series, 'date': 1700000000 + i * 5, 'read_io_ps': value // 2, 'write_io_ps': value - value // 2}
+            ).write_to_db(db.kv_store)
+
+
+def _moves(db, **kwargs):
+    return [(move['lvol_id'], move['source'], move['target'])
+            for move in RebalancePlanner(db, 'c1', **{'window': WINDOW, **kwargs}).plan()]
+
+
+def test_plan_moves_off_hot_node(db):
+    planner = RebalancePlanner(db, 'c1', window=WINDOW, max_moves=3)
+    moves = planner.plan()
+    # 'a' would make its target hot, 'd' does not fit anywhere once 'b' and 'c' moved
+    assert [(move['lvol_id'], move['target'], move['metric'], move['load']) for move in moves] == [
+        ('b', 'n3', 'iops', 15000), ('c', 'n4', 'iops', 12000)]
+    assert moves[0]['reason'] == "iops 60000 > 32500 for 4 samples"
+    assert planner.loads['n1']['iops'] == 33000 and planner.loads['n3']['iops'] == 25000
+
+
+def test_hysteresis(db):
+    # a spike within the window does not make a node hot
+    _stats(db, NodeStatObject, {'cluster_id': 'c1', 'uuid': 'n1'}, [60000, 60000, 30000, 60000])
+    assert _moves(db) == []
+
+    # a node above the settle limit but below the trigger is left as is
+    for node_id, iops in [('n1', 12000), ('n2', 10000), ('n3', 10000), ('n4', 10000)]:
+        _stats(db, NodeStatObject, {'cluster_id': 'c1', 'uuid': node_id}, [iops] * WINDOW)
+    planner = RebalancePlanner(db, 'c1', window=WINDOW)
+    assert planner.plan() == []
+    assert planner.mean('iops') * 1.1 < 12000 < planner.mean('iops') * 1.3
+
+    # too little history
+    assert _moves(db, window=WINDOW + 1) == []
+
+
+def test_rate_limits(db):
+    assert _moves(db, max_moves=1) == [('b', 'n1', 'n3')]
+
+    # running migrations count against the limit, their nodes are left alone
+    JobSchedule({'uuid': 't1', 'cluster_id': 'c1', 'node_id': 'n2', 'date': int(time.time()),
+                 'function_name': JobSchedule.FN_LVOL_MIG, 'status': JobSchedule.STATUS_RUNNING,
+                 'function_params': {'lvol_id': 'e', 'target_node_id': 'n3'}}).write_to_db(db.kv_store)
+    assert _moves(db, max_moves=1) == []
+    assert _moves(db, max_moves=3) == [('b', 'n1', 'n4')]
+
+
+def test_old_running_migration(db):
+    # a long running migration counts however many tasks were added since
+    JobSchedule({'uuid': 't0', 'cluster_id': 'c1', 'node_id': 'n2', 'date': int(time.time()) - 86400,
+                 'function_name': JobSchedule.FN_LVOL_MIG, 'status': JobSchedule.STATUS_RUNNING,
+                 'function_params': {'lvol_id': 'e', 'target_node_id': 'n3'}}).write_to_db(db.kv_store)
+    for i in range(1500):
+        JobSchedule({'uuid': f't{i + 1}', 'cluster_id': 'c1', 'node_id': 'n4', 'date': int(time.time()) - 3600 + i,
+                     'function_name': JobSchedule.FN_NODE_RESTART, 'status': JobSchedule.STATUS_DONE,
+                     }).write_to_db(db.kv_store)
+    assert _moves(db, max_moves=1) == []
+    assert _moves(db, max_moves=3) == [('b', 'n1', 'n4')]
+
+
+def test_cooldown(db):
+    # past the window, the nodes are eligible again but not the lvol
+    JobSchedule({'uuid': 't1', 'cluster_id': 'c1', 'node_id': 'n1', 'date': int(time.time()) - 100,
+                 'function_name': JobSchedule.FN_LVOL_MIG, 'status': JobSchedule.STATUS_DONE,
+                 'function_params': {'lvol_id': 'b', 'target_node_id': 'n3'}}).write_to_db(db.kv_store)
+    assert _moves(db, max_moves=3) == [('c', 'n1', 'n3'), ('d', 'n1', 'n4')]
+    assert _moves(db, max_moves=3, cooldown=50) == [('b', 'n1', 'n3'), ('c', 'n1', 'n4')]
+
+
+def test_dry_run(db, monkeypatch):
+    monkeypatch.setattr(cluster_ops, 'RebalancePlanner',
+                        lambda db, cluster_id: RebalancePlanner(db, cluster_id, window=WINDOW))
+    moves = cluster_ops.rebalance_lvols('c1', dry_run=True)
+    assert [(move['LVol'], move['From'], move['To']) for move in moves] == [('b', 'n1', 'n3'), ('c', 'n1', 'n4')]
+    assert db.get_active_job_tasks('c1') == []
+
+    cluster_ops.rebalance_lvols('c1')
+    tasks = db.get_active_job_tasks('c1', JobSchedule.FN_LVOL_MIG)
+    assert sorted((task.node_id, task.function_params['lvol_id'], task.function_params['target_node_id'])
+                  for task in tasks) == [('n1', 'b', 'n3'), ('n1', 'c', 'n4')]
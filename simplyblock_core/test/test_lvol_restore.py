@@ -0,0 +1,49 @@
+from simplyblock_core.lvol_restore import LVolRestore
+from simplyblock_core.models.iface import IFace
+from simplyblock_core.models.lvol_model import LVol
+from simplyblock_core.models.pool import Pool
+from simplyblock_core.models.storage_node import StorageNode
+
+
+def _answer(ip, method, params):
+    if method == 'nvmf_subsystem_add_ns' and params['namespace']['bdev_name'] == 'lvs/bad':
+        return None, {'code': -32602, 'message': 'Invalid parameters'}
+    return 1 if method == 'nvmf_subsystem_add_ns' else True, None
+
+
+def test_restore(rpc, db):
+    rpc.answer = _answer
+    Pool({'uuid': 'p1', 'status': Pool.STATUS_ACTIVE}).write_to_db(db.kv_store)
+    node = StorageNode({'uuid': 'n1', 'mgmt_ip': '10.0.0.1', 'rpc_port': 8080,
+                        'data_nics': [IFace({'ip4_address': f'10.1.0.{i}'}).to_dict() for i in (1, 2)]})
+    lvols = []
+    for i in range(5):
+        lvol = LVol({'uuid': f'lvol-{i}', 'node_id': 'n1', 'pool_uuid': 'p1', 'status': LVol.STATUS_OFFLINE,
+                     'nqn': 'nqn-shared' if i >= 3 else f'nqn-{i}', 'top_bdev': 'lvs/bad' if i == 1 else f'lvs/{i}',
+                     'rw_ios_per_sec': 1000 if i == 2 else 0})
+        lvol.write_to_db(db.kv_store)
+        lvols.append(lvol)
+
+    restore = LVolRestore(db, node, lvols, "non_optimized", min_cntlid=1000, chunk=2, workers=2)
+    assert restore.create_subsystems() == 0
+    batches = [calls for _, calls in rpc.batches]
+    # one subsystem per NQN, in batches of 2
+    assert [[params['nqn'] for _, params in calls] for calls in batches] == [['nqn-0', 'nqn-1'], ['nqn-2', 'nqn-shared']]
+    assert batches[0][0][1]['min_cntlid'] == 1000
+
+    restore.start()
+    errors = restore.wait()
+    assert errors == {'lvol-1': 'nvmf_subsystem_add_ns: Invalid parameters'}
+    assert restore.restored == 4
+    batches = [calls for _, calls in rpc.batches]
+
+    methods = sorted(method for calls in batches[2:] for method, _ in calls)
+    # the listeners of the shared NQN are created once, QoS is only set for lvols having limits
+    assert methods.count('nvmf_subsystem_add_listener') == 2 * 4
+    assert methods.count('nvmf_subsystem_add_ns') == 5 and methods.count('bdev_set_qos_limit') == 1
+    assert {params['ana_state'] for calls in batches[2:] for method, params in calls
+            if method == 'nvmf_subsystem_add_listener'} == {'non_optimized'}
+
+    # the restored lvols are online, the failed one is left as it was
+    assert [db.get_lvol_by_id(f'lvol-{i}').status for i in range(5)] == [
+        LVol.STATUS_ONLINE, LVol.STATUS_OFFLINE, LVol.STATUS_ONLINE, LVol.STATUS_ONLINE, LVol.STATUS_ONLINE]
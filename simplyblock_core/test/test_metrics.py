@@ -0,0 +1,64 @@
+from simplyblock_core.models.cluster import Cluster
+from simplyblock_core.models.lvol_model import LVol
+from simplyblock_core.models.stats import LVolStatObject
+from simplyblock_web.api.v1 import metrics
+
+
+class _DB:
+
+    def __init__(self):
+        self.cluster = Cluster({'uuid': 'cluster_1', 'status': Cluster.STATUS_ACTIVE})
+        self.lvols = {}
+        self.stats = {}
+
+    def get_clusters(self):
+        return [self.cluster]
+
+    def get_cluster_stats(self, cluster, limit=20):
+        return []
+
+    def get_storage_nodes_by_cluster_id(self, cluster_id):
+        return []
+
+    def get_pools(self, cluster_id=None):
+        return []
+
+    def get_lvols(self, cluster_id=None):
+        return list(self.lvols.values())
+
+    def get_lvol_stats(self, lvol, limit=20):
+        return self.stats.get(lvol.get_id(), [])
+
+
+def _value(name, **labels):
+    return metrics.registry.get_sample_value(name, labels)
+
+
+def test_collector(monkeypatch):
+    db = _DB()
+    monkeypatch.setattr(metrics, 'db', db)
+    collector = metrics.MetricsCollector(interval=10, reactor_ttl=60)
+    labels = {'cluster': 'cluster_1', 'pool': 'pool_1', 'pvc_name': 'pvc_1'}
+
+    for i in range(2):
+        db.lvols[f'lvol_{i}'] = LVol({'uuid': f'lvol_{i}', 'pool_name': 'pool_1', 'pvc_name': 'pvc_1'})
+        db.stats[f'lvol_{i}'] = [LVolStatObject({'uuid': f'lvol_{i}', 'date': 100, 'read_io': i})]
+    collector.refresh()
+    assert _value('lvol_read_io', lvol='lvol_1', **labels) == 1
+    assert b'lvol_read_io{cluster="cluster_1",lvol="lvol_1"' in collector.exposition
+
+    # the gauges are only updated from new records
+    db.stats['lvol_1'][0].read_io = 5
+    collector.refresh()
+    assert _value('lvol_read_io', lvol='lvol_1', **labels) == 1
+    db.stats['lvol_1'] = [LVolStatObject({'uuid': 'lvol_1', 'date': 105, 'read_io': 5})]
+    collector.refresh()
+    assert _value('lvol_read_io', lvol='lvol_1', **labels) == 5
+
+    # label sets of deleted lvols are removed
+    del db.lvols['lvol_0']
+    collector.refresh()
+    assert _value('lvol_read_io', lvol='lvol_0', **labels) is None
+    assert _value('lvol_status_code', lvol='lvol_0', **labels) is None
+    assert _value('lvol_read_io', lvol='lvol_1', **labels) == 5
+    assert b'lvol="lvol_0"' not in collector.exposition
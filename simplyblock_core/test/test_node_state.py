@@ -0,0 +1,149 @@
+from typing import Any
+
+import pytest
+
+from simplyblock_core import constants
+from simplyblock_core.controllers import health_controller
+from simplyblock_core.models.lvol_model import LVol
+from simplyblock_core.models.storage_node import StorageNode
+from simplyblock_core.node_state import BdevCache, NodeStateSnapshot
+
+RESULTS: dict[str, Any] = {
+    'bdev_get_bdevs': [{'name': f'lvs/lvol-{i}', 'aliases': [f'uuid-{i}']} for i in range(3)],
+    'nvmf_get_subsystems': [{'nqn': f'nqn-{i}', 'namespaces': [{'uuid': f'lvol-{i}'}],
+                             'listen_addresses': [{'traddr': '10.0.0.1', 'trsvcid': '4420'}]} for i in range(3)],
+    'bdev_lvol_get_lvstores': [{'name': 'lvs', 'lvs leadership': True}],
+    'bdev_get_iostat': {'bdevs': [{'name': 'uuid-0', 'bytes_read': 4096}]},
+}
+
+
+def _answer(ip, method, params):
+    if ip == '10.0.0.2':
+        return False, 'connection refused'
+    if method == 'bdev_get_bdevs' and params:
+        found = [b for b in RESULTS[method] if params['name'] in [b['name']] + b['aliases']]
+        return (found, None) if found else (None, {'code': -19, 'message': 'No such device'})
+    return RESULTS[method], None
+
+
+@pytest.fixture
+def rpc(rpc):
+    rpc.answer = _answer
+    return rpc
+
+
+def _node(uuid, ip):
+    return StorageNode({'uuid': uuid, 'cluster_id': 'c', 'mgmt_ip': ip, 'rpc_port': 8080})
+
+
+def test_views_are_fetched_once(rpc):
+    snapshot = NodeStateSnapshot()
+    node = _node('n1', '10.0.0.1')
+
+    state = snapshot.get(node)
+    assert snapshot.get(node) is state
+    assert rpc.methods() == [('10.0.0.1', ['bdev_get_bdevs', 'nvmf_get_subsystems', 'bdev_lvol_get_lvstores'])]
+    assert state.bdevs['uuid-1'] is state.bdevs['lvs/lvol-1']
+    assert set(state.subsystems) == {'nqn-0', 'nqn-1', 'nqn-2'}
+    assert state.lvstores['lvs']['lvs leadership']
+
+    # views requested later are added with another request
+    assert snapshot.get(node, ('bdevs', 'stats')).stats['uuid-0']['bytes_read'] == 4096
+    assert rpc.methods()[1:] == [('10.0.0.1', ['bdev_get_iostat'])]
+
+    # a node which does not answer is not asked again during the snapshot
+    down = snapshot.get(_node('n2', '10.0.0.2'))
+    assert down.bdevs == {} and down.failed == {'bdevs', 'subsystems', 'lvstores'}
+    snapshot.get(_node('n2', '10.0.0.2'))
+    assert snapshot.requests == len(rpc.batches) == 3
+
+
+def test_views_are_shared(rpc, db, monkeypatch):
+    monkeypatch.setattr(constants, 'NODE_STATE_CHUNK_BYTES', 16)
+    node = _node('n1', '10.0.0.1')
+    fetched = NodeStateSnapshot(db, ttl=10).get(node, ('bdevs', 'stats'))
+    assert len([k for k in db.kv_store.data if k.startswith(b'cache/NodeState/n1/bdevs/')]) > 1
+    assert not [k for k in db.kv_store.data if b'/stats/' in k]
+
+    # another service reuses the stored views, the stats and missing views are fetched
+    snapshot = NodeStateSnapshot(db, ttl=10)
+    state = snapshot.get(node, ('bdevs', 'subsystems', 'stats'))
+    assert state.bdevs == fetched.bdevs and state.dates['bdevs'] == fetched.dates['bdevs']
+    assert snapshot.shared == 1
+    assert rpc.methods()[1:] == [('10.0.0.1', ['nvmf_get_subsystems', 'bdev_get_iostat'])]
+
+    # the leadership is always read from the node
+    NodeStateSnapshot(db, ttl=10).get(node, ('lvstores',))
+    NodeStateSnapshot(db, ttl=10).get(node, ('lvstores',))
+    assert rpc.methods()[2:] == [('10.0.0.1', ['bdev_lvol_get_lvstores'])] * 2
+    assert not [k for k in db.kv_store.data if b'/lvstores/' in k]
+
+    # views of a failed fetch are not stored, stored views expire after the ttl
+    NodeStateSnapshot(db, ttl=10).get(_node('n2', '10.0.0.2'))
+    assert not [k for k in db.kv_store.data if k.startswith(b'cache/NodeState/n2/')]
+    monkeypatch.setattr('time.time', lambda: fetched.dates['bdevs'] + 11)
+    assert NodeStateSnapshot(db, ttl=10).get(node, ('bdevs',)).dates['bdevs'] == fetched.dates['bdevs'] + 11
+
+
+def test_bdevs_requested_by_name(rpc, monkeypatch):
+    monkeypatch.setitem(RESULTS, 'bdev_get_bdevs', [dict(b, num_blocks=8) for b in RESULTS['bdev_get_bdevs']])
+    cache = BdevCache(list_interval=60)
+    node = _node('n1', '10.0.0.1')
+
+    # the first cycle lists all bdevs of the node
+    assert len(NodeStateSnapshot(bdev_cache=cache).get(node, ('bdevs',), ['uuid-0']).bdevs) == 6
+    assert rpc.methods() == [('10.0.0.1', ['bdev_get_bdevs'])]
+
+    # later cycles only request the bdevs they need, and refresh the capacity of the cached ones
+    RESULTS['bdev_get_bdevs'][0]['num_blocks'] = 16
+    RESULTS['bdev_get_bdevs'][0]['claimed'] = True
+    snapshot = NodeStateSnapshot(bdev_cache=cache)
+    state = snapshot.get(node, ('bdevs', 'subsystems'), ['uuid-0', 'missing'])
+    assert rpc.methods()[1:] == [('10.0.0.1', ['nvmf_get_subsystems', 'bdev_get_bdevs', 'bdev_get_bdevs'])]
+    assert set(state.bdevs) == {'lvs/lvol-0', 'uuid-0'} and not state.failed
+    assert state.bdevs['uuid-0']['num_blocks'] == 16 and 'claimed' not in state.bdevs['uuid-0']
+
+    # names already looked up are not requested again, others are added to the view
+    snapshot.get(node, ('bdevs',), ['uuid-0'])
+    assert set(snapshot.get(node, ('bdevs',), ['uuid-0', 'uuid-1']).bdevs) == {
+        'lvs/lvol-0', 'uuid-0', 'lvs/lvol-1', 'uuid-1'}
+    assert rpc.methods()[2:] == [('10.0.0.1', ['bdev_get_bdevs'])]
+
+    # callers passing no names get all bdevs
+    assert len(snapshot.get(node, ('bdevs',)).bdevs) == 6
+    assert rpc.methods()[3:] == [('10.0.0.1', ['bdev_get_bdevs'])]
+
+
+def test_bdevs_evicted_only_when_not_found(rpc):
+    cache = BdevCache(list_interval=60)
+    node = _node('n1', '10.0.0.1')
+    NodeStateSnapshot(bdev_cache=cache).get(node, ('bdevs',), ['uuid-0'])
+
+    # an invalid response fails the view, the cached bdevs are kept
+    rpc.answer = lambda ip, method, params: (None, None)
+    state = NodeStateSnapshot(bdev_cache=cache).get(node, ('bdevs',), ['uuid-0', 'uuid-1'])
+    assert state.failed == {'bdevs'} and state.bdevs == {}
+    assert cache.update('n1', []) == [] and len(cache._bdevs['n1']) == 3
+
+    # bdevs the node reports as not existing are dropped
+    not_found = {'code': -19, 'message': 'No such device'}
+    rpc.answer = lambda ip, method, params: (None, not_found)
+    state = NodeStateSnapshot(bdev_cache=cache).get(node, ('bdevs',), ['uuid-0'])
+    assert not state.failed and state.bdevs == {}
+    assert set(cache._bdevs['n1']) == {'lvs/lvol-1', 'lvs/lvol-2'}
+
+
+def test_lvol_checks_share_the_snapshot(rpc, db):
+    node = _node('n1', '10.0.0.1')
+    node.write_to_db(db.kv_store)
+    for i in range(3):
+        LVol({'uuid': f'lvol-{i}', 'node_id': 'n1', 'lvol_uuid': f'uuid-{i}', 'nqn': f'nqn-{i}',
+              'bdev_stack': [{'name': f'lvol-{i}', 'type': 'bdev_lvol'}]}).write_to_db(db.kv_store)
+
+    snapshot = NodeStateSnapshot()
+    assert all(health_controller.check_lvol_on_node(f'lvol-{i}', 'n1', snapshot=snapshot) for i in range(3))
+    assert len(rpc.batches) == 1
+
+    # without a snapshot, only the views the caller did not pass are fetched
+    assert health_controller.check_lvol_on_node('lvol-0', 'n1', node_bdev_names={'uuid-0': {}})
+    assert rpc.methods()[1:] == [('10.0.0.1', ['nvmf_get_subsystems'])]
@@ -0,0 +1,73 @@
+import pytest
+
+from simplyblock_core.models.cluster import Cluster
+from simplyblock_core.models.events import EventObj
+from simplyblock_core.models.job_schedule import JobSchedule
+from simplyblock_core.models.stats import NodeStatObject
+from simplyblock_core.retention import RetentionEngine
+from simplyblock_core.test.test_db_controller import _task
+
+NOW = 1_700_000_000
+
+
+@pytest.fixture
+def db(db):
+    Cluster({'uuid': 'c'}).write_to_db(db.kv_store)
+    return db
+
+
+def _size(db, prefix):
+    return sum(len(k) + len(v) for k, v in db.kv_store.data.items() if k.startswith(prefix))
+
+
+def test_trim_stats(db):
+    series = [('n1', [NOW - 5000, NOW - 4000, NOW - 10]), ('n2', [NOW - 5000, NOW - 4000]), ('n3', [NOW - 10])]
+    for node_id, dates in series:
+        for date in dates:
+            NodeStatObject({'cluster_id': 'c', 'uuid': node_id, 'date': date}).write_to_db(db.kv_store)
+    rollups = NodeStatObject({'cluster_id': 'c', 'uuid': 'n1'}).read_rollups(db.kv_store, '1m')
+    size = _size(db, b'stats/NodeStatObject/')
+
+    engine = RetentionEngine(db, batch_keys=1, orphan_grace=100)
+    report = engine.run(1000, {'NodeStatObject': {'n1'}}, now=NOW)
+
+    # old samples are trimmed, series of deleted nodes entirely once no sample arrived within the grace period
+    assert [s.date for s in NodeStatObject({'cluster_id': 'c', 'uuid': 'n1'}).read_samples(db.kv_store)] == [NOW - 10]
+    assert [s.date for s in NodeStatObject({'cluster_id': 'c', 'uuid': 'n3'}).read_samples(db.kv_store)] == [NOW - 10]
+    assert not [k for k in db.kv_store.data if b'/n2/' in k]
+    assert NodeStatObject({'cluster_id': 'c', 'uuid': 'n1'}).read_rollups(db.kv_store, '1m') == rollups
+
+    assert report['stats/NodeStatObject/']['keys'] == 4
+    assert report['stats/NodeStatObject/']['bytes'] == size - _size(db, b'stats/NodeStatObject/')
+    assert report['rollup/1m/NodeStatObject/']['keys'] == 1
+    assert engine.run(1000, {'NodeStatObject': {'n1'}}, now=NOW)['stats/NodeStatObject/']['keys'] == 0
+
+
+def test_trim_keeps_blocks_within_retention(db):
+    # both samples are in the block of NOW - 1040 to NOW - 980, which ends within the retention
+    for date in (NOW - 1010, NOW - 990):
+        NodeStatObject({'cluster_id': 'c', 'uuid': 'n1', 'date': date}).write_to_db(db.kv_store)
+    RetentionEngine(db).run(1000, now=NOW)
+    dates = [s.date for s in NodeStatObject({'cluster_id': 'c', 'uuid': 'n1'}).read_samples(db.kv_store)]
+    assert sorted(dates) == [NOW - 1010, NOW - 990]
+
+    # cleared once the end of the block is past the retention
+    RetentionEngine(db).run(1000, now=NOW + 21)
+    assert NodeStatObject({'cluster_id': 'c', 'uuid': 'n1'}).read_samples(db.kv_store) == []
+
+
+def test_trim_events_and_tasks(db):
+    day = 24 * 60 * 60
+    for uuid, date in [('e1', NOW - 100 * day), ('e2', NOW - 95 * day), ('e3', NOW - 10)]:
+        EventObj({'uuid': uuid, 'cluster_uuid': 'c', 'date': date * 1000}).write_to_db(db.kv_store)
+    for uuid, date in [('t1', NOW - 200 * day), ('t2', NOW - 190 * day), ('t3', NOW - 10)]:
+        _task(uuid, date, JobSchedule.FN_NODE_ADD, status=JobSchedule.STATUS_DONE).write_to_db(db.kv_store)
+    db.archive_job_tasks('c', NOW)
+
+    report = RetentionEngine(db).run(1000, now=NOW)
+    assert [e.uuid for e in db.get_events('c')] == ['e3']
+    assert report['object/EventObj/']['keys'] == 2
+
+    assert report['archive/JobSchedule/']['keys'] == 2
+    assert db.get_task_by_id('t3').object_type == 'archive'
+    assert not [k for k in db.kv_store.data if b't1' in k or b't2' in k]
@@ -0,0 +1,112 @@
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from simplyblock_core import rpc_client
+from simplyblock_core.rpc_client import RPCClient
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    batches = True
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if isinstance(request, list) and not self.batches:
+            body = json.dumps({'jsonrpc': '2.0', 'id': None, 'error': {'code': -32600, 'message': 'Invalid Request'}}
+                              ).encode()
+        elif isinstance(request, list):
+            # answered in reverse order, responses are matched by id
+            body = json.dumps([self._response(call) for call in reversed(request)]).encode()
+        else:
+            body = json.dumps(self._response(request)).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @staticmethod
+    def _response(request):
+        if request['method'] == 'fail':
+            return {'jsonrpc': '2.0', 'id': request['id'], 'error': {'code': -32601, 'message': 'Method not found'}}
+        return {'jsonrpc': '2.0', 'id': request['id'], 'result': [request['method'], request.get('params')]}
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_connections_are_shared(server):
+    ip, port = server
+    clients = [RPCClient(ip, port, 'user', 'secret', timeout=5, retry=1) for _ in range(3)]
+    for client in clients:
+        assert client.get_version() == ['spdk_get_version', None]
+        assert client._request3('spdk_get_version') == ['spdk_get_version', {}]
+
+    assert len({id(client.connection) for client in clients}) == 1
+    stats = rpc_client.get_connection_stats()[clients[0].url]
+    assert stats['requests'] == 6
+    assert stats['connections'] == 1
+    assert stats['errors'] == 0
+
+
+def test_failing_connection_is_evicted():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]  # nothing listens here once closed
+
+    client = RPCClient('127.0.0.1', port, 'user', 'secret', timeout=1, retry=0)
+    for _ in range(rpc_client.constants.RPC_POOL_EVICT_AFTER_ERRORS):
+        assert client.get_version() is False
+
+    assert client.url not in rpc_client.get_connection_stats()
+    assert RPCClient('127.0.0.1', port, 'user', 'secret').connection is not client.connection
+
+
+def test_batch(server, monkeypatch):
+    ip, port = server
+    client = RPCClient(ip, port, 'user', 'secret', timeout=5, retry=1)
+    requests_before = rpc_client.get_connection_stats().get(client.url, {}).get('requests', 0)
+
+    batch = client.batch()
+    batch.get_version()
+    batch.alceml_get_capacity('alceml_1')
+    batch._request('fail')
+    assert batch.send() == [
+        (['spdk_get_version', None], None),
+        (['alceml_get_pages_usage', {'name': 'alceml_1'}], None),
+        (None, {'code': -32601, 'message': 'Method not found'}),
+    ]
+    assert batch.calls == []
+    assert rpc_client.get_connection_stats()[client.url]['requests'] == requests_before + 1
+    # the response sizes are accounted per client and per connection
+    assert batch.response_bytes > 0 and batch.decode_time > 0
+    assert rpc_client.get_connection_stats()[client.url]['response_bytes'] >= batch.response_bytes
+
+    monkeypatch.setattr(rpc_client.constants, 'RPC_BATCH_MAX_CALLS', 2)
+    for i in range(5):
+        batch.alceml_get_capacity(f'alceml_{i}')
+    assert [result[1]['name'] for result, _ in batch.send()] == [f'alceml_{i}' for i in range(5)]
+    assert rpc_client.get_connection_stats()[client.url]['requests'] == requests_before + 4
+
+    # proxies not taking batch requests get the calls one by one
+    monkeypatch.setattr(_Handler, 'batches', False)
+    batch.get_version()
+    batch._request('fail')
+    assert batch.send() == [
+        (['spdk_get_version', None], None),
+        (None, {'code': -32601, 'message': 'Method not found'}),
+    ]
+    assert rpc_client.get_connection_stats()[client.url]['requests'] == requests_before + 7
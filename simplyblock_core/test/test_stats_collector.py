@@ -0,0 +1,60 @@
+import threading
+import time
+
+import pytest
+
+from simplyblock_core import constants
+from simplyblock_core.models.cluster import Cluster
+from simplyblock_core.models.stats import NodeStatObject
+from simplyblock_core.models.storage_node import StorageNode
+from simplyblock_core.services import capacity_and_stats_collector as collector
+
+
+@pytest.fixture
+def db(db, monkeypatch):
+    monkeypatch.setattr(collector, 'db', db)
+    monkeypatch.setattr(collector, 'in_flight', {})
+    monkeypatch.setattr(constants, 'DEV_STAT_COLLECTOR_DEADLINE_SEC', 0.2)
+    return db
+
+
+def test_late_node_is_collected_once(db, monkeypatch):
+    cluster = Cluster({'uuid': 'c1'})
+    nodes = [StorageNode({'uuid': node_id, 'cluster_id': 'c1', 'status': StorageNode.STATUS_ONLINE,
+                          'nvme_devices': [{'uuid': f'{node_id}-dev'}]}) for node_id in ['fast', 'slow']]
+    for node in nodes:
+        node.write_to_db(db.kv_store)
+
+    answer = threading.Event()
+    queried = []
+
+    def collect_node_stats(node):
+        queried.append(node.get_id())
+        if node.get_id() == 'slow':
+            answer.wait(5)
+        # samples of the same second replace each other
+        return time.time() + 10 * len(queried), [], {}
+
+    monkeypatch.setattr(collector, 'collect_node_stats', collect_node_stats)
+
+    def samples(node_id):
+        return len(NodeStatObject({'cluster_id': 'c1', 'uuid': node_id}).read_samples(db.kv_store))
+
+    tick = time.time()
+    collector.collect([cluster], tick)
+    assert (samples('fast'), samples('slow')) == (1, 0)
+
+    # still not answering, the node is not queried again
+    collector.collect([cluster], tick + 1)
+    assert queried.count('slow') == 1 and samples('slow') == 0
+
+    # the late sample is recorded, the node is queried again in the next cycle
+    answer.set()
+    collector.in_flight['slow'][1].result()
+    collector.collect([cluster], tick + 2)
+    assert queried.count('slow') == 1 and samples('slow') == 1
+    assert not collector.in_flight
+
+    collector.collect([cluster], tick + 3)
+    assert queried.count('slow') == 2 and samples('slow') == 2
+    assert not collector.in_flight
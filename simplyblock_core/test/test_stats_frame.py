@@ -0,0 +1,48 @@
+import pytest
+
+from simplyblock_core import utils
+from simplyblock_core.models.stats import DeviceStatObject, StatsObject
+from simplyblock_core.stats_frame import StatsFrame
+
+
+def _records(count):
+    return [DeviceStatObject({'uuid': f'dev-{i % 3}', 'cluster_id': 'c', 'date': 1000 + i * 5,
+                              'read_bytes': i * 4096, 'read_io': i, 'write_latency_ps': i * 2})
+            for i in range(count)]
+
+
+def test_aggregates():
+    frame = StatsFrame.from_records([{'name': 'a', 'io': 1, 'lat': 2.0}, {'name': 'b', 'io': 4, 'lat': 'x'},
+                                     {'name': 'c', 'io': 7, 'lat': 4.0}])
+    assert list(frame.columns) == ['io', 'lat']
+    assert frame.sum() == {'io': 12, 'lat': 6.0}
+    assert frame.mean() == {'io': 4, 'lat': 2}
+    assert frame.min() == {'io': 1, 'lat': 0} and frame.max() == {'io': 7, 'lat': 4.0}
+    assert frame.percentile(50) == {'io': 4, 'lat': 2.0}
+    assert frame.percentile(75)['io'] == pytest.approx(5.5)
+    assert StatsFrame.from_records([]).sum() == {} and StatsFrame.from_records([]).downsample(5) == []
+
+    # a single record is returned as is, large counters are kept exact
+    assert StatsFrame.from_records([{'io': 3, 'lat': 1.5}]).mean() == {'io': 3, 'lat': 1.5}
+    assert StatsFrame.from_records([{'io': 2 ** 63}, {'io': 1}]).sum() == {'io': 2 ** 63 + 1}
+
+
+def test_downsample():
+    records = _records(23)
+    keys = ['date', 'read_bytes', 'read_io']
+    buckets = utils.process_records(records, 5, keys=keys)
+
+    # buckets of 4 records, the last 3 records are dropped
+    assert len(buckets) == 5
+    assert buckets[0] == {'date': 1007, 'read_bytes': 6144, 'read_io': 1}
+    assert buckets[4] == {'date': 1087, 'read_bytes': 71680, 'read_io': 17}
+    assert utils.process_records(records[:2], 5, keys=keys)[1] == {'date': 1005, 'read_bytes': 4096, 'read_io': 1}
+    assert utils.dict_agg([r.to_dict() for r in records[:3]], keys=['read_io', 'uuid']) == {'read_io': 3}
+
+
+def test_sum_records():
+    records = _records(4)
+    total = utils.sum_records(records)
+    assert isinstance(total, StatsObject) and total.cluster_id == 'c' and total.uuid not in ('dev-0', 'dev-1')
+    assert total.read_bytes == 6 * 4096 and total.read_io == 6 and total.write_latency_ps == 12
+    assert utils.sum_records(records[:1]) is records[0] and utils.sum_records([]) is False
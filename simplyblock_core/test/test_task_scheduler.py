@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+from simplyblock_core.models.cluster import Cluster
+from simplyblock_core.models.job_schedule import JobSchedule
+from simplyblock_core.task_scheduler import TaskScheduler
+from simplyblock_core.test.test_db_controller import _task
+
+
+@pytest.fixture
+def db(db):
+    Cluster({'uuid': 'c'}).write_to_db(db.kv_store)
+    return db
+
+
+def _run_until(scheduler, done, timeout=5):
+    deadline = time.time() + timeout
+    while not done() and time.time() < deadline:
+        scheduler.run_once(max_wait=0.05)
+    assert done()
+
+
+def test_tasks_per_node(db):
+    for uuid, node_id in [('t1', 'n1'), ('t2', 'n1'), ('t3', 'n2')]:
+        _task(uuid, 100, JobSchedule.FN_DEV_MIG, node_id).write_to_db(db.kv_store)
+
+    gate = threading.Event()
+    lock = threading.Lock()
+    running: dict = {}
+    started = []
+
+    def run(task):
+        with lock:
+            running[task.node_id] = running.get(task.node_id, 0) + 1
+            assert running[task.node_id] == 1
+            started.append(task.uuid)
+        gate.wait(5)
+        with lock:
+            running[task.node_id] -= 1
+        task = db.get_task_by_id(task.uuid)
+        task.status = JobSchedule.STATUS_DONE
+        task.write_to_db(db.kv_store)
+        return True
+
+    scheduler = TaskScheduler(db, {JobSchedule.FN_DEV_MIG: ('migration', 1, run)}, {'migration': 4})
+    # the tasks of different nodes run at the same time, the second one of n1 waits for the first
+    _run_until(scheduler, lambda: len(started) == 2)
+    assert sorted(started) == ['t1', 't3']
+
+    gate.set()
+    _run_until(scheduler, lambda: not db.get_active_job_tasks('c'))
+    assert started[2] == 't2'
+    # finished tasks are dropped
+    _run_until(scheduler, lambda: not scheduler._tasks)
+    assert not scheduler._due
+
+
+def test_cluster_pools(db):
+    Cluster({'uuid': 'c2'}).write_to_db(db.kv_store)
+    for uuid, node_id in [('t1', 'n1'), ('t2', 'n2')]:
+        _task(uuid, 100, JobSchedule.FN_NODE_RESTART, node_id).write_to_db(db.kv_store)
+    task = _task('t3', 100, JobSchedule.FN_NODE_RESTART, 'n3')
+    task.cluster_id = 'c2'
+    task.write_to_db(db.kv_store)
+
+    gate = threading.Event()
+    started = []
+
+    def run(task):
+        started.append(task.uuid)
+        gate.wait(5)
+        task = db.get_task_by_id(task.uuid)
+        task.status = JobSchedule.STATUS_DONE
+        task.write_to_db(db.kv_store)
+        return True
+
+    scheduler = TaskScheduler(db, {JobSchedule.FN_NODE_RESTART: ('restart', 1, run)}, {'restart': 4},
+                              cluster_pools=('restart',))
+    # the restarts of different clusters run at the same time, those of a cluster one after the other
+    _run_until(scheduler, lambda: len(started) == 2)
+    for _ in range(3):
+        scheduler.run_once(max_wait=0.05)
+    assert sorted(started) == ['t1', 't3']
+
+    gate.set()
+    _run_until(scheduler, lambda: not db.get_active_job_tasks('c'))
+    assert started[2] == 't2'
+
+
+def test_backoff(db):
+    _task('t1', 100, JobSchedule.FN_NODE_RESTART, 'n1').write_to_db(db.kv_store)
+    retry = [True]
+
+    def run(task):
+        if retry[0]:
+            task = db.get_task_by_id(task.uuid)
+            task.retry += 1
+            task.write_to_db(db.kv_store)
+        return False
+
+    scheduler = TaskScheduler(db, {JobSchedule.FN_NODE_RESTART: ('restart', 10, run)}, {'restart': 1},
+                              max_backoff=25)
+
+    def step():
+        scheduler._push('t1', 0)
+        _run_until(scheduler, lambda: 't1' in scheduler._due and scheduler._due['t1'] > 0)
+        return scheduler._due['t1'] - time.time()
+
+    assert 19 < step() <= 20
+    assert 24 < step() <= 25
+    retry[0] = False
+    assert 9 < step() <= 10
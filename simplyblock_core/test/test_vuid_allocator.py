@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from simplyblock_core import constants
+from simplyblock_core.models.lvol_model import LVol
+from simplyblock_core.test.test_db_controller import FakeDatabase
+from simplyblock_core.vuid_allocator import BLOCK_IDS, VUIDAllocator
+
+
+@pytest.fixture
+def kv_store(monkeypatch):
+    monkeypatch.setitem(constants.VUID_SPACES, 'lvol', BLOCK_IDS + 10)
+    return FakeDatabase()
+
+
+def test_seeded_with_used_vuids(kv_store):
+    used = [(vuid, f'lvol-{vuid}') for vuid in range(1, BLOCK_IDS + 8)]
+    allocator = VUIDAllocator('lvol', lambda: used)
+
+    vuids = {allocator.allocate(kv_store, owner) for owner in 'abc'}
+    assert vuids == {BLOCK_IDS + 8, BLOCK_IDS + 9, BLOCK_IDS + 10}
+    assert allocator.allocate(kv_store, 'd') == 0
+    assert allocator.owners(kv_store, 5) == ['lvol-5']
+
+    # the seed is only read once
+    assert VUIDAllocator('lvol', lambda: []).allocate(kv_store, 'e') == 0
+
+
+def test_release_and_shared_vuids(kv_store):
+    allocator = VUIDAllocator('lvol')
+    vuid = allocator.allocate(kv_store, 'lvol-1')
+    assert not allocator.reserve(kv_store, vuid, 'lvol-2')
+    assert allocator.reserve(kv_store, vuid, 'clone-1', shared=True)
+    assert not allocator.reserve(kv_store, BLOCK_IDS + 11, 'lvol-2')
+
+    allocator.release(kv_store, 'lvol-1')
+    assert allocator.owners(kv_store, vuid) == ['clone-1']
+    assert not allocator.reserve(kv_store, vuid, 'lvol-2')
+
+    allocator.release(kv_store, 'clone-1')
+    assert allocator.owners(kv_store, vuid) == []
+    assert allocator.reserve(kv_store, vuid, 'lvol-2')
+
+
+def test_freed_blocks_are_allocated_again(kv_store):
+    allocator = VUIDAllocator('lvol')
+    vuids = {allocator.allocate(kv_store, f'lvol-{i}') for i in range(BLOCK_IDS + 10)}
+    assert vuids == set(range(1, BLOCK_IDS + 11))
+    assert allocator.allocate(kv_store, 'full') == 0
+
+    allocator.release(kv_store, 'lvol-0')
+    assert allocator.allocate(kv_store, 'again') > 0
+
+
+def test_removed_lvol_releases_its_vuid(kv_store):
+    allocator = VUIDAllocator('lvol')
+    vuid = allocator.allocate(kv_store, 'lvol-1')
+    LVol({'uuid': 'lvol-1', 'vuid': vuid}).write_to_db(kv_store)
+    assert allocator.owners(kv_store, vuid) == ['lvol-1']
+
+    LVol({'uuid': 'lvol-1', 'vuid': vuid}).remove(kv_store)
+    assert allocator.owners(kv_store, vuid) == []
+
+
+def test_concurrent_allocations_are_unique(kv_store):
+    allocator = VUIDAllocator('lvol')
+    vuids: list = []
+    lock = threading.Lock()
+
+    def allocate(worker):
+        for i in range(50):
+            vuid = allocator.allocate(kv_store, f'lvol-{worker}-{i}')
+            with lock:
+                vuids.append(vuid)
+
+    threads = [threading.Thread(target=allocate, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert 0 not in vuids
+    assert len(set(vuids)) == len(vuids) == 400
@@ -1,4 +1,5 @@
 # coding=utf-8
+import importlib.util
 import json
 import logging
 import math
@@ -6,28 +7,28 @@ import os
 import random
 import re
 import string
+import struct
 import subprocess
 import sys
 import uuid
 import time
 import socket
-from typing import Union
-from kubernetes import client, config
-from kubernetes.client import ApiException
-import docker
-from prettytable import PrettyTable
-from docker.errors import APIError, DockerException, ImageNotFound, NotFound
+from typing import TYPE_CHECKING, Union
 
 import tempfile
-from jinja2 import Environment, FileSystemLoader
 
 from simplyblock_core import constants
 from simplyblock_core import shell_utils
+from simplyblock_core.stats_frame import StatsFrame
+from simplyblock_core.vuid_allocator import VUIDAllocator
 from simplyblock_core.models.job_schedule import JobSchedule
 from simplyblock_core.models.nvme_device import NVMeDevice
-from simplyblock_web import node_utils
+from simplyblock_core.models.stats import StatsObject
 
-from . import pci as pci_utils
+# kubernetes, docker, jinja2, prettytable, pci (pydantic) and node_utils (boto3)
+# take hundreds of milliseconds to import, the functions using them import them
+if TYPE_CHECKING:
+    import docker
 
 CONFIG_KEYS = [
     "app_thread_core",
@@ -125,6 +126,8 @@ def get_iface_ip(ifname):
 
 
 def print_table(data: list, title=None):
+    from prettytable import PrettyTable
+
     if data:
         x = PrettyTable(field_names=data[0].keys(), max_width=70, title=title)
         x.align = 'l'
@@ -165,6 +168,7 @@ def generate_string(length):
 
 
 def get_docker_client(cluster_id=None):
+    import docker
     from simplyblock_core.db_controller import DBController
     db_controller = DBController()
     nodes = db_controller.get_mgmt_nodes()
@@ -203,78 +207,8 @@ def get_k8s_node_ip():
     return False
 
 def dict_agg(data, mean=False, keys=None):
-    out: dict = {}
-    if not keys and data:
-        keys = data[0].keys()
-    for d in data:
-        for key in keys:
-            if isinstance(d[key], int) or isinstance(d[key], float):
-                if key in out:
-                    out[key] += d[key]
-                else:
-                    out[key] = d[key]
-    if out and mean:
-        count = len(data)
-        if count > 1:
-            for key in out:
-                out[key] = int(out[key] / count)
-    return out
-
-
-def get_weights(node_stats, cluster_stats):
-    """"
-    node_st = {
-            "lvol": len(node.lvols),
-            "cpu": cpuinfo.get_cpu_info()['count']*cpuinfo.get_cpu_info()['hz_advertised'][0],
-            "r_io": 0,
-            "w_io": 0,
-            "r_b": 0,
-            "w_b": 0}
-    """
-
-    def _normalize_w(key, v):
-        if key in constants.weights:
-            return round(((v * constants.weights[key]) / 100), 2)
-        else:
-            return v
-
-    def _get_key_w(node_id, key):
-        w = 0
-        if cluster_stats[key] > 0:
-            w = (cluster_stats[key] / node_stats[node_id][key]) * 10
-            # if key in ["lvol", "r_io", "w_io", "r_b", "w_b"]:  # get reverse value
-            #     w = (cluster_stats[key]/node_stats[node_id][key]) * 100
-        return w
-
-    out: dict = {}
-    heavy_node_w = 0
-    heavy_node_id = None
-    for node_id in node_stats:
-        out[node_id] = {}
-        total = 0
-        for key in cluster_stats:
-            w = _get_key_w(node_id, key)
-            w = _normalize_w(key, w)
-            out[node_id][key] = w
-            total += w
-        out[node_id]['total'] = int(total)
-        if total > heavy_node_w:
-            heavy_node_w = total
-            heavy_node_id = node_id
-
-    if heavy_node_id:
-        out[heavy_node_id]['total'] *= 5
-
-    return out
-
-
-def print_table_dict(node_stats):
-    d = []
-    for node_id in node_stats:
-        data = {"node_id": node_id}
-        data.update(node_stats[node_id])
-        d.append(data)
-    print(print_table(d))
+    frame = StatsFrame.from_records(data, keys)
+    return frame.mean() if mean else frame.sum()
 
 
 def generate_rpc_user_and_pass():
@@ -316,21 +250,7 @@ def parse_history_param(history_string):
 
 def process_records(records, records_count, keys=None):
     # combine records
-    if not records:
-        return []
-
-    records_count = min(records_count, len(records))
-
-    data_per_record = int(len(records) / records_count)
-    new_records = []
-    for i in range(records_count):
-        first_index = i * data_per_record
-        last_index = (i + 1) * data_per_record
-        last_index = min(last_index, len(records))
-        sl = records[first_index:last_index]
-        rec = dict_agg(sl, mean=True, keys=keys)
-        new_records.append(rec)
-    return new_records
+    return StatsFrame.from_records(records, keys).downsample(records_count)
 
 
 def ping_host(ip):
@@ -344,19 +264,97 @@ def ping_host(ip):
         return False
 
 
+def _icmp_checksum(data):
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(int.from_bytes(data[i:i + 2], 'big') for i in range(0, len(data), 2))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def _icmp_socket():
+    """Returns an ICMP socket and whether it is raw, or (None, False) if ICMP sockets are not permitted"""
+    for sock_type in [socket.SOCK_DGRAM, socket.SOCK_RAW]:
+        try:
+            return socket.socket(socket.AF_INET, sock_type, socket.IPPROTO_ICMP), sock_type == socket.SOCK_RAW
+        except OSError:
+            continue
+    return None, False
+
+
+def ping_hosts(ips, timeout=3, count=3):
+    """Pings all `ips` at once, returns a dict of the ips and whether they replied.
+
+    Sends `count` echo requests to every ip, spread over the first half of
+    `timeout`, from one ICMP socket, so that the cost does not grow with the
+    number of hosts. Falls back to ping_host per ip, in parallel, where ICMP
+    sockets are not permitted.
+    """
+    import select
+    ips = set(ips)
+    if not ips:
+        return {}
+    sock, raw = _icmp_socket()
+    if sock is None:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(len(ips), 32)) as executor:
+            return dict(zip(ips, executor.map(ping_host, ips)))
+
+    ident = os.getpid() & 0xffff
+    alive: set = set()
+    start = time.monotonic()
+    interval = timeout / 2 / count
+    sent = 0
+    try:
+        sock.setblocking(False)
+        while alive != ips:
+            now = time.monotonic()
+            if now >= start + timeout:
+                break
+            if sent < count and now >= start + sent * interval:
+                header = struct.pack('!BBHHH', 8, 0, 0, ident, sent)
+                packet = struct.pack('!BBHHH', 8, 0, _icmp_checksum(header), ident, sent)
+                for ip in ips - alive:
+                    try:
+                        sock.sendto(packet, (ip, 0))
+                    except OSError as e:
+                        logger.debug(f"Failed to ping {ip}: {e}")
+                sent += 1
+            next_send = start + sent * interval if sent < count else start + timeout
+            readable, _, _ = select.select([sock], [], [], max(0.0, min(next_send, start + timeout) - now))
+            while readable:
+                try:
+                    data, (ip, _) = sock.recvfrom(1024)
+                except BlockingIOError:
+                    break
+                except OSError:
+                    continue
+                if raw:
+                    data = data[(data[0] & 0x0f) * 4:]
+                # the kernel sets the identifier of datagram ICMP sockets
+                if len(data) >= 8 and data[0] == 0 and (not raw or struct.unpack('!H', data[4:6])[0] == ident):
+                    alive.add(ip)
+    finally:
+        sock.close()
+    logger.debug(f"Pinged {len(ips)} hosts, {len(alive)} are up")
+    return {ip: ip in alive for ip in ips}
+
+
 def sum_records(records):
     if len(records) == 0:
         return False
     elif len(records) == 1:
         return records[0]
     else:
-        total = records[0]
-        for rec in records[1:]:
-            total += rec
-        return total
+        keys = [attr for attr, value in records[0].get_attrs_map().items() if value['type'] in [int, float]]
+        data = StatsFrame.from_records(records, keys).sum()
+        data.update(cluster_id=records[0].cluster_id, uuid=str(uuid.uuid4()))
+        return StatsObject(data)
 
 
-def get_random_vuid():
+def _used_lvol_vuids():
+    """Returns the (vuid, owner) of the distribs, JMs and lvols, to seed the lvol VUID space"""
     from simplyblock_core.db_controller import DBController
     db_controller = DBController()
     used_vuids = []
@@ -370,15 +368,28 @@ def get_random_vuid():
                 vuid = bdev['jm_vuid']
             else:
                 continue
-            used_vuids.append(vuid)
+            used_vuids.append((vuid, node.get_id()))
 
     for lvol in db_controller.get_lvols():
-        used_vuids.append(lvol.vuid)
+        used_vuids.append((lvol.vuid, lvol.get_id()))
+    return used_vuids
+
+
+def _used_snapshot_vuids():
+    from simplyblock_core.db_controller import DBController
+    return [(snap.vuid, snap.get_id()) for snap in DBController().get_snapshots()]
 
-    r = 1 + int(random.random() * 10000)
-    while r in used_vuids:
-        r = 1 + int(random.random() * 10000)
-    return r
+
+def vuid_allocator(space):
+    """Returns the VUIDAllocator of `space`, 'lvol' or 'snapshot'"""
+    used = {'lvol': _used_lvol_vuids, 'snapshot': _used_snapshot_vuids}[space]
+    return VUIDAllocator(space, used)
+
+
+def get_random_vuid(owner):
+    """Returns a free VUID of the lvol space, reserved for the object `owner` until it is removed"""
+    from simplyblock_core.db_controller import DBController
+    return vuid_allocator('lvol').allocate(DBController().kv_store, owner)
 
 
 def hexa_to_cpu_list(cpu_mask):
@@ -601,6 +612,28 @@ def decimal_to_hex_power_of_2(decimal_number):
     return hex_result
 
 
+def lazy_import(name):
+    """Returns the module `name`, it is executed on the first attribute access.
+
+    For module level references to heavy modules used by some code paths
+    only, like the operations behind the CLI commands.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    parent, _, child = name.rpartition('.')
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
 def get_logger(name=""):
     # first configure a root logger
     logging.getLogger("urllib3.connectionpool").setLevel(logging.WARNING)
@@ -1084,20 +1117,13 @@ def addNvmeDevices(rpc_client, snode, devs):
     return devices
 
 
-def get_random_snapshot_vuid():
+def get_random_snapshot_vuid(owner):
+    """Returns a free VUID of the snapshot space, reserved for the object `owner` until it is removed"""
     from simplyblock_core.db_controller import DBController
-    db_controller = DBController()
-    used_vuids = []
-    for snap in db_controller.get_snapshots():
-        used_vuids.append(snap.vuid)
-
-    r = 1 + int(random.random() * 1000000)
-    while r in used_vuids:
-        r = 1 + int(random.random() * 1000000)
-    return r
+    return vuid_allocator('snapshot').allocate(DBController().kv_store, owner)
 
 
-def pull_docker_image_with_retry(client: docker.DockerClient, image_name, retries=3, delay=5):
+def pull_docker_image_with_retry(client: 'docker.DockerClient', image_name, retries=3, delay=5):
     """
     Pulls a Docker image with retries in case of failure.
 
@@ -1113,6 +1139,8 @@ def pull_docker_image_with_retry(client: docker.DockerClient, image_name, retrie
     Raises:
         DockerException: If all retry attempts fail.
     """
+    from docker.errors import APIError, DockerException, ImageNotFound
+
     for attempt in range(1, retries + 1):
         try:
             print(f"Attempt {attempt}: Pulling image '{image_name}'...")
@@ -1202,6 +1230,8 @@ def get_nvme_pci_devices():
 
 
 def detect_nvmes(pci_allowed, pci_blocked):
+    from . import pci as pci_utils
+
     pci_addresses, blocked_devices = get_nvme_pci_devices()
     ssd_pci_set = set(pci_addresses)
 
@@ -1361,6 +1391,8 @@ def generate_core_allocation(cores_by_numa, sockets_to_use, nodes_per_socket, co
 
 
 def regenerate_config(new_config, old_config, force=False):
+    from simplyblock_web import node_utils
+
     if len(old_config.get("nodes")) != len(new_config.get("nodes")):
         logger.error("The number of node in old config not equal to the number of node in updated config")
         return False
@@ -1441,6 +1473,9 @@ def regenerate_config(new_config, old_config, force=False):
 
 
 def generate_configs(max_lvol, max_prov, sockets_to_use, nodes_per_socket, pci_allowed, pci_blocked, cores_percentage=0):
+    from simplyblock_web import node_utils
+    from . import pci as pci_utils
+
     system_info = {}
     nodes_config: dict = {"nodes": []}
 
@@ -1750,10 +1785,12 @@ def validate_config(config, upgrade=False):
 
 
 def get_k8s_apps_client():
+    from kubernetes import client, config
     config.load_incluster_config()
     return client.AppsV1Api()
 
 def get_k8s_core_client():
+    from kubernetes import client, config
     config.load_incluster_config()
     return client.CoreV1Api()
 
@@ -1773,10 +1810,13 @@ def all_pods_ready(k8s_core_v1, statefulset_name, namespace, expected_replicas):
     return ready_pods == expected_replicas
 
 def get_k8s_batch_client():
+    from kubernetes import client, config
     config.load_incluster_config()
     return client.BatchV1Api()
 
-def remove_container(client: docker.DockerClient, name, graceful_timeout=3):
+def remove_container(client: 'docker.DockerClient', name, graceful_timeout=3):
+    from docker.errors import APIError, NotFound
+
     try:
         container = client.containers.get(name)
         if graceful_timeout:
@@ -1789,6 +1829,8 @@ def remove_container(client: docker.DockerClient, name, graceful_timeout=3):
             raise
 
 def render_and_deploy_alerting_configs(contact_point, grafana_endpoint, cluster_uuid, cluster_secret):
+    from jinja2 import Environment, FileSystemLoader
+
     TOP_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
     alerts_template_folder = os.path.join(TOP_DIR, "simplyblock_core/scripts/alerting/")
     alert_resources_file = "alert_resources.yaml"
@@ -1849,6 +1891,8 @@ def load_kernel_module(module):
 
 
 def get_node_name_by_ip(target_ip: str) -> str:
+    from kubernetes import client, config
+
     config.load_kube_config()
     v1 = client.CoreV1Api()
     nodes = v1.list_node().items
@@ -1861,6 +1905,8 @@ def get_node_name_by_ip(target_ip: str) -> str:
     raise ValueError(f"No node found with IP address: {target_ip}")
 
 def label_node_as_mgmt_plane(node_name: str):
+    from kubernetes import client, config
+    from kubernetes.client import ApiException
 
     config.load_kube_config()
     v1 = client.CoreV1Api()
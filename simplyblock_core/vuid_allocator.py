@@ -0,0 +1,145 @@
+# coding=utf-8
+import random
+
+from simplyblock_core import constants
+from simplyblock_core.models.base_model import transact
+
+# Ids per bitmap block, a block is one FDB value of BLOCK_IDS / 8 bytes
+BLOCK_IDS = 1024
+
+
+def _test(bitmap, index):
+    return bitmap[index >> 3] & (1 << (index & 7))
+
+
+def _assign(bitmap, index, used):
+    if used:
+        bitmap[index >> 3] |= 1 << (index & 7)
+    else:
+        bitmap[index >> 3] &= ~(1 << (index & 7)) & 0xff
+
+
+def _prefix(space, *parts):
+    return ('vuid/%s/%s/' % (space, '/'.join(parts))).encode('utf-8')
+
+
+class VUIDAllocator:
+    """Allocates the VUIDs of a space, from 1 to the size of the space, with bitmaps in FDB.
+
+    The ids are split into blocks of BLOCK_IDS, each a bitmap under
+    `vuid/<space>/block/<n>`, and the bitmap `vuid/<space>/full` marks the
+    blocks without a free id. An allocation picks a random block which is not
+    full and a random free id in it: three reads and at most four writes, no
+    matter how many ids are in use. Allocations of the same id conflict, one
+    of their transactions is retried.
+
+    The owners of an id, the objects using it, are kept under
+    `vuid/<space>/owner/<owner>/<vuid>` and `vuid/<space>/id/<vuid>/<owner>`.
+    An id can be shared, e.g. a clone shares the VUID of its snapshot's lvol,
+    and is freed when its last owner releases it. Objects release their ids
+    when they are removed, see BaseModel._VUID_SPACES.
+
+    `used` returns the (vuid, owner) tuples in use before the allocator, the
+    bitmaps are seeded with them by the first transaction using the space.
+    All methods take an FDB transaction, or a kv_store to run in a
+    transaction of their own.
+    """
+
+    def __init__(self, space, used=None):
+        self.space = space
+        self.size = constants.VUID_SPACES[space]
+        self.blocks = (self.size + BLOCK_IDS - 1) // BLOCK_IDS
+        self.used = used
+        self._full_key = ('vuid/%s/full' % space).encode('utf-8')
+
+    def _block_key(self, block):
+        return _prefix(self.space, 'block') + b'%06d' % block
+
+    def _block_ids(self, block):
+        return min(BLOCK_IDS, self.size - block * BLOCK_IDS)
+
+    def _full(self, bitmap, block):
+        return all(_test(bitmap, i) for i in range(self._block_ids(block)))
+
+    def _read(self, tr, key, length):
+        value = tr[key]
+        return bytearray(bytes(value)) if value.present() else bytearray(length)
+
+    def _seed(self, tr):
+        if tr[self._full_key].present():
+            return
+        tr.set(self._full_key, bytes((self.blocks + 7) // 8))
+        for vuid, owner in (self.used() if self.used else []):
+            if 0 < vuid <= self.size:
+                self._add_owner(tr, vuid, owner)
+
+    def _set(self, tr, vuid, used):
+        """Marks `vuid` used or free in its block and the block in the full bitmap"""
+        block, index = divmod(vuid - 1, BLOCK_IDS)
+        key = self._block_key(block)
+        bitmap = self._read(tr, key, BLOCK_IDS // 8)
+        was_full = self._full(bitmap, block)
+        _assign(bitmap, index, used)
+        tr.set(key, bytes(bitmap))
+        is_full = used and self._full(bitmap, block)
+        if is_full != was_full:
+            full = self._read(tr, self._full_key, (self.blocks + 7) // 8)
+            _assign(full, block, is_full)
+            tr.set(self._full_key, bytes(full))
+
+    def _add_owner(self, tr, vuid, owner):
+        if not self.owners(tr, vuid):
+            self._set(tr, vuid, True)
+        tr.set(_prefix(self.space, 'owner', owner) + b'%07d' % vuid, b'')
+        tr.set(_prefix(self.space, 'id', '%07d' % vuid) + owner.encode('utf-8'), b'')
+
+    def owners(self, kv_store, vuid):
+        """Returns the owners of `vuid`"""
+        prefix = _prefix(self.space, 'id', '%07d' % vuid)
+        return transact(kv_store, lambda tr: [
+            bytes(key)[len(prefix):].decode('utf-8') for key, _ in tr.get_range_startswith(prefix)])
+
+    def allocate(self, kv_store, owner):
+        """Returns a free VUID reserved for `owner`, 0 if all are in use"""
+        def allocate(tr):
+            self._seed(tr)
+            full = self._read(tr, self._full_key, (self.blocks + 7) // 8)
+            blocks = [block for block in range(self.blocks) if not _test(full, block)]
+            if not blocks:
+                return 0
+            block = random.choice(blocks)
+            bitmap = self._read(tr, self._block_key(block), BLOCK_IDS // 8)
+            free = [i for i in range(self._block_ids(block)) if not _test(bitmap, i)]
+            vuid = block * BLOCK_IDS + random.choice(free) + 1
+            self._add_owner(tr, vuid, owner)
+            return vuid
+
+        return transact(kv_store, allocate)
+
+    def allocate_many(self, kv_store, owners):
+        """Returns a free VUID reserved for each of `owners`, in one transaction, 0 for those left once all are in use"""
+        return transact(kv_store, lambda tr: [self.allocate(tr, owner) for owner in owners])
+
+    def reserve(self, kv_store, vuid, owner, shared=False):
+        """Reserves `vuid` for `owner`, returns False if it is out of the space, or in use and not `shared`"""
+        def reserve(tr):
+            self._seed(tr)
+            if not 0 < vuid <= self.size or (not shared and set(self.owners(tr, vuid)) - {owner}):
+                return False
+            self._add_owner(tr, vuid, owner)
+            return True
+
+        return transact(kv_store, reserve)
+
+    def release(self, kv_store, owner):
+        """Releases the VUIDs of `owner`, those without other owners are freed"""
+        def release(tr):
+            prefix = _prefix(self.space, 'owner', owner)
+            for key, _ in list(tr.get_range_startswith(prefix)):
+                vuid = int(bytes(key)[len(prefix):])
+                tr.clear(bytes(key))
+                tr.clear(_prefix(self.space, 'id', '%07d' % vuid) + owner.encode('utf-8'))
+                if not self.owners(tr, vuid):
+                    self._set(tr, vuid, False)
+
+        transact(kv_store, release)
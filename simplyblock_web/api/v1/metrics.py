@@ -1,11 +1,15 @@
 #!/usr/bin/env python
 # encoding: utf-8
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 from flask import Blueprint
 from simplyblock_core.models.nvme_device import NVMeDevice
 from simplyblock_core.models.storage_node import StorageNode
-from simplyblock_core import db_controller
+from simplyblock_core import constants, db_controller
 from simplyblock_core.rpc_client import RPCClient
 
 
@@ -50,6 +54,7 @@ io_stats_keys = [
     "unmap_latency_ps",
     "unmap_latency_ticks",
     "write_latency_ticks",
+    "collection_lag_ms",
 ]
 
 ng: dict[str, Gauge] = {}
@@ -113,142 +118,192 @@ def get_pool_metrics():
     return pg
 
 
-@bp.route('/cluster/metrics', methods=['GET'])
-def get_data():
-
-    clusters = db.get_clusters()
-    for cl in clusters:
-
-        records = db.get_cluster_stats(cl, 1)
-        if records:
-            data = records[0].get_clean_dict()
-            object_data =  cl.get_clean_dict()
-
-            ng = get_cluster_metrics()
-            for g in ng:
-                v = g.replace("cluster_", "")
-                if v in data:
-                    ng[g].labels(cluster=cl.get_id()).set(data[v])
-                elif v == "status_code":
-                    ng[g].labels(cluster=cl.get_id()).set(cl.get_status_code())
-                elif v == "prov_cap_crit":
-                    ng[g].labels(cluster=cl.get_id()).set(object_data[v])
-                elif v == "cap_crit":
-                    ng[g].labels(cluster=cl.get_id()).set(object_data[v])
-
-        snodes = db.get_storage_nodes_by_cluster_id(cl.get_id())
-        for node in snodes:
-            logger.info("Node: %s", node.get_id())
+class MetricsCollector:
+    """Refreshes the metrics from a background thread and caches the exposition text.
+
+    The gauges of an object are only updated from its stats when a new record
+    has landed since the last refresh. SPDK reactor and thread stats are cached
+    per node for `reactor_ttl` seconds. Label sets of objects which are gone,
+    like deleted lvols, are removed from the registry.
+    """
+
+    def __init__(self, interval, reactor_ttl):
+        self.interval = interval
+        self.reactor_ttl = reactor_ttl
+        self.exposition = generate_latest(registry)
+        self.refreshed_at = 0.0
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        # (gauge name, label values) set by the previous and by the running refresh
+        self._previous: set = set()
+        self._current: set = set()
+        # (prefix, label values) -> date of the last exported record and the gauges set from it
+        self._records: dict = {}
+        # node id -> (fetch time, reactor data, thread data)
+        self._reactors: dict = {}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='metrics-collector', daemon=True)
+                self._thread.start()
+
+    def get_exposition(self, timeout):
+        """Returns the last exposition text, waits up to `timeout` seconds for the first refresh"""
+        self.start()
+        self._ready.wait(timeout)
+        return self.exposition
+
+    def _run(self):
+        while True:
+            started = time.time()
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Error refreshing metrics")
+            self._ready.set()
+            time.sleep(max(0.0, self.interval - (time.time() - started)))
+
+    def refresh(self):
+        self._current = set()
+        reactors, self._reactors = self._reactors, {}
+        for cl in db.get_clusters():
+            self._refresh_cluster(cl, reactors)
+
+        gauges = {**cg, **ng, **dg, **pg, **lg}
+        for name, labels in self._previous - self._current:
+            gauges[name].remove(*labels)
+        exported = {(name[:name.index('_') + 1], labels) for name, labels in self._current}
+        self._records = {key: value for key, value in self._records.items() if key in exported}
+        self._previous = self._current
+
+        self.exposition = generate_latest(registry)
+        self.refreshed_at = time.time()
+
+    def _refresh_cluster(self, cl, reactors):
+        object_data = cl.get_clean_dict()
+        self._export(get_cluster_metrics(), "cluster_", (cl.get_id(),), db.get_cluster_stats(cl, 1), {
+            "status_code": cl.get_status_code(),
+            "prov_cap_crit": object_data["prov_cap_crit"],
+            "cap_crit": object_data["cap_crit"],
+        })
+
+        snodes = []
+        for node in db.get_storage_nodes_by_cluster_id(cl.get_id()):
             if node.status != StorageNode.STATUS_ONLINE:
-                logger.info("Node is not online, skipping")
+                logger.debug("Node is not online, skipping: %s", node.get_id())
                 continue
-
             if not node.nvme_devices:
                 logger.error("No devices found in node: %s", node.get_id())
                 continue
-            
-            rpc_client = RPCClient(
-                node.mgmt_ip, node.rpc_port,
-                node.rpc_username, node.rpc_password,
-                timeout=3*60, retry=10)
-
-            reactor_data = rpc_client.framework_get_reactors()
-            thread_data = rpc_client.thread_get_stats()
-
-            thread_busy_map = {t["id"]: t["busy"] for t in thread_data.get("threads", [])}    
-
-            node_records = db.get_node_stats(node, 1)
-            if node_records:
-                data = node_records[0].get_clean_dict()
-                ng = get_snode_metrics()
-                for g in ng:
-                    v = g.replace("snode_", "")
-                    if v in data:
-                        ng[g].labels(cluster=cl.get_id(), snode=node.get_id()).set(data[v])
-                    elif v == "status_code":
-                        ng[g].labels(cluster=cl.get_id(), snode=node.get_id()).set(node.get_status_code())
-                    elif v == "health_check":
-                        ng[g].labels(cluster=cl.get_id(), snode=node.get_id()).set(node.health_check)
-                    if reactor_data and "reactors" in reactor_data:
-                        for reactor in reactor_data.get("reactors", []):
-                            lcore = reactor.get("lcore")
-                            core_idle = reactor.get("idle", 0)
-                            core_busy = reactor.get("busy", 0)
-                            irq = reactor.get("irq", 0)
-                            sys = reactor.get("sys", 0)
-
-                            thread_names = ", ".join(thread["name"] for thread in reactor.get("lw_threads", []))
-                            if v == "cpu_busy_percentage":
-                                for thread in reactor.get("lw_threads", []):
-                                    thread_name = thread.get("name")
-                                    thread_id = thread.get("id")
-                                    thread_busy = thread_busy_map.get(thread_id, 0)
-
-                                    total_core_cycles = core_busy + core_idle
-                                    cpu_usage_percent = (thread_busy / total_core_cycles) * 100 if total_core_cycles > 0 else 0
-
-                                    ng[g].labels(cluster=cl.get_id(), snode=node.get_id(), thread_name=thread_name).set(cpu_usage_percent)
-
-                            elif v == "cpu_core_utilization":
-
-                                total_cycle = core_busy + irq + sys
-                                total_with_idle = total_cycle + core_idle
-                                core_utilization = (total_cycle / total_with_idle) * 100 if total_with_idle > 0 else 0
-                                ng[g].labels(cluster=cl.get_id(), snode=node.get_id(), core_id=str(lcore), thread_names=thread_names).set(core_utilization)
+            snodes.append(node)
+
+        # nodes of the previous refresh keep their reactor data until it expires
+        for node in snodes:
+            if node.get_id() in reactors and time.time() - reactors[node.get_id()][0] <= self.reactor_ttl:
+                self._reactors[node.get_id()] = reactors[node.get_id()]
+        expired = [node for node in snodes if node.get_id() not in self._reactors]
+        if expired:
+            with ThreadPoolExecutor(max_workers=min(len(expired), 16)) as executor:
+                for node, data in zip(expired, executor.map(self._fetch_reactors, expired)):
+                    self._reactors[node.get_id()] = (time.time(), *data)
 
+        for node in snodes:
+            labels = (cl.get_id(), node.get_id())
+            self._export(get_snode_metrics(), "snode_", labels, db.get_node_stats(node, 1), {
+                "status_code": node.get_status_code(),
+                "health_check": node.health_check,
+            })
+            self._export_reactors(labels, *self._reactors[node.get_id()][1:])
 
             for device in node.nvme_devices:
-
-                logger.info("Getting device stats: %s", device.uuid)
-                if device.status not in [NVMeDevice.STATUS_ONLINE, NVMeDevice.STATUS_READONLY, NVMeDevice.STATUS_CANNOT_ALLOCATE]:
-                    logger.info(f"Device is skipped: {device.get_id()} status: {device.status}")
+                if device.status not in [NVMeDevice.STATUS_ONLINE, NVMeDevice.STATUS_READONLY,
+                                         NVMeDevice.STATUS_CANNOT_ALLOCATE]:
                     continue
+                self._export(get_device_metrics(), "device_", labels + (device.get_id(),),
+                             db.get_device_stats(device, 1), {
+                                 "status_code": device.get_status_code(),
+                                 "health_check": device.health_check,
+                             })
 
-                device_records = db.get_device_stats(device, 1)
-                if device_records:
-                    data = device_records[0].get_clean_dict()
-                    ng = get_device_metrics()
-                    for g in ng:
-                        v = g.replace("device_", "")
-                        if v in data:
-                            ng[g].labels(cluster=cl.get_id(), snode=node.get_id(), device=device.get_id()).set(data[v])
-                        elif v == "status_code":
-                            ng[g].labels(cluster=cl.get_id(), snode=node.get_id(), device=device.get_id()).set(
-                                device.get_status_code())
-                        elif v == "health_check":
-                            ng[g].labels(cluster=cl.get_id(), snode=node.get_id(), device=device.get_id()).set(
-                                device.health_check)
-
-
-        for pool in db.get_pools():
-
-            pool_records = db.get_pool_stats(pool, 1)
-            if pool_records:
-                data = pool_records[0].get_clean_dict()
-                ng = get_pool_metrics()
-                for g in ng:
-                    v = g.replace("pool_", "")
-                    if v in data:
-                        ng[g].labels(cluster=cl.get_id(), name=pool.pool_name, pool=pool.get_id()).set(data[v])
-                    elif v == "status_code":
-                        ng[g].labels(cluster=cl.get_id(), name=pool.pool_name, pool=pool.get_id()).set(
-                            pool.get_status_code())
+        for pool in db.get_pools(cl.get_id()):
+            self._export(get_pool_metrics(), "pool_", (cl.get_id(), pool.get_id(), pool.pool_name),
+                         db.get_pool_stats(pool, 1), {"status_code": pool.get_status_code()})
 
         for lvol in db.get_lvols(cl.get_id()):
-            lvol_records = db.get_lvol_stats(lvol, limit=1)
-            if lvol_records:
-                data = lvol_records[0].get_clean_dict()
-                ng = get_lvol_metrics()
-                for g in ng:
-                    v = g.replace("lvol_", "")
-                    if v in data:
-                        ng[g].labels(cluster=cl.get_id(), lvol=lvol.get_id(), pvc_name=lvol.pvc_name, pool=lvol.pool_name).set(data[v])
-                    elif v == "status_code":
-                        ng[g].labels(cluster=cl.get_id(), lvol=lvol.get_id(), pvc_name=lvol.pvc_name, pool=lvol.pool_name).set(
-                            lvol.get_status_code())
-                    elif v == "health_check":
-                        ng[g].labels(cluster=cl.get_id(), lvol=lvol.get_id(), pvc_name=lvol.pvc_name, pool=lvol.pool_name).set(
-                            lvol.health_check)
-
-
-    return Response(generate_latest(registry), mimetype=str('text/plain; version=0.0.4; charset=utf-8'))
+            self._export(get_lvol_metrics(), "lvol_", (cl.get_id(), lvol.pool_name, lvol.get_id(), lvol.pvc_name),
+                         db.get_lvol_stats(lvol, limit=1), {
+                             "status_code": lvol.get_status_code(),
+                             "health_check": lvol.health_check,
+                         })
+
+    def _export(self, gauges, prefix, labels, records, values):
+        """Sets the gauges of one object from the newest of its stats `records`, if it is new, and from `values`"""
+        labels = tuple(str(label) for label in labels)
+        key = (prefix, labels)
+        if not records and key not in self._records:
+            return
+
+        date, names = self._records.get(key, (None, []))
+        if records and records[0].date != date:
+            data = records[0].get_clean_dict()
+            names = [prefix + k for k in io_stats_keys if k in data]
+            for name in names:
+                gauges[name].labels(*labels).set(data[name[len(prefix):]])
+            self._records[key] = (records[0].date, names)
+
+        for k, value in values.items():
+            gauges[prefix + k].labels(*labels).set(value)
+        self._current.update((name, labels) for name in names + [prefix + k for k in values])
+
+    @staticmethod
+    def _fetch_reactors(node):
+        rpc_client = RPCClient(
+            node.mgmt_ip, node.rpc_port,
+            node.rpc_username, node.rpc_password,
+            timeout=5, retry=1)
+        batch = rpc_client.batch()
+        batch.framework_get_reactors()
+        batch.thread_get_stats()
+        (reactor_data, _), (thread_data, _) = batch.send()
+        return reactor_data, thread_data
+
+    def _export_reactors(self, labels, reactor_data, thread_data):
+        if not reactor_data or "reactors" not in reactor_data:
+            return
+
+        gauges = get_snode_metrics()
+        thread_busy_map = {t["id"]: t["busy"] for t in (thread_data or {}).get("threads", [])}
+        for reactor in reactor_data["reactors"]:
+            core_idle = reactor.get("idle", 0)
+            core_busy = reactor.get("busy", 0)
+            irq = reactor.get("irq", 0)
+            sys = reactor.get("sys", 0)
+
+            total_core_cycles = core_busy + core_idle
+            for thread in reactor.get("lw_threads", []):
+                thread_busy = thread_busy_map.get(thread.get("id"), 0)
+                cpu_usage_percent = (thread_busy / total_core_cycles) * 100 if total_core_cycles > 0 else 0
+                self._set(gauges, "snode_cpu_busy_percentage", labels + (str(thread.get("name")),),
+                          cpu_usage_percent)
+
+            thread_names = ", ".join(thread["name"] for thread in reactor.get("lw_threads", []))
+            total_cycle = core_busy + irq + sys
+            total_with_idle = total_cycle + core_idle
+            core_utilization = (total_cycle / total_with_idle) * 100 if total_with_idle > 0 else 0
+            self._set(gauges, "snode_cpu_core_utilization", labels + (str(reactor.get("lcore")), thread_names),
+                      core_utilization)
+
+    def _set(self, gauges, name, labels, value):
+        gauges[name].labels(*labels).set(value)
+        self._current.add((name, labels))
+
+
+collector = MetricsCollector(constants.METRICS_REFRESH_INTERVAL_SEC, constants.METRICS_REACTOR_CACHE_TTL_SEC)
+
+
+@bp.route('/cluster/metrics', methods=['GET'])
+def get_data():
+    exposition = collector.get_exposition(constants.METRICS_FIRST_REFRESH_WAIT_SEC)
+    return Response(exposition, mimetype=str('text/plain; version=0.0.4; charset=utf-8'))
@@ -192,8 +192,8 @@ def pool_iostats(uuid, history):
     else:
         records_number = 20
 
-    out = db.get_pool_stats(pool, records_number)
     records_count = 20
+    out = db.get_pool_stats(pool, records_number, records_count)
     new_records = core_utils.process_records(out, records_count)
 
     ret = {
@@ -5,7 +5,7 @@ from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from pydantic import BaseModel, Field, RootModel
 
 from simplyblock_core.db_controller import DBController
-from simplyblock_core import utils as core_utils
+from simplyblock_core import constants, utils as core_utils
 from simplyblock_core.controllers import lvol_controller, snapshot_controller
 from simplyblock_core.models.lvol_model import LVol
 
@@ -103,6 +103,47 @@ def add(
     return Response(status_code=201, headers={'Location': entity_url})
 
 
+class _BulkCreateParams(BaseModel):
+    volumes: Annotated[List[_CreateParams], Field(min_length=1, max_length=constants.LVOL_BULK_MAX_LVOLS)]
+
+
+class _BulkCreateResult(BaseModel):
+    name: str
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+
+@api.post('/bulk', name='clusters:storage-pools:volumes:bulk-create')
+def add_bulk(cluster: Cluster, pool: StoragePool, parameters: _BulkCreateParams) -> List[_BulkCreateResult]:
+    if any(data.namespace for data in parameters.volumes):
+        raise HTTPException(400, 'Volumes sharing a subsystem can not be created in bulk')
+
+    results = lvol_controller.add_lvols_bulk(pool.get_id(), [
+        {
+            'name': data.name,
+            'size': data.size,
+            'host_id_or_name': data.host_id,
+            'ha_type': data.ha_type if data.ha_type is not None else 'default',
+            'use_crypto': data.crypto_key is not None,
+            'crypto_key1': data.crypto_key[0] if data.crypto_key is not None else None,
+            'crypto_key2': data.crypto_key[1] if data.crypto_key is not None else None,
+            'max_rw_iops': data.max_rw_iops,
+            'max_rw_mbytes': data.max_rw_mbytes,
+            'max_r_mbytes': data.max_r_mbytes,
+            'max_w_mbytes': data.max_w_mbytes,
+            'lvol_priority_class': data.priority_class,
+            'pvc_name': data.pvc_name,
+        }
+        for data
+        in parameters.volumes
+    ])
+    return [
+        _BulkCreateResult(name=data.name, id=volume_id or None, error=error)
+        for data, (volume_id, error)
+        in zip(parameters.volumes, results)
+    ]
+
+
 instance_api = APIRouter(prefix='/{volume_id}')
 
 